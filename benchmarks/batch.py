@@ -0,0 +1,133 @@
+"""Run a batch analysis job end to end and check it survives a crash.
+
+Boots the app against the stand-in services, submits one batch of --videos
+video IDs and streams its results as NDJSON while it runs. With --crash-after
+the server is killed (SIGKILL) once that many results have arrived, started
+again on the same database, and the client resumes the result stream with
+?after=<last seq>. The run passes when every video ends up with exactly one
+result row and the job completes. Reports throughput and the ETA the API
+gave along the way.
+
+    python -m benchmarks.batch --videos 200 --workers 8 --crash-after 50
+"""
+import sys
+import json
+import time
+import signal
+import argparse
+import tempfile
+
+import requests
+
+from .fake_services import FakeServices, add_arguments, config_from_args, _video_ids
+from .loadtest import start_app
+
+
+def login(base_url):
+    session = requests.Session()
+    credentials = {"email": "batch@example.com", "password": "batch-password"}
+    session.post(f"{base_url}/register", data=dict(
+        credentials, username="batch", gemini_api_key="fake-gemini-key"), allow_redirects=False)
+    session.post(f"{base_url}/login", data=credentials, allow_redirects=False)
+    if "session" not in session.cookies:
+        raise RuntimeError("Login failed")
+    return session
+
+
+def stream_results(session, base_url, job_id, after, rows, stop_after, timeout):
+    """Append result rows to `rows`; returns False if it stopped early at `stop_after` rows."""
+    response = session.get(f"{base_url}/api/batches/{job_id}/results",
+                           params={"format": "ndjson", "after": after}, stream=True, timeout=timeout)
+    response.raise_for_status()
+    try:
+        for line in response.iter_lines(decode_unicode=True):
+            if line:
+                rows.append(json.loads(line))
+                if stop_after and len(rows) >= stop_after:
+                    return False
+    finally:
+        response.close()
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--videos", type=int, default=100, help="videos in the batch")
+    parser.add_argument("--workers", type=int, default=4, help="BATCH_WORKERS for the server")
+    parser.add_argument("--crash-after", type=int, default=0, help="kill the server after N results")
+    parser.add_argument("--lease-seconds", type=int, default=5,
+                        help="BATCH_LEASE_SECONDS, how soon a crashed item is taken over")
+    parser.add_argument("--timeout", type=float, default=600.0)
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    parser.add_argument("--real-upstream", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help="write the result as JSON to this file")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    fakes = FakeServices(config=config_from_args(args)).start()
+    workdir = tempfile.mkdtemp(prefix="youinsight-batch-")
+    env = dict(fakes.environment(), BATCH_WORKERS=str(args.workers),
+               BATCH_LEASE_SECONDS=str(args.lease_seconds), BATCH_POLL_SECONDS="1")
+    process = None
+    rows, etas = [], []
+    restarts = 0
+    try:
+        process, base_url = start_app(args, env, workdir)
+        session = login(base_url)
+        started = time.perf_counter()
+        response = session.post(f"{base_url}/api/batches", json={
+            "prompt": "Summarize this video in one sentence.",
+            "video_ids": _video_ids("batch", args.videos),
+        }, timeout=60)
+        response.raise_for_status()
+        job_id = response.json()["id"]
+
+        finished = stream_results(session, base_url, job_id, 0, rows, args.crash_after, args.timeout)
+        if not finished:
+            process.send_signal(signal.SIGKILL)
+            process.wait()
+            restarts += 1
+            args.port = int(base_url.rsplit(":", 1)[1])
+            process, base_url = start_app(args, env, workdir)
+            session = login(base_url)
+            etas.append(session.get(f"{base_url}/api/batches/{job_id}", timeout=60).json().get("eta_seconds"))
+            stream_results(session, base_url, job_id, rows[-1]["seq"], rows, 0, args.timeout)
+        elapsed = time.perf_counter() - started
+        job = session.get(f"{base_url}/api/batches/{job_id}", timeout=60).json()
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+        fakes.stop()
+
+    video_ids = [row["video_id"] for row in rows]
+    seqs = [row["seq"] for row in rows]
+    report = {
+        "benchmark": "batch",
+        "videos": args.videos,
+        "workers": args.workers,
+        "restarts": restarts,
+        "results": len(rows),
+        "distinct_videos": len(set(video_ids)),
+        "failed": sum(1 for row in rows if row["status"] != "done"),
+        "job_status": job["status"],
+        "elapsed_s": round(elapsed, 2),
+        "videos_per_minute": round(len(rows) / elapsed * 60, 1),
+        "eta_after_restart_s": etas[0] if etas else None,
+        "logs": workdir,
+    }
+    report["passed"] = (
+        job["status"] == "completed"
+        and len(rows) == args.videos == len(set(video_ids))
+        and seqs == list(range(1, args.videos + 1))
+    )
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    sys.exit(0 if report["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""Check that many Gemini streams make progress simultaneously on one eventlet hub.
+
+Starts the stand-in services in a subprocess, then runs N greenlets in this
+process, each consuming GeminiService.stream_analysis, after the warm-up a
+server worker does at start. A heartbeat greenlet
+ticks every 10ms to measure how long the hub is ever blocked. Passes when every
+stream received its first chunk before any stream finished, and the hub was never
+stalled for longer than --max-stall-ms. Exits non-zero otherwise.
+
+    python -m benchmarks.concurrent_streams --streams 100
+
+--password-hashes adds concurrent login-style password checks to the mix.
+--unpatched skips monkey patching to show the blocking baseline.
+"""
+import sys
+import argparse
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+parser.add_argument("--streams", type=int, default=100)
+parser.add_argument("--llm-ttft-ms", type=float, default=300.0)
+parser.add_argument("--llm-chunks", type=int, default=20)
+parser.add_argument("--llm-chunk-interval-ms", type=float, default=50.0)
+parser.add_argument("--max-stall-ms", type=float, default=250.0)
+parser.add_argument("--password-hashes", type=int, default=0,
+                    help="password checks (as on login) to run alongside the streams")
+parser.add_argument("--unpatched", action="store_true", help="skip eventlet.monkey_patch()")
+parser.add_argument("--output", help="write the result as JSON to this file")
+args = parser.parse_args()
+
+import eventlet  # noqa: E402
+
+if not args.unpatched:
+    eventlet.monkey_patch()
+
+import os  # noqa: E402
+import json  # noqa: E402
+import time  # noqa: E402
+import socket  # noqa: E402
+import subprocess  # noqa: E402
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def main():
+    port = _free_port()
+    fakes = subprocess.Popen(
+        [
+            sys.executable, "-m", "benchmarks.fake_services", "--port", str(port),
+            "--llm-ttft-ms", str(args.llm_ttft_ms),
+            "--llm-chunks", str(args.llm_chunks),
+            "--llm-chunk-interval-ms", str(args.llm_chunk_interval_ms),
+        ],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.time() + 30
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+                break
+            except OSError:
+                if time.time() > deadline:
+                    raise RuntimeError("Stand-in services did not start")
+                eventlet.sleep(0.1)
+
+        os.environ["GEMINI_API_BASE_URL"] = f"http://127.0.0.1:{port}"
+        # As a server worker does at start (WARMUP), before it takes traffic
+        from youinsight.warmup import preload
+        preload()
+        from youinsight.gemini_service import GeminiService
+        from youinsight.passwords import hash_password, verify_password
+
+        transcripts = [{"title": "Benchmark", "url": "https://example.com", "transcript": "words " * 500}]
+        streams = []
+
+        def consume(index):
+            service = GeminiService("fake-gemini-key")
+            record = {"first": None, "last": None, "chunks": 0}
+            started = time.perf_counter()
+            for _ in service.stream_analysis(f"Prompt {index}", transcripts):
+                now = time.perf_counter() - started
+                if record["first"] is None:
+                    record["first"] = now
+                record["last"] = now
+                record["chunks"] += 1
+            record["started"] = started
+            streams.append(record)
+
+        password_hash = hash_password("benchmark-password") if args.password_hashes else None
+        hash_seconds = []
+
+        def check_password():
+            started = time.perf_counter()
+            verify_password(password_hash, "benchmark-password")
+            hash_seconds.append(time.perf_counter() - started)
+
+        stalls = []
+        running = [True]
+
+        def heartbeat():
+            previous = time.perf_counter()
+            while running[0]:
+                eventlet.sleep(0.01)
+                now = time.perf_counter()
+                stalls.append(now - previous - 0.01)
+                previous = now
+
+        beat = eventlet.spawn(heartbeat)
+        started = time.perf_counter()
+        pool = eventlet.GreenPool(args.streams)
+        for i in range(args.streams):
+            pool.spawn(consume, i)
+        hashers = eventlet.GreenPool(max(1, args.password_hashes))
+        for _ in range(args.password_hashes):
+            hashers.spawn(check_password)
+        hashers.waitall()
+        pool.waitall()
+        elapsed = time.perf_counter() - started
+        running[0] = False
+        beat.wait()
+    finally:
+        fakes.terminate()
+        fakes.wait()
+
+    base = min(record["started"] for record in streams)
+    first_chunks = [record["started"] - base + record["first"] for record in streams if record["first"] is not None]
+    finishes = [record["started"] - base + record["last"] for record in streams if record["last"] is not None]
+    single_stream = (args.llm_ttft_ms + args.llm_chunk_interval_ms * (args.llm_chunks - 1)) / 1000
+    max_stall_ms = max(stalls) * 1000 if stalls else None
+    overlapping = bool(first_chunks) and len(first_chunks) == args.streams and max(first_chunks) < min(finishes)
+    result = {
+        "benchmark": "concurrent_streams",
+        "monkey_patched": not args.unpatched,
+        "streams": args.streams,
+        "completed": len(finishes),
+        "chunks_per_stream": sorted({record["chunks"] for record in streams}),
+        "elapsed_seconds": round(elapsed, 3),
+        "single_stream_seconds": round(single_stream, 3),
+        "last_first_chunk_seconds": round(max(first_chunks), 3) if first_chunks else None,
+        "first_finish_seconds": round(min(finishes), 3) if finishes else None,
+        "max_hub_stall_ms": round(max_stall_ms, 1) if max_stall_ms is not None else None,
+        "all_streams_overlapped": overlapping,
+        "password_checks": len(hash_seconds),
+        "password_check_max_ms": round(max(hash_seconds) * 1000, 1) if hash_seconds else None,
+    }
+    result["passed"] = overlapping and max_stall_ms is not None and max_stall_ms <= args.max_stall_ms
+
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    sys.exit(0 if result["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""Prove Socket.IO emits reach clients connected to another worker process.
+
+Starts the Redis-protocol stand-in, the YouTube/Gemini stand-ins and two app
+instances that share a database and SOCKETIO_MESSAGE_QUEUE. One user opens a
+page on each instance and runs an analysis on the first. The run passes when
+the page on the second instance receives the analysis_saved event (a room
+emit relayed through the queue) and the first page does not. It also checks
+that the streamed chunks, which go only to the requesting socket, were not
+published to the queue. Exits non-zero otherwise.
+
+    python -m benchmarks.cross_worker
+    python -m benchmarks.cross_worker --gunicorn   # each instance under gunicorn
+"""
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import tempfile
+import subprocess
+
+import requests
+import socketio
+
+from .fake_redis import FakeRedisServer
+from .fake_services import FakeServices, add_arguments, config_from_args
+from .loadtest import ROOT, _free_port, _wait_for_port, migrate_database
+
+
+def start_instance(args, env, workdir, name):
+    port = _free_port()
+    env = dict(env, PORT=str(port))
+    if args.gunicorn:
+        command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app"]
+    else:
+        command = [sys.executable, "main.py"]
+    log = open(os.path.join(workdir, f"{name}.log"), "w")
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    _wait_for_port(port, args.startup_timeout, process)
+    return process, f"http://127.0.0.1:{port}"
+
+
+def login(base_url):
+    session = requests.Session()
+    credentials = {"email": "worker@example.com", "password": "worker-password"}
+    session.post(f"{base_url}/register", data=dict(
+        credentials, username="worker", gemini_api_key="fake-gemini-key"), allow_redirects=False)
+    session.post(f"{base_url}/login", data=credentials, allow_redirects=False)
+    if "session" not in session.cookies:
+        raise RuntimeError("Login failed")
+    return "; ".join(f"{name}={value}" for name, value in session.cookies.items())
+
+
+def connect(base_url, cookie, events):
+    client = socketio.Client(reconnection=False, serializer=os.getenv("SOCKETIO_SERIALIZER", "default"))
+    for name in ("search_results", "analysis_chunk", "analysis_complete", "analysis_saved", "error"):
+        client.on(name, lambda data=None, name=name: events.put((name, time.perf_counter(), data)))
+    client.connect(base_url, headers={"Cookie": cookie}, wait_timeout=30)
+    return client
+
+
+def wait_for(events, name, timeout):
+    deadline = time.perf_counter() + timeout
+    seen = []
+    while time.perf_counter() < deadline:
+        try:
+            event = events.get(timeout=max(0.0, deadline - time.perf_counter()))
+        except queue.Empty:
+            break
+        seen.append(event[0])
+        if event[0] == "error":
+            raise RuntimeError((event[2] or {}).get("message"))
+        if event[0] == name:
+            return event, seen
+    return None, seen
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--gunicorn", action="store_true", help="run each instance with gunicorn.conf.py")
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--output", help="write the result as JSON to this file")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    redis = FakeRedisServer().start()
+    fakes = FakeServices(config=config_from_args(args)).start()
+    workdir = tempfile.mkdtemp(prefix="youinsight-workers-")
+    env = dict(os.environ)
+    env.update(fakes.environment())
+    env.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'workers.db')}",
+        "CACHE_PATH": os.path.join(workdir, "cache.sqlite"),
+        "SECRET_KEY": "cross-worker-secret",
+        "YOUTUBE_API_KEY": "fake-youtube-key",
+        "SOCKETIO_MESSAGE_QUEUE": redis.url,
+    })
+    processes = []
+    clients = []
+    try:
+        migrate_database(env)
+        for name in ("worker-1", "worker-2"):
+            process, url = start_instance(args, env, workdir, name)
+            processes.append((process, url))
+        (_, first_url), (_, second_url) = processes
+
+        cookie = login(first_url)
+        first_events, second_events = queue.Queue(), queue.Queue()
+        clients.append(connect(first_url, cookie, first_events))
+        clients.append(connect(second_url, cookie, second_events))
+        first, second = clients
+
+        first.emit("search_videos", {"query": "cross worker"})
+        event, _ = wait_for(first_events, "search_results", args.timeout)
+        video_ids = [video["video_id"] for video in event[2]["videos"]][:2]
+        published_before = redis.counts["published"]
+
+        first.emit("analyze_videos", {
+            "search_term": "cross worker",
+            "video_ids": video_ids,
+            "prompt": "Summarize these videos.",
+            "is_new_conversation": True,
+        })
+        complete, first_seen = wait_for(first_events, "analysis_complete", args.timeout)
+        saved, _ = wait_for(second_events, "analysis_saved", args.timeout)
+        # The page that started the analysis is skipped
+        echoed, _ = wait_for(first_events, "analysis_saved", 1.0)
+        published = redis.counts["published"] - published_before
+    finally:
+        for client in clients:
+            client.disconnect()
+        for process, _ in processes:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        fakes.stop()
+        redis.shutdown()
+
+    chunks = first_seen.count("analysis_chunk")
+    result = {
+        "benchmark": "cross_worker",
+        "server": "gunicorn" if args.gunicorn else "main.py",
+        "analysis_complete": complete is not None,
+        "received_on_other_worker": saved is not None,
+        "relay_ms": round((saved[1] - complete[1]) * 1000, 1) if saved and complete else None,
+        "echoed_to_origin": echoed is not None,
+        "chunks_streamed": chunks,
+        "messages_published_during_analysis": published,
+        "logs": workdir,
+    }
+    result["passed"] = bool(
+        complete and saved and saved[2].get("analysis_id") == complete[2].get("analysis_id")
+        and not echoed and chunks > 0 and published < chunks
+    )
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    sys.exit(0 if result["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
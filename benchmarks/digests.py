@@ -0,0 +1,155 @@
+"""Answer standard prompts from digests precomputed at ingest time.
+
+Boots the app against the stand-in services and ingests a channel of
+--playlist-videos videos, which queues a summary, takeaways and arguments
+digest for each. Once they are generated it runs, over /api/analyze:
+
+- "Summarize this video" for one video, answered from its stored digest;
+- a prompt that is not a standard one for the same video, run by Gemini;
+- "What are the key takeaways?" over all videos, run over their digests;
+- a non-standard prompt over all videos, run over the full transcripts.
+
+Reports time to first chunk and to completion, the Gemini and YouTube calls
+and the input tokens of each. The run passes when the standard single-video
+prompt makes no upstream call and the multi-video one sends Gemini less than
+a third of the tokens the transcripts take.
+
+    python -m benchmarks.digests --playlist-videos 20
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import tempfile
+
+from .fake_services import FakeServices, add_arguments, config_from_args
+from .loadtest import start_app
+from .http_stream import read_ndjson
+from .playlist_sync import login, wait_for_sync
+
+
+def wait_for_digests(session, base_url, video_ids, timeout):
+    deadline = time.monotonic() + timeout
+    pending = list(video_ids)
+    while pending:
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Digests of {len(pending)} videos not generated within {timeout}s")
+        digests = session.get(f"{base_url}/api/videos/{pending[0]}/digests", timeout=30).json()["digests"]
+        if digests and all(d["status"] in ("done", "failed") for d in digests):
+            pending.pop(0)
+        else:
+            time.sleep(0.2)
+
+
+def analyze(fakes, session, base_url, payload, timeout):
+    """Run one analysis over NDJSON and count the upstream calls it made."""
+    before = dict(fakes.requests)
+    started = time.perf_counter()
+    response = session.post(f"{base_url}/api/analyze?format=ndjson", json=dict(payload, is_new_conversation=True),
+                            stream=True, timeout=timeout)
+    response.raise_for_status()
+    first_chunk = complete = None
+    for _, event, data in read_ndjson(response):
+        if event == "analysis_chunk" and first_chunk is None:
+            first_chunk = time.perf_counter() - started
+        elif event == "analysis_complete":
+            complete = data
+            break
+        elif event == "error":
+            raise RuntimeError(f"Analysis failed: {data}")
+    elapsed = time.perf_counter() - started
+    calls = {path: count - before.get(path, 0) for path, count in fakes.requests.items()
+             if count != before.get(path, 0)}
+    return {
+        "analysis_id": complete["analysis_id"],
+        "first_chunk_ms": round(first_chunk * 1000, 1),
+        "total_ms": round(elapsed * 1000, 1),
+        "gemini_calls": calls.get("streamGenerateContent", 0),
+        "youtube_calls": sum(count for path, count in calls.items()
+                             if path not in ("streamGenerateContent", "generateContent")),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--timeout", type=float, default=600.0)
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    parser.add_argument("--real-upstream", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help="write the result as JSON to this file")
+    add_arguments(parser)
+    parser.set_defaults(playlist_videos=10)
+    args = parser.parse_args()
+
+    fakes = FakeServices(config=config_from_args(args)).start()
+    workdir = tempfile.mkdtemp(prefix="youinsight-digests-")
+    database = os.path.join(workdir, "loadtest.db")
+    process = None
+    try:
+        process, base_url = start_app(args, dict(
+            fakes.environment(), BATCH_WORKER="0", WATCH_SCHEDULER="0", STATS_REFRESHER="0",
+            DIGEST_POLL_SECONDS="0.2", DIGEST_GEMINI_API_KEY="fake-digest-key",
+        ), workdir)
+        session = login(base_url)
+        response = session.post(f"{base_url}/api/playlists", json={"source": "@benchmark"}, timeout=60)
+        response.raise_for_status()
+        wait_for_sync(session, base_url, response.json()["id"], args.timeout)
+        with sqlite3.connect(database) as conn:
+            video_ids = [row[0] for row in conn.execute("SELECT video_id FROM video ORDER BY id")]
+
+        started = time.perf_counter()
+        wait_for_digests(session, base_url, video_ids, args.timeout)
+        generation_s = time.perf_counter() - started
+
+        url = f"https://www.youtube.com/watch?v={video_ids[0]}"
+        runs = {
+            "single_standard": analyze(fakes, session, base_url, {
+                "video_url": url, "prompt": "Summarize this video"}, args.timeout),
+            "single_custom": analyze(fakes, session, base_url, {
+                "video_url": url, "prompt": "Summarize this video for a ten year old"}, args.timeout),
+            "multi_standard": analyze(fakes, session, base_url, {
+                "search_term": "benchmark", "video_ids": video_ids,
+                "prompt": "What are the key takeaways?"}, args.timeout),
+            "multi_custom": analyze(fakes, session, base_url, {
+                "search_term": "benchmark", "video_ids": video_ids,
+                "prompt": "Which of these videos disagree with each other?"}, args.timeout),
+        }
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+        fakes.stop()
+
+    with sqlite3.connect(database) as conn:
+        statuses = dict(conn.execute("SELECT status, count(*) FROM video_digest GROUP BY status").fetchall())
+        for run in runs.values():
+            run["input_tokens"] = conn.execute(
+                "SELECT input_tokens FROM analysis WHERE id = ?", (run["analysis_id"],)).fetchone()[0]
+
+    report = {
+        "benchmark": "digests",
+        "videos": len(video_ids),
+        "digests": statuses,
+        "generation_s": round(generation_s, 2),
+        "runs": runs,
+        "logs": workdir,
+    }
+    single, multi = runs["single_standard"], runs["multi_standard"]
+    report["passed"] = (
+        statuses.get("done") == 3 * len(video_ids)
+        and single["gemini_calls"] == 0 and single["youtube_calls"] == 0
+        and runs["single_custom"]["gemini_calls"] == 1
+        and multi["gemini_calls"] == 1
+        and multi["input_tokens"] * 3 < runs["multi_custom"]["input_tokens"]
+    )
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    sys.exit(0 if report["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
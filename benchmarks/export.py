@@ -0,0 +1,181 @@
+"""Check that history exports stream in constant memory.
+
+Fills a migrated database with one user's history: --analyses analyses with
+--videos-per-analysis videos each, conversation messages, and transcripts of
+--transcript-kb KB. Then runs `flask export-history` in fresh processes over
+a quarter of the history and over all of it, as NDJSON and gzipped CSV with
+transcripts, and records each run's peak RSS, bytes and rows. For
+comparison it also loads the whole history at once the way the history page
+does (Analysis.query ... .all() and to_dict()).
+
+The run passes when every export has one row per analysis and the gzipped
+output decompresses, and when peak RSS over the whole history is at most
+--max-growth-mb above the quarter's.
+
+    python -m benchmarks.export --analyses 8000
+"""
+import os
+import sys
+import csv
+import gzip
+import json
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime, timedelta
+
+from .loadtest import ROOT, migrate_database
+
+WORKERS_OFF = {worker: "0" for worker in (
+    "EMAIL_OUTBOX_WORKER", "BATCH_WORKER", "WATCH_SCHEDULER", "DIGEST_WORKER", "STATS_REFRESHER")}
+
+EXPORT_SNIPPET = """
+import sys, json, resource
+from youinsight import create_app
+from youinsight.export import export_command
+app = create_app()
+with app.app_context():
+    export_command.main(args=sys.argv[1:], standalone_mode=False)
+print(json.dumps({"max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}), file=sys.stderr)
+"""
+
+MATERIALIZE_SNIPPET = """
+import sys, json, resource
+from youinsight import create_app
+from youinsight.models import Analysis
+app = create_app()
+with app.app_context():
+    analyses = Analysis.query.filter_by(user_id=int(sys.argv[1])).order_by(Analysis.id).all()
+    rows = [analysis.to_dict() for analysis in analyses]
+print(json.dumps({"rows": len(rows), "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}), file=sys.stderr)
+"""
+
+WORDS = ("video", "travel", "camera", "budget", "editing", "interview", "tutorial", "review", "city", "music")
+
+
+def text(rng, size):
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)
+
+
+def populate(path, args):
+    """One user with `--analyses` analyses; returns the user's id."""
+    rng = random.Random(7)
+    started = datetime(2025, 1, 1)
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute(
+            "INSERT INTO user (email, username, password_hash, gemini_api_key, tier, created_at) "
+            "VALUES ('export@example.com', 'export', 'x', 'fake-gemini-key', 'free', ?)", (started,))
+        user_id = conn.execute("SELECT id FROM user WHERE username = 'export'").fetchone()[0]
+        conn.executemany(
+            "INSERT INTO video (video_id, title, url, channel_title, transcript, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            [(f"vid{i:08d}", f"Export video {i}", f"https://www.youtube.com/watch?v=vid{i:08d}", "Export channel",
+              text(rng, args.transcript_kb * 1024), started) for i in range(args.videos)],
+        )
+        for first in range(0, args.analyses, 1000):
+            rows = []
+            for i in range(first, min(first + 1000, args.analyses)):
+                prompt = f"What do these videos say about {rng.choice(WORDS)}?"
+                result = text(rng, 2048)
+                messages = json.dumps([{"role": "user", "content": prompt}, {"role": "assistant", "content": result}])
+                rows.append((user_id, "export", prompt, result, f"conv-{i // 4}", True, messages,
+                             started + timedelta(minutes=i)))
+            conn.executemany(
+                "INSERT INTO analysis (user_id, search_term, prompt, result, conversation_id, is_conversation, "
+                "messages, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        conn.execute(
+            "INSERT INTO analysis_video (analysis_id, video_id, created_at) "
+            "SELECT analysis.id, video.id, analysis.created_at FROM analysis JOIN video "
+            "ON (video.id - 1) BETWEEN (analysis.id * 7) % ? AND (analysis.id * 7) % ? + ? - 1",
+            (args.videos - args.videos_per_analysis, args.videos - args.videos_per_analysis, args.videos_per_analysis),
+        )
+    conn.close()
+    return user_id
+
+
+def run(snippet, arguments, env):
+    started = time.perf_counter()
+    process = subprocess.run([sys.executable, "-c", snippet, *arguments], cwd=ROOT, env=env,
+                             capture_output=True, text=True)
+    if process.returncode != 0:
+        raise RuntimeError(f"Export failed: {process.stderr[-2000:]}")
+    report = json.loads(process.stderr.strip().splitlines()[-1])
+    report["seconds"] = round(time.perf_counter() - started, 2)
+    report["max_rss_mb"] = round(report.pop("max_rss_kb") / 1024, 1)
+    return report
+
+
+def count_rows(path, fmt):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8", newline="") as f:
+        if fmt == "csv":
+            return sum(1 for _ in csv.reader(f)) - 1
+        return sum(1 for line in f if json.loads(line))
+
+
+def export(env, workdir, user, fmt, transcripts, compress, label):
+    path = os.path.join(workdir, f"export-{label}-{fmt}{'-transcripts' if transcripts else ''}.{fmt}")
+    if compress:
+        path += ".gz"
+    arguments = [user, "--format", fmt, "--output", path] + (["--transcripts"] if transcripts else [])
+    report = run(EXPORT_SNIPPET, arguments, env)
+    report.update({"format": fmt, "transcripts": transcripts, "gzip": compress,
+                   "bytes": os.path.getsize(path), "rows": count_rows(path, fmt)})
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--analyses", type=int, default=8000)
+    parser.add_argument("--videos", type=int, default=500)
+    parser.add_argument("--videos-per-analysis", type=int, default=3)
+    parser.add_argument("--transcript-kb", type=int, default=20)
+    parser.add_argument("--max-growth-mb", type=float, default=15.0)
+    parser.add_argument("--output", help="write the result as JSON to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="youinsight-export-")
+    runs = {}
+    for label, analyses in (("quarter", args.analyses // 4), ("full", args.analyses)):
+        path = os.path.join(workdir, f"{label}.db")
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{path}",
+                   CACHE_PATH=os.path.join(workdir, "cache.sqlite"), **WORKERS_OFF)
+        migrate_database(env)
+        user_id = populate(path, argparse.Namespace(**dict(vars(args), analyses=analyses)))
+        runs[label] = {
+            "analyses": analyses,
+            "ndjson": export(env, workdir, "export", "ndjson", False, False, label),
+            "csv_gzip_transcripts": export(env, workdir, "export", "csv", True, True, label),
+            "materialized": run(MATERIALIZE_SNIPPET, [str(user_id)], env),
+        }
+
+    report = {"benchmark": "export", "runs": runs}
+    growth = {
+        name: round(runs["full"][name]["max_rss_mb"] - runs["quarter"][name]["max_rss_mb"], 1)
+        for name in ("ndjson", "csv_gzip_transcripts", "materialized")
+    }
+    report["rss_growth_mb"] = growth
+    report["passed"] = (
+        all(runs[label][name]["rows"] == runs[label]["analyses"]
+            for label in runs for name in ("ndjson", "csv_gzip_transcripts"))
+        and growth["ndjson"] <= args.max_growth_mb
+        and growth["csv_gzip_transcripts"] <= args.max_growth_mb
+    )
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    sys.exit(0 if report["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
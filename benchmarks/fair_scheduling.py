@@ -0,0 +1,115 @@
+"""Compare analysis latency under a bursty load with FIFO and fair scheduling.
+
+One heavy user fires --burst analyses at once while --users light users each
+start one analysis at random moments shortly after. Each analysis holds its
+slot for about --service-ms. The same workload runs twice through
+youinsight.scheduler.FairScheduler: once with every analysis treated as the
+same user (plain FIFO, no per-user limit) and once with real user IDs (fair
+queuing). Reports light-user latency percentiles for both, plus what
+admission control rejected.
+
+    python -m benchmarks.fair_scheduling --burst 40 --users 20
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+
+from youinsight.scheduler import FairScheduler, AnalysisRejected
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def run(args, fair):
+    rng = random.Random(args.seed)
+    scheduler = FairScheduler(
+        max_in_flight=args.slots,
+        max_per_user=args.per_user if fair else args.slots,
+        max_wait=args.max_wait_ms / 1000.0,
+        expected_seconds=args.service_ms / 1000.0,
+    )
+    latencies = {"heavy": [], "light": []}
+    rejected = {"heavy": 0, "light": 0}
+    lock = threading.Lock()
+
+    def analysis(kind, user_id, delay):
+        time.sleep(delay)
+        started = time.perf_counter()
+        try:
+            with scheduler.slot(user_id if fair else 0, f"sid-{user_id}"):
+                time.sleep(rng.uniform(0.5, 1.5) * args.service_ms / 1000.0)
+        except AnalysisRejected:
+            with lock:
+                rejected[kind] += 1
+            return
+        with lock:
+            latencies[kind].append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=analysis, args=("heavy", 1, 0.0)) for _ in range(args.burst)]
+    threads += [
+        threading.Thread(target=analysis, args=("light", 100 + i, rng.uniform(0.01, args.spread_ms / 1000.0)))
+        for i in range(args.users)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    def summary(kind):
+        values = latencies[kind]
+        return {
+            "completed": len(values),
+            "rejected": rejected[kind],
+            "p50_ms": round(_percentile(values, 0.5) * 1000, 1) if values else None,
+            "p99_ms": round(_percentile(values, 0.99) * 1000, 1) if values else None,
+        }
+
+    return {"light": summary("light"), "heavy": summary("heavy")}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--slots", type=int, default=4, help="analyses in flight at once")
+    parser.add_argument("--per-user", type=int, default=2)
+    parser.add_argument("--burst", type=int, default=40, help="analyses the heavy user starts at once")
+    parser.add_argument("--users", type=int, default=20, help="light users with one analysis each")
+    parser.add_argument("--service-ms", type=float, default=100.0)
+    parser.add_argument("--spread-ms", type=float, default=200.0, help="window light users arrive in")
+    parser.add_argument("--max-wait-ms", type=float, default=60000.0, help="admission control threshold")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the result as JSON to this file")
+    args = parser.parse_args()
+
+    fifo = run(args, fair=False)
+    fair = run(args, fair=True)
+    result = {
+        "benchmark": "fair_scheduling",
+        "slots": args.slots,
+        "per_user": args.per_user,
+        "burst": args.burst,
+        "light_users": args.users,
+        "fifo": fifo,
+        "fair": fair,
+    }
+    # Light users should no longer wait behind the whole burst
+    result["passed"] = bool(
+        fair["light"]["p99_ms"] is not None
+        and fifo["light"]["p99_ms"] is not None
+        and fair["light"]["p99_ms"] < fifo["light"]["p99_ms"]
+    )
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    sys.exit(0 if result["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
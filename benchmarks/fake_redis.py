@@ -0,0 +1,373 @@
+"""A minimal Redis-protocol stand-in: strings with expiry, WATCH/MULTI/EXEC,
+pub/sub and the handful of other commands the app's Redis clients send. Not
+for production.
+
+    python -m benchmarks.fake_redis --port 6390
+
+Point the app at it with RATE_LIMIT_BACKEND=redis://127.0.0.1:6390/0 or
+SOCKETIO_MESSAGE_QUEUE=redis://127.0.0.1:6390/0.
+"""
+import time
+import fnmatch
+import argparse
+import threading
+import socketserver
+
+
+class _Status(str):
+    """A simple-string reply such as +OK."""
+
+
+OK = _Status("OK")
+QUEUED = _Status("QUEUED")
+
+
+class _Error(Exception):
+    pass
+
+
+def _encode(value) -> bytes:
+    if isinstance(value, _Status):
+        return b"+" + value.encode() + b"\r\n"
+    if isinstance(value, _Error):
+        return b"-" + str(value).encode() + b"\r\n"
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, bool):
+        value = int(value)
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(_encode(item) for item in value)
+    if isinstance(value, str):
+        value = value.encode()
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+class FakeRedisHandler(socketserver.StreamRequestHandler):
+    disable_nagle_algorithm = True
+
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            # Inline command, as typed into telnet
+            return [part.encode() for part in line.decode().split()]
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def setup(self):
+        super().setup()
+        # Published messages are written from the publisher's thread
+        self.write_lock = threading.Lock()
+        self.channels = set()
+        self.patterns = set()
+
+    def send(self, reply) -> None:
+        data = _encode(reply)
+        with self.write_lock:
+            self.wfile.write(data)
+            self.wfile.flush()
+
+    def _subscription(self, name, args):
+        """Handle a pub/sub command; replies go out one per channel."""
+        server = self.server
+        kind = name.lower()
+        targets = self.patterns if "PSUB" in name or "PUNSUB" in name else self.channels
+        if name in ("SUBSCRIBE", "PSUBSCRIBE"):
+            for channel in args:
+                targets.add(channel)
+                server.subscribe(self, channel, pattern=name == "PSUBSCRIBE")
+                self.send([kind, channel, len(self.channels) + len(self.patterns)])
+            return
+        for channel in args or list(targets) or [None]:
+            if channel is not None:
+                targets.discard(channel)
+                server.unsubscribe(self, channel, pattern=name == "PUNSUBSCRIBE")
+            self.send([kind, channel, len(self.channels) + len(self.patterns)])
+
+    def finish(self):
+        self.server.unsubscribe_all(self)
+        super().finish()
+
+    def handle(self):
+        server = self.server
+        server.count("connections")
+        watched = {}  # key -> version when watched
+        queue = None  # commands queued by MULTI
+        while True:
+            args = self._read_command()
+            if args is None:
+                return
+            if not args:
+                continue
+            name = args[0].decode().upper()
+            server.count("commands")
+
+            if name in ("SUBSCRIBE", "UNSUBSCRIBE", "PSUBSCRIBE", "PUNSUBSCRIBE"):
+                self._subscription(name, args[1:])
+                continue
+            if name == "PING" and (self.channels or self.patterns):
+                self.send(["pong", args[1] if len(args) > 1 else b""])
+                continue
+            if name == "PUBLISH":
+                server.count("published")
+                self.send(server.publish(*args[1:3]))
+                continue
+
+            if name == "MULTI":
+                queue = []
+                reply = OK
+            elif name == "DISCARD":
+                queue, watched = None, {}
+                reply = OK
+            elif name == "EXEC":
+                if queue is None:
+                    reply = _Error("ERR EXEC without MULTI")
+                else:
+                    with server.lock:
+                        if any(server.version(key) != version for key, version in watched.items()):
+                            server.count("aborted_transactions")
+                            reply = None
+                        else:
+                            reply = [server.execute(command[0].decode().upper(), command[1:]) for command in queue]
+                    queue, watched = None, {}
+            elif queue is not None:
+                queue.append(args)
+                reply = QUEUED
+            elif name == "WATCH":
+                with server.lock:
+                    for key in args[1:]:
+                        watched[key] = server.version(key)
+                reply = OK
+            elif name == "UNWATCH":
+                watched = {}
+                reply = OK
+            elif name == "QUIT":
+                self.send(OK)
+                return
+            else:
+                with server.lock:
+                    reply = server.execute(name, args[1:])
+            self.send(reply)
+
+
+class FakeRedisServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=0):
+        super().__init__((host, port), FakeRedisHandler)
+        self.lock = threading.RLock()
+        # key -> (value, expires at or None)
+        self.data = {}
+        # key -> write counter, for WATCH
+        self.versions = {}
+        self.counts = {"connections": 0, "commands": 0, "aborted_transactions": 0, "published": 0}
+        self._count_lock = threading.Lock()
+        # channel or pattern -> subscribed handlers
+        self._channels = {}
+        self._patterns = {}
+        self._pubsub_lock = threading.Lock()
+
+    def count(self, name):
+        with self._count_lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="fake-redis", daemon=True).start()
+        return self
+
+    # Pub/sub
+
+    def subscribe(self, handler, channel, pattern=False):
+        with self._pubsub_lock:
+            (self._patterns if pattern else self._channels).setdefault(channel, set()).add(handler)
+
+    def unsubscribe(self, handler, channel, pattern=False):
+        with self._pubsub_lock:
+            subscribers = (self._patterns if pattern else self._channels).get(channel)
+            if subscribers is not None:
+                subscribers.discard(handler)
+
+    def unsubscribe_all(self, handler):
+        with self._pubsub_lock:
+            for registry in (self._channels, self._patterns):
+                for subscribers in registry.values():
+                    subscribers.discard(handler)
+
+    def publish(self, channel, message):
+        """Deliver to subscribers; returns how many received it."""
+        with self._pubsub_lock:
+            direct = list(self._channels.get(channel, ()))
+            matched = [
+                (pattern, handler)
+                for pattern, handlers in self._patterns.items()
+                if fnmatch.fnmatchcase(channel.decode(errors="replace"), pattern.decode(errors="replace"))
+                for handler in handlers
+            ]
+        delivered = 0
+        for handler in direct:
+            try:
+                handler.send([b"message", channel, message])
+                delivered += 1
+            except OSError:
+                pass
+        for pattern, handler in matched:
+            try:
+                handler.send([b"pmessage", pattern, channel, message])
+                delivered += 1
+            except OSError:
+                pass
+        return delivered
+
+    # Storage; callers hold self.lock
+
+    def version(self, key):
+        self._get(key)  # an expired key counts as modified
+        return self.versions.get(key, 0)
+
+    def _touch(self, key):
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+    def _get(self, key):
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.time():
+            del self.data[key]
+            self._touch(key)
+            return None
+        return value
+
+    def _set(self, key, value, expires_at=None):
+        self.data[key] = (value, expires_at)
+        self._touch(key)
+
+    def execute(self, name, args):
+        handler = getattr(self, "cmd_" + name.lower(), None)
+        if handler is None:
+            return _Error(f"ERR unknown command '{name}'")
+        try:
+            return handler(*args)
+        except TypeError:
+            return _Error(f"ERR wrong number of arguments for '{name.lower()}' command")
+        except ValueError:
+            return _Error("ERR value is not an integer or out of range")
+
+    # Commands
+
+    def cmd_ping(self, message=None):
+        return message if message is not None else _Status("PONG")
+
+    def cmd_echo(self, message):
+        return message
+
+    def cmd_select(self, index):
+        return OK
+
+    def cmd_client(self, *args):
+        return OK
+
+    def cmd_flushdb(self, *args):
+        for key in list(self.data):
+            self._touch(key)
+        self.data.clear()
+        return OK
+
+    cmd_flushall = cmd_flushdb
+
+    def cmd_dbsize(self):
+        return sum(1 for key in list(self.data) if self._get(key) is not None)
+
+    def cmd_get(self, key):
+        return self._get(key)
+
+    def cmd_set(self, key, value, *options):
+        options = [option.decode().upper() if isinstance(option, bytes) else option for option in options]
+        expires_at = None
+        exists = self._get(key) is not None
+        i = 0
+        while i < len(options):
+            option = options[i]
+            if option in ("EX", "PX"):
+                amount = float(options[i + 1])
+                expires_at = time.time() + (amount if option == "EX" else amount / 1000.0)
+                i += 2
+                continue
+            if option == "NX" and exists or option == "XX" and not exists:
+                return None
+            i += 1
+        self._set(key, value, expires_at)
+        return OK
+
+    def cmd_del(self, *keys):
+        deleted = 0
+        for key in keys:
+            if self._get(key) is not None:
+                del self.data[key]
+                self._touch(key)
+                deleted += 1
+        return deleted
+
+    def cmd_exists(self, *keys):
+        return sum(1 for key in keys if self._get(key) is not None)
+
+    def cmd_incrby(self, key, amount):
+        entry = self.data.get(key)
+        value = int(self._get(key) or 0) + int(amount)
+        self._set(key, str(value).encode(), entry[1] if entry and key in self.data else None)
+        return value
+
+    def cmd_incr(self, key):
+        return self.cmd_incrby(key, 1)
+
+    def cmd_pexpire(self, key, milliseconds):
+        value = self._get(key)
+        if value is None:
+            return 0
+        self._set(key, value, time.time() + int(milliseconds) / 1000.0)
+        return 1
+
+    def cmd_expire(self, key, seconds):
+        return self.cmd_pexpire(key, int(seconds) * 1000)
+
+    def cmd_pttl(self, key):
+        if self._get(key) is None:
+            return -2
+        expires_at = self.data[key][1]
+        return -1 if expires_at is None else int((expires_at - time.time()) * 1000)
+
+    def cmd_ttl(self, key):
+        ttl = self.cmd_pttl(key)
+        return ttl if ttl < 0 else ttl // 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+
+    server = FakeRedisServer(args.host, args.port)
+    print(server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,453 @@
+"""Local stand-ins for the YouTube Data API, the YouTube watch page/timedtext
+endpoints the transcript library scrapes, and Gemini's REST API, streaming and not.
+
+Point the app at them with:
+
+    YOUTUBE_API_BASE_URL=http://127.0.0.1:8765/
+    YOUTUBE_WATCH_URL=http://127.0.0.1:8765/watch?v={video_id}
+    GEMINI_API_BASE_URL=http://127.0.0.1:8765
+
+Run standalone with ``python -m benchmarks.fake_services --port 8765``.
+"""
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from dataclasses import dataclass, asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from xml.sax.saxutils import escape
+
+WORDS = (
+    "video analysis transcript model stream latency python flask socket cache "
+    "search result channel quota token insight summary review tutorial guide"
+).split()
+
+
+@dataclass
+class FakeConfig:
+    # YouTube Data API and transcript endpoints
+    latency_ms: float = 80.0
+    jitter_ms: float = 20.0
+    results: int = 10
+    transcript_chars: int = 20_000
+    # Gemini streaming
+    llm_ttft_ms: float = 400.0
+    llm_chunks: int = 40
+    llm_chunk_chars: int = 120
+    llm_chunk_interval_ms: float = 25.0
+    # Fraction of Gemini requests that take llm_slow_ttft_ms to start instead
+    llm_slow_rate: float = 0.0
+    llm_slow_ttft_ms: float = 30_000.0
+    # Fraction of Gemini requests answered with a 503, on top of failure_rate
+    llm_failure_rate: float = 0.0
+    # Comma-separated Gemini API keys whose every request gets a 503
+    llm_failing_keys: str = ""
+    # Videos in every playlist and channel; raise it at runtime to "upload" more
+    playlist_videos: int = 200
+    # Fraction of videos without captions (chosen by video ID, so stable)
+    no_transcript_rate: float = 0.0
+    # Raise stats_epoch at runtime to add views to this fraction of videos
+    # (chosen by video ID, so stable)
+    view_growth_rate: float = 0.0
+    stats_epoch: int = 0
+    # Fraction of requests answered with a 503
+    failure_rate: float = 0.0
+
+
+def _video_ids(query: str, count: int):
+    """Stable 11-character IDs so repeated queries return the same videos."""
+    return [
+        hashlib.sha1(f"{query}:{i}".encode()).hexdigest()[:11]
+        for i in range(count)
+    ]
+
+
+def has_transcript(video_id: str, no_transcript_rate: float) -> bool:
+    return int(hashlib.sha1(f"captions:{video_id}".encode()).hexdigest()[:8], 16) / 0x100000000 >= no_transcript_rate
+
+
+def _grows(video_id: str, view_growth_rate: float) -> bool:
+    return int(hashlib.sha1(f"views:{video_id}".encode()).hexdigest()[:8], 16) / 0x100000000 < view_growth_rate
+
+
+def _words(seed: str, chars: int) -> str:
+    rng = random.Random(seed)
+    out, size = [], 0
+    while size < chars:
+        word = rng.choice(WORDS)
+        out.append(word)
+        size += len(word) + 1
+    return " ".join(out)
+
+
+class FakeServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "FakeServices/1.0"
+
+    @property
+    def config(self) -> FakeConfig:
+        return self.server.config
+
+    def log_message(self, format, *args):
+        pass
+
+    def _sleep(self, ms: float, jitter: float = 0.0) -> None:
+        delay = ms + (random.uniform(-jitter, jitter) if jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+
+    def _fail(self) -> bool:
+        if self.config.failure_rate and random.random() < self.config.failure_rate:
+            self._send(503, "application/json", json.dumps(
+                {"error": {"code": 503, "message": "Injected failure", "errors": [{"reason": "backendError"}]}}
+            ))
+            return True
+        return False
+
+    def _send(self, status: int, content_type: str, body: str) -> None:
+        data = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    # YouTube Data API
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        self.server.count(url.path)
+        self._sleep(self.config.latency_ms, self.config.jitter_ms)
+        if self._fail():
+            return
+
+        if url.path == "/youtube/v3/search":
+            count = min(int(params.get("maxResults", self.config.results)), self.config.results)
+            items = [
+                {"kind": "youtube#searchResult", "id": {"kind": "youtube#video", "videoId": video_id}}
+                for video_id in _video_ids(params.get("q", ""), count)
+            ]
+            self._send(200, "application/json", json.dumps({"items": items}))
+        elif url.path == "/youtube/v3/videos":
+            self._videos(params)
+        elif url.path == "/youtube/v3/playlistItems":
+            self._playlist_items(params)
+        elif url.path == "/youtube/v3/playlists":
+            items = [
+                {"kind": "youtube#playlist", "id": playlist_id,
+                 "snippet": {"title": f"Playlist {playlist_id}", "channelId": "UC" + playlist_id[2:]}}
+                for playlist_id in params.get("id", "").split(",") if playlist_id
+            ]
+            self._send(200, "application/json", json.dumps({"items": items}))
+        elif url.path == "/youtube/v3/channels":
+            channel_id = params.get("id") or "UC" + hashlib.sha1(
+                (params.get("forHandle") or params.get("forUsername", "")).encode()).hexdigest()[:22]
+            items = [{
+                "kind": "youtube#channel", "id": channel_id,
+                "snippet": {"title": f"Channel {channel_id}"},
+                "contentDetails": {"relatedPlaylists": {"uploads": "UU" + channel_id[2:]}},
+            }]
+            self._send(200, "application/json", json.dumps({"items": items}))
+        elif url.path == "/watch":
+            self._send(200, "text/html; charset=utf-8", self._watch_page(params.get("v", "")))
+        elif url.path == "/api/timedtext":
+            self._send(200, "text/xml; charset=utf-8", self._timedtext(params.get("v", "")))
+        else:
+            self._send(404, "application/json", json.dumps({"error": {"code": 404, "message": "Not found"}}))
+
+    def _playlist_items(self, params):
+        """Newest first, like an uploads playlist; the ETag changes when videos are added."""
+        playlist_id = params.get("playlistId", "")
+        total = self.config.playlist_videos
+        offset = int(params.get("pageToken") or 0)
+        size = min(int(params.get("maxResults", 5)), 50)
+        etag = hashlib.sha1(f"{playlist_id}:{total}:{offset}:{size}".encode()).hexdigest()
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        video_ids = _video_ids(playlist_id, total)
+        items = []
+        for index in range(total - 1 - offset, max(total - 1 - offset - size, -1), -1):
+            published = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(1_700_000_000 + index * 3600))
+            items.append({
+                "kind": "youtube#playlistItem",
+                "contentDetails": {"videoId": video_ids[index], "videoPublishedAt": published},
+            })
+        response = {"kind": "youtube#playlistItemListResponse", "etag": etag, "items": items,
+                    "pageInfo": {"totalResults": total, "resultsPerPage": size}}
+        if offset + size < total:
+            response["nextPageToken"] = str(offset + size)
+        self._send(200, "application/json", json.dumps(response))
+
+    def _videos(self, params):
+        """Video details; the ETags change when a video's view count does."""
+        items = [self._video(video_id) for video_id in params.get("id", "").split(",") if video_id]
+        etag = hashlib.sha1(f"{params.get('part')}:".encode() + "".join(
+            item["etag"] for item in items).encode()).hexdigest()
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self._send(200, "application/json", json.dumps({"kind": "youtube#videoListResponse", "etag": etag,
+                                                        "items": items}))
+
+    def _video(self, video_id: str):
+        views = int(video_id[:6], 16)
+        if _grows(video_id, self.config.view_growth_rate):
+            views += self.config.stats_epoch * 1000
+        thumbnail = {"url": f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg"}
+        return {
+            "kind": "youtube#video",
+            "etag": hashlib.sha1(f"{video_id}:{views}".encode()).hexdigest(),
+            "id": video_id,
+            "snippet": {
+                "title": f"Benchmark video {video_id}",
+                "channelTitle": "Benchmark Channel",
+                "publishedAt": "2024-01-01T00:00:00Z",
+                "thumbnails": {"high": thumbnail, "medium": thumbnail, "default": thumbnail},
+            },
+            "statistics": {"viewCount": str(views)},
+        }
+
+    # Watch page and timedtext, in the shape youtube-transcript-api parses
+
+    def _watch_page(self, video_id: str) -> str:
+        if not has_transcript(video_id, self.config.no_transcript_rate):
+            return (
+                "<html><body><script>var ytInitialPlayerResponse = {"
+                f'"playabilityStatus":{{"status":"OK"}},"videoDetails":{{"videoId":"{video_id}"}}}};'
+                "</script></body></html>"
+            )
+        captions = {
+            "playerCaptionsTracklistRenderer": {
+                "captionTracks": [
+                    {
+                        "baseUrl": f"{self._base_url()}/api/timedtext?v={video_id}",
+                        "name": {"simpleText": "English"},
+                        "languageCode": "en",
+                        "isTranslatable": False,
+                    }
+                ],
+                "translationLanguages": [],
+            }
+        }
+        return (
+            "<html><body><script>var ytInitialPlayerResponse = {"
+            '"playabilityStatus":{"status":"OK"},'
+            f'"captions":{json.dumps(captions)},"videoDetails":{{"videoId":"{video_id}"}}}};'
+            "</script></body></html>"
+        )
+
+    def _timedtext(self, video_id: str) -> str:
+        words = _words(video_id, self.config.transcript_chars).split()
+        lines = []
+        for i in range(0, len(words), 12):
+            text = escape(" ".join(words[i:i + 12]))
+            lines.append(f'<text start="{i / 2:.1f}" dur="6.0">{text}</text>')
+        return '<?xml version="1.0" encoding="utf-8" ?><transcript>' + "".join(lines) + "</transcript>"
+
+    # Gemini REST, streaming and not
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        method = url.path.split(":")[-1]
+        self.server.count(method)
+
+        if method not in ("streamGenerateContent", "generateContent"):
+            self._send(404, "application/json", json.dumps({"error": {"code": 404, "message": "Not found"}}))
+            return
+
+        self.server.count_model(url.path.split("/")[-1].split(":")[0])
+        api_key = self.headers.get("x-goog-api-key") or parse_qs(url.query).get("key", [""])[0]
+        slow = self.config.llm_slow_rate and random.random() < self.config.llm_slow_rate
+        self._sleep(self.config.llm_slow_ttft_ms if slow else self.config.llm_ttft_ms)
+        if (api_key and api_key in self.config.llm_failing_keys.split(",")) or (
+            self.config.llm_failure_rate and random.random() < self.config.llm_failure_rate
+        ):
+            self._send(503, "application/json", json.dumps(
+                {"error": {"code": 503, "message": "Injected Gemini failure", "status": "UNAVAILABLE"}}
+            ))
+            return
+        if self._fail():
+            return
+
+        prompt_tokens = max(1, len(body) // 4)
+        try:
+            max_output_tokens = json.loads(body)["generationConfig"]["maxOutputTokens"]
+        except (ValueError, KeyError, TypeError):
+            max_output_tokens = None
+
+        def elements():
+            output_tokens = 0
+            for i in range(self.config.llm_chunks):
+                text = _words(f"{body[:64]!r}:{i}", self.config.llm_chunk_chars) + " "
+                truncated = max_output_tokens is not None and output_tokens + len(text) // 4 >= max_output_tokens
+                if truncated:
+                    text = text[:max(0, max_output_tokens - output_tokens) * 4]
+                output_tokens += len(text) // 4
+                last = truncated or i == self.config.llm_chunks - 1
+                candidate = {"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}
+                if last:
+                    candidate["finishReason"] = "MAX_TOKENS" if truncated else "STOP"
+                yield {
+                    "candidates": [candidate],
+                    "usageMetadata": {
+                        "promptTokenCount": prompt_tokens,
+                        "candidatesTokenCount": output_tokens,
+                        "totalTokenCount": prompt_tokens + output_tokens,
+                    },
+                }
+                if last:
+                    return
+
+        if method == "generateContent":
+            # The whole completion in one response, after it has all been "generated"
+            text, element = "", None
+            for i, element in enumerate(elements()):
+                if i:
+                    self._sleep(self.config.llm_chunk_interval_ms)
+                text += element["candidates"][0]["content"]["parts"][0]["text"]
+            if element is None:
+                element = {"candidates": [{"content": {"parts": [{"text": ""}], "role": "model"},
+                                           "index": 0, "finishReason": "STOP"}]}
+            element["candidates"][0]["content"]["parts"][0]["text"] = text
+            self._send(200, "application/json", json.dumps(element))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        # A JSON array, one GenerateContentResponse per element, written as it is "generated"
+        try:
+            for i, element in enumerate(elements()):
+                if i:
+                    self._sleep(self.config.llm_chunk_interval_ms)
+                prefix = "[" if i == 0 else ",\r\n"
+                self._write_chunk(prefix + json.dumps(element))
+            self._write_chunk("]" if self.config.llm_chunks else "[]")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client cancelled the stream, e.g. the slower of two hedged requests
+            self.close_connection = True
+
+    def _write_chunk(self, text: str) -> None:
+        data = text.encode()
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+class FakeServices(ThreadingHTTPServer):
+    """Threaded HTTP server serving every stand-in endpoint on one port."""
+
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, config: FakeConfig = None):
+        super().__init__((host, port), FakeServiceHandler)
+        self.config = config or FakeConfig()
+        self.requests = {}
+        # Gemini requests by the model they named
+        self.models = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def count(self, endpoint: str) -> None:
+        with self._lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+    def count_model(self, model: str) -> None:
+        with self._lock:
+            self.models[model] = self.models.get(model, 0) + 1
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def environment(self):
+        """Environment variables that point the app at this server."""
+        return {
+            "YOUTUBE_API_BASE_URL": f"{self.base_url}/",
+            "YOUTUBE_WATCH_URL": f"{self.base_url}/watch?v={{video_id}}",
+            "GEMINI_API_BASE_URL": self.base_url,
+        }
+
+    def start(self) -> "FakeServices":
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-services", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    defaults = FakeConfig()
+    parser.add_argument("--latency-ms", type=float, default=defaults.latency_ms,
+                        help="YouTube and transcript response latency")
+    parser.add_argument("--jitter-ms", type=float, default=defaults.jitter_ms)
+    parser.add_argument("--results", type=int, default=defaults.results,
+                        help="videos returned per search")
+    parser.add_argument("--transcript-chars", type=int, default=defaults.transcript_chars)
+    parser.add_argument("--llm-ttft-ms", type=float, default=defaults.llm_ttft_ms)
+    parser.add_argument("--llm-chunks", type=int, default=defaults.llm_chunks)
+    parser.add_argument("--llm-chunk-chars", type=int, default=defaults.llm_chunk_chars)
+    parser.add_argument("--llm-chunk-interval-ms", type=float, default=defaults.llm_chunk_interval_ms)
+    parser.add_argument("--llm-slow-rate", type=float, default=defaults.llm_slow_rate,
+                        help="fraction of Gemini requests that start after --llm-slow-ttft-ms")
+    parser.add_argument("--llm-slow-ttft-ms", type=float, default=defaults.llm_slow_ttft_ms)
+    parser.add_argument("--llm-failure-rate", type=float, default=defaults.llm_failure_rate,
+                        help="fraction of Gemini requests answered with a 503")
+    parser.add_argument("--llm-failing-keys", default=defaults.llm_failing_keys,
+                        help="comma-separated Gemini API keys that always get a 503")
+    parser.add_argument("--playlist-videos", type=int, default=defaults.playlist_videos,
+                        help="videos in every playlist and channel")
+    parser.add_argument("--no-transcript-rate", type=float, default=defaults.no_transcript_rate,
+                        help="fraction of videos without captions")
+    parser.add_argument("--view-growth-rate", type=float, default=defaults.view_growth_rate,
+                        help="fraction of videos whose view count grows with --stats-epoch")
+    parser.add_argument("--stats-epoch", type=int, default=defaults.stats_epoch)
+    parser.add_argument("--failure-rate", type=float, default=defaults.failure_rate)
+
+
+def config_from_args(args: argparse.Namespace) -> FakeConfig:
+    return FakeConfig(**{field: getattr(args, field) for field in asdict(FakeConfig())})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server = FakeServices(args.host, args.port, config_from_args(args))
+    for name, value in server.environment().items():
+        print(f"{name}={value}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
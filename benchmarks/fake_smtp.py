@@ -0,0 +1,127 @@
+"""A minimal SMTP stand-in: accepts any AUTH, records messages, and can add
+latency per command and fail a fraction of deliveries with a 451.
+
+    python -m benchmarks.fake_smtp --port 2525
+
+Point the app at it with SMTP_SERVER=127.0.0.1 SMTP_PORT=2525
+SMTP_USERNAME=any SMTP_PASSWORD=any SMTP_USE_TLS=false.
+"""
+import time
+import random
+import argparse
+import threading
+import socketserver
+
+
+class FakeSMTPHandler(socketserver.StreamRequestHandler):
+    def _reply(self, line: str) -> None:
+        self.wfile.write((line + "\r\n").encode())
+        self.wfile.flush()
+
+    def handle(self):
+        server = self.server
+        server.count("connections")
+        self._reply("220 fake-smtp ready")
+        recipients = []
+        while True:
+            raw = self.rfile.readline()
+            if not raw:
+                return
+            command = raw.decode(errors="replace").strip()
+            verb = command.split(" ", 1)[0].upper()
+            if server.latency_ms:
+                time.sleep(server.latency_ms / 1000.0)
+
+            if verb in ("EHLO", "HELO"):
+                self.wfile.write(b"250-fake-smtp\r\n250-AUTH PLAIN LOGIN\r\n250 8BITMIME\r\n")
+                self.wfile.flush()
+            elif verb == "AUTH":
+                server.count("logins")
+                self._reply("235 Authentication successful")
+            elif verb == "MAIL":
+                recipients = []
+                self._reply("250 OK")
+            elif verb == "RCPT":
+                recipients.append(command.split(":", 1)[-1].strip(" <>"))
+                self._reply("250 OK")
+            elif verb == "DATA":
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                while True:
+                    line = self.rfile.readline()
+                    if not line or line in (b".\r\n", b".\n"):
+                        break
+                    lines.append(line)
+                if server.failure_rate and random.random() < server.failure_rate:
+                    server.count("rejected")
+                    self._reply("451 Injected temporary failure")
+                else:
+                    server.record(recipients, b"".join(lines))
+                    self._reply("250 Queued")
+            elif verb in ("RSET", "NOOP"):
+                self._reply("250 OK")
+            elif verb == "QUIT":
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("502 Command not implemented")
+
+
+class FakeSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=0, latency_ms=0.0, failure_rate=0.0):
+        super().__init__((host, port), FakeSMTPHandler)
+        self.latency_ms = latency_ms
+        self.failure_rate = failure_rate
+        self.messages = []
+        self.counts = {"connections": 0, "logins": 0, "rejected": 0, "messages": 0}
+        self._lock = threading.Lock()
+
+    def count(self, name):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def record(self, recipients, data):
+        with self._lock:
+            self.messages.append((recipients, data))
+            self.counts["messages"] += 1
+
+    def environment(self):
+        host, port = self.server_address[:2]
+        return {
+            "SMTP_SERVER": host,
+            "SMTP_PORT": str(port),
+            "SMTP_USERNAME": "benchmark",
+            "SMTP_PASSWORD": "benchmark",
+            "SMTP_USE_TLS": "false",
+            "SENDER_EMAIL": "noreply@example.com",
+        }
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="fake-smtp", daemon=True).start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2525)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakeSMTPServer(args.host, args.port, args.latency_ms, args.failure_rate)
+    for name, value in server.environment().items():
+        print(f"{name}={value}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""Exercise the /api/analyze streaming endpoint against a running app.
+
+Boots the app against the stand-in services, then runs --streams analyses
+over HTTP, half as Server-Sent Events and half as NDJSON. Every other stream
+is cut after --cut-after chunks and resumed from its last event ID. The run
+passes when every stream, resumed or not, reassembles exactly the result
+stored for its analysis and no event was delivered twice. Reports time to
+the first chunk and to completion.
+
+    python -m benchmarks.http_stream --streams 10
+"""
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+
+import requests
+
+from .fake_services import FakeServices, add_arguments, config_from_args
+from .loadtest import start_app, summarize
+
+
+def read_sse(response):
+    """Yield (id, event, data) from a Server-Sent Events response."""
+    fields = {}
+    for line in response.iter_lines(decode_unicode=True):
+        if line:
+            if not line.startswith(":"):
+                name, _, value = line.partition(": ")
+                fields[name] = value
+            continue
+        if "event" in fields:
+            yield int(fields["id"]), fields["event"], json.loads(fields["data"])
+        fields = {}
+
+
+def read_ndjson(response):
+    for line in response.iter_lines(decode_unicode=True):
+        if line:
+            event = json.loads(line)
+            yield event["id"], event["event"], event["data"]
+
+
+def run_stream(base_url, session, fmt, cut_after, timeout):
+    """One analysis; returns its timings and whether the streamed text matches the stored result."""
+    read = read_sse if fmt == "sse" else read_ndjson
+    started = time.perf_counter()
+    response = session.post(f"{base_url}/api/analyze?format={fmt}", json={
+        "search_term": "http stream",
+        "prompt": "Summarize these videos.",
+        "is_new_conversation": True,
+    }, stream=True, timeout=timeout)
+    response.raise_for_status()
+    stream_id = response.headers["X-Analysis-Stream"]
+
+    seen, chunks, first_chunk, complete = [], [], None, None
+    resumed = False
+    while complete is None:
+        for event_id, event, data in read(response):
+            seen.append(event_id)
+            if event == "error":
+                raise RuntimeError(data.get("message"))
+            if event == "analysis_chunk":
+                first_chunk = first_chunk or time.perf_counter()
+                chunks.append(data["chunk"])
+                if cut_after and not resumed and len(chunks) == cut_after:
+                    break
+            if event == "analysis_complete":
+                complete = data
+        else:
+            if complete is None:
+                raise RuntimeError("Stream ended before analysis_complete")
+            break
+        # Drop the connection mid-analysis and pick up after the last event seen
+        response.close()
+        resumed = True
+        response = session.get(f"{base_url}/api/analyze/{stream_id}?format={fmt}",
+                               headers={"Last-Event-ID": str(seen[-1])}, stream=True, timeout=timeout)
+        response.raise_for_status()
+    finished = time.perf_counter()
+    response.close()
+
+    stored = session.get(f"{base_url}/api/analysis/{complete['analysis_id']}", timeout=timeout).json()
+    return {
+        "first_chunk": first_chunk - started,
+        "analysis": finished - started,
+        "resumed": resumed,
+        "matches": "".join(chunks) == stored["result"] and len(seen) == len(set(seen)),
+    }
+
+
+def login(base_url):
+    session = requests.Session()
+    credentials = {"email": "stream@example.com", "password": "stream-password"}
+    session.post(f"{base_url}/register", data=dict(
+        credentials, username="stream", gemini_api_key="fake-gemini-key"), allow_redirects=False)
+    session.post(f"{base_url}/login", data=credentials, allow_redirects=False)
+    if "session" not in session.cookies:
+        raise RuntimeError("Login failed")
+    return session
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--streams", type=int, default=10, help="analyses to stream")
+    parser.add_argument("--cut-after", type=int, default=3, help="chunks before a resumed stream is cut")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    parser.add_argument("--real-upstream", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help="write the result as JSON to this file")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    fakes = FakeServices(config=config_from_args(args)).start()
+    workdir = tempfile.mkdtemp(prefix="youinsight-http-stream-")
+    process = None
+    results, errors, lock = [], [], threading.Lock()
+    try:
+        process, base_url = start_app(args, fakes.environment(), workdir)
+        session = login(base_url)
+
+        def worker(index):
+            fmt = "sse" if index % 2 == 0 else "ndjson"
+            cut_after = args.cut_after if index % 4 < 2 else 0
+            try:
+                result = run_stream(base_url, session, fmt, cut_after, args.timeout)
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+                return
+            with lock:
+                results.append(result)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.streams)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+        fakes.stop()
+
+    report = {
+        "benchmark": "http_stream",
+        "streams": args.streams,
+        "resumed": sum(1 for r in results if r["resumed"]),
+        "mismatched": sum(1 for r in results if not r["matches"]),
+        "errors": errors,
+        "timings": {
+            "first_chunk": summarize([r["first_chunk"] for r in results]),
+            "analysis": summarize([r["analysis"] for r in results]),
+        },
+        "logs": workdir,
+    }
+    report["passed"] = len(results) == args.streams and report["mismatched"] == 0
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    sys.exit(0 if report["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""Exercise hedging, retries and the circuit breaker of Gemini requests.
+
+Runs GeminiService in this process against the stand-in Gemini server, with
+latency and failures injected into it, in three scenarios:
+
+- hedging: --slow-rate of requests take --slow-ttft-ms to start. Counts the
+  analyses that stall that long, and time to first chunk, with hedging off
+  and on;
+- retries: --failure-rate of requests get a 503. The share of analyses that
+  fail is measured with one attempt and with LLM_MAX_ATTEMPTS;
+- circuit breaker: every request with one API key gets a 503. Counts the
+  requests that still reach Gemini once its circuit is open, checks that
+  another key is not affected and that the circuit closes again once the
+  key recovers.
+
+The run passes when hedging at least halves the stalled analyses, retries
+leave fewer failed analyses than single attempts, and the open circuit keeps
+requests from reaching Gemini.
+
+    python -m benchmarks.llm_resilience --analyses 40
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+from .fake_services import FakeServices, FakeConfig
+
+FAILING_KEY = "failing-gemini-key"
+HEALTHY_KEY = "healthy-gemini-key"
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else None
+
+
+def run_analyses(count, api_key="benchmark-gemini-key", stall_ms=None):
+    """Run `count` one-video analyses; their time to first chunk and outcomes."""
+    from youinsight.gemini_service import GeminiService
+
+    ttfts, outcomes = [], {}
+    video = {"title": "Benchmark video", "url": "https://www.youtube.com/watch?v=benchmark", "transcript": "words " * 500}
+    for i in range(count):
+        service = GeminiService(api_key)
+        started = time.perf_counter()
+        first_chunk = None
+        for _ in service.stream_analysis(f"What does the speaker say about topic {i}?", [video]):
+            if first_chunk is None:
+                first_chunk = time.perf_counter() - started
+        outcome = service.last_usage["outcome"]
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        if outcome == "ok":
+            ttfts.append(first_chunk * 1000)
+    report = {
+        "analyses": count,
+        "outcomes": outcomes,
+        "ttft_p50_ms": round(percentile(ttfts, 0.5) or 0, 1),
+        "ttft_p95_ms": round(percentile(ttfts, 0.95) or 0, 1),
+        "ttft_max_ms": round(max(ttfts, default=0), 1),
+    }
+    if stall_ms is not None:
+        report["stalled"] = sum(1 for ttft in ttfts if ttft >= stall_ms)
+    return report
+
+
+def gemini_requests(fakes):
+    return fakes.requests.get("streamGenerateContent", 0) + fakes.requests.get("generateContent", 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--analyses", type=int, default=40, help="analyses per measurement")
+    parser.add_argument("--slow-rate", type=float, default=0.1)
+    parser.add_argument("--slow-ttft-ms", type=float, default=5000.0)
+    parser.add_argument("--deadline", type=float, default=1.0, help="LLM_TTFT_DEADLINE_SECONDS for the run")
+    parser.add_argument("--failure-rate", type=float, default=0.3)
+    parser.add_argument("--output", help="write the result as JSON to this file")
+    args = parser.parse_args()
+
+    config = FakeConfig(llm_ttft_ms=200.0, llm_chunks=5, llm_chunk_interval_ms=10.0,
+                        llm_slow_ttft_ms=args.slow_ttft_ms)
+    fakes = FakeServices(config=config).start()
+    os.environ.update(fakes.environment())
+    os.environ.update({
+        "LLM_TTFT_DEADLINE_SECONDS": str(args.deadline),
+        "LLM_TTFT_DEADLINE_PER_100K_TOKENS": "0",
+        # Past the slow requests, so a slow start is only cut short by the hedge
+        "LLM_TTFT_TIMEOUT_DEADLINES": str(max(3.0, 2 * args.slow_ttft_ms / 1000 / args.deadline)),
+        "LLM_RETRY_BASE_SECONDS": "0.05",
+        "LLM_BREAKER_RESET_SECONDS": "1",
+    })
+    from youinsight import resilience
+
+    try:
+        # A hedge can be slow too, so some analyses still stall: about slow-rate squared of them
+        stall_ms = 0.9 * args.slow_ttft_ms
+        config.llm_slow_rate = args.slow_rate
+        resilience.LLM_HEDGE = False
+        unhedged = run_analyses(args.analyses, stall_ms=stall_ms)
+        resilience.LLM_HEDGE = True
+        hedged = run_analyses(args.analyses, stall_ms=stall_ms)
+        config.llm_slow_rate = 0.0
+
+        # Runs of failures would open the circuit now and then; measured on its own below
+        config.llm_failure_rate = args.failure_rate
+        breaker_failures, resilience.BREAKER.failures = resilience.BREAKER.failures, 10 ** 9
+        max_attempts = resilience.LLM_MAX_ATTEMPTS
+        resilience.LLM_MAX_ATTEMPTS = 1
+        single = run_analyses(args.analyses, api_key="single-attempt-key")
+        resilience.LLM_MAX_ATTEMPTS = max_attempts
+        retried = run_analyses(args.analyses, api_key="retrying-key")
+        resilience.BREAKER.failures = breaker_failures
+        config.llm_failure_rate = 0.0
+
+        config.llm_failing_keys = FAILING_KEY
+        before = gemini_requests(fakes)
+        failing = run_analyses(10, api_key=FAILING_KEY)
+        failing["gemini_requests"] = gemini_requests(fakes) - before
+        healthy = run_analyses(3, api_key=HEALTHY_KEY)
+        config.llm_failing_keys = ""
+        time.sleep(resilience.LLM_BREAKER_RESET_SECONDS)
+        recovered = run_analyses(3, api_key=FAILING_KEY)
+    finally:
+        fakes.stop()
+
+    report = {
+        "benchmark": "llm_resilience",
+        "hedging": {"deadline_s": args.deadline, "slow_rate": args.slow_rate, "off": unhedged, "on": hedged},
+        "retries": {"failure_rate": args.failure_rate, "max_attempts": max_attempts,
+                    "single_attempt": single, "retried": retried},
+        "circuit_breaker": {"failing_key": failing, "other_key": healthy, "after_recovery": recovered},
+    }
+    report["passed"] = (
+        hedged["outcomes"].get("ok") == args.analyses
+        and hedged["stalled"] * 2 <= unhedged["stalled"]
+        and retried["outcomes"].get("error", 0) < max(1, single["outcomes"].get("error", 0))
+        and failing["outcomes"].get("error") == 10
+        and failing["gemini_requests"] == resilience.LLM_BREAKER_FAILURES
+        and healthy["outcomes"].get("ok") == 3
+        and recovered["outcomes"].get("ok") == 3
+    )
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    sys.exit(0 if report["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,417 @@
+"""End-to-end load test: boots the app against the stand-in services in
+fake_services.py and drives it with a swarm of logged-in Socket.IO clients.
+
+Each virtual user repeatedly searches (``search_videos``) and analyzes the
+top results (``analyze_videos``). The run reports p50/p95/p99 of
+
+- search: emit ``search_videos`` -> ``search_results``
+- first_chunk: emit ``analyze_videos`` -> first ``analysis_chunk``
+- analysis: emit ``analyze_videos`` -> ``analysis_complete``
+
+plus the server process's CPU and RSS (sampled from /proc, Linux only), and
+writes everything to a JSON file. With ``--baseline`` it compares p95s to a
+previous result file and exits non-zero on a regression.
+
+    python -m benchmarks.loadtest --concurrency 20 --duration 60
+
+The app server inherits the environment, so the same run can replay recorded
+traffic instead of the stand-ins (see youinsight/cassettes.py):
+
+    YOUINSIGHT_CASSETTE_MODE=record YOUTUBE_API_KEY=... GEMINI_API_KEY=... \
+        python -m benchmarks.loadtest --real-upstream --distinct-queries 5 --iterations 1
+    YOUINSIGHT_CASSETTE_MODE=replay YOUINSIGHT_CASSETTE_SPEED=4 \
+        python -m benchmarks.loadtest --distinct-queries 5
+"""
+import os
+import sys
+import json
+import time
+import queue
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+from datetime import datetime
+
+import requests
+import socketio
+
+from .fake_services import FakeServices, add_arguments, config_from_args
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PERCENTILES = (50, 95, 99)
+TIMINGS = ("search", "first_chunk", "analysis")
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile; None for an empty sample."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def summarize(values):
+    summary = {"count": len(values)}
+    for pct in PERCENTILES:
+        value = percentile(values, pct)
+        summary[f"p{pct}_ms"] = round(value * 1000, 1) if value is not None else None
+    summary["mean_ms"] = round(sum(values) / len(values) * 1000, 1) if values else None
+    return summary
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_port(port: int, timeout: float, process: subprocess.Popen) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"App server exited with status {process.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"App server did not listen on port {port} within {timeout}s")
+
+
+class ProcessSampler(threading.Thread):
+    """Samples CPU time and RSS of one process from /proc."""
+
+    def __init__(self, pid: int, interval: float = 0.5):
+        super().__init__(name="process-sampler", daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self._done = threading.Event()
+        self._ticks = os.sysconf("SC_CLK_TCK")
+        self._page_size = os.sysconf("SC_PAGE_SIZE")
+
+    def _read(self):
+        with open(f"/proc/{self.pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        cpu_seconds = (int(fields[11]) + int(fields[12])) / self._ticks
+        with open(f"/proc/{self.pid}/statm") as f:
+            rss_bytes = int(f.read().split()[1]) * self._page_size
+        return time.time(), cpu_seconds, rss_bytes
+
+    def run(self):
+        while not self._done.is_set():
+            try:
+                self.samples.append(self._read())
+            except (OSError, IndexError, ValueError):
+                return
+            self._done.wait(self.interval)
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+    def summary(self):
+        if len(self.samples) < 2:
+            return {"available": False}
+        cpu_percent = [
+            (c2 - c1) / (t2 - t1) * 100
+            for (t1, c1, _), (t2, c2, _) in zip(self.samples, self.samples[1:])
+            if t2 > t1
+        ]
+        (t_first, c_first, _), (t_last, c_last, rss_last) = self.samples[0], self.samples[-1]
+        rss = [sample[2] for sample in self.samples]
+        return {
+            "available": True,
+            "cpu_seconds": round(c_last - c_first, 2),
+            "cpu_percent_mean": round((c_last - c_first) / (t_last - t_first) * 100, 1),
+            "cpu_percent_max": round(max(cpu_percent), 1) if cpu_percent else None,
+            "rss_mb_start": round(rss[0] / 1024 / 1024, 1),
+            "rss_mb_max": round(max(rss) / 1024 / 1024, 1),
+            "rss_mb_end": round(rss_last / 1024 / 1024, 1),
+        }
+
+
+class VirtualUser(threading.Thread):
+    """One logged-in browser session: search, then analyze, until the run ends."""
+
+    def __init__(self, index, base_url, args, stop_at, results, lock):
+        super().__init__(name=f"user-{index}", daemon=True)
+        self.index = index
+        self.base_url = base_url
+        self.args = args
+        self.stop_at = stop_at
+        self.results = results
+        self.lock = lock
+        self.events = queue.Queue()
+        self.iterations = 0
+
+    def _record(self, key, value):
+        with self.lock:
+            self.results[key].append(value)
+
+    def _login(self) -> str:
+        session = requests.Session()
+        email = f"loadtest{self.index}@example.com"
+        password = "loadtest-password"
+        session.post(f"{self.base_url}/register", data={
+            "email": email,
+            "username": f"loadtest{self.index}",
+            "password": password,
+            "gemini_api_key": self.args.gemini_api_key,
+        }, allow_redirects=False)
+        response = session.post(
+            f"{self.base_url}/login", data={"email": email, "password": password}, allow_redirects=False
+        )
+        if "session" not in session.cookies:
+            raise RuntimeError(f"Login failed for {email}: HTTP {response.status_code}")
+        return "; ".join(f"{name}={value}" for name, value in session.cookies.items())
+
+    def _connect(self, cookie):
+        client = socketio.Client(reconnection=False, serializer=os.getenv("SOCKETIO_SERIALIZER", "default"))
+        for name in ("search_results", "analysis_started", "analysis_chunk", "analysis_complete", "error"):
+            client.on(name, self._handler(name))
+        client.connect(self.base_url, headers={"Cookie": cookie}, wait_timeout=self.args.timeout)
+        return client
+
+    def _handler(self, name):
+        def handle(data=None):
+            self.events.put((name, time.perf_counter(), data))
+        return handle
+
+    def _wait(self, names, deadline):
+        """Return the next event in `names`, raising on an 'error' event or timeout."""
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise TimeoutError(f"Timed out waiting for {'/'.join(names)}")
+            try:
+                name, at, data = self.events.get(timeout=remaining)
+            except queue.Empty:
+                continue
+            if name == "error":
+                raise RuntimeError((data or {}).get("message", "error event"))
+            if name in names:
+                return name, at, data
+
+    def _query(self) -> str:
+        if self.args.distinct_queries:
+            return f"benchmark topic {(self.index + self.iterations) % self.args.distinct_queries}"
+        return f"benchmark topic {self.index}-{self.iterations}"
+
+    def _iteration(self, client):
+        query = self._query()
+        started = time.perf_counter()
+        client.emit("search_videos", {"query": query})
+        _, at, data = self._wait({"search_results"}, started + self.args.timeout)
+        self._record("search", at - started)
+        self._record("search_source", (data or {}).get("source", "unknown"))
+
+        video_ids = [video["video_id"] for video in (data or {}).get("videos", [])][: self.args.videos_per_analysis]
+        if not video_ids or self.args.search_only:
+            return
+
+        started = time.perf_counter()
+        client.emit("analyze_videos", {
+            "search_term": query,
+            "video_ids": video_ids,
+            "prompt": "Summarize the main points of these videos.",
+            "is_new_conversation": True,
+        })
+        deadline = started + self.args.timeout
+        name, at, _ = self._wait({"analysis_chunk", "analysis_complete"}, deadline)
+        if name == "analysis_chunk":
+            self._record("first_chunk", at - started)
+            name, at, _ = self._wait({"analysis_complete"}, deadline)
+        self._record("analysis", at - started)
+
+    def run(self):
+        try:
+            client = self._connect(self._login())
+        except Exception as e:
+            self._record("errors", f"connect: {e}")
+            return
+        try:
+            while time.time() < self.stop_at and (
+                not self.args.iterations or self.iterations < self.args.iterations
+            ):
+                try:
+                    self._iteration(client)
+                except Exception as e:
+                    self._record("errors", str(e))
+                    # Drain anything left over from the failed iteration
+                    time.sleep(0.5)
+                    while not self.events.empty():
+                        self.events.get_nowait()
+                self.iterations += 1
+                if self.args.think_time:
+                    time.sleep(self.args.think_time)
+        finally:
+            client.disconnect()
+
+
+def migrate_database(env, log=None):
+    """Bring the database in env's DATABASE_URL up to the latest migration."""
+    env = dict(env, FLASK_APP="main.py")
+    # The CLI builds the app too; its background workers have nothing to do here
+    for worker in ("EMAIL_OUTBOX_WORKER", "BATCH_WORKER", "WATCH_SCHEDULER", "DIGEST_WORKER", "STATS_REFRESHER"):
+        env[worker] = "0"
+    subprocess.run(
+        [sys.executable, "-m", "flask", "db", "upgrade"], cwd=ROOT, env=env, check=True,
+        stdout=log or subprocess.DEVNULL, stderr=subprocess.STDOUT,
+    )
+
+
+def start_app(args, fake_env, workdir, migrate=True):
+    port = args.port or _free_port()
+    env = dict(os.environ)
+    env.update(fake_env)
+    env.update({
+        "PORT": str(port),
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'loadtest.db')}",
+        "CACHE_PATH": os.path.join(workdir, "cache.sqlite"),
+        "SECRET_KEY": "loadtest-secret",
+    })
+    # Measure capacity, not the per-user limits (set RATE_LIMITS to test those)
+    env.setdefault("RATE_LIMITS", json.dumps({
+        "free": {event: "1000000/second" for event in ("api", "search_videos", "analyze_videos")}
+    }))
+    if not args.real_upstream:
+        env["YOUTUBE_API_KEY"] = "fake-youtube-key"
+    log = open(os.path.join(workdir, "server.log"), "w")
+    if migrate:
+        migrate_database(env, log)
+    process = subprocess.Popen(
+        [sys.executable, "main.py"], cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    _wait_for_port(port, args.startup_timeout, process)
+    return process, f"http://127.0.0.1:{port}"
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline_path, max_regression):
+    """Return a list of p95 regressions beyond `max_regression` (a fraction)."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressions = []
+    for name in TIMINGS:
+        before = baseline["timings"].get(name, {}).get("p95_ms")
+        after = report["timings"].get(name, {}).get("p95_ms")
+        if before and after and after > before * (1 + max_regression):
+            regressions.append(f"{name} p95 {before}ms -> {after}ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=10, help="virtual users")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to run")
+    parser.add_argument("--iterations", type=int, default=0, help="stop each user after N iterations")
+    parser.add_argument("--ramp-up", type=float, default=2.0, help="seconds over which users start")
+    parser.add_argument("--think-time", type=float, default=0.0, help="pause between iterations")
+    parser.add_argument("--videos-per-analysis", type=int, default=3)
+    parser.add_argument("--distinct-queries", type=int, default=0,
+                        help="cycle through N queries (0: every search is new)")
+    parser.add_argument("--search-only", action="store_true")
+    parser.add_argument("--timeout", type=float, default=120.0, help="per-request timeout")
+    parser.add_argument("--url", help="drive an already running app instead of starting one")
+    parser.add_argument("--port", type=int, default=0, help="port for the app server")
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    parser.add_argument("--real-upstream", action="store_true",
+                        help="call the real YouTube and Gemini APIs (e.g. to record cassettes)")
+    parser.add_argument("--gemini-api-key", default=os.getenv("GEMINI_API_KEY", "fake-gemini-key"),
+                        help="key registered for virtual users (default $GEMINI_API_KEY)")
+    parser.add_argument("--output", help="result file (default benchmarks/results/loadtest-<time>.json)")
+    parser.add_argument("--baseline", help="previous result file to compare p95s against")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="allowed p95 slowdown versus the baseline, as a fraction")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    fakes = FakeServices(config=config_from_args(args)).start()
+    workdir = tempfile.mkdtemp(prefix="youinsight-loadtest-")
+    process = None
+    try:
+        if args.url:
+            base_url = args.url.rstrip("/")
+        else:
+            fake_env = {} if args.real_upstream else fakes.environment()
+            process, base_url = start_app(args, fake_env, workdir)
+        sampler = ProcessSampler(process.pid) if process else None
+
+        results = {name: [] for name in TIMINGS + ("search_source", "errors")}
+        lock = threading.Lock()
+        started = time.time()
+        stop_at = started + args.duration
+        users = [VirtualUser(i, base_url, args, stop_at, results, lock) for i in range(args.concurrency)]
+        if sampler:
+            sampler.start()
+        for user in users:
+            user.start()
+            time.sleep(args.ramp_up / max(1, args.concurrency))
+        for user in users:
+            user.join()
+        elapsed = time.time() - started
+        if sampler:
+            sampler.stop()
+    finally:
+        if process:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        fakes.stop()
+
+    sources = {}
+    for source in results["search_source"]:
+        sources[source] = sources.get(source, 0) + 1
+    report = {
+        "benchmark": "loadtest",
+        "created_at": datetime.utcnow().isoformat() + "Z",
+        "revision": _git_revision(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "elapsed_seconds": round(elapsed, 2),
+        "iterations": sum(user.iterations for user in users),
+        "timings": {name: summarize(results[name]) for name in TIMINGS},
+        "search_sources": sources,
+        "errors": {"count": len(results["errors"]), "samples": results["errors"][:20]},
+        "server": sampler.summary() if sampler else {"available": False},
+        "upstream_requests": fakes.requests,
+        "server_log": None if args.url else os.path.join(workdir, "server.log"),
+    }
+
+    output = args.output or os.path.join(
+        ROOT, "benchmarks", "results", f"loadtest-{datetime.utcnow():%Y%m%d-%H%M%S}.json"
+    )
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for name in TIMINGS:
+        timing = report["timings"][name]
+        print(f"{name:12} n={timing['count']:<5} p50={timing['p50_ms']}ms "
+              f"p95={timing['p95_ms']}ms p99={timing['p99_ms']}ms")
+    print(f"errors={report['errors']['count']} server={report['server']}")
+    print(f"Wrote {output}")
+
+    if args.baseline:
+        regressions = compare(report, args.baseline, args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
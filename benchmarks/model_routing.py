@@ -0,0 +1,114 @@
+"""Check which model tier each kind of analysis is routed to.
+
+Boots the app against the stand-in services, ingests a channel of
+--playlist-videos videos (standard digests off, so every prompt reaches
+Gemini) and runs, over /api/analyze:
+
+- a short question about one video;
+- "Summarize this video" for one video;
+- the same question over --many videos;
+- a request for a detailed comparison over --many videos;
+- an open-ended prompt over every video.
+
+Reports the tier, model, output cap, finish reason and timings the app
+logged for each, and the model the stand-in was asked for. The run passes
+when each analysis went to the model of the tier expected for it under the
+default MODEL_TIERS and every one left a routing log line.
+
+    python -m benchmarks.model_routing --playlist-videos 20
+"""
+import os
+import re
+import sys
+import json
+import sqlite3
+import argparse
+import tempfile
+
+from .fake_services import FakeServices, add_arguments, config_from_args
+from .loadtest import start_app
+from .digests import analyze
+from .playlist_sync import login, wait_for_sync
+
+ROUTE_LINE = re.compile(r"Model route (\{.*\})$", re.M)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--many", type=int, default=10, help="videos in the multi-video runs")
+    parser.add_argument("--timeout", type=float, default=600.0)
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    parser.add_argument("--real-upstream", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help="write the result as JSON to this file")
+    add_arguments(parser)
+    parser.set_defaults(playlist_videos=20)
+    args = parser.parse_args()
+
+    fakes = FakeServices(config=config_from_args(args)).start()
+    workdir = tempfile.mkdtemp(prefix="youinsight-routing-")
+    process = None
+    try:
+        process, base_url = start_app(args, dict(
+            fakes.environment(), BATCH_WORKER="0", WATCH_SCHEDULER="0", STATS_REFRESHER="0",
+            DIGEST_ON_INGEST="0",
+        ), workdir)
+        session = login(base_url)
+        response = session.post(f"{base_url}/api/playlists", json={"source": "@benchmark"}, timeout=60)
+        response.raise_for_status()
+        wait_for_sync(session, base_url, response.json()["id"], args.timeout)
+        with sqlite3.connect(os.path.join(workdir, "loadtest.db")) as conn:
+            video_ids = [row[0] for row in conn.execute("SELECT video_id FROM video ORDER BY id")]
+
+        url = f"https://www.youtube.com/watch?v={video_ids[0]}"
+        many = {"search_term": "benchmark", "video_ids": video_ids[:args.many]}
+        everything = {"search_term": "benchmark", "video_ids": video_ids}
+        plan = [
+            ("question_one", "quick", {"video_url": url, "prompt": "What tools does the speaker use?"}),
+            ("standard_one", "light", {"video_url": url, "prompt": "Summarize this video"}),
+            ("question_many", "standard", dict(many, prompt="What tools do the speakers use?")),
+            ("report_many", "report", dict(many, prompt="Write a detailed comparison of these videos")),
+            ("general_all", "standard", dict(everything, prompt="Rank these videos by how practical they are")),
+        ]
+        runs = {}
+        for name, expected, payload in plan:
+            models_before = dict(fakes.models)
+            run = analyze(fakes, session, base_url, payload, args.timeout)
+            run["expected_tier"] = expected
+            run["requested_models"] = [model for model, count in fakes.models.items()
+                                       if count != models_before.get(model, 0)]
+            runs[name] = run
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+        fakes.stop()
+
+    with open(os.path.join(workdir, "server.log")) as f:
+        decisions = [json.loads(line) for line in ROUTE_LINE.findall(f.read())]
+    # Runs are sequential, so the log lines are in the same order
+    for run, decision in zip(runs.values(), decisions):
+        run["route"] = decision
+
+    from youinsight.model_router import DEFAULT_MODEL_TIERS
+    tier_models = {tier["name"]: tier["model"] for tier in DEFAULT_MODEL_TIERS}
+    report = {
+        "benchmark": "model_routing",
+        "videos": len(video_ids),
+        "runs": runs,
+        "logs": workdir,
+    }
+    report["passed"] = len(decisions) == len(runs) and all(
+        run["route"]["tier"] == run["expected_tier"]
+        and run["requested_models"] == [tier_models[run["expected_tier"]]]
+        for run in runs.values()
+    )
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    sys.exit(0 if report["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Drain the email outbox against the SMTP stand-in and report delivery stats.
+
+Queues --emails password reset emails, then runs the outbox worker's batches
+until nothing is due, against a fake SMTP server with optional latency and
+injected temporary failures. Reports sent/failed counts, attempts, SMTP
+connections opened (pooling keeps this near --pool-size) and throughput.
+
+    python -m benchmarks.outbox --emails 200 --failure-rate 0.1
+"""
+import os
+import json
+import time
+import argparse
+import tempfile
+
+from .fake_smtp import FakeSMTPServer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--emails", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--pool-size", type=int, default=2)
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="SMTP per-command latency")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--max-attempts", type=int, default=5)
+    parser.add_argument("--output", help="write the result as JSON to this file")
+    args = parser.parse_args()
+
+    smtp = FakeSMTPServer(latency_ms=args.latency_ms, failure_rate=args.failure_rate).start()
+    workdir = tempfile.mkdtemp(prefix="youinsight-outbox-")
+    os.environ.update(smtp.environment())
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'outbox.db')}",
+        "CACHE_PATH": os.path.join(workdir, "cache.sqlite"),
+        "DB_CREATE_ALL": "1",
+        "EMAIL_OUTBOX_WORKER": "0",
+        "EMAIL_MAX_ATTEMPTS": str(args.max_attempts),
+        # Retry immediately so the run measures delivery, not backoff
+        "EMAIL_RETRY_BASE_SECONDS": "0",
+    })
+
+    from youinsight import create_app, db
+    from youinsight.email_service import OutboxWorker, send_reset_email
+    from youinsight.models import EmailOutbox
+
+    app = create_app()
+    with app.test_request_context():
+        started = time.perf_counter()
+        for i in range(args.emails):
+            send_reset_email(f"user{i}@example.com", f"https://example.com/reset-password/token{i}")
+        queued = time.perf_counter() - started
+
+        worker = OutboxWorker(app, batch_size=args.batch_size, pool_size=args.pool_size)
+        batches = 0
+        started = time.perf_counter()
+        while worker.process_batch():
+            batches += 1
+        elapsed = time.perf_counter() - started
+
+        statuses = dict(
+            db.session.query(EmailOutbox.status, db.func.count()).group_by(EmailOutbox.status).all()
+        )
+        attempts = db.session.query(db.func.sum(EmailOutbox.attempts)).scalar() or 0
+
+    result = {
+        "benchmark": "outbox",
+        "emails": args.emails,
+        "queue_ms_per_email": round(queued / args.emails * 1000, 3),
+        "batches": batches,
+        "elapsed_seconds": round(elapsed, 3),
+        "emails_per_second": round(statuses.get("sent", 0) / elapsed, 1) if elapsed else None,
+        "statuses": statuses,
+        "attempts": attempts,
+        "smtp": smtp.counts,
+    }
+    smtp.shutdown()
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
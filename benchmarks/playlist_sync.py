@@ -0,0 +1,130 @@
+"""Ingest a channel, then sync it again unchanged and after new uploads.
+
+Boots the app against the stand-in services, adds a channel of
+--playlist-videos videos through /api/playlists and waits for the sync to
+finish. It then syncs again with nothing new, "uploads" --new-videos more
+videos and syncs a third time. Reports the Data API calls and quota units
+each sync used next to what finding the same videos with search.list would
+have cost. The run passes when every video lands in the library exactly once,
+the unchanged sync costs a single call and the last sync fetches only the
+new videos.
+
+    python -m benchmarks.playlist_sync --playlist-videos 500 --new-videos 7
+"""
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+import requests
+
+from .fake_services import FakeServices, add_arguments, config_from_args
+from .loadtest import start_app
+
+# What the app's search path pays for every 50 videos it finds
+SEARCH_UNITS_PER_50 = 100 + 1
+
+
+def login(base_url):
+    session = requests.Session()
+    credentials = {"email": "playlist@example.com", "password": "playlist-password"}
+    session.post(f"{base_url}/register", data=dict(
+        credentials, username="playlist", gemini_api_key="fake-gemini-key"), allow_redirects=False)
+    session.post(f"{base_url}/login", data=credentials, allow_redirects=False)
+    if "session" not in session.cookies:
+        raise RuntimeError("Login failed")
+    return session
+
+
+def wait_for_sync(session, base_url, sync_id, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        sync = session.get(f"{base_url}/api/playlists/{sync_id}", timeout=30).json()
+        if sync["status"] != "syncing":
+            return sync
+        time.sleep(0.2)
+    raise RuntimeError(f"Sync {sync_id} did not finish within {timeout}s")
+
+
+def measure(fakes, run):
+    """Run one sync and count the upstream calls it made."""
+    before = dict(fakes.requests)
+    started = time.perf_counter()
+    sync = run()
+    elapsed = time.perf_counter() - started
+    calls = {path.rsplit("/", 1)[-1]: count - before.get(path, 0)
+             for path, count in fakes.requests.items() if count != before.get(path, 0)}
+    return {
+        "new_videos": sync["last_new_videos"],
+        "quota_units": sync["last_quota_units"],
+        "search_quota_units": -(-sync["last_new_videos"] // 50) * SEARCH_UNITS_PER_50,
+        "calls": calls,
+        "elapsed_s": round(elapsed, 2),
+        "status": sync["status"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--new-videos", type=int, default=7, help="videos uploaded before the last sync")
+    parser.add_argument("--timeout", type=float, default=600.0)
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    parser.add_argument("--real-upstream", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help="write the result as JSON to this file")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    fakes = FakeServices(config=config_from_args(args)).start()
+    workdir = tempfile.mkdtemp(prefix="youinsight-playlist-")
+    process = None
+    try:
+        process, base_url = start_app(args, dict(fakes.environment(), BATCH_WORKER="0"), workdir)
+        session = login(base_url)
+
+        def add():
+            response = session.post(f"{base_url}/api/playlists", json={"source": "@benchmark"}, timeout=60)
+            response.raise_for_status()
+            return wait_for_sync(session, base_url, response.json()["id"], args.timeout)
+
+        initial = measure(fakes, add)
+        sync_id = session.get(f"{base_url}/api/playlists", timeout=30).json()["playlists"][0]["id"]
+
+        def resync():
+            session.post(f"{base_url}/api/playlists/{sync_id}/sync", timeout=60).raise_for_status()
+            return wait_for_sync(session, base_url, sync_id, args.timeout)
+
+        unchanged = measure(fakes, resync)
+        fakes.config.playlist_videos += args.new_videos
+        incremental = measure(fakes, resync)
+        final = session.get(f"{base_url}/api/playlists/{sync_id}", timeout=30).json()
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+        fakes.stop()
+
+    report = {
+        "benchmark": "playlist_sync",
+        "playlist_videos": args.playlist_videos,
+        "syncs": {"initial": initial, "unchanged": unchanged, "incremental": incremental},
+        "video_count": final["video_count"],
+        "logs": workdir,
+    }
+    report["passed"] = (
+        initial["status"] == unchanged["status"] == incremental["status"] == "idle"
+        and initial["new_videos"] == args.playlist_videos
+        and unchanged["new_videos"] == 0 and unchanged["quota_units"] == 1
+        and incremental["new_videos"] == args.new_videos
+        and final["video_count"] == args.playlist_videos + args.new_videos
+    )
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    sys.exit(0 if report["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Check the rate limiter stays correct when several processes share one backend.
+
+Starts --processes workers that hammer the same few buckets for --duration
+seconds through the chosen backend, then compares the total number of allowed
+hits with what a single token bucket permits (capacity + rate * duration).
+Also reports checks per second and, for the memory backend, that idle buckets
+are dropped once refilled.
+
+    python -m benchmarks.rate_limit --backend sqlite --processes 4
+    python -m benchmarks.rate_limit --backend redis   # against benchmarks.fake_redis
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import multiprocessing
+
+from youinsight.rate_limit import Limit, MemoryBackend, RateLimiter, create_backend
+
+
+def _worker(spec, path, limit, keys, start_at, duration, results):
+    limiter = RateLimiter(create_backend(spec, path), {"free": {"bench": limit}})
+    allowed = checks = 0
+    # Start together so the run matches one window of `duration` seconds
+    time.sleep(max(0.0, start_at - time.time()))
+    deadline = start_at + duration
+    while time.time() < deadline:
+        for key in range(keys):
+            checks += 1
+            if limiter.hit("bench", f"user:{key}").allowed:
+                allowed += 1
+    results.put((allowed, checks))
+
+
+def _idle_expiry():
+    """Buckets for callers that went quiet are gone once they would be full."""
+    backend = MemoryBackend()
+    limiter = RateLimiter(backend, {"free": {"bench": Limit(1, 0.2)}})
+    for caller in range(1000):
+        limiter.hit("bench", f"user:{caller}")
+    held = len(backend)
+    time.sleep(0.25)
+    limiter.hit("bench", "user:active")
+    return {"buckets_after_burst": held, "buckets_after_idle": len(backend)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", choices=("memory", "sqlite", "redis"), default="sqlite")
+    parser.add_argument("--redis-url", help="use this server instead of starting the stand-in")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--keys", type=int, default=4, help="distinct callers sharing the load")
+    parser.add_argument("--limit", default="50/2", help='per-caller limit, e.g. "50/2" is 50 per 2 seconds')
+    parser.add_argument("--duration", type=float, default=3.0)
+    parser.add_argument("--tolerance", type=float, default=0.05, help="allowed relative error")
+    parser.add_argument("--output", help="write the result as JSON to this file")
+    args = parser.parse_args()
+
+    limit = Limit.parse(args.limit)
+    fake = None
+    path = os.path.join(tempfile.mkdtemp(prefix="youinsight-ratelimit-"), "ratelimit.sqlite")
+    spec = args.backend
+    if args.backend == "redis":
+        if args.redis_url:
+            spec = args.redis_url
+        else:
+            from .fake_redis import FakeRedisServer
+
+            fake = FakeRedisServer().start()
+            spec = fake.url
+    processes = 1 if args.backend == "memory" else args.processes
+
+    results = multiprocessing.Queue()
+    start_at = time.time() + 2.0
+    workers = [
+        multiprocessing.Process(
+            target=_worker, args=(spec, path, limit, args.keys, start_at, args.duration, results)
+        )
+        for _ in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    totals = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+
+    allowed = sum(allowed for allowed, _ in totals)
+    checks = sum(checks for _, checks in totals)
+    expected = args.keys * (limit.capacity + limit.rate * args.duration)
+    error = abs(allowed - expected) / expected
+    result = {
+        "benchmark": "rate_limit",
+        "backend": args.backend,
+        "processes": processes,
+        "keys": args.keys,
+        "limit": args.limit,
+        "duration_seconds": args.duration,
+        "checks": checks,
+        "checks_per_second": round(checks / args.duration, 1),
+        "allowed": allowed,
+        "expected_allowed": round(expected, 1),
+        "relative_error": round(error, 4),
+    }
+    if fake is not None:
+        result["redis"] = fake.counts
+        fake.shutdown()
+    if args.backend == "memory":
+        result["idle_expiry"] = _idle_expiry()
+    result["passed"] = error <= args.tolerance and (
+        args.backend != "memory" or result["idle_expiry"]["buckets_after_idle"] == 1
+    )
+
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    sys.exit(0 if result["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Measure how long the app takes to import, boot and serve its first requests.
+
+- imports: `import youinsight` and create_app() in a fresh interpreter,
+  median of --runs, and which of the heavy client libraries (see
+  youinsight/warmup.py) that left imported;
+- boot: main.py against the stand-in services, from spawn until it listens,
+  then the first page request and the first two analyses over /api/analyze
+  (each of a different video). Measured with WARMUP off and on.
+
+The run passes when importing the app leaves every heavy client library
+unimported and, with WARMUP=1, the first analysis takes at most --max-warm-ratio
+times as long as the second.
+
+    python -m benchmarks.startup --runs 5
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+from .fake_services import FakeServices, add_arguments, config_from_args, _video_ids
+from .loadtest import ROOT, start_app, migrate_database
+from .digests import analyze
+from .playlist_sync import login
+
+WORKERS_OFF = {worker: "0" for worker in (
+    "EMAIL_OUTBOX_WORKER", "BATCH_WORKER", "WATCH_SCHEDULER", "DIGEST_WORKER", "STATS_REFRESHER")}
+
+IMPORT_SNIPPET = """
+import sys, time, json
+started = time.perf_counter()
+import youinsight
+imported = time.perf_counter()
+app = youinsight.create_app()
+created = time.perf_counter()
+from youinsight.warmup import HEAVY_MODULES
+print(json.dumps({
+    "import_s": imported - started,
+    "create_app_s": created - imported,
+    "heavy_modules": [name for name in HEAVY_MODULES if name in sys.modules],
+}))
+"""
+
+
+def measure_imports(runs, env):
+    results = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=ROOT, env=env,
+                                check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return {
+        "runs": runs,
+        "import_ms": round(statistics.median(r["import_s"] for r in results) * 1000, 1),
+        "create_app_ms": round(statistics.median(r["create_app_s"] for r in results) * 1000, 1),
+        "heavy_modules_imported": sorted({name for r in results for name in r["heavy_modules"]}),
+    }
+
+
+def measure_boot(args, fakes, warmup):
+    workdir = tempfile.mkdtemp(prefix="youinsight-startup-")
+    process = None
+    try:
+        env = dict(fakes.environment(), WARMUP="1" if warmup else "0", DIGEST_ON_INGEST="0", **WORKERS_OFF)
+        migrate_database(dict(os.environ, **env, DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'loadtest.db')}",
+                              CACHE_PATH=os.path.join(workdir, "cache.sqlite")))
+        started = time.perf_counter()
+        process, base_url = start_app(args, env, workdir, migrate=False)
+        listening = time.perf_counter()
+        session = login(base_url)
+        started_request = time.perf_counter()
+        session.get(f"{base_url}/profile", timeout=60).raise_for_status()
+        first_request = time.perf_counter() - started_request
+        analyses = []
+        for video_id in _video_ids("startup", 2):
+            payload = {"video_url": f"https://www.youtube.com/watch?v={video_id}",
+                       "prompt": "What does the speaker talk about?"}
+            analyses.append(analyze(fakes, session, base_url, payload, args.timeout))
+        return {
+            "warmup": warmup,
+            "spawn_to_listen_ms": round((listening - started) * 1000, 1),
+            "first_request_ms": round(first_request * 1000, 1),
+            "first_analysis_ms": analyses[0]["total_ms"],
+            "second_analysis_ms": analyses[1]["total_ms"],
+        }
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters to time imports in")
+    parser.add_argument("--max-warm-ratio", type=float, default=1.5)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    parser.add_argument("--real-upstream", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help="write the result as JSON to this file")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="youinsight-imports-")
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'imports.db')}",
+               CACHE_PATH=os.path.join(workdir, "cache.sqlite"), **WORKERS_OFF)
+    migrate_database(env)
+    imports = measure_imports(args.runs, env)
+
+    fakes = FakeServices(config=config_from_args(args)).start()
+    try:
+        cold = measure_boot(args, fakes, warmup=False)
+        warm = measure_boot(args, fakes, warmup=True)
+    finally:
+        fakes.stop()
+
+    report = {"benchmark": "startup", "imports": imports, "boot": {"cold": cold, "warmup": warm}}
+    report["passed"] = (
+        not imports["heavy_modules_imported"]
+        and warm["first_analysis_ms"] <= args.max_warm_ratio * warm["second_analysis_ms"]
+    )
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    sys.exit(0 if report["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""Check that search results say which videos have transcripts, and that the
+analysis path skips the ones that do not without asking YouTube again.
+
+Boots the app against the stand-in services with --no-transcript-rate of the
+videos lacking captions, then over one Socket.IO connection:
+
+1. searches, waits for the transcript_availability event that follows the
+   results, and checks every result's availability against the stand-in's
+   captions;
+2. analyzes all results, which must reuse the transcript lists the probes
+   fetched rather than load any watch page again;
+3. analyzes only the videos without transcripts, which must fail without any
+   watch page fetch;
+4. repeats the search, which must be answered without probing again.
+
+    python -m benchmarks.transcript_availability --results 20 --no-transcript-rate 0.4
+"""
+import sys
+import json
+import time
+import queue
+import argparse
+import tempfile
+
+import requests
+import socketio
+
+from .fake_services import FakeServices, add_arguments, config_from_args, has_transcript
+from .loadtest import start_app
+
+
+def login(base_url):
+    session = requests.Session()
+    credentials = {"email": "captions@example.com", "password": "captions-password"}
+    session.post(f"{base_url}/register", data=dict(
+        credentials, username="captions", gemini_api_key="fake-gemini-key"), allow_redirects=False)
+    session.post(f"{base_url}/login", data=credentials, allow_redirects=False)
+    if "session" not in session.cookies:
+        raise RuntimeError("Login failed")
+    return "; ".join(f"{name}={value}" for name, value in session.cookies.items())
+
+
+class Client:
+    def __init__(self, base_url, cookie, timeout):
+        self.events = queue.Queue()
+        self.timeout = timeout
+        self.sio = socketio.Client(reconnection=False)
+        for name in ("search_results", "transcript_availability", "analysis_complete", "error"):
+            self.sio.on(name, lambda data=None, name=name: self.events.put((name, data)))
+        self.sio.connect(base_url, headers={"Cookie": cookie}, wait_timeout=timeout)
+
+    def call(self, event, payload, wanted):
+        """Emit `event` (unless None) and wait for one of the `wanted` events."""
+        if event is not None:
+            self.sio.emit(event, payload)
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            try:
+                name, data = self.events.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if name in wanted:
+                return name, data
+        raise TimeoutError(f"No {'/'.join(wanted)} after {event}")
+
+
+def watch_pages(fakes, before):
+    return fakes.requests.get("/watch", 0) - before.get("/watch", 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    parser.add_argument("--real-upstream", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help="write the result as JSON to this file")
+    add_arguments(parser)
+    parser.set_defaults(results=20, no_transcript_rate=0.4)
+    args = parser.parse_args()
+
+    fakes = FakeServices(config=config_from_args(args)).start()
+    workdir = tempfile.mkdtemp(prefix="youinsight-captions-")
+    process = None
+    query = "transcript availability"
+    try:
+        process, base_url = start_app(args, dict(fakes.environment(), BATCH_WORKER="0", WATCH_SCHEDULER="0"), workdir)
+        client = Client(base_url, login(base_url), args.timeout)
+
+        before = dict(fakes.requests)
+        started = time.perf_counter()
+        _, data = client.call("search_videos", {"query": query}, {"search_results", "error"})
+        results_ms = round((time.perf_counter() - started) * 1000, 1)
+        videos = data["videos"]
+        if any(v.get("transcript_available") is None for v in videos):
+            _, availability = client.call(None, None, {"transcript_availability"})
+            videos = [dict(v, transcript_available=availability["videos"][v["video_id"]]["available"])
+                      if v["video_id"] in availability["videos"] else v for v in videos]
+        availability_ms = round((time.perf_counter() - started) * 1000, 1)
+        search_probes = watch_pages(fakes, before)
+        wrong = [v["video_id"] for v in videos
+                 if v.get("transcript_available") != has_transcript(v["video_id"], args.no_transcript_rate)]
+        with_transcript = [v["video_id"] for v in videos if v.get("transcript_available")]
+        without = [v["video_id"] for v in videos if v.get("transcript_available") is False]
+
+        before = dict(fakes.requests)
+        name, _ = client.call("analyze_videos", {
+            "search_term": query, "video_ids": [v["video_id"] for v in videos],
+            "prompt": "Summarize.", "is_new_conversation": True,
+        }, {"analysis_complete", "error"})
+        analyze_all = {"outcome": name, "watch_pages": watch_pages(fakes, before)}
+
+        before = dict(fakes.requests)
+        name, data = client.call("analyze_videos", {
+            "search_term": query, "video_ids": without, "prompt": "Summarize.", "is_new_conversation": True,
+        }, {"analysis_complete", "error"})
+        analyze_missing = {"outcome": name, "message": (data or {}).get("message"),
+                           "watch_pages": watch_pages(fakes, before)}
+
+        before = dict(fakes.requests)
+        _, data = client.call("search_videos", {"query": query}, {"search_results", "error"})
+        repeat_search = {"source": data.get("source"), "watch_pages": watch_pages(fakes, before),
+                         "annotated": all("transcript_available" in v for v in data["videos"])}
+        client.sio.disconnect()
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+        fakes.stop()
+
+    report = {
+        "benchmark": "transcript_availability",
+        "results": len(videos),
+        "with_transcript": len(with_transcript),
+        "without_transcript": len(without),
+        "misreported": wrong,
+        "search_probes": search_probes,
+        "search_results_ms": results_ms,
+        "availability_ms": availability_ms,
+        "analyze_all": analyze_all,
+        "analyze_missing": analyze_missing,
+        "repeat_search": repeat_search,
+        "logs": workdir,
+    }
+    report["passed"] = (
+        not wrong and without
+        and analyze_all["outcome"] == "analysis_complete"
+        and analyze_all["watch_pages"] == 0
+        and analyze_missing["outcome"] == "error" and analyze_missing["watch_pages"] == 0
+        and repeat_search["watch_pages"] == 0 and repeat_search["annotated"]
+    )
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    sys.exit(0 if report["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
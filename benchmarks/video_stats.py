@@ -0,0 +1,144 @@
+"""Refresh the view counts of a library in the background and count the calls.
+
+Boots the app against the stand-in services with a short statistics max age,
+ingests a channel of --playlist-videos videos and lets the refresher run
+three passes over them: the first after ingest, the second with nothing
+changed and the third after --view-growth-rate of the videos gained views.
+Reports the videos.list calls and quota units of each pass and how many rows
+were written. The run passes when every pass costs one call per 50 videos,
+the unchanged pass is answered entirely by 304s and writes nothing, the last
+pass writes only the videos that changed, and the stored view counts match
+the stand-in's.
+
+    python -m benchmarks.video_stats --playlist-videos 1000 --view-growth-rate 0.1
+"""
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import tempfile
+
+import requests
+
+from .fake_services import FakeServices, add_arguments, config_from_args, _grows
+from .loadtest import start_app
+from .playlist_sync import login, wait_for_sync
+
+REFRESHED = re.compile(r'^youinsight_video_stats_refreshed_total\{result="(\w+)"\} ([0-9.e+]+)$', re.M)
+UNITS = re.compile(r"^youinsight_video_stats_quota_units_total ([0-9.e+]+)$", re.M)
+
+
+def refresh_counters(base_url):
+    text = requests.get(f"{base_url}/metrics", timeout=30).text
+    counts = {result: int(float(value)) for result, value in REFRESHED.findall(text)}
+    units = UNITS.search(text)
+    counts["quota_units"] = int(float(units.group(1))) if units else 0
+    return counts
+
+
+def measure_pass(fakes, base_url, videos, timeout):
+    """Wait until the refresher has checked `videos` more videos; what that took."""
+    before, calls_before = refresh_counters(base_url), fakes.requests.get("/youtube/v3/videos", 0)
+    started = time.perf_counter()
+    deadline = time.monotonic() + timeout
+    while True:
+        after = refresh_counters(base_url)
+        delta = {key: after.get(key, 0) - before.get(key, 0) for key in set(after) | set(before)}
+        if sum(value for key, value in delta.items() if key != "quota_units") >= videos:
+            break
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Refresher checked {delta} of {videos} videos within {timeout}s")
+        time.sleep(0.05)
+    return {
+        "videos_list_calls": fakes.requests.get("/youtube/v3/videos", 0) - calls_before,
+        "quota_units": delta.get("quota_units", 0),
+        "updated": delta.get("updated", 0),
+        "unchanged": delta.get("unchanged", 0),
+        "not_modified": delta.get("not_modified", 0),
+        "missing": delta.get("missing", 0),
+        "elapsed_s": round(time.perf_counter() - started, 2),
+    }
+
+
+def expected_views(video_id, config):
+    views = int(video_id[:6], 16)
+    if _grows(video_id, config.view_growth_rate):
+        views += config.stats_epoch * 1000
+    return views
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--max-age", type=float, default=5.0, help="seconds before statistics are stale")
+    parser.add_argument("--budget", default="100000/day", help="STATS_UNIT_BUDGET for the run")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    parser.add_argument("--real-upstream", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help="write the result as JSON to this file")
+    add_arguments(parser)
+    parser.set_defaults(view_growth_rate=0.1, latency_ms=20.0, jitter_ms=5.0)
+    args = parser.parse_args()
+
+    fakes = FakeServices(config=config_from_args(args)).start()
+    workdir = tempfile.mkdtemp(prefix="youinsight-stats-")
+    process = None
+    total = args.playlist_videos
+    try:
+        process, base_url = start_app(args, dict(
+            fakes.environment(),
+            BATCH_WORKER="0",
+            WATCH_SCHEDULER="0",
+            STATS_MAX_AGE_SECONDS=str(int(args.max_age)),
+            STATS_POLL_SECONDS="0.2",
+            STATS_UNIT_BUDGET=args.budget,
+        ), workdir)
+        session = login(base_url)
+        response = session.post(f"{base_url}/api/playlists", json={"source": "@benchmark"}, timeout=60)
+        response.raise_for_status()
+        wait_for_sync(session, base_url, response.json()["id"], args.timeout)
+
+        initial = measure_pass(fakes, base_url, total, args.timeout)
+        unchanged = measure_pass(fakes, base_url, total, args.timeout)
+        # Views grow before the next pass starts: its videos are not stale for max-age seconds yet
+        fakes.config.stats_epoch += 1
+        grown = measure_pass(fakes, base_url, total, args.timeout)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+        fakes.stop()
+
+    with sqlite3.connect(os.path.join(workdir, "loadtest.db")) as conn:
+        rows = conn.execute("SELECT video_id, view_count FROM video").fetchall()
+    stale = [video_id for video_id, views in rows if views != expected_views(video_id, fakes.config)]
+    growers = sum(1 for video_id, _ in rows if _grows(video_id, args.view_growth_rate))
+    calls_per_pass = -(-total // 50)
+
+    report = {
+        "benchmark": "video_stats",
+        "videos": total,
+        "changed_videos": growers,
+        "passes": {"initial": initial, "unchanged": unchanged, "grown": grown},
+        "stale_view_counts": len(stale),
+        "logs": workdir,
+    }
+    report["passed"] = (
+        len(rows) == total and not stale
+        and all(p["videos_list_calls"] == calls_per_pass for p in (initial, unchanged, grown))
+        and initial["updated"] == total
+        and unchanged["not_modified"] == total and unchanged["updated"] == 0
+        and grown["updated"] == growers
+    )
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    sys.exit(0 if report["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
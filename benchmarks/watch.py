@@ -0,0 +1,130 @@
+"""Run a watch query three times and check each run only analyzes what is new.
+
+Boots the app against the stand-in services with --initial-results search
+results, saves a watch query, which runs right away, runs it again with nothing new,
+then lets the search return --new-videos more results and runs it a third
+time. Reports the transcript and Gemini calls of each run. The run passes
+when the unchanged run makes no transcript or Gemini calls and the last run
+fetches transcripts only for the new videos and analyzes them in one call.
+
+    python -m benchmarks.watch --initial-results 10 --new-videos 3
+"""
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+import requests
+
+from .fake_services import FakeServices, add_arguments, config_from_args
+from .loadtest import start_app
+
+
+def login(base_url):
+    session = requests.Session()
+    credentials = {"email": "watch@example.com", "password": "watch-password"}
+    session.post(f"{base_url}/register", data=dict(
+        credentials, username="watch", gemini_api_key="fake-gemini-key"), allow_redirects=False)
+    session.post(f"{base_url}/login", data=credentials, allow_redirects=False)
+    if "session" not in session.cookies:
+        raise RuntimeError("Login failed")
+    return session
+
+
+def run_once(fakes, session, base_url, watch_id, timeout, calls_before=None):
+    """Wait for a run and count the upstream calls it made.
+
+    Without `calls_before` the run is triggered here; otherwise it is the one
+    a new watch query gets right away, and the calls are counted from then.
+    """
+    last_run_at = last_error = None
+    if calls_before is None:
+        watch = session.get(f"{base_url}/api/watches/{watch_id}", timeout=30).json()
+        last_run_at, last_error = watch["last_run_at"], watch["last_error"]
+        calls_before = dict(fakes.requests)
+        session.post(f"{base_url}/api/watches/{watch_id}/run", timeout=30).raise_for_status()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        watch = session.get(f"{base_url}/api/watches/{watch_id}", timeout=30).json()
+        # A failed run leaves last_run_at alone and records its error
+        if watch["last_run_at"] and watch["last_run_at"] != last_run_at:
+            break
+        if watch["last_error"] and watch["last_error"] != last_error:
+            break
+        time.sleep(0.2)
+    else:
+        raise RuntimeError(f"Watch query {watch_id} did not run within {timeout}s")
+    calls = {path.rsplit("/", 1)[-1]: count - calls_before.get(path, 0)
+             for path, count in fakes.requests.items() if count != calls_before.get(path, 0)}
+    return {
+        "new_videos": watch["last_new_videos"],
+        "transcripts": calls.get("timedtext", 0),
+        "gemini_calls": calls.get("streamGenerateContent", 0) + calls.get("generateContent", 0),
+        "analysis_id": watch["last_analysis_id"],
+        "error": watch["last_error"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--initial-results", type=int, default=10, help="search results on the first run")
+    parser.add_argument("--new-videos", type=int, default=3, help="results added before the last run")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    parser.add_argument("--real-upstream", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help="write the result as JSON to this file")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    config = config_from_args(args)
+    config.results = args.initial_results
+    fakes = FakeServices(config=config).start()
+    workdir = tempfile.mkdtemp(prefix="youinsight-watch-")
+    process = None
+    try:
+        # Digests would add Gemini calls of their own to the counts
+        env = dict(fakes.environment(), BATCH_WORKER="0", WATCH_POLL_SECONDS="1", DIGEST_ON_INGEST="0")
+        process, base_url = start_app(args, env, workdir)
+        session = login(base_url)
+        calls_before = dict(fakes.requests)
+        response = session.post(f"{base_url}/api/watches", json={
+            "search_term": "watch benchmark",
+            "prompt": "What is new about this topic?",
+            "max_results": args.initial_results + args.new_videos,
+        }, timeout=30)
+        response.raise_for_status()
+        watch_id = response.json()["id"]
+
+        first = run_once(fakes, session, base_url, watch_id, args.timeout, calls_before)
+        unchanged = run_once(fakes, session, base_url, watch_id, args.timeout)
+        fakes.config.results += args.new_videos
+        incremental = run_once(fakes, session, base_url, watch_id, args.timeout)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+        fakes.stop()
+
+    report = {
+        "benchmark": "watch",
+        "runs": {"first": first, "unchanged": unchanged, "incremental": incremental},
+        "logs": workdir,
+    }
+    report["passed"] = (
+        first["new_videos"] == args.initial_results and first["gemini_calls"] == 1
+        and unchanged["new_videos"] == 0 and unchanged["transcripts"] == 0 and unchanged["gemini_calls"] == 0
+        and incremental["new_videos"] == args.new_videos
+        and incremental["transcripts"] == args.new_videos and incremental["gemini_calls"] == 1
+        and not any(run["error"] for run in (first, unchanged, incremental))
+    )
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    sys.exit(0 if report["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Compare the default JSON Socket.IO wire format with msgpack.
+
+Encodes representative payloads, a 20-video search_results and a stream of
+analysis_chunk events, with python-socketio's JSON and msgpack packet classes
+and reports per message:
+
+- bytes on the wire as a WebSocket frame and in a long-polling response
+  (where binary packets are base64-encoded);
+- bytes after permessage-deflate, with the compression context kept across
+  messages (the default eventlet negotiates) and reset for every message;
+- server CPU to encode, and to encode and deflate, in microseconds.
+
+msgpack mostly saves CPU: every packet carries its type/data/nsp keys, so
+small chunks come out larger than JSON, and after deflate the two are within
+a few percent. Compression is what shrinks the wire.
+
+    python -m benchmarks.wire_format --chunks 200
+"""
+import sys
+import json
+import time
+import zlib
+import base64
+import argparse
+
+from socketio import packet
+from socketio.msgpack_packet import MsgPackPacket
+
+from .fake_services import _video_ids, _words
+
+FORMATS = {"json": packet.Packet, "msgpack": MsgPackPacket}
+
+
+def search_results(query, count):
+    videos = []
+    for i, video_id in enumerate(_video_ids(query, count)):
+        videos.append({
+            "video_id": video_id,
+            "title": _words(f"title-{video_id}", 60).capitalize(),
+            "url": f"https://www.youtube.com/watch?v={video_id}",
+            "view_count": 1000 + i * 7919,
+            "thumbnail_url": f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg",
+            "channel_title": _words(f"channel-{video_id}", 16).title(),
+            "published_at": f"2024-0{1 + i % 9}-1{i % 10}T12:00:00Z",
+        })
+    return {"videos": videos, "source": "youtube"}
+
+
+def analysis_chunks(count, chars):
+    return [{"chunk": _words(f"chunk-{i}", chars) + " "} for i in range(count)]
+
+
+def websocket_frame(encoded):
+    """Engine.IO message as sent in one WebSocket frame."""
+    if isinstance(encoded, bytes):
+        return encoded
+    return ("4" + encoded).encode()
+
+
+def polling_body(encoded):
+    """Engine.IO message as sent in a long-polling response."""
+    if isinstance(encoded, bytes):
+        return b"b" + base64.b64encode(encoded)
+    return ("4" + encoded).encode()
+
+
+def deflate(frames, context_takeover):
+    """Sizes of `frames` compressed as permessage-deflate would."""
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    sizes = []
+    for frame in frames:
+        if not context_takeover:
+            compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        data = compressor.compress(frame) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        # The trailing empty block is stripped from each message
+        sizes.append(len(data) - 4)
+    return sizes
+
+
+def measure(packet_class, event, payloads, repeat):
+    encode = lambda data: packet_class(packet.EVENT, data=[event, data], namespace="/").encode()
+
+    encoded = [encode(data) for data in payloads]
+    frames = [websocket_frame(e) for e in encoded]
+    # The client must decode exactly what the server sent
+    for e, data in zip(encoded, payloads):
+        assert packet_class(encoded_packet=e).data == [event, data]
+
+    started = time.process_time()
+    for _ in range(repeat):
+        for data in payloads:
+            encode(data)
+    encode_us = (time.process_time() - started) / (repeat * len(payloads)) * 1e6
+
+    started = time.process_time()
+    for _ in range(repeat):
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        for data in payloads:
+            frame = websocket_frame(encode(data))
+            compressor.compress(frame) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    deflate_us = (time.process_time() - started) / (repeat * len(payloads)) * 1e6
+
+    count = len(payloads)
+    return {
+        "websocket_bytes": round(sum(len(f) for f in frames) / count, 1),
+        "polling_bytes": round(sum(len(polling_body(e)) for e in encoded) / count, 1),
+        "deflate_bytes": round(sum(deflate(frames, True)) / count, 1),
+        "deflate_no_context_bytes": round(sum(deflate(frames, False)) / count, 1),
+        "encode_us": round(encode_us, 1),
+        "encode_deflate_us": round(deflate_us, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--videos", type=int, default=20, help="videos in search_results")
+    parser.add_argument("--chunks", type=int, default=200, help="analysis_chunk events")
+    parser.add_argument("--chunk-chars", type=int, default=80, help="text per analysis chunk")
+    parser.add_argument("--repeat", type=int, default=200, help="timing repetitions")
+    parser.add_argument("--output", help="write the result as JSON to this file")
+    args = parser.parse_args()
+
+    workloads = {
+        "search_results": ("search_results", [search_results("wire format", args.videos)]),
+        "analysis_chunk": ("analysis_chunk", analysis_chunks(args.chunks, args.chunk_chars)),
+    }
+    result = {"benchmark": "wire_format", "workloads": {}}
+    for name, (event, payloads) in workloads.items():
+        repeat = max(1, args.repeat * args.chunks // len(payloads) // 10)
+        measured = {fmt: measure(cls, event, payloads, repeat) for fmt, cls in FORMATS.items()}
+        measured["msgpack_vs_json_websocket"] = round(
+            measured["msgpack"]["websocket_bytes"] / measured["json"]["websocket_bytes"], 3)
+        measured["msgpack_vs_json_deflate"] = round(
+            measured["msgpack"]["deflate_bytes"] / measured["json"]["deflate_bytes"], 3)
+        result["workloads"][name] = measured
+
+    # Negotiated compression should at least halve what goes on the wire
+    result["passed"] = all(
+        w[fmt]["deflate_bytes"] * 2 <= w[fmt]["websocket_bytes"]
+        for w in result["workloads"].values() for fmt in FORMATS
+    )
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    sys.exit(0 if result["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""gunicorn settings for production:
+
+    gunicorn -c gunicorn.conf.py main:app
+
+WEB_CONCURRENCY sets the number of eventlet worker processes. With more than
+one, the workers must share a Socket.IO message queue (SOCKETIO_MESSAGE_QUEUE)
+and browsers must use WebSockets (SOCKETIO_TRANSPORT=websocket). gunicorn hands
+each HTTP request to whichever worker accepts it, so long-polling sessions,
+which span many requests, cannot stay on one worker. To keep long polling,
+run several single-worker instances behind a load balancer with sticky
+sessions instead (see the README).
+
+Each worker is warmed up before it takes traffic (WARMUP=0 turns this off), and
+PRELOAD_LIBRARIES=1 imports the heavy client libraries once in the master (see
+youinsight/warmup.py). The background workers start in each worker process
+after warm-up.
+"""
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5001')}"
+worker_class = "eventlet"
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+# Concurrent connections (sockets, streams) per worker
+worker_connections = int(os.getenv("WORKER_CONNECTIONS", "1000"))
+timeout = 120
+graceful_timeout = 30
+# Workers import the app themselves, after eventlet has patched the standard library
+preload_app = False
+accesslog = "-"
+
+
+def on_starting(server):
+    if os.getenv("PRELOAD_LIBRARIES", "0") == "1":
+        from youinsight.warmup import preload
+        preload()
+    if workers <= 1:
+        return
+    if not os.getenv("SOCKETIO_MESSAGE_QUEUE"):
+        raise RuntimeError(
+            "WEB_CONCURRENCY > 1 needs SOCKETIO_MESSAGE_QUEUE so emits reach clients on other workers"
+        )
+    if os.getenv("SOCKETIO_TRANSPORT", "polling") != "websocket":
+        raise RuntimeError(
+            "WEB_CONCURRENCY > 1 needs SOCKETIO_TRANSPORT=websocket: gunicorn cannot keep a "
+            "long-polling session on one worker. Use sticky sessions across single-worker "
+            "instances to keep long polling."
+        )
+
+
+def post_worker_init(worker):
+    # The worker has patched the standard library and loaded the app by now
+    if os.getenv("WARMUP", "1") != "0":
+        from youinsight.warmup import warmup
+        warmup(worker.wsgi)
+    # Background workers run in the server processes only, not in flask CLI commands
+    from youinsight import start_workers
+    start_workers(worker.wsgi)
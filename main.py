@@ -1,5 +1,14 @@
 #!/usr/bin/env python3
+# Patch the standard library before anything imports socket, ssl or threading,
+# so HTTP clients and sleeps yield to other greenlets instead of blocking the hub.
+# Only when serving: the flask CLI imports Flask before this module, and
+# gunicorn's eventlet worker patches by itself.
+import eventlet
+if __name__ == '__main__':
+    eventlet.monkey_patch()
+
 import os
+import sys
 from dotenv import load_dotenv
 
 # Load environment variables before importing app
@@ -7,17 +16,16 @@ load_dotenv()
 
 # Make sure environment variables are set
 if not os.getenv('YOUTUBE_API_KEY'):
-    print('Warning: YOUTUBE_API_KEY environment variable not set')
+    print('Warning: YOUTUBE_API_KEY environment variable not set', file=sys.stderr)
 if not os.getenv('SECRET_KEY'):
-    print('Warning: SECRET_KEY environment variable not set, using development key')
+    print('Warning: SECRET_KEY environment variable not set, using development key', file=sys.stderr)
 
 # Import application parts - we do this after loading environment variables
-from youinsight import create_app, socketio
+from youinsight import create_app, socketio, start_workers
 
 # Create the Flask application
 app = create_app()
 
-import eventlet
 import eventlet.wsgi
 
 if __name__ == '__main__':
@@ -25,4 +33,9 @@ if __name__ == '__main__':
     print('Starting YouInsight server with Eventlet...') 
     # Set Flask app debug mode explicitly if needed, e.g., app.debug = True, if not already set in create_app()
     # Note: Eventlet doesn't use Werkzeug's reloader, so debug=True from socketio.run is not directly applicable for auto-reloading.
-    eventlet.wsgi.server(eventlet.listen(('0.0.0.0', 5001)), app)
+    port = int(os.getenv('PORT', 5001))
+    from youinsight.warmup import WARMUP, warmup
+    if WARMUP:
+        warmup(app)
+    start_workers(app)
+    eventlet.wsgi.server(eventlet.listen(('0.0.0.0', port)), app)
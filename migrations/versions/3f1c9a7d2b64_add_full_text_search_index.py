@@ -0,0 +1,80 @@
+"""Add full-text search index over analyses and videos
+
+Revision ID: 3f1c9a7d2b64
+Revises: e5a70a4bd6b5
+Create Date: 2026-10-19 09:12:41.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c9a7d2b64'
+down_revision = 'e5a70a4bd6b5'
+branch_labels = None
+depends_on = None
+
+
+MESSAGES_TEXT = """coalesce((SELECT group_concat(json_extract(value, '$.content'), char(10))
+    FROM json_each(CASE WHEN json_valid({row}.messages) THEN {row}.messages ELSE '[]' END)), '')"""
+
+ANALYSIS_VALUES = """{row}.id, 'u' || {row}.user_id, {row}.prompt, coalesce({row}.result, ''),
+    """ + MESSAGES_TEXT + """, coalesce({row}.search_term, '')"""
+
+VIDEO_VALUES = """{row}.id, {row}.title, coalesce({row}.transcript, '')"""
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    op.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS analysis_fts USING fts5(
+        owner, prompt, result, messages, search_term,
+        tokenize='porter unicode61', prefix='2 3 4')""")
+    op.execute("""CREATE TRIGGER IF NOT EXISTS analysis_fts_ai AFTER INSERT ON analysis BEGIN
+        INSERT INTO analysis_fts(rowid, owner, prompt, result, messages, search_term)
+        VALUES (""" + ANALYSIS_VALUES.format(row='new') + """);
+    END""")
+    op.execute("""CREATE TRIGGER IF NOT EXISTS analysis_fts_au
+        AFTER UPDATE OF user_id, prompt, result, messages, search_term ON analysis BEGIN
+        DELETE FROM analysis_fts WHERE rowid = old.id;
+        INSERT INTO analysis_fts(rowid, owner, prompt, result, messages, search_term)
+        VALUES (""" + ANALYSIS_VALUES.format(row='new') + """);
+    END""")
+    op.execute("""CREATE TRIGGER IF NOT EXISTS analysis_fts_ad AFTER DELETE ON analysis BEGIN
+        DELETE FROM analysis_fts WHERE rowid = old.id;
+    END""")
+    op.execute("""INSERT INTO analysis_fts(rowid, owner, prompt, result, messages, search_term)
+        SELECT """ + ANALYSIS_VALUES.format(row='analysis') + """ FROM analysis
+        WHERE analysis.id NOT IN (SELECT rowid FROM analysis_fts)""")
+
+    op.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS video_fts USING fts5(
+        title, transcript,
+        tokenize='porter unicode61', prefix='2 3 4')""")
+    op.execute("""CREATE TRIGGER IF NOT EXISTS video_fts_ai AFTER INSERT ON video BEGIN
+        INSERT INTO video_fts(rowid, title, transcript)
+        VALUES (""" + VIDEO_VALUES.format(row='new') + """);
+    END""")
+    op.execute("""CREATE TRIGGER IF NOT EXISTS video_fts_au AFTER UPDATE OF title, transcript ON video BEGIN
+        DELETE FROM video_fts WHERE rowid = old.id;
+        INSERT INTO video_fts(rowid, title, transcript)
+        VALUES (""" + VIDEO_VALUES.format(row='new') + """);
+    END""")
+    op.execute("""CREATE TRIGGER IF NOT EXISTS video_fts_ad AFTER DELETE ON video BEGIN
+        DELETE FROM video_fts WHERE rowid = old.id;
+    END""")
+    op.execute("""INSERT INTO video_fts(rowid, title, transcript)
+        SELECT """ + VIDEO_VALUES.format(row='video') + """ FROM video
+        WHERE video.id NOT IN (SELECT rowid FROM video_fts)""")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    for trigger in ('analysis_fts_ai', 'analysis_fts_au', 'analysis_fts_ad',
+                    'video_fts_ai', 'video_fts_au', 'video_fts_ad'):
+        op.execute('DROP TRIGGER IF EXISTS {}'.format(trigger))
+    op.execute('DROP TABLE IF EXISTS video_fts')
+    op.execute('DROP TABLE IF EXISTS analysis_fts')
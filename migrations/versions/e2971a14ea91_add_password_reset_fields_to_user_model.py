@@ -1,7 +1,7 @@
 """Add password reset fields to User model
 
 Revision ID: e2971a14ea91
-Revises: 
+Revises: 0a4d7f2c9e13
 Create Date: 2025-05-06 10:56:54.560835
 
 """
@@ -11,7 +11,7 @@ import sqlalchemy as sa
 
 # revision identifiers, used by Alembic.
 revision = 'e2971a14ea91'
-down_revision = None
+down_revision = '0a4d7f2c9e13'
 branch_labels = None
 depends_on = None
 
@@ -0,0 +1,221 @@
+/**
+ * Socket.IO parser for the msgpack wire format (SOCKETIO_SERIALIZER=msgpack).
+ *
+ * Each Socket.IO packet travels as one binary msgpack map with the keys
+ * type, nsp, data and id, the layout python-socketio's MsgPackPacket uses.
+ * Pass it to the client as io({ parser: msgpackParser }).
+ */
+(function (root) {
+    'use strict';
+
+    const textEncoder = new TextEncoder();
+    const textDecoder = new TextDecoder();
+
+    // Encoding
+
+    function encodeValue(value, out) {
+        if (value === null || value === undefined) {
+            out.push(0xc0);
+        } else if (value === false || value === true) {
+            out.push(value ? 0xc3 : 0xc2);
+        } else if (typeof value === 'number') {
+            encodeNumber(value, out);
+        } else if (typeof value === 'string') {
+            const bytes = textEncoder.encode(value);
+            const n = bytes.length;
+            if (n < 32) out.push(0xa0 | n);
+            else if (n < 0x100) out.push(0xd9, n);
+            else if (n < 0x10000) out.push(0xda, n >> 8, n & 0xff);
+            else out.push(0xdb, n >>> 24, (n >> 16) & 0xff, (n >> 8) & 0xff, n & 0xff);
+            for (let i = 0; i < n; i++) out.push(bytes[i]);
+        } else if (value instanceof ArrayBuffer || ArrayBuffer.isView(value)) {
+            const bytes = value instanceof ArrayBuffer
+                ? new Uint8Array(value)
+                : new Uint8Array(value.buffer, value.byteOffset, value.byteLength);
+            const n = bytes.length;
+            if (n < 0x100) out.push(0xc4, n);
+            else if (n < 0x10000) out.push(0xc5, n >> 8, n & 0xff);
+            else out.push(0xc6, n >>> 24, (n >> 16) & 0xff, (n >> 8) & 0xff, n & 0xff);
+            for (let i = 0; i < n; i++) out.push(bytes[i]);
+        } else if (Array.isArray(value)) {
+            encodeLength(value.length, 0x90, 0xdc, out);
+            value.forEach(item => encodeValue(item, out));
+        } else if (typeof value === 'object') {
+            const keys = Object.keys(value).filter(key => value[key] !== undefined);
+            encodeLength(keys.length, 0x80, 0xde, out);
+            keys.forEach(key => {
+                encodeValue(key, out);
+                encodeValue(value[key], out);
+            });
+        } else {
+            throw new Error('Cannot encode ' + typeof value + ' as msgpack');
+        }
+    }
+
+    function encodeLength(n, fix, marker16, out) {
+        if (n < 16) out.push(fix | n);
+        else if (n < 0x10000) out.push(marker16, n >> 8, n & 0xff);
+        else out.push(marker16 + 1, n >>> 24, (n >> 16) & 0xff, (n >> 8) & 0xff, n & 0xff);
+    }
+
+    function encodeNumber(value, out) {
+        if (Number.isInteger(value) && value >= -0x80000000 && value <= 0xffffffff) {
+            if (value >= 0 && value < 0x80) out.push(value);
+            else if (value < 0 && value >= -32) out.push(value & 0xff);
+            else if (value >= 0) out.push(0xce, value >>> 24, (value >> 16) & 0xff, (value >> 8) & 0xff, value & 0xff);
+            else out.push(0xd2, (value >> 24) & 0xff, (value >> 16) & 0xff, (value >> 8) & 0xff, value & 0xff);
+            return;
+        }
+        const view = new DataView(new ArrayBuffer(8));
+        view.setFloat64(0, value);
+        out.push(0xcb);
+        for (let i = 0; i < 8; i++) out.push(view.getUint8(i));
+    }
+
+    function encode(value) {
+        const out = [];
+        encodeValue(value, out);
+        return new Uint8Array(out);
+    }
+
+    // Decoding
+
+    function decode(buffer) {
+        const bytes = buffer instanceof ArrayBuffer
+            ? new Uint8Array(buffer)
+            : new Uint8Array(buffer.buffer, buffer.byteOffset, buffer.byteLength);
+        const view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+        let offset = 0;
+
+        function str(n) {
+            const value = textDecoder.decode(bytes.subarray(offset, offset + n));
+            offset += n;
+            return value;
+        }
+        function bin(n) {
+            const value = bytes.slice(offset, offset + n).buffer;
+            offset += n;
+            return value;
+        }
+        function array(n) {
+            const value = new Array(n);
+            for (let i = 0; i < n; i++) value[i] = read();
+            return value;
+        }
+        function map(n) {
+            const value = {};
+            for (let i = 0; i < n; i++) {
+                const key = read();
+                value[key] = read();
+            }
+            return value;
+        }
+        function uint(size) {
+            let value;
+            if (size === 1) value = view.getUint8(offset);
+            else if (size === 2) value = view.getUint16(offset);
+            else if (size === 4) value = view.getUint32(offset);
+            else value = Number(view.getBigUint64(offset));
+            offset += size;
+            return value;
+        }
+        function int(size) {
+            let value;
+            if (size === 1) value = view.getInt8(offset);
+            else if (size === 2) value = view.getInt16(offset);
+            else if (size === 4) value = view.getInt32(offset);
+            else value = Number(view.getBigInt64(offset));
+            offset += size;
+            return value;
+        }
+        function read() {
+            const byte = bytes[offset++];
+            if (byte < 0x80) return byte;
+            if (byte < 0x90) return map(byte & 0x0f);
+            if (byte < 0xa0) return array(byte & 0x0f);
+            if (byte < 0xc0) return str(byte & 0x1f);
+            if (byte >= 0xe0) return byte - 0x100;
+            switch (byte) {
+                case 0xc0: return null;
+                case 0xc2: return false;
+                case 0xc3: return true;
+                case 0xc4: return bin(uint(1));
+                case 0xc5: return bin(uint(2));
+                case 0xc6: return bin(uint(4));
+                case 0xca: { const value = view.getFloat32(offset); offset += 4; return value; }
+                case 0xcb: { const value = view.getFloat64(offset); offset += 8; return value; }
+                case 0xcc: return uint(1);
+                case 0xcd: return uint(2);
+                case 0xce: return uint(4);
+                case 0xcf: return uint(8);
+                case 0xd0: return int(1);
+                case 0xd1: return int(2);
+                case 0xd2: return int(4);
+                case 0xd3: return int(8);
+                case 0xd9: return str(uint(1));
+                case 0xda: return str(uint(2));
+                case 0xdb: return str(uint(4));
+                case 0xdc: return array(uint(2));
+                case 0xdd: return array(uint(4));
+                case 0xde: return map(uint(2));
+                case 0xdf: return map(uint(4));
+                default: throw new Error('Unsupported msgpack type 0x' + byte.toString(16));
+            }
+        }
+
+        const value = read();
+        if (offset !== bytes.length) throw new Error('Trailing bytes after msgpack value');
+        return value;
+    }
+
+    // Socket.IO parser interface
+
+    class Encoder {
+        encode(packet) {
+            return [encode(packet)];
+        }
+    }
+
+    class Decoder {
+        constructor() {
+            this.listeners = {};
+        }
+        on(event, listener) {
+            (this.listeners[event] = this.listeners[event] || []).push(listener);
+            return this;
+        }
+        off(event, listener) {
+            if (!event) {
+                this.listeners = {};
+            } else if (!listener) {
+                delete this.listeners[event];
+            } else if (this.listeners[event]) {
+                this.listeners[event] = this.listeners[event].filter(l => l !== listener);
+            }
+            return this;
+        }
+        emit(event, value) {
+            (this.listeners[event] || []).slice().forEach(listener => listener(value));
+            return this;
+        }
+        add(chunk) {
+            if (typeof chunk === 'string') {
+                throw new Error('Expected a binary msgpack packet, got text');
+            }
+            const packet = decode(chunk);
+            if (typeof packet !== 'object' || packet === null || typeof packet.type !== 'number' ||
+                typeof packet.nsp !== 'string') {
+                throw new Error('Invalid Socket.IO packet');
+            }
+            this.emit('decoded', packet);
+        }
+        destroy() {}
+    }
+
+    const parser = { protocol: 5, Encoder, Decoder, encode, decode };
+    if (typeof module !== 'undefined' && module.exports) {
+        module.exports = parser;
+    } else {
+        root.msgpackParser = parser;
+    }
+})(typeof self !== 'undefined' ? self : this);
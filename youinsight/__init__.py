@@ -1,18 +1,36 @@
 import os
+import logging
 from flask import Flask
 from flask_socketio import SocketIO
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager
 from flask_caching import Cache
+from .rate_limit import RateLimiter
 
 # Initialize extensions
 db = SQLAlchemy()
 migrate = Migrate()
-# Use threading mode instead of eventlet to be compatible with Python 3.12
+# Runs on eventlet; main.py monkey-patches the standard library and blocking
+# calls that cannot be patched go through youinsight.blocking
 socketio = SocketIO(async_mode='eventlet')
 login_manager = LoginManager()
 cache = Cache()
+limiter = RateLimiter()
+
+logger = logging.getLogger(__name__)
+
+def warn_if_unmigrated():
+    """Log a warning when the database has never been migrated."""
+    from sqlalchemy import inspect
+    try:
+        migrated = inspect(db.engine).has_table('alembic_version')
+    except Exception as e:
+        logger.warning(f"Could not check the database schema: {str(e)}")
+        return
+    if not migrated:
+        logger.warning("The database has no schema yet: run 'flask db upgrade' "
+                       "(or set DB_CREATE_ALL=1 for a throwaway database)")
 
 def create_app(testing=False):
     """Application factory function."""
@@ -25,16 +43,56 @@ def create_app(testing=False):
     app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///youinsight.db')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     
-    # Initialize cache
+    # Initialize cache: per-process LRU in front of a SQLite file shared by all workers
+    from .tiered_cache import load_namespace_ttls
     cache.init_app(app, config={
-        'CACHE_TYPE': 'simple',
-        'CACHE_DEFAULT_TIMEOUT': 3600  # 1 hour
+        'CACHE_TYPE': 'youinsight.tiered_cache.TieredCache',
+        'CACHE_DEFAULT_TIMEOUT': 3600,  # 1 hour
+        'CACHE_PATH': os.getenv('CACHE_PATH'),
+        'CACHE_MEMORY_LIMIT_BYTES': int(os.getenv('CACHE_MEMORY_LIMIT_BYTES', 64 * 1024 * 1024)),
+        'CACHE_MEMORY_MAX_AGE': int(os.getenv('CACHE_MEMORY_MAX_AGE', 60)),
+        'CACHE_DISK_LIMIT_BYTES': int(os.getenv('CACHE_DISK_LIMIT_BYTES', 512 * 1024 * 1024)),
+        'CACHE_NAMESPACE_TTLS': load_namespace_ttls(),
     })
     
+    # Token-bucket limits for the API and expensive socket events. "memory" is
+    # per process; "sqlite" shares buckets between workers on one host and a
+    # redis:// URL shares them across hosts.
+    app.config['RATE_LIMIT_BACKEND'] = os.getenv('RATE_LIMIT_BACKEND', 'memory')
+    app.config['RATE_LIMIT_PATH'] = os.getenv('RATE_LIMIT_PATH')
+    app.config['RATE_LIMITS'] = os.getenv('RATE_LIMITS')
+    limiter.init_app(app)
+    
+    # Latency metrics for DB commits and cache stats, served on /metrics
+    from .metrics import instrument_sqlalchemy, instrument_cache
+    instrument_sqlalchemy()
+    instrument_cache(cache)
+
     # Initialize extensions with app
     db.init_app(app)
     migrate.init_app(app, db)
-    socketio.init_app(app, cors_allowed_origins="*")
+    # Several worker processes share Socket.IO rooms and broadcasts through a
+    # message queue (SOCKETIO_MESSAGE_QUEUE, e.g. redis://host:6379/0); see
+    # gunicorn.conf.py. SOCKETIO_TRANSPORT picks the browser's transport.
+    app.config['SOCKETIO_TRANSPORT'] = os.getenv('SOCKETIO_TRANSPORT', 'polling')
+    socketio_options = {}
+    message_queue = os.getenv('SOCKETIO_MESSAGE_QUEUE')
+    if message_queue and message_queue.startswith(('redis://', 'rediss://', 'unix://')):
+        from .socket_queue import LocalFirstRedisManager
+        socketio_options['client_manager'] = LocalFirstRedisManager(
+            message_queue, channel=os.getenv('SOCKETIO_CHANNEL', 'youinsight')
+        )
+    elif message_queue:
+        socketio_options['message_queue'] = message_queue
+        socketio_options['channel'] = os.getenv('SOCKETIO_CHANNEL', 'youinsight')
+    # Opt-in compact wire format: SOCKETIO_SERIALIZER=msgpack sends every packet
+    # as binary msgpack, which the chat page decodes with static/js/msgpack-parser.js.
+    # Polling responses over SOCKETIO_COMPRESSION_THRESHOLD bytes are gzipped;
+    # WebSocket frames are deflated whenever the browser offers permessage-deflate.
+    app.config['SOCKETIO_SERIALIZER'] = os.getenv('SOCKETIO_SERIALIZER', 'default')
+    socketio_options['serializer'] = app.config['SOCKETIO_SERIALIZER']
+    socketio_options['compression_threshold'] = int(os.getenv('SOCKETIO_COMPRESSION_THRESHOLD', '1024'))
+    socketio.init_app(app, cors_allowed_origins="*", **socketio_options)
     login_manager.init_app(app)
     login_manager.login_view = 'main.login'
     
@@ -46,11 +104,55 @@ def create_app(testing=False):
         from .routes import main
         app.register_blueprint(main)
         
-        # Create database tables
-        db.create_all()
+        # The schema comes from migrations ('flask db upgrade'). Tests and
+        # throwaway databases can still have it created on boot.
+        if testing or os.getenv('DB_CREATE_ALL') == '1':
+            db.create_all()
+
+            # Full-text search tables and their sync triggers
+            from .search_index import ensure_search_index
+            ensure_search_index()
+        else:
+            warn_if_unmigrated()
         
         # Register socket events
         from .socket_events import register_socket_events
         register_socket_events()
-        
+
+    # flask export-history <user>
+    from .export import export_command
+    app.cli.add_command(export_command)
+
     return app
+
+
+def start_workers(app):
+    """Start the background workers that are switched on.
+
+    Only the server entrypoints (main.py and gunicorn's post_worker_init) call
+    this, so flask CLI commands and scripts that build an app start none.
+    """
+    # Deliver queued emails (password resets) in the background
+    if os.getenv('EMAIL_OUTBOX_WORKER', '1') != '0':
+        from .email_service import start_outbox_worker
+        start_outbox_worker(app)
+
+    # Analyze batch jobs, resuming any that were running when the last process stopped
+    if os.getenv('BATCH_WORKER', '1') != '0':
+        from .batch import start_batch_worker
+        start_batch_worker(app)
+
+    # Re-run saved watch queries over newly published videos
+    if os.getenv('WATCH_SCHEDULER', '1') != '0':
+        from .watch import start_watch_scheduler
+        start_watch_scheduler(app)
+
+    # Generate standard digests of newly stored transcripts when there is spare capacity
+    if os.getenv('DIGEST_WORKER', '1') != '0':
+        from .digests import start_digest_worker
+        start_digest_worker(app)
+
+    # Keep stored view counts current within a quota budget
+    if os.getenv('STATS_REFRESHER', '1') != '0':
+        from .video_stats import start_stats_refresher
+        start_stats_refresher(app)
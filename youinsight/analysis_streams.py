@@ -0,0 +1,140 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from . import socketio, db
+from .pipeline import run_analysis, answer_from_digest
+from .scheduler import scheduler, AnalysisRejected, Ticket
+from .metrics import AnalysisTracker
+
+logger = logging.getLogger(__name__)
+
+# Seconds a finished stream stays available for Last-Event-ID resume
+ANALYSIS_STREAM_TTL = float(os.getenv("ANALYSIS_STREAM_TTL", "300"))
+# Seconds between SSE keep-alive comments while no event arrives
+ANALYSIS_STREAM_KEEPALIVE = float(os.getenv("ANALYSIS_STREAM_KEEPALIVE", "15"))
+
+# Event ID, event name, payload
+Event = Tuple[int, str, dict]
+
+
+class AnalysisStream:
+    """Append-only log of one analysis' events, read by any number of HTTP responses.
+
+    The analysis runs in a background task that appends to the log, so a
+    client that drops the connection can reconnect with Last-Event-ID and
+    continue where it stopped while the analysis keeps going.
+    """
+
+    def __init__(self, stream_id: str, user_id: int):
+        self.id = stream_id
+        self.user_id = user_id
+        self.events: List[Event] = []
+        self.done = False
+        self.finished_at: Optional[float] = None
+        self._changed = threading.Condition()
+
+    def append(self, event: str, payload: dict) -> None:
+        with self._changed:
+            self.events.append((len(self.events) + 1, event, payload))
+            self._changed.notify_all()
+
+    def close(self) -> None:
+        with self._changed:
+            self.done = True
+            self.finished_at = time.monotonic()
+            self._changed.notify_all()
+
+    def follow(self, after: int = 0, keepalive: float = ANALYSIS_STREAM_KEEPALIVE) -> Iterator[Optional[Event]]:
+        """Yield the events after ID `after` as they arrive, until the stream is done.
+
+        Yields None whenever `keepalive` seconds pass without a new event.
+        """
+        position = max(0, after)
+        while True:
+            with self._changed:
+                if position >= len(self.events) and not self.done:
+                    self._changed.wait(keepalive)
+                batch = self.events[position:]
+                done = self.done
+            if not batch and not done:
+                yield None
+                continue
+            yield from batch
+            position += len(batch)
+            if done and position >= len(self.events):
+                return
+
+
+# stream ID -> stream
+_streams: Dict[str, AnalysisStream] = {}
+_lock = threading.Lock()
+
+
+def _prune(now: float) -> None:
+    for stream_id in [s.id for s in _streams.values() if s.done and now - s.finished_at > ANALYSIS_STREAM_TTL]:
+        del _streams[stream_id]
+
+
+def get_stream(stream_id: str, user_id: int) -> Optional[AnalysisStream]:
+    """The user's stream, or None if it is unknown, expired or someone else's."""
+    with _lock:
+        _prune(time.monotonic())
+        stream = _streams.get(stream_id)
+    if stream is None or stream.user_id != user_id:
+        return None
+    return stream
+
+
+def start_stream(app, identity, data: dict, weight: float = 1.0) -> AnalysisStream:
+    """Admit an analysis and start producing its events in the background.
+
+    Raises AnalysisRejected when the scheduler turns it away, before anything
+    is streamed, so the caller can answer with a plain error response.
+    """
+    stream = AnalysisStream(uuid.uuid4().hex, identity.id)
+    ticket = scheduler.submit(identity.id, f"stream:{stream.id}", weight)
+    with _lock:
+        _prune(time.monotonic())
+        _streams[stream.id] = stream
+    stream.append("analysis_stream", {"stream_id": stream.id})
+    socketio.start_background_task(_produce, app, stream, identity, data, ticket)
+    return stream
+
+
+def _produce(app, stream: AnalysisStream, identity, data: dict, ticket: Ticket) -> None:
+    def report_position(position, estimated_wait):
+        stream.append("analysis_queued", {"position": position, "estimated_wait": round(estimated_wait)})
+
+    with app.app_context():
+        try:
+            with AnalysisTracker() as tracker:
+                try:
+                    # Standard prompts answered from stored digests do not wait for the slot
+                    if not answer_from_digest(data, identity, stream.append, tracker):
+                        scheduler.wait(ticket, report_position)
+                        run_analysis(data, identity, stream.append, tracker)
+                finally:
+                    scheduler.release(ticket)
+        except AnalysisRejected as e:
+            stream.append("error", {"message": str(e), "reason": e.reason})
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Analysis stream {stream.id} failed: {str(e)}", exc_info=True)
+            stream.append("error", {"message": "An unexpected error occurred during the analysis."})
+        finally:
+            stream.close()
+
+
+def format_sse(event: Event) -> str:
+    event_id, name, payload = event
+    return f"id: {event_id}\nevent: {name}\ndata: {json.dumps(payload)}\n\n"
+
+
+def format_ndjson(event: Event) -> str:
+    event_id, name, payload = event
+    return json.dumps({"id": event_id, "event": name, "data": payload}) + "\n"
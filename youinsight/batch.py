@@ -0,0 +1,379 @@
+import os
+import csv
+import io
+import uuid
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import or_, and_
+
+from . import db
+from .models import BatchJob, BatchItem
+from .youtube_service import YouTubeService
+from .gemini_service import GeminiService
+from .identity import get_identity
+from .pipeline import load_video
+from .usage import record_usage
+from .metrics import BATCH_ITEMS, BATCH_ITEM_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Videos accepted in one batch job
+BATCH_MAX_VIDEOS = int(os.getenv('BATCH_MAX_VIDEOS', '5000'))
+# Jobs a user may have running at once
+BATCH_MAX_ACTIVE_PER_USER = int(os.getenv('BATCH_MAX_ACTIVE_PER_USER', '3'))
+# Videos analyzed at once by each process, across all jobs
+BATCH_WORKERS = int(os.getenv('BATCH_WORKERS', '4'))
+BATCH_MAX_ATTEMPTS = int(os.getenv('BATCH_MAX_ATTEMPTS', '3'))
+BATCH_RETRY_BASE_SECONDS = float(os.getenv('BATCH_RETRY_BASE_SECONDS', '10'))
+BATCH_POLL_SECONDS = float(os.getenv('BATCH_POLL_SECONDS', '5'))
+# How long a claimed item may stay 'running' before another worker takes it
+# over, e.g. after the process analyzing it crashed. The worker renews it every
+# third of that while the analysis runs.
+BATCH_LEASE_SECONDS = int(os.getenv('BATCH_LEASE_SECONDS', '180'))
+# Window the throughput behind the ETA is measured over
+THROUGHPUT_WINDOW_SECONDS = 300
+
+RESULT_FIELDS = (
+    'seq', 'position', 'video_id', 'title', 'status', 'result', 'error',
+    'model_name', 'input_tokens', 'output_tokens', 'duration_ms',
+)
+
+
+class BatchError(Exception):
+    """A batch could not be created; the message is meant for the user."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def create_job(user_id: int, prompt: str, video_ids: Iterable[str]) -> BatchJob:
+    """Store a running job with one pending item per distinct video ID."""
+    video_ids = list(dict.fromkeys(str(v).strip() for v in video_ids if v))
+    if not prompt:
+        raise BatchError('Prompt is required')
+    if not video_ids:
+        raise BatchError('No videos to analyze')
+    if len(video_ids) > BATCH_MAX_VIDEOS:
+        raise BatchError(f'A batch can have at most {BATCH_MAX_VIDEOS} videos')
+    active = BatchJob.query.filter_by(user_id=user_id, status='running').count()
+    if active >= BATCH_MAX_ACTIVE_PER_USER:
+        raise BatchError(
+            f'You already have {active} batches running. Wait for one to finish or cancel it.', status=429
+        )
+
+    job = BatchJob(user_id=user_id, prompt=prompt, total=len(video_ids))
+    db.session.add(job)
+    db.session.flush()
+    db.session.execute(BatchItem.__table__.insert(), [
+        {'job_id': job.id, 'position': position, 'video_id': video_id, 'status': 'pending', 'attempts': 0}
+        for position, video_id in enumerate(video_ids)
+    ])
+    db.session.commit()
+    if _worker is not None:
+        _worker.wake()
+    return job
+
+
+def cancel_job(job: BatchJob) -> None:
+    """Stop handing out the job's items; items already being analyzed still finish."""
+    if job.status != 'running':
+        return
+    BatchItem.query.filter_by(job_id=job.id, status='pending').update(
+        {'status': 'cancelled'}, synchronize_session=False
+    )
+    job.status = 'cancelled'
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+
+
+def job_progress(job: BatchJob) -> Dict[str, Any]:
+    """Counts, recent throughput and the estimated time left."""
+    end = job.finished_at or datetime.utcnow()
+    remaining = job.total - job.processed
+    window = min(THROUGHPUT_WINDOW_SECONDS, max((end - job.created_at).total_seconds(), 1.0))
+    recent = BatchItem.query.filter(
+        BatchItem.job_id == job.id,
+        BatchItem.finished_at >= end - timedelta(seconds=window),
+    ).count()
+    per_second = recent / window
+    return {
+        'id': job.id,
+        'status': job.status,
+        'prompt': job.prompt,
+        'total': job.total,
+        'processed': job.processed,
+        'succeeded': job.processed - job.failed,
+        'failed': job.failed,
+        'created_at': job.created_at.isoformat(),
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'throughput_per_minute': round(per_second * 60, 2),
+        'eta_seconds': (
+            round(remaining / per_second) if job.status == 'running' and per_second > 0 else None
+        ),
+    }
+
+
+def result_row(item: BatchItem) -> Dict[str, Any]:
+    return {field: getattr(item, field) for field in RESULT_FIELDS}
+
+
+def csv_line(values: List[Any]) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(values)
+    return buffer.getvalue()
+
+
+def follow_results(job_id: int, after: int = 0, page_size: int = 200) -> Iterable[Optional[Dict[str, Any]]]:
+    """Yield finished items as rows, in completion order, after seq `after`.
+
+    Keeps polling while the job runs and yields None between polls with
+    nothing new, so the caller can keep the connection alive.
+    """
+    cursor = after
+    while True:
+        # Read the status first: once it is final, every finished item has its seq
+        status = db.session.query(BatchJob.status).filter_by(id=job_id).scalar()
+        items = (
+            BatchItem.query.filter(BatchItem.job_id == job_id, BatchItem.seq > cursor)
+            .order_by(BatchItem.seq).limit(page_size).all()
+        )
+        rows = [result_row(item) for item in items]
+        # End the read transaction so workers' commits are visible to the next poll
+        db.session.rollback()
+        for row in rows:
+            cursor = row['seq']
+            yield row
+        if len(rows) == page_size:
+            continue
+        if status != 'running':
+            return
+        yield None
+        _results_changed.wait(BATCH_POLL_SECONDS)
+
+
+# Set whenever this process finishes an item, so result streams poll early
+_results_changed = threading.Event()
+
+
+class BatchWorker:
+    """
+    Analyzes pending batch items with a pool of background tasks.
+
+    Each task claims one item at a time, taking running jobs in turn so a
+    large job does not hold up the ones created after it. A claim is a lease:
+    if the process dies, the item is taken over once the lease expires, and
+    finished items are never redone, so a job picks up where it stopped.
+    """
+
+    def __init__(self, app, workers: int = BATCH_WORKERS):
+        self.app = app
+        self.workers = workers
+        self.worker_id = uuid.uuid4().hex
+        self._wake = threading.Event()
+        self._last_job_id = 0
+
+    def wake(self):
+        self._wake.set()
+
+    def run(self):
+        """Loop forever; meant to run as a background task."""
+        while True:
+            try:
+                with self.app.app_context():
+                    processed = self.process_next()
+            except Exception as e:
+                logger.error(f"Batch worker error: {str(e)}", exc_info=True)
+                processed = False
+            if not processed:
+                self._wake.wait(BATCH_POLL_SECONDS)
+                self._wake.clear()
+
+    def _claim(self, now: datetime) -> Optional[BatchItem]:
+        """Atomically take the next due item, from the job after the last one served."""
+        due = or_(
+            and_(BatchItem.status == 'pending', or_(
+                BatchItem.lease_expires_at.is_(None), BatchItem.lease_expires_at <= now,
+            )),
+            and_(BatchItem.status == 'running', BatchItem.lease_expires_at <= now),
+        )
+        job_ids = [row.id for row in BatchJob.query.with_entities(BatchJob.id).filter_by(status='running')
+                   .order_by(BatchJob.id)]
+        # Round robin over running jobs
+        job_ids = [j for j in job_ids if j > self._last_job_id] + [j for j in job_ids if j <= self._last_job_id]
+        for job_id in job_ids:
+            item = BatchItem.query.filter(BatchItem.job_id == job_id, due).order_by(BatchItem.position).first()
+            if item is None:
+                continue
+            claim = uuid.uuid4().hex
+            claimed = BatchItem.query.filter(
+                BatchItem.id == item.id, BatchItem.status == item.status, due,
+            ).update({
+                'status': 'running',
+                'claimed_by': claim,
+                'attempts': BatchItem.attempts + 1,
+                'lease_expires_at': now + timedelta(seconds=BATCH_LEASE_SECONDS),
+            }, synchronize_session=False)
+            db.session.commit()
+            self._last_job_id = job_id
+            if claimed:
+                return BatchItem.query.filter_by(id=item.id, claimed_by=claim).first()
+        return None
+
+    def _analyze(self, item: BatchItem) -> Optional[Dict[str, Any]]:
+        """Run the job's prompt over the item's video and set the outcome on the item.
+
+        Returns the Gemini usage to record, if it was called.
+        """
+        job = item.job
+        identity = get_identity(job.user_id)
+        if identity is None:
+            raise RuntimeError(f"User {job.user_id} no longer exists")
+
+        yt_service = YouTubeService(os.getenv('YOUTUBE_API_KEY'))
+        video = load_video(yt_service, item.video_id, job.user_id)
+        if video is None:
+            item.status, item.error = 'failed', 'Video not found'
+            return None
+        video = {'title': video.title, 'url': video.url, 'transcript': video.transcript}
+        if not video['transcript']:
+            item.title = video['title']
+            item.status, item.error = 'failed', 'Transcript not available for this video'
+            return None
+
+        # Nothing on the item changes until Gemini is done, so no write
+        # transaction (and, on SQLite, no database lock) is held meanwhile
+        gemini_service = GeminiService(identity.gemini_api_key)
+        result = ''.join(gemini_service.stream_analysis(job.prompt, [video], interactive=False))
+        usage = gemini_service.last_usage or {}
+        if usage.get('outcome') == 'error':
+            raise RuntimeError(result)
+        item.title = video['title']
+        item.status, item.result, item.error = 'done', result, None
+        return usage
+
+    def process_next(self) -> bool:
+        """Analyze one item; False when there was nothing to do."""
+        item = self._claim(datetime.utcnow())
+        if item is None:
+            return False
+
+        claim = item.claimed_by
+        started = datetime.utcnow()
+        try:
+            with self._lease_renewed(item.id, claim):
+                usage = self._analyze(item)
+        except Exception as e:
+            db.session.rollback()
+            item = db.session.get(BatchItem, item.id)
+            if not self._release(item, claim):
+                return True
+            if item.attempts < BATCH_MAX_ATTEMPTS:
+                item.status = 'pending'
+                item.lease_expires_at = datetime.utcnow() + timedelta(
+                    seconds=BATCH_RETRY_BASE_SECONDS * 2 ** (item.attempts - 1)
+                )
+                item.error = str(e)[:500]
+                db.session.commit()
+                logger.warning(f"Batch item {item.id} attempt {item.attempts} failed, will retry: {str(e)}")
+                BATCH_ITEMS.inc(outcome='retried')
+                return True
+            item.status, item.error = 'failed', str(e)[:500]
+            logger.error(f"Giving up on batch item {item.id} after {item.attempts} attempts: {str(e)}")
+        else:
+            if not self._release(item, claim):
+                return True
+            record_usage(item, usage, user_id=item.job.user_id)
+
+        self._finish(item, started)
+        return True
+
+    @contextmanager
+    def _lease_renewed(self, item_id: int, claim: str):
+        """Keep extending the item's lease from another task while the block runs."""
+        done = threading.Event()
+        threading.Thread(target=self._renew_lease, args=(item_id, claim, done), daemon=True).start()
+        try:
+            yield
+        finally:
+            done.set()
+
+    def _renew_lease(self, item_id: int, claim: str, done: threading.Event) -> None:
+        with self.app.app_context():
+            while not done.wait(BATCH_LEASE_SECONDS / 3):
+                try:
+                    renewed = BatchItem.query.filter(
+                        BatchItem.id == item_id, BatchItem.claimed_by == claim, BatchItem.status == 'running',
+                    ).update({
+                        'lease_expires_at': datetime.utcnow() + timedelta(seconds=BATCH_LEASE_SECONDS),
+                    }, synchronize_session=False)
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    logger.warning(f"Could not renew the lease on batch item {item_id}: {str(e)}")
+                    continue
+                if not renewed:
+                    return
+
+    def _release(self, item: BatchItem, claim: str) -> bool:
+        """Start writing the item's outcome if it is still ours.
+
+        The lease is renewed while Gemini runs, but can still run out, e.g.
+        when renewals fail, and the item be claimed again by another worker.
+        Then the outcome is dropped and False returned, so the item is
+        finished only once.
+        """
+        # Checked before the outcome set on the item is flushed; the UPDATE
+        # holds the row until the caller commits
+        with db.session.no_autoflush:
+            kept = BatchItem.query.filter(
+                BatchItem.id == item.id, BatchItem.claimed_by == claim, BatchItem.status == 'running',
+            ).update({'lease_expires_at': None}, synchronize_session=False)
+        if kept:
+            return True
+        db.session.rollback()
+        logger.warning(f"Lease on batch item {item.id} ran out before it finished; dropping this outcome")
+        BATCH_ITEMS.inc(outcome='dropped')
+        return False
+
+    def _finish(self, item: BatchItem, started: datetime) -> None:
+        """Count the item on its job and give it the next seq, in one transaction."""
+        failed = item.status == 'failed'
+        BatchJob.query.filter_by(id=item.job_id).update({
+            'processed': BatchJob.processed + 1,
+            'failed': BatchJob.failed + (1 if failed else 0),
+        }, synchronize_session=False)
+        job = db.session.query(BatchJob.processed, BatchJob.total, BatchJob.status).filter_by(id=item.job_id).one()
+        item.seq = job.processed
+        item.finished_at = datetime.utcnow()
+        item.lease_expires_at = None
+        if job.processed >= job.total and job.status == 'running':
+            BatchJob.query.filter_by(id=item.job_id).update(
+                {'status': 'completed', 'finished_at': item.finished_at}, synchronize_session=False
+            )
+        db.session.commit()
+        _results_changed.set()
+        _results_changed.clear()
+        BATCH_ITEMS.inc(outcome='failed' if failed else 'done')
+        BATCH_ITEM_SECONDS.observe((item.finished_at - started).total_seconds())
+
+
+_worker = None
+
+
+def start_batch_worker(app, workers: int = BATCH_WORKERS):
+    """Start this process's batch worker pool as Socket.IO background tasks."""
+    global _worker
+    if _worker is not None:
+        return _worker
+    from . import socketio
+
+    _worker = BatchWorker(app, workers)
+    for _ in range(workers):
+        socketio.start_background_task(_worker.run)
+    logger.info(f"Batch worker started with {workers} tasks")
+    return _worker
@@ -0,0 +1,60 @@
+import os
+import logging
+from typing import Any, Callable, Iterator, TypeVar
+
+import eventlet.patcher
+from eventlet import tpool
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Native threads available to blocking calls. A streaming call holds one for
+# every chunk it waits on, so this bounds how many streams make progress at once.
+BLOCKING_POOL_SIZE = int(os.getenv("BLOCKING_POOL_SIZE", "128"))
+tpool.set_num_threads(BLOCKING_POOL_SIZE)
+
+_DONE = object()
+
+
+def is_green() -> bool:
+    """True when running under a monkey-patched eventlet hub (the production server)."""
+    return eventlet.patcher.is_monkey_patched("socket")
+
+
+def run_blocking(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a call that cannot yield to the hub (C extensions, gRPC, CPU-bound work)
+    in eventlet's native thread pool, so other greenlets keep running meanwhile.
+
+    Outside eventlet this is a plain call.
+    """
+    if not is_green():
+        return fn(*args, **kwargs)
+    return tpool.execute(fn, *args, **kwargs)
+
+
+def iterate_blocking(factory: Callable[[], Iterator[T]]) -> Iterator[T]:
+    """Drive a blocking iterator from the native thread pool, one item at a time.
+
+    Each item is handed back to the calling greenlet as soon as it is produced,
+    so a slow stream only ever parks its own greenlet. Closing this generator
+    early closes the underlying iterator in the pool too.
+    """
+    if not is_green():
+        yield from factory()
+        return
+
+    iterator = tpool.execute(lambda: iter(factory()))
+    try:
+        while True:
+            item = tpool.execute(next, iterator, _DONE)
+            if item is _DONE:
+                return
+            yield item
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            try:
+                tpool.execute(close)
+            except Exception as e:
+                logger.warning(f"Error closing blocking iterator: {str(e)}")
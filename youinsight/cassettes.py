@@ -0,0 +1,118 @@
+import os
+import gzip
+import json
+import time
+import hashlib
+import logging
+import tempfile
+from typing import Any, Callable, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+MODES = ("off", "record", "replay")
+
+
+class CassetteMissing(LookupError):
+    """Replay mode found no recording for a request."""
+
+
+class Cassettes:
+    """Record/replay of upstream calls at the YouTubeService/GeminiService boundary.
+
+    In record mode each real call is saved as a gzipped JSON cassette keyed by a
+    hash of the request, along with how long it took (or, for streams, when each
+    chunk arrived). In replay mode the call is answered from the cassette with the
+    same timing divided by ``speed``; ``speed=0`` replays without delays.
+    """
+
+    def __init__(self, mode: str = "off", directory: str = "cassettes", speed: float = 1.0):
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode {mode!r}, expected one of {', '.join(MODES)}")
+        self.mode = mode
+        self.directory = directory
+        self.speed = speed
+        if mode != "off":
+            logger.info(f"Cassettes in {mode} mode at {directory} (speed {speed}x)")
+
+    @classmethod
+    def from_env(cls) -> "Cassettes":
+        return cls(
+            mode=os.getenv("YOUINSIGHT_CASSETTE_MODE", "off").lower(),
+            directory=os.getenv("YOUINSIGHT_CASSETTE_DIR", os.path.join("instance", "cassettes")),
+            speed=float(os.getenv("YOUINSIGHT_CASSETTE_SPEED", "1")),
+        )
+
+    @staticmethod
+    def key(request: Dict[str, Any]) -> str:
+        return hashlib.sha1(json.dumps(request, sort_keys=True).encode()).hexdigest()[:20]
+
+    def _path(self, service: str, name: str, request: Dict[str, Any]) -> str:
+        return os.path.join(self.directory, service, name, self.key(request) + ".json.gz")
+
+    def _load(self, service: str, name: str, request: Dict[str, Any]) -> Dict[str, Any]:
+        path = self._path(service, name, request)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise CassetteMissing(f"No cassette for {service}.{name} at {path}") from None
+
+    def _save(self, service: str, name: str, request: Dict[str, Any], record: Dict[str, Any]) -> None:
+        path = self._path(service, name, request)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as raw, gzip.open(raw, "wt", encoding="utf-8") as f:
+            json.dump({"request": request, **record}, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    def _sleep(self, seconds: float) -> None:
+        if self.speed > 0 and seconds > 0:
+            time.sleep(seconds / self.speed)
+
+    def call(self, service: str, name: str, request: Dict[str, Any], fn: Callable[[], Any]) -> Any:
+        """Run a request/response call through the cassette layer; the result must be JSON-serializable."""
+        if self.mode == "off":
+            return fn()
+
+        if self.mode == "replay":
+            cassette = self._load(service, name, request)
+            self._sleep(cassette["elapsed"])
+            return cassette["response"]
+
+        started = time.perf_counter()
+        response = fn()
+        self._save(service, name, request, {
+            "elapsed": round(time.perf_counter() - started, 4),
+            "response": response,
+        })
+        return response
+
+    def stream(
+        self, service: str, name: str, request: Dict[str, Any], fn: Callable[[], Iterator[Any]]
+    ) -> Iterator[Any]:
+        """Like call() for a generator, keeping the arrival time of each item.
+
+        A stream is only recorded once it has been consumed to the end.
+        """
+        if self.mode == "off":
+            yield from fn()
+            return
+
+        if self.mode == "replay":
+            cassette = self._load(service, name, request)
+            previous = 0.0
+            for offset, item in cassette["chunks"]:
+                self._sleep(offset - previous)
+                previous = offset
+                yield item
+            return
+
+        started = time.perf_counter()
+        chunks = []
+        for item in fn():
+            chunks.append([round(time.perf_counter() - started, 4), item])
+            yield item
+        self._save(service, name, request, {"chunks": chunks})
+
+
+CASSETTES = Cassettes.from_env()
@@ -0,0 +1,106 @@
+import os
+import logging
+from datetime import datetime
+from typing import Any, Dict, List
+from sqlalchemy import text
+from . import db, cache
+from .models import Video
+from .search_index import build_match_query, is_supported
+from .youtube_service import YouTubeService
+
+logger = logging.getLogger(__name__)
+
+# YouTube Data API cost of a search: search.list plus the videos.list details call
+SEARCH_QUOTA_COST = 100 + 1
+
+# A local answer is only used when it has at least this many matches
+CATALOG_MIN_RESULTS = int(os.getenv("CATALOG_MIN_RESULTS", "10"))
+
+QUOTA_SAVED_KEY = "catalog_quota_saved_total"
+
+
+def search_catalog(query: str, limit: int = 20) -> List[Dict[str, Any]]:
+    """BM25-ranked search over ingested videos (title, channel and transcript)."""
+    match = build_match_query(query)
+    if not match or not is_supported():
+        return []
+
+    rows = db.session.execute(
+        text(
+            """
+            SELECT rowid FROM video_fts
+            WHERE video_fts MATCH :match
+            ORDER BY bm25(video_fts, 5.0, 2.0, 1.0)
+            LIMIT :limit
+            """
+        ),
+        {"match": match, "limit": limit},
+    ).all()
+
+    ids = [row[0] for row in rows]
+    if not ids:
+        return []
+
+    videos = {video.id: video for video in Video.query.filter(Video.id.in_(ids)).all()}
+    results = []
+    for video_pk in ids:
+        video = videos.get(video_pk)
+        if not video:
+            continue
+        results.append(
+            {
+                "video_id": video.video_id,
+                "title": video.title,
+                "url": video.url,
+                "view_count": video.view_count or 0,
+                "thumbnail_url": video.thumbnail_url or "",
+                "channel_title": video.channel_title or "Unknown Channel",
+                "published_at": video.published_at.isoformat() + "Z" if video.published_at else "",
+                "from_library": True,
+            }
+        )
+    return results
+
+
+def record_quota_saved(units: int = SEARCH_QUOTA_COST) -> int:
+    """Add to the running total of YouTube quota units saved by library answers."""
+    total = (cache.get(QUOTA_SAVED_KEY) or 0) + units
+    cache.set(QUOTA_SAVED_KEY, total, timeout=0)
+    logger.info(f"Search served from library, saved {units} quota units ({total} total)")
+    return total
+
+
+def ingest_search_results(videos: List[Dict[str, Any]]) -> None:
+    """Upsert YouTube search results into the Video table so later searches can hit the library."""
+    if not videos:
+        return
+
+    now = datetime.utcnow()
+    existing = {
+        video.video_id: video
+        for video in Video.query.filter(
+            Video.video_id.in_([v["video_id"] for v in videos])
+        ).all()
+    }
+    for video_data in videos:
+        video = existing.get(video_data["video_id"])
+        if video is None:
+            video = Video(
+                video_id=video_data["video_id"],
+                title=video_data["title"],
+                url=video_data["url"],
+            )
+            db.session.add(video)
+            existing[video.video_id] = video
+        if "view_count" in video_data:
+            # Just fetched, so the statistics refresher can leave it for a while
+            video.view_count = video_data["view_count"]
+            video.stats_refreshed_at = now
+        video.channel_title = video_data.get("channel_title") or video.channel_title
+        video.thumbnail_url = (
+            video_data.get("thumbnail_url") or video_data.get("thumbnail") or video.thumbnail_url
+        )
+        video.published_at = (
+            YouTubeService.parse_published_at(video_data.get("published_at")) or video.published_at
+        )
+    db.session.commit()
@@ -0,0 +1,265 @@
+import os
+import re
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import or_, and_
+from sqlalchemy.exc import IntegrityError
+
+from . import db
+from .models import Video, VideoDigest
+from .gemini_service import GeminiService
+from .usage import estimate_cost
+from .scheduler import scheduler
+from .metrics import DIGESTS_GENERATED
+
+logger = logging.getLogger(__name__)
+
+# The standard analyses stored for every video with a transcript
+DIGEST_KINDS = {
+    'summary': {
+        'label': 'Summary',
+        'prompt': 'Summarize this video in two or three short paragraphs.',
+    },
+    'takeaways': {
+        'label': 'Key takeaways',
+        'prompt': 'List the key takeaways of this video as short bullet points.',
+    },
+    'arguments': {
+        'label': 'Main arguments',
+        'prompt': 'List the main arguments this video makes, each with the reasoning or evidence given for it.',
+    },
+}
+
+# Queue digests whenever a transcript is stored
+DIGEST_ON_INGEST = os.getenv('DIGEST_ON_INGEST', '1') != '0'
+# The deployment's Gemini key digests are generated with. Digests are shared by
+# every user, so they are never charged to the key of the user whose search,
+# batch or playlist stored the transcript: without this key none are queued.
+DIGEST_GEMINI_API_KEY = os.getenv('DIGEST_GEMINI_API_KEY')
+DIGEST_MAX_ATTEMPTS = int(os.getenv('DIGEST_MAX_ATTEMPTS', '3'))
+DIGEST_RETRY_BASE_SECONDS = float(os.getenv('DIGEST_RETRY_BASE_SECONDS', '60'))
+DIGEST_LEASE_SECONDS = int(os.getenv('DIGEST_LEASE_SECONDS', '300'))
+DIGEST_POLL_SECONDS = float(os.getenv('DIGEST_POLL_SECONDS', '10'))
+# Digests are low priority: they are only generated while no analysis waits
+# for a slot and fewer than this many run in this process
+DIGEST_MAX_BUSY_SLOTS = int(os.getenv('DIGEST_MAX_BUSY_SLOTS', '4'))
+
+# Prompts longer than this are never taken for a standard one
+_INTENT_MAX_WORDS = 12
+# Words that do not change what a short prompt asks for
+_FILLER = set("""
+    a all an and are can could do does for from give i in is it its list me
+    made make need of please presented provide s show speaker tell that the
+    these this those to us video videos want what would write you
+""".split())
+_INTENTS = {
+    'summary': [
+        {'summarize'}, {'summarise'}, {'summary'}, {'tldr'}, {'sum', 'up'},
+        {'short', 'summary'}, {'brief', 'summary'}, {'overview'}, {'about'},
+    ],
+    'takeaways': [
+        {'takeaways'}, {'key', 'takeaways'}, {'main', 'takeaways'}, {'key', 'points'},
+        {'main', 'points'}, {'key', 'lessons'},
+    ],
+    'arguments': [
+        {'arguments'}, {'main', 'arguments'}, {'key', 'arguments'}, {'central', 'arguments'},
+        {'main', 'argument'}, {'main', 'claims'},
+    ],
+}
+
+
+def recognize_intent(prompt: str) -> Optional[str]:
+    """The digest kind a prompt asks for, if it is just a request for one.
+
+    Only short prompts made of a standard request and filler words match, so
+    "summarize the part about pricing" still goes to Gemini.
+    """
+    text = re.sub(r'\btl\s*;?\s*dr\b', 'tldr', (prompt or '').lower())
+    words = re.findall(r"[a-z]+", text)
+    if not words or len(words) > _INTENT_MAX_WORDS:
+        return None
+    meaning = {word for word in words if word not in _FILLER}
+    for kind, phrasings in _INTENTS.items():
+        if meaning in phrasings:
+            return kind
+    return None
+
+
+def digest_context(kind: str, content: str) -> str:
+    """A digest in place of a transcript in a multi-video prompt."""
+    return f"({DIGEST_KINDS[kind]['label']} written from the full transcript)\n{content}"
+
+
+def stored_digests(video_ids: Iterable[str], kind: str) -> Dict[str, str]:
+    """Finished digests of one kind by video ID."""
+    video_ids = list(set(video_ids))
+    if not video_ids:
+        return {}
+    rows = VideoDigest.query.with_entities(VideoDigest.video_id, VideoDigest.content).filter(
+        VideoDigest.video_id.in_(video_ids), VideoDigest.kind == kind, VideoDigest.status == 'done',
+    )
+    return {row.video_id: row.content for row in rows}
+
+
+def queue_digests(video_ids: Iterable[str], user_id: Optional[int] = None) -> int:
+    """Queue every standard digest the videos do not have yet; the number queued.
+
+    Call it after their transcripts are committed. Nothing is queued unless
+    DIGEST_GEMINI_API_KEY is set. `user_id` only records whose request
+    stored the transcript.
+    """
+    video_ids = list(dict.fromkeys(video_ids))
+    if not DIGEST_ON_INGEST or not DIGEST_GEMINI_API_KEY or not video_ids:
+        return 0
+    existing = set(
+        VideoDigest.query.with_entities(VideoDigest.video_id, VideoDigest.kind)
+        .filter(VideoDigest.video_id.in_(video_ids)).all()
+    )
+    now = datetime.utcnow()
+    rows = [
+        {'video_id': video_id, 'kind': kind, 'status': 'pending', 'attempts': 0, 'user_id': user_id,
+         'created_at': now}
+        for video_id in video_ids for kind in DIGEST_KINDS if (video_id, kind) not in existing
+    ]
+    if not rows:
+        return 0
+    try:
+        db.session.execute(VideoDigest.__table__.insert(), rows)
+        db.session.commit()
+    except IntegrityError:
+        # Another process queued some of them first; they get generated either way
+        db.session.rollback()
+        logger.info(f"Digests of {len(video_ids)} videos were already queued")
+        return 0
+    if _worker is not None:
+        _worker.wake()
+    return len(rows)
+
+
+class DigestWorker:
+    """Generates queued digests one at a time in a background task.
+
+    It steps aside while users' analyses need the capacity. Digests are
+    claimed with a lease like batch items, so one whose process died is
+    taken over once the lease runs out.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._wake = threading.Event()
+
+    def wake(self):
+        self._wake.set()
+
+    def run(self):
+        """Loop forever; meant to run as a background task."""
+        while True:
+            try:
+                with self.app.app_context():
+                    processed = self.process_next()
+            except Exception as e:
+                logger.error(f"Digest worker error: {str(e)}", exc_info=True)
+                processed = False
+            if not processed:
+                self._wake.wait(DIGEST_POLL_SECONDS)
+                self._wake.clear()
+
+    @staticmethod
+    def _busy() -> bool:
+        stats = scheduler.stats()
+        return stats['waiting'] > 0 or stats['in_flight'] >= DIGEST_MAX_BUSY_SLOTS
+
+    def _claim(self, now: datetime) -> Optional[VideoDigest]:
+        due = or_(
+            and_(VideoDigest.status == 'pending', or_(
+                VideoDigest.lease_expires_at.is_(None), VideoDigest.lease_expires_at <= now,
+            )),
+            and_(VideoDigest.status == 'running', VideoDigest.lease_expires_at <= now),
+        )
+        for digest in VideoDigest.query.filter(due).order_by(VideoDigest.id).limit(10).all():
+            claimed = VideoDigest.query.filter(
+                VideoDigest.id == digest.id, VideoDigest.status == digest.status, due,
+            ).update({
+                'status': 'running',
+                'attempts': VideoDigest.attempts + 1,
+                'lease_expires_at': now + timedelta(seconds=DIGEST_LEASE_SECONDS),
+            }, synchronize_session=False)
+            db.session.commit()
+            if claimed:
+                return db.session.get(VideoDigest, digest.id)
+        return None
+
+    def _generate(self, digest: VideoDigest) -> None:
+        video = Video.query.filter_by(video_id=digest.video_id).first()
+        if video is None or not video.transcript:
+            digest.status, digest.error = 'failed', 'Transcript not available for this video'
+            return
+        if not DIGEST_GEMINI_API_KEY:
+            # Queued before the key was removed
+            digest.status, digest.error = 'failed', 'DIGEST_GEMINI_API_KEY is not set'
+            return
+        video = {'title': video.title, 'url': video.url, 'transcript': video.transcript}
+
+        # Nothing is written until Gemini is done, so no database lock is held meanwhile
+        gemini_service = GeminiService(DIGEST_GEMINI_API_KEY)
+        result = ''.join(gemini_service.stream_analysis(
+            DIGEST_KINDS[digest.kind]['prompt'], [video], interactive=False))
+        usage = gemini_service.last_usage or {}
+        if usage.get('outcome') == 'error':
+            raise RuntimeError(result)
+        digest.content, digest.status, digest.error = result, 'done', None
+        # Paid for by the deployment, so kept on the digest rather than in a user's usage
+        digest.model_name = usage['model_name']
+        digest.input_tokens, digest.output_tokens = usage['input_tokens'], usage['output_tokens']
+        digest.ttft_ms, digest.duration_ms = usage['ttft_ms'], usage['duration_ms']
+        digest.cost_usd = estimate_cost(usage['model_name'], usage['input_tokens'], usage['output_tokens'])
+
+    def process_next(self) -> bool:
+        """Generate one digest; False when there was nothing to do or no spare capacity."""
+        if self._busy():
+            return False
+        digest = self._claim(datetime.utcnow())
+        if digest is None:
+            return False
+        try:
+            self._generate(digest)
+        except Exception as e:
+            db.session.rollback()
+            digest = db.session.get(VideoDigest, digest.id)
+            digest.error = str(e)[:500]
+            if digest.attempts < DIGEST_MAX_ATTEMPTS:
+                digest.status = 'pending'
+                digest.lease_expires_at = datetime.utcnow() + timedelta(
+                    seconds=DIGEST_RETRY_BASE_SECONDS * 2 ** (digest.attempts - 1)
+                )
+                db.session.commit()
+                logger.warning(f"Digest {digest.id} attempt {digest.attempts} failed, will retry: {str(e)}")
+                DIGESTS_GENERATED.inc(outcome='retried')
+                return True
+            digest.status = 'failed'
+            logger.error(f"Giving up on digest {digest.id} after {digest.attempts} attempts: {str(e)}")
+
+        digest.lease_expires_at = None
+        digest.finished_at = datetime.utcnow()
+        db.session.commit()
+        DIGESTS_GENERATED.inc(outcome=digest.status)
+        return True
+
+
+_worker = None
+
+
+def start_digest_worker(app):
+    """Start this process's digest worker as a Socket.IO background task."""
+    global _worker
+    if _worker is not None:
+        return _worker
+    from . import socketio
+
+    _worker = DigestWorker(app)
+    socketio.start_background_task(_worker.run)
+    logger.info("Digest worker started")
+    return _worker
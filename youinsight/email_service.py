@@ -1,5 +1,12 @@
 import os
+import uuid
+import time
 import smtplib
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from dotenv import load_dotenv
@@ -7,17 +14,28 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
-def send_reset_email(email, reset_url):
+logger = logging.getLogger(__name__)
+
+# Outbox delivery settings
+EMAIL_BATCH_SIZE = int(os.getenv('EMAIL_BATCH_SIZE', '20'))
+EMAIL_MAX_ATTEMPTS = int(os.getenv('EMAIL_MAX_ATTEMPTS', '5'))
+EMAIL_RETRY_BASE_SECONDS = float(os.getenv('EMAIL_RETRY_BASE_SECONDS', '30'))
+EMAIL_POLL_SECONDS = float(os.getenv('EMAIL_POLL_SECONDS', '30'))
+EMAIL_SMTP_POOL_SIZE = int(os.getenv('EMAIL_SMTP_POOL_SIZE', '2'))
+# Idle SMTP connections older than this are reconnected rather than reused
+SMTP_IDLE_SECONDS = 60
+# How long a claimed email may stay 'sending' before another worker may retry it
+CLAIM_LEASE_SECONDS = 300
+
+
+def get_smtp_settings():
     """
-    Send a password reset email to the user
-    
-    Args:
-        email (str): Recipient's email address
-        reset_url (str): URL for password reset
+    SMTP configuration from the environment, or None in development mode
+    (no credentials, or placeholder values) where emails are only logged.
     """
     # Get email configuration from environment variables
     smtp_server = os.getenv('SMTP_SERVER', 'smtp.gmail.com')
-    
+
     # Try to get SMTP port, handle invalid values
     smtp_port_str = os.getenv('SMTP_PORT', '587')
     try:
@@ -25,27 +43,29 @@ def send_reset_email(email, reset_url):
     except ValueError:
         # Use default port if the value is not a valid integer
         smtp_port = 587
-        
+
     smtp_username = os.getenv('SMTP_USERNAME')
     smtp_password = os.getenv('SMTP_PASSWORD')
     sender_email = os.getenv('SENDER_EMAIL', smtp_username)
-    
+
     # Check if we have valid SMTP credentials or just placeholder values
     placeholder_values = ['your_email_username', 'your_smtp_username', 'your_email_password', 'your_smtp_password']
     is_dev_mode = not all([smtp_username, smtp_password]) or smtp_username in placeholder_values or smtp_password in placeholder_values
-    
     if is_dev_mode:
-        # For development/testing without actual email sending
-        print(f"[DEV MODE] Password reset link for {email}: {reset_url}")
-        return True
-    
-    # Create message
-    message = MIMEMultipart("alternative")
-    message["Subject"] = "YouInsight - Password Reset"
-    message["From"] = sender_email
-    message["To"] = email
-    
-    # Create HTML email content
+        return None
+
+    return {
+        'server': smtp_server,
+        'port': smtp_port,
+        'username': smtp_username,
+        'password': smtp_password,
+        'sender': sender_email,
+        'use_tls': os.getenv('SMTP_USE_TLS', 'true').lower() not in ('0', 'false', 'no'),
+    }
+
+
+def render_reset_email(reset_url):
+    """Subject and HTML body of the password reset email."""
     html = f"""
     <html>
       <body>
@@ -62,19 +82,246 @@ def send_reset_email(email, reset_url):
       </body>
     </html>
     """
-    
-    # Add HTML part to message
-    part = MIMEText(html, "html")
-    message.attach(part)
-    
+    return "YouInsight - Password Reset", html
+
+
+def send_reset_email(email, reset_url):
+    """
+    Queue a password reset email to the user. Delivery happens in the
+    background outbox worker, so the request never waits on SMTP.
+
+    Args:
+        email (str): Recipient's email address
+        reset_url (str): URL for password reset
+
+    Returns:
+        bool: True when the email was queued (or logged in development mode)
+    """
+    if get_smtp_settings() is None:
+        # For development/testing without actual email sending
+        print(f"[DEV MODE] Password reset link for {email}: {reset_url}")
+        return True
+
+    subject, html = render_reset_email(reset_url)
     try:
-        # Connect to mail server
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            server.ehlo()
-            server.starttls()
-            server.login(smtp_username, smtp_password)
-            server.sendmail(sender_email, email, message.as_string())
+        queue_email(email, subject, html)
         return True
     except Exception as e:
-        print(f"Error sending email: {e}")
+        logger.error(f"Error queueing email: {str(e)}")
         return False
+
+
+def queue_email(recipient, subject, html):
+    """Add an email to the outbox and wake the worker. Commits the session."""
+    from . import db
+    from .models import EmailOutbox
+
+    db.session.add(EmailOutbox(recipient=recipient, subject=subject, html=html))
+    db.session.commit()
+    if _worker is not None:
+        _worker.wake()
+
+
+class SMTPConnectionPool:
+    """Up to `size` authenticated SMTP connections, reused across sends."""
+
+    def __init__(self, settings, size=EMAIL_SMTP_POOL_SIZE, idle_timeout=SMTP_IDLE_SECONDS):
+        self.settings = settings
+        self.idle_timeout = idle_timeout
+        self._idle = []  # (connection, last used)
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _connect(self):
+        server = smtplib.SMTP(self.settings['server'], self.settings['port'], timeout=30)
+        server.ehlo()
+        if self.settings['use_tls']:
+            server.starttls()
+            server.ehlo()
+        server.login(self.settings['username'], self.settings['password'])
+        return server
+
+    @staticmethod
+    def _close(server):
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; it is dropped if the send failed below the SMTP reply level."""
+        with self._slots:
+            server = None
+            with self._lock:
+                while self._idle and server is None:
+                    candidate, last_used = self._idle.pop()
+                    if time.monotonic() - last_used < self.idle_timeout:
+                        server = candidate
+                    else:
+                        self._close(candidate)
+            if server is None:
+                server = self._connect()
+            try:
+                yield server
+            except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused):
+                # The server answered, so the session is still usable once reset
+                try:
+                    server.rset()
+                except Exception:
+                    self._close(server)
+                    raise
+                with self._lock:
+                    self._idle.append((server, time.monotonic()))
+                raise
+            except Exception:
+                self._close(server)
+                raise
+            with self._lock:
+                self._idle.append((server, time.monotonic()))
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for server, _ in idle:
+            self._close(server)
+
+
+def _is_permanent(error):
+    """SMTP 5xx replies and refused recipients will not succeed on retry."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+
+class OutboxWorker:
+    """
+    Delivers EmailOutbox rows in batches over pooled SMTP connections,
+    retrying transient failures with exponential backoff.
+    """
+
+    def __init__(self, app, batch_size=EMAIL_BATCH_SIZE, pool_size=EMAIL_SMTP_POOL_SIZE):
+        self.app = app
+        self.batch_size = batch_size
+        self.pool_size = pool_size
+        self.worker_id = uuid.uuid4().hex
+        self._wake = threading.Event()
+        self._pool = None
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='smtp')
+
+    def wake(self):
+        self._wake.set()
+
+    def run(self):
+        """Loop forever; meant to run as a background task."""
+        logger.info("Email outbox worker started")
+        while True:
+            try:
+                with self.app.app_context():
+                    processed = self.process_batch()
+            except Exception as e:
+                logger.error(f"Email outbox worker error: {str(e)}")
+                processed = 0
+            if processed < self.batch_size:
+                self._wake.wait(EMAIL_POLL_SECONDS)
+                self._wake.clear()
+
+    def _claim(self, now):
+        """Atomically take up to batch_size due emails for this worker."""
+        from . import db
+        from .models import EmailOutbox
+
+        due = [
+            row.id for row in EmailOutbox.query.with_entities(EmailOutbox.id).filter(
+                EmailOutbox.status.in_(('pending', 'sending')),
+                EmailOutbox.next_attempt_at <= now,
+            ).order_by(EmailOutbox.next_attempt_at).limit(self.batch_size)
+        ]
+        if not due:
+            return []
+
+        claim = uuid.uuid4().hex
+        EmailOutbox.query.filter(
+            EmailOutbox.id.in_(due),
+            EmailOutbox.status.in_(('pending', 'sending')),
+            EmailOutbox.next_attempt_at <= now,
+        ).update({
+            'status': 'sending',
+            'claimed_by': claim,
+            'attempts': EmailOutbox.attempts + 1,
+            'next_attempt_at': now + timedelta(seconds=CLAIM_LEASE_SECONDS),
+        }, synchronize_session=False)
+        db.session.commit()
+        return EmailOutbox.query.filter_by(claimed_by=claim, status='sending').all()
+
+    def _send(self, pool, sender, recipient, subject, html):
+        message = MIMEMultipart("alternative")
+        message["Subject"] = subject
+        message["From"] = sender
+        message["To"] = recipient
+        message.attach(MIMEText(html, "html"))
+        try:
+            with pool.connection() as server:
+                server.sendmail(sender, recipient, message.as_string())
+            return None
+        except Exception as e:
+            return e
+
+    def process_batch(self):
+        """Send one batch of due emails; returns how many were attempted."""
+        from . import db
+
+        settings = get_smtp_settings()
+        if settings is None:
+            return 0
+        if self._pool is None or self._pool.settings != settings:
+            if self._pool is not None:
+                self._pool.close()
+            self._pool = SMTPConnectionPool(settings, self.pool_size)
+
+        emails = self._claim(datetime.utcnow())
+        if not emails:
+            return 0
+
+        results = list(self._executor.map(
+            lambda email: self._send(self._pool, settings['sender'], email.recipient, email.subject, email.html),
+            emails,
+        ))
+
+        now = datetime.utcnow()
+        for email, error in zip(emails, results):
+            if error is None:
+                email.status = 'sent'
+                email.sent_at = now
+                email.last_error = None
+            elif _is_permanent(error) or email.attempts >= EMAIL_MAX_ATTEMPTS:
+                email.status = 'failed'
+                email.last_error = str(error)[:500]
+                logger.error(f"Giving up on email {email.id} after {email.attempts} attempts: {str(error)}")
+            else:
+                email.status = 'pending'
+                email.next_attempt_at = now + timedelta(
+                    seconds=EMAIL_RETRY_BASE_SECONDS * 2 ** (email.attempts - 1)
+                )
+                email.last_error = str(error)[:500]
+                logger.warning(f"Email {email.id} attempt {email.attempts} failed, will retry: {str(error)}")
+        db.session.commit()
+
+        sent = sum(1 for error in results if error is None)
+        logger.info(f"Email outbox batch: {sent}/{len(emails)} sent")
+        return len(emails)
+
+
+_worker = None
+
+
+def start_outbox_worker(app):
+    """Start this process's outbox worker as a Socket.IO background task."""
+    global _worker
+    if _worker is not None:
+        return _worker
+    from . import socketio
+
+    _worker = OutboxWorker(app)
+    socketio.start_background_task(_worker.run)
+    return _worker
@@ -0,0 +1,200 @@
+import os
+import io
+import csv
+import json
+import zlib
+import logging
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import select, or_
+
+from . import db
+from .models import User, Video, Analysis, AnalysisVideo
+from .metrics import EXPORT_ROWS
+
+logger = logging.getLogger(__name__)
+
+# Analyses fetched from the database at a time, with their videos. Exports
+# with transcripts fetch a tenth as many at a time, since each can be large.
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', '500'))
+# Output is handed on in pieces of about this size, before compression
+EXPORT_CHUNK_BYTES = int(os.getenv('EXPORT_CHUNK_BYTES', str(64 * 1024)))
+EXPORT_GZIP_LEVEL = int(os.getenv('EXPORT_GZIP_LEVEL', '6'))
+
+EXPORT_FORMATS = ('ndjson', 'csv')
+# CSV columns; messages and videos hold the same JSON as in NDJSON
+EXPORT_FIELDS = (
+    'id', 'created_at', 'conversation_id', 'is_conversation', 'search_term', 'prompt', 'result',
+    'messages', 'model_name', 'input_tokens', 'output_tokens', 'cost_usd', 'videos',
+)
+
+
+def _isoformat(value) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+
+def _messages(raw: Optional[str]) -> Optional[List[Any]]:
+    if not raw:
+        return None
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return None
+
+
+def _analysis_page(user_id: int, after: int, page_size: int):
+    return db.session.execute(
+        select(
+            Analysis.id, Analysis.created_at, Analysis.conversation_id, Analysis.is_conversation,
+            Analysis.search_term, Analysis.prompt, Analysis.result, Analysis.messages,
+            Analysis.model_name, Analysis.input_tokens, Analysis.output_tokens, Analysis.cost_usd,
+        )
+        .where(Analysis.user_id == user_id, Analysis.id > after)
+        .order_by(Analysis.id)
+        .limit(page_size)
+    ).all()
+
+
+def _videos_by_analysis(analysis_ids: List[int], transcripts: bool) -> Dict[int, List[Dict[str, Any]]]:
+    columns = [
+        AnalysisVideo.analysis_id, Video.video_id, Video.title, Video.url,
+        Video.channel_title, Video.published_at,
+    ]
+    if transcripts:
+        columns.append(Video.transcript)
+    rows = db.session.execute(
+        select(*columns)
+        .join(Video, Video.id == AnalysisVideo.video_id)
+        .where(AnalysisVideo.analysis_id.in_(analysis_ids))
+        .order_by(AnalysisVideo.analysis_id, AnalysisVideo.id)
+    )
+    videos: Dict[int, List[Dict[str, Any]]] = {}
+    for row in rows:
+        video = {
+            'video_id': row.video_id,
+            'title': row.title,
+            'url': row.url,
+            'channel_title': row.channel_title,
+            'published_at': _isoformat(row.published_at),
+        }
+        if transcripts:
+            video['transcript'] = row.transcript
+        videos.setdefault(row.analysis_id, []).append(video)
+    return videos
+
+
+def export_records(user_id: int, transcripts: bool = False,
+                   batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[Dict[str, Any]]:
+    """The user's analyses and conversation turns, oldest first, with their videos.
+
+    Analyses are read a page at a time after the last id exported, with the
+    videos of that page, so only one page is held however long the history
+    is. The read transaction ends before each page is handed on: a slow
+    download does not keep the database locked against writers.
+    """
+    page_size = max(1, batch_size // 10) if transcripts else batch_size
+    after = 0
+    while True:
+        try:
+            analyses = _analysis_page(user_id, after, page_size)
+            videos = _videos_by_analysis([row.id for row in analyses], transcripts) if analyses else {}
+        finally:
+            # End the read transaction; nothing was written
+            db.session.rollback()
+        for row in analyses:
+            after = row.id
+            yield {
+                'id': row.id,
+                'created_at': _isoformat(row.created_at),
+                'conversation_id': row.conversation_id,
+                'is_conversation': bool(row.is_conversation),
+                'search_term': row.search_term,
+                'prompt': row.prompt,
+                'result': row.result,
+                'messages': _messages(row.messages),
+                'model_name': row.model_name,
+                'input_tokens': row.input_tokens,
+                'output_tokens': row.output_tokens,
+                'cost_usd': row.cost_usd,
+                'videos': videos.get(row.id, []),
+            }
+        if len(analyses) < page_size:
+            return
+
+
+def export_lines(records: Iterable[Dict[str, Any]], fmt: str) -> Iterator[str]:
+    """Records as NDJSON lines, or CSV rows after a header row."""
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+
+        def line(values):
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerow(values)
+            return buffer.getvalue()
+
+        yield line(EXPORT_FIELDS)
+        for record in records:
+            EXPORT_ROWS.inc(format=fmt)
+            yield line([
+                json.dumps(record[field]) if field in ('messages', 'videos') and record[field] is not None
+                else record[field]
+                for field in EXPORT_FIELDS
+            ])
+    else:
+        for record in records:
+            EXPORT_ROWS.inc(format=fmt)
+            yield json.dumps(record) + '\n'
+
+
+def export_chunks(lines: Iterable[str], compress: bool = False,
+                  chunk_bytes: int = EXPORT_CHUNK_BYTES) -> Iterator[bytes]:
+    """Lines joined into pieces of about `chunk_bytes`, gzipped on the fly if `compress`."""
+    compressor = zlib.compressobj(EXPORT_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if compress else None
+    parts, size = [], 0
+    for line in lines:
+        data = line.encode('utf-8')
+        parts.append(data)
+        size += len(data)
+        if size >= chunk_bytes:
+            chunk = b''.join(parts)
+            parts, size = [], 0
+            if compressor is not None:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+    chunk = b''.join(parts)
+    if compressor is not None:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
+
+
+@click.command('export-history')
+@click.argument('user')
+@click.option('--format', 'fmt', type=click.Choice(EXPORT_FORMATS), default='ndjson', show_default=True)
+@click.option('--transcripts', is_flag=True, help='Include the transcript of every video.')
+@click.option('--gzip', 'compress', is_flag=True, help='Gzip the output (implied by an output path ending in .gz).')
+@click.option('--output', '-o', type=click.Path(dir_okay=False, writable=True), default='-',
+              help='File to write to, standard output by default.')
+@with_appcontext
+def export_command(user, fmt, transcripts, compress, output):
+    """Export the history of USER (id, username or email) as NDJSON or CSV."""
+    conditions = [User.username == user, User.email == user]
+    if user.isdigit():
+        conditions.append(User.id == int(user))
+    user_id = db.session.execute(select(User.id).where(or_(*conditions))).scalar()
+    if user_id is None:
+        raise click.ClickException(f'No user {user!r}')
+    compress = compress or output.endswith('.gz')
+
+    written = 0
+    with click.open_file(output, 'wb') as f:
+        for chunk in export_chunks(export_lines(export_records(user_id, transcripts), fmt), compress):
+            f.write(chunk)
+            written += len(chunk)
+    if output != '-':
+        logger.info(f"Exported the history of user {user_id} to {output} ({written} bytes)")
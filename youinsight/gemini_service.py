@@ -1,15 +1,104 @@
-from typing import Dict, List, Optional
-import google.generativeai as genai
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 import hashlib
+import inspect
 import json
+import os
+import time
+import threading
+from collections import OrderedDict
 from . import cache
+from .blocking import iterate_blocking, run_blocking
+from .cassettes import CASSETTES
+from .model_router import Route, route, record_outcome
+from .resilience import resilient_stream, ttft_deadline
+from .metrics import (
+    LLM_TIME_TO_FIRST_TOKEN,
+    LLM_STREAM_SECONDS,
+    LLM_TOKENS_PER_SECOND,
+    LLM_STREAMS,
+)
+
+# Alternate REST endpoint for the Gemini API, e.g. the stand-in server in benchmarks/
+GEMINI_API_BASE_URL = os.getenv("GEMINI_API_BASE_URL")
+
+# gRPC does not cooperate with eventlet's monkey patching; REST over requests does
+GEMINI_TRANSPORT = os.getenv("GEMINI_TRANSPORT", "rest")
+
+
+def _genai():
+    """google.generativeai, imported on first use: it takes most of a second to import."""
+    import google.generativeai as genai
+    return genai
+
+
+# Gemini clients by API key, most recently used last. genai.configure() sets
+# one key for the whole process, and a model only creates its client when it
+# first sends a request, from whichever key was configured last; every model
+# here gets the client of its own service's key instead.
+GEMINI_CLIENTS_MAX = 256
+_clients: "OrderedDict[str, Any]" = OrderedDict()
+_clients_lock = threading.Lock()
+
+
+def _client_for(api_key: str):
+    """A generative service client that sends `api_key`, shared by the services using it."""
+    with _clients_lock:
+        client = _clients.get(api_key)
+        if client is not None:
+            _clients.move_to_end(api_key)
+            return client
+    from google.generativeai.client import _ClientManager
+    manager = _ClientManager()
+    manager.configure(
+        api_key=api_key,
+        transport="rest" if GEMINI_API_BASE_URL else GEMINI_TRANSPORT,
+        client_options={"api_endpoint": GEMINI_API_BASE_URL} if GEMINI_API_BASE_URL else None,
+    )
+    client = manager.get_default_client("generative")
+    session = getattr(client._transport, "_session", None)
+    if session is not None:
+        # REST: lets a request be cut off from another thread (see _generate_stream)
+        from .request_abort import TrackingAdapter
+        adapter = TrackingAdapter()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+    with _clients_lock:
+        client = _clients.setdefault(api_key, client)
+        _clients.move_to_end(api_key)
+        while len(_clients) > GEMINI_CLIENTS_MAX:
+            _clients.popitem(last=False)
+    return client
+
+
+_NO_CLIENT_RETRY: Optional[Dict[str, Any]] = None
+
+
+def _no_client_retry() -> Dict[str, Any]:
+    """generate_content kwargs that turn off the client's own retries.
+
+    Recent google-generativeai versions take request_options. Older ones,
+    like the 0.3.1 pinned in requirements.txt, reject it as an unknown
+    request field; their built-in retry of 503s gives up after 60 seconds.
+    """
+    global _NO_CLIENT_RETRY
+    if _NO_CLIENT_RETRY is None:
+        parameters = inspect.signature(_genai().GenerativeModel.generate_content).parameters
+        _NO_CLIENT_RETRY = {"request_options": {"retry": None}} if "request_options" in parameters else {}
+    return _NO_CLIENT_RETRY
 
 
 class GeminiService:
     def __init__(self, api_key: str):
         """Initialize Gemini API service with the provided API key."""
         self.api_key = api_key
-        genai.configure(api_key=api_key)
+        # Token counts and timings of the most recent stream_analysis call
+        self.last_usage: Optional[Dict[str, Any]] = None
+
+    def _model(self, model_name: str):
+        """A model that sends this service's API key, whatever other services configured."""
+        model = _genai().GenerativeModel(model_name)
+        model._client = _client_for(self.api_key)
+        return model
 
     def get_cache_key(self, prompt: str, transcripts: List[str]) -> str:
         """Generate a cache key for a specific prompt and transcripts combination."""
@@ -45,24 +134,76 @@ IMPORTANT: Provide a direct, well-formatted response. DO NOT include any stateme
             )
 
         try:
-            model = genai.GenerativeModel("gemini-2.0-flash-exp")
+            decision = route(prompt, formatted_prompt, interactive=False)
+            model = self._model(decision.model)
 
-            response = model.generate_content(
+            response = run_blocking(
+                model.generate_content,
                 formatted_prompt,
-                generation_config={
-                    "temperature": 0.7,
-                    "top_p": 0.95,
-                    "top_k": 64,
-                    "max_output_tokens": 8192,
-                },
+                generation_config=decision.generation_config(),
             )
 
             return response.text
         except Exception as e:
             return f"Error analyzing transcripts: {str(e)}"
 
-    def stream_analysis(self, prompt: str, transcripts: List[Dict[str, str]]) -> str:
-        """Stream Gemini analysis results - yields chunks of text as they are generated."""
+    @staticmethod
+    def _chunk_usage(chunk) -> Optional[Dict[str, Any]]:
+        usage = getattr(chunk, "usage_metadata", None)
+        candidates = getattr(chunk, "candidates", None)
+        finish_reason = candidates[0].finish_reason if candidates else None
+        if not usage and not finish_reason:
+            return None
+        result = {
+            "prompt_token_count": getattr(usage, "prompt_token_count", 0),
+            "candidates_token_count": getattr(usage, "candidates_token_count", 0),
+        } if usage else {}
+        if finish_reason:
+            result["finish_reason"] = getattr(finish_reason, "name", str(finish_reason))
+        return result
+
+    def _generate_stream(
+        self, formatted_prompt: str, decision: Route, on_cancel: Optional[Callable] = None
+    ) -> Iterator[Tuple[Optional[str], Optional[Dict[str, Any]]]]:
+        """Stream a Gemini completion as (text, usage) pairs; either may be None.
+
+        Usage carries the finish reason once Gemini reports it. When the route
+        does not stream, the whole completion comes as a single pair.
+        `on_cancel` is given a function that cuts the request off, for
+        resilience.resilient_stream to call when another attempt wins.
+        """
+        from .request_abort import Connections, tracking
+
+        connections = Connections()
+        if on_cancel is not None:
+            on_cancel(connections.abort)
+        model = self._model(decision.model)
+
+        # The client's own retries would keep a 503 going for up to ten minutes
+        # in recent versions; resilience.resilient_stream retries instead
+        with tracking(connections):
+            response = model.generate_content(
+                formatted_prompt,
+                generation_config=decision.generation_config(),
+                stream=decision.stream,
+                **_no_client_retry(),
+            )
+
+        if not decision.stream:
+            yield response.text, self._chunk_usage(response)
+            return
+
+        for chunk in response:
+            yield chunk.text if hasattr(chunk, "text") else None, self._chunk_usage(chunk)
+
+    def stream_analysis(self, prompt: str, transcripts: List[Dict[str, str]], interactive: bool = True) -> str:
+        """Stream Gemini analysis results - yields chunks of text as they are generated.
+
+        The model, output cap and whether to stream at all are routed by
+        model_router; pass interactive=False when nobody reads the chunks as
+        they arrive. Until the first chunk, slow starts are hedged and transient
+        errors retried by resilience.resilient_stream.
+        """
         if not transcripts:
             yield "No transcripts to analyze."
             return
@@ -84,22 +225,62 @@ IMPORTANT: Provide a direct, well-formatted response. DO NOT include any stateme
                 video.get("transcript", "No transcript available") + "\n\n"
             )
 
+        decision = route(prompt, formatted_prompt, interactive=interactive)
+        started = time.perf_counter()
+        first_chunk_at = None
+        output_chars = 0
+        usage = None
+        finish_reason = None
+        outcome = "cancelled"
+        request = {
+            "model": decision.model,
+            "max_output_tokens": decision.max_output_tokens,
+            "stream": decision.stream,
+            "prompt_sha1": hashlib.sha1(formatted_prompt.encode()).hexdigest(),
+            "prompt_chars": len(formatted_prompt),
+        }
         try:
-            model = genai.GenerativeModel("gemini-2.0-flash-exp")
-
-            response = model.generate_content(
-                formatted_prompt,
-                generation_config={
-                    "temperature": 0.7,
-                    "top_p": 0.95,
-                    "top_k": 64,
-                    "max_output_tokens": 8192,
-                },
-                stream=True,
+            chunks = resilient_stream(
+                lambda on_cancel: CASSETTES.stream(
+                    "gemini", "stream_analysis", request,
+                    lambda: iterate_blocking(lambda: self._generate_stream(formatted_prompt, decision, on_cancel)),
+                ),
+                self.api_key,
+                # Without streaming the first chunk is the whole answer, so there is no deadline for it
+                ttft_deadline(decision.estimated_input_tokens) if decision.stream else None,
             )
-
-            for chunk in response:
-                if hasattr(chunk, "text"):
-                    yield chunk.text
+            for text, chunk_usage in chunks:
+                if chunk_usage:
+                    finish_reason = chunk_usage.get("finish_reason") or finish_reason
+                    if "prompt_token_count" in chunk_usage:
+                        usage = chunk_usage
+                if text is not None:
+                    if first_chunk_at is None:
+                        first_chunk_at = time.perf_counter()
+                        LLM_TIME_TO_FIRST_TOKEN.observe(first_chunk_at - started)
+                    output_chars += len(text)
+                    yield text
+            outcome = "ok"
         except Exception as e:
+            outcome = "error"
             yield f"Error analyzing transcripts: {str(e)}"
+        finally:
+            finished = time.perf_counter()
+            LLM_STREAM_SECONDS.observe(finished - started)
+            LLM_STREAMS.inc(outcome=outcome)
+            # Fall back to ~4 characters per token when usage metadata is missing
+            output_tokens = (usage or {}).get("candidates_token_count") or output_chars // 4
+            input_tokens = (usage or {}).get("prompt_token_count") or len(formatted_prompt) // 4
+            if first_chunk_at is not None and finished > first_chunk_at:
+                LLM_TOKENS_PER_SECOND.observe(output_tokens / (finished - first_chunk_at))
+            self.last_usage = {
+                "model_name": decision.model,
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "ttft_ms": int((first_chunk_at - started) * 1000) if first_chunk_at is not None else None,
+                "duration_ms": int((finished - started) * 1000),
+                "estimated": usage is None,
+                # "error" when the stream failed and the text ends with the error message
+                "outcome": outcome,
+            }
+            record_outcome(decision, self.last_usage, finish_reason)
@@ -0,0 +1,107 @@
+import os
+import time
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+from flask_login import UserMixin
+from . import db
+from .models import User
+
+# Seconds a cached identity is trusted. Changes made through this process are
+# invalidated immediately; this bounds how long other workers can lag behind.
+IDENTITY_CACHE_TTL = float(os.getenv("IDENTITY_CACHE_TTL", "30"))
+IDENTITY_CACHE_MAX_ENTRIES = 10000
+
+
+@dataclass(frozen=True, eq=False)
+class Identity(UserMixin):
+    """Read-only snapshot of the User fields requests and socket events read.
+
+    Returned by the Flask-Login user loader, so `current_user` is one of these.
+    Code that modifies the account loads the User row itself and then calls
+    invalidate_identity().
+    """
+
+    id: int
+    email: str
+    username: str
+    gemini_api_key: str
+    created_at: Optional[datetime]
+    tier: str
+
+    @classmethod
+    def from_user(cls, user: User) -> "Identity":
+        return cls(
+            id=user.id,
+            email=user.email,
+            username=user.username,
+            gemini_api_key=user.gemini_api_key,
+            created_at=user.created_at,
+            tier=user.tier,
+        )
+
+
+# user ID -> (expires at, identity)
+_identities: Dict[int, Tuple[float, Identity]] = {}
+# Socket.IO sid -> (user ID, identity snapshot or None once invalidated)
+_connections: Dict[str, Tuple[int, Optional[Identity]]] = {}
+_lock = threading.Lock()
+
+
+def get_identity(user_id: int) -> Optional[Identity]:
+    """The user's identity from the cache, loading the row when missing or expired."""
+    now = time.monotonic()
+    entry = _identities.get(user_id)
+    if entry is not None and entry[0] > now:
+        return entry[1]
+
+    user = db.session.get(User, user_id)
+    if user is None:
+        _identities.pop(user_id, None)
+        return None
+
+    identity = Identity.from_user(user)
+    with _lock:
+        if len(_identities) >= IDENTITY_CACHE_MAX_ENTRIES:
+            for key in [key for key, (expires_at, _) in _identities.items() if expires_at <= now]:
+                del _identities[key]
+            if len(_identities) >= IDENTITY_CACHE_MAX_ENTRIES:
+                _identities.clear()
+        _identities[user_id] = (now + IDENTITY_CACHE_TTL, identity)
+    return identity
+
+
+def invalidate_identity(user_id: int) -> None:
+    """Drop the cached identity and any socket snapshots of this user."""
+    with _lock:
+        _identities.pop(user_id, None)
+        for sid, (connection_user_id, _) in list(_connections.items()):
+            if connection_user_id == user_id:
+                _connections[sid] = (user_id, None)
+
+
+def bind_connection(sid: str, identity: Identity) -> None:
+    """Snapshot the identity of a socket at connect time."""
+    with _lock:
+        _connections[sid] = (identity.id, identity)
+
+
+def release_connection(sid: str) -> None:
+    with _lock:
+        _connections.pop(sid, None)
+
+
+def connection_identity(sid: str) -> Optional[Identity]:
+    """The identity snapshot of a connected socket, reloaded if it was invalidated."""
+    entry = _connections.get(sid)
+    if entry is None:
+        return None
+    user_id, identity = entry
+    if identity is None:
+        identity = get_identity(user_id)
+        if identity is not None:
+            with _lock:
+                if sid in _connections:
+                    _connections[sid] = (user_id, identity)
+    return identity
@@ -0,0 +1,180 @@
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import or_, and_
+
+from . import db
+from .models import Video, PlaylistSync
+from .youtube_service import YouTubeService
+from .catalog import ingest_search_results
+from .digests import queue_digests
+from .metrics import PLAYLIST_SYNCS, PLAYLIST_SYNC_VIDEOS
+
+logger = logging.getLogger(__name__)
+
+# Transcripts fetched at once while ingesting new videos
+INGEST_TRANSCRIPT_CONCURRENCY = int(os.getenv('INGEST_TRANSCRIPT_CONCURRENCY', '8'))
+# A sync left 'syncing' this long (its process died) may be started again
+PLAYLIST_SYNC_LEASE_SECONDS = int(os.getenv('PLAYLIST_SYNC_LEASE_SECONDS', '1800'))
+
+
+class IngestError(Exception):
+    """A playlist could not be added; the message is meant for the user."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def add_playlist(yt_service: YouTubeService, source: str, user_id: Optional[int] = None) -> PlaylistSync:
+    """The sync for a playlist or channel reference, created on first use."""
+    if not YouTubeService.parse_playlist_source(source):
+        raise IngestError('Not a YouTube playlist or channel')
+    resolved = yt_service.resolve_playlist(source)
+    if resolved is None:
+        raise IngestError('Playlist or channel not found', status=404)
+
+    sync = PlaylistSync.query.filter_by(playlist_id=resolved['playlist_id']).first()
+    if sync is None:
+        sync = PlaylistSync(source=source.strip(), user_id=user_id, **resolved)
+        db.session.add(sync)
+        db.session.commit()
+    return sync
+
+
+def claim_sync(sync_id: int) -> bool:
+    """Mark a sync as running unless another one is; False if it already is."""
+    now = datetime.utcnow()
+    claimed = PlaylistSync.query.filter(
+        PlaylistSync.id == sync_id,
+        or_(
+            PlaylistSync.status != 'syncing',
+            and_(PlaylistSync.status == 'syncing',
+                 PlaylistSync.sync_started_at <= now - timedelta(seconds=PLAYLIST_SYNC_LEASE_SECONDS)),
+        ),
+    ).update({'status': 'syncing', 'sync_started_at': now}, synchronize_session=False)
+    db.session.commit()
+    return bool(claimed)
+
+
+def _new_video_ids(yt_service: YouTubeService, sync: PlaylistSync) -> Dict[str, Any]:
+    """Page through the playlist and collect the videos not in the library yet.
+
+    The first page is requested with the ETag of the last sync, so an
+    unchanged playlist costs one call. Uploads playlists list the newest
+    videos first, so paging stops at the first known video no newer than the
+    last sync's newest.
+    """
+    found = {'video_ids': [], 'etag': sync.etag, 'newest': sync.last_published_at, 'units': 0, 'changed': False}
+    page_token = None
+    while True:
+        response = yt_service.list_playlist_page(
+            sync.playlist_id, page_token, etag=None if page_token else sync.etag
+        )
+        found['units'] += 1
+        if response is None:
+            return found
+        if page_token is None:
+            found['etag'], found['changed'] = response.get('etag'), True
+
+        page = []
+        for item in response.get('items', []):
+            details = item.get('contentDetails', {})
+            if details.get('videoId'):
+                page.append((details['videoId'], YouTubeService.parse_published_at(details.get('videoPublishedAt'))))
+        known = {
+            row.video_id for row in
+            Video.query.with_entities(Video.video_id).filter(Video.video_id.in_([v for v, _ in page]))
+        }
+        reached_known = False
+        for video_id, published_at in page:
+            if published_at and (found['newest'] is None or published_at > found['newest']):
+                found['newest'] = published_at
+            if video_id in known:
+                if (sync.last_published_at and published_at and published_at <= sync.last_published_at
+                        and sync.playlist_id.startswith('UU')):
+                    reached_known = True
+                    break
+                continue
+            if video_id not in found['video_ids']:
+                found['video_ids'].append(video_id)
+
+        page_token = response.get('nextPageToken')
+        if reached_known or not page_token:
+            return found
+
+
+def fetch_transcripts(yt_service: YouTubeService, videos: List[Dict[str, Any]]) -> Dict[str, str]:
+    """Transcripts of `videos` by video ID, fetched in parallel; missing ones are left out."""
+    with ThreadPoolExecutor(max_workers=INGEST_TRANSCRIPT_CONCURRENCY, thread_name_prefix='ingest') as pool:
+        transcripts = pool.map(yt_service.get_transcript, [video['url'] for video in videos])
+        return {video['video_id']: text for video, text in zip(videos, transcripts) if text}
+
+
+def sync_playlist(yt_service: YouTubeService, sync: PlaylistSync) -> Dict[str, int]:
+    """Add the playlist's videos that are not in the library yet, with their transcripts.
+
+    Details are fetched 50 videos per call and transcripts in parallel; each
+    group of 50 is committed before the next, so an interrupted sync keeps what
+    it stored and the next one skips those videos.
+    """
+    found = _new_video_ids(yt_service, sync)
+    units = found['units']
+    video_ids = found['video_ids']
+    added = transcripts = 0
+    for start in range(0, len(video_ids), 50):
+        videos = yt_service.get_videos(video_ids[start:start + 50])
+        units += 1
+        ingest_search_results(videos)
+        fetched = fetch_transcripts(yt_service, videos)
+        for video in Video.query.filter(Video.video_id.in_(list(fetched))):
+            if not video.transcript:
+                video.transcript = fetched[video.video_id]
+        db.session.commit()
+        queue_digests(list(fetched), sync.user_id)
+        added += len(videos)
+        transcripts += len(fetched)
+
+    sync.etag = found['etag']
+    sync.last_published_at = found['newest']
+    sync.video_count += added
+    sync.last_new_videos = added
+    sync.last_quota_units = units
+    sync.last_error = None
+    sync.status = 'idle'
+    sync.last_synced_at = datetime.utcnow()
+    db.session.commit()
+    PLAYLIST_SYNCS.inc(outcome='changed' if found['changed'] else 'unchanged')
+    PLAYLIST_SYNC_VIDEOS.inc(added)
+    logger.info(
+        f"Synced playlist {sync.playlist_id}: {added} new videos, {transcripts} transcripts, {units} quota units"
+    )
+    return {'new_videos': added, 'transcripts': transcripts, 'quota_units': units}
+
+
+def run_sync(app, sync_id: int) -> None:
+    """Sync a claimed playlist, recording a failure on it; meant to run as a background task."""
+    with app.app_context():
+        sync = db.session.get(PlaylistSync, sync_id)
+        try:
+            sync_playlist(YouTubeService(os.getenv('YOUTUBE_API_KEY')), sync)
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Playlist sync {sync_id} failed: {str(e)}", exc_info=True)
+            sync = db.session.get(PlaylistSync, sync_id)
+            sync.status, sync.last_error = 'failed', str(e)[:500]
+            db.session.commit()
+            PLAYLIST_SYNCS.inc(outcome='failed')
+
+
+def start_sync(app, sync: PlaylistSync) -> bool:
+    """Sync in the background; False if the playlist is already being synced."""
+    from . import socketio
+
+    if not claim_sync(sync.id):
+        return False
+    socketio.start_background_task(run_sync, app, sync.id)
+    return True
@@ -0,0 +1,473 @@
+import time
+import logging
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds, from fast cache paths up to long LLM streams
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+logger = logging.getLogger(__name__)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """Base class: a named metric with a fixed set of label names."""
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [
+            "# HELP {} {}".format(self.name, self.documentation),
+            "# TYPE {} {}".format(self.name, self.type),
+        ]
+        for suffix, labels, value in self.samples():
+            lines.append("{}{}{} {}".format(self.name, suffix, labels, _format_value(value)))
+        return lines
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set_total(self, value: float, **labels) -> None:
+        """Mirror a monotonic total kept elsewhere (used by scrape-time collectors)."""
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield "", _format_labels(self.labelnames, key), value
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield "", _format_labels(self.labelnames, key), value
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label key -> [bucket counts..., sum, count]
+        self._values = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            values = [(key, list(state)) for key, state in self._values.items()]
+        for key, state in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                yield "_bucket", _format_labels(
+                    self.labelnames, key, 'le="{}"'.format(_format_value(bound))
+                ), cumulative
+            yield "_bucket", _format_labels(self.labelnames, key, 'le="+Inf"'), state[-1]
+            yield "_sum", _format_labels(self.labelnames, key), state[-2]
+            yield "_count", _format_labels(self.labelnames, key), state[-1]
+
+
+class Registry:
+    """Holds metrics and callbacks; nothing is aggregated until a scrape calls render()."""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], None]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], None]) -> None:
+        """Register a callback run at scrape time to refresh derived metrics."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e:
+                # The scrape still serves the last values the collector set
+                name = getattr(collector, "__qualname__", repr(collector))
+                logger.error(f"Metrics collector {name} failed: {str(e)}", exc_info=True)
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(
+    name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Optional[Sequence[float]] = None
+) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets or DEFAULT_BUCKETS))
+
+
+# YouTube Data API and transcripts
+YOUTUBE_REQUEST_SECONDS = histogram(
+    "youinsight_youtube_request_seconds",
+    "Latency of YouTube Data API and transcript requests.",
+    ["operation"],
+)
+YOUTUBE_REQUESTS = counter(
+    "youinsight_youtube_requests_total",
+    "YouTube Data API and transcript requests by outcome.",
+    ["operation", "outcome"],
+)
+SEARCHES = counter(
+    "youinsight_searches_total",
+    "Video searches answered, by where the results came from.",
+    ["source"],
+)
+
+# Gemini streaming
+LLM_TIME_TO_FIRST_TOKEN = histogram(
+    "youinsight_llm_time_to_first_token_seconds",
+    "Time from sending a Gemini request to receiving the first streamed chunk.",
+)
+LLM_STREAM_SECONDS = histogram(
+    "youinsight_llm_stream_seconds",
+    "Total duration of Gemini analysis streams.",
+)
+LLM_TOKENS_PER_SECOND = histogram(
+    "youinsight_llm_output_tokens_per_second",
+    "Output token rate of Gemini streams after the first token.",
+    buckets=(5, 10, 25, 50, 100, 200, 400, 800, 1600),
+)
+LLM_STREAMS = counter(
+    "youinsight_llm_streams_total",
+    "Gemini analysis streams by outcome.",
+    ["outcome"],
+)
+LLM_RETRIES = counter(
+    "youinsight_llm_retries_total",
+    "Gemini requests retried after a transient error, by error kind.",
+    ["error"],
+)
+LLM_HEDGES = counter(
+    "youinsight_llm_hedges_total",
+    "Gemini requests duplicated after missing the first-token deadline, by which answered first "
+    "(primary, hedge, neither).",
+    ["winner"],
+)
+LLM_CIRCUIT_EVENTS = counter(
+    "youinsight_llm_circuit_events_total",
+    "Per-API-key Gemini circuit breaker events (opened, half_open, closed, rejected).",
+    ["event"],
+)
+MODEL_ROUTES = counter(
+    "youinsight_model_routes_total",
+    "Gemini requests by routed tier, model, prompt class and outcome (ok, truncated, error, cancelled).",
+    ["tier", "model", "prompt_class", "outcome"],
+)
+MODEL_ROUTE_TTFT_SECONDS = histogram(
+    "youinsight_model_route_time_to_first_token_seconds",
+    "Time to the first chunk of Gemini requests, by routed tier.",
+    ["tier"],
+)
+MODEL_ROUTE_SECONDS = histogram(
+    "youinsight_model_route_seconds",
+    "Total duration of Gemini requests, by routed tier.",
+    ["tier"],
+)
+
+# Database
+DB_COMMIT_SECONDS = histogram(
+    "youinsight_db_commit_seconds",
+    "Latency of SQLAlchemy session commits.",
+)
+
+# Socket.IO
+ACTIVE_SOCKETS = gauge(
+    "youinsight_active_sockets",
+    "Connected Socket.IO clients in this process.",
+)
+SOCKET_EVENT_SECONDS = histogram(
+    "youinsight_socket_event_seconds",
+    "Handler duration of Socket.IO events.",
+    ["event"],
+)
+RATE_LIMITED = counter(
+    "youinsight_rate_limited_total",
+    "Requests and socket events rejected by the rate limiter.",
+    ["event"],
+)
+ANALYSES_IN_FLIGHT = gauge(
+    "youinsight_analyses_in_flight",
+    "Analyses currently streaming from Gemini in this process.",
+)
+ANALYSES_QUEUED = gauge(
+    "youinsight_analyses_queued",
+    "Analyses accepted but not yet streaming (fetching videos, transcripts, persisting).",
+)
+ANALYSIS_QUEUE_WAIT_SECONDS = histogram(
+    "youinsight_analysis_queue_wait_seconds",
+    "Time analyses waited for a slot in the fair scheduler.",
+)
+ANALYSES_REJECTED = counter(
+    "youinsight_analyses_rejected_total",
+    "Analyses turned away by admission control, by reason.",
+    ["reason"],
+)
+ANALYSIS_STREAM_REQUESTS = counter(
+    "youinsight_analysis_stream_requests_total",
+    "HTTP analysis streams opened, by format (sse, ndjson) and kind (new, resume).",
+    ["format", "kind"],
+)
+BATCH_ITEMS = counter(
+    "youinsight_batch_items_total",
+    "Batch items processed, by outcome (done, failed, retried, dropped).",
+    ["outcome"],
+)
+BATCH_ITEM_SECONDS = histogram(
+    "youinsight_batch_item_seconds",
+    "Time to fetch and analyze one batch item.",
+)
+PLAYLIST_SYNCS = counter(
+    "youinsight_playlist_syncs_total",
+    "Playlist and channel syncs, by outcome (changed, unchanged, failed).",
+    ["outcome"],
+)
+PLAYLIST_SYNC_VIDEOS = counter(
+    "youinsight_playlist_sync_videos_total",
+    "New videos added to the library by playlist and channel syncs.",
+)
+WATCH_RUNS = counter(
+    "youinsight_watch_runs_total",
+    "Watch query runs, by outcome (changed, unchanged, failed).",
+    ["outcome"],
+)
+WATCH_NEW_VIDEOS = counter(
+    "youinsight_watch_new_videos_total",
+    "Newly found videos analyzed by watch query runs.",
+)
+TRANSCRIPT_PROBES = counter(
+    "youinsight_transcript_probes_total",
+    "Transcript availability probes, by result (available, none, error).",
+    ["result"],
+)
+TRANSCRIPT_LOOKUPS_SKIPPED = counter(
+    "youinsight_transcript_lookups_skipped_total",
+    "Transcript fetches skipped because the video is known to have none.",
+)
+VIDEO_STATS_REFRESHED = counter(
+    "youinsight_video_stats_refreshed_total",
+    "Videos whose statistics were checked, by result (updated, unchanged, not_modified, missing).",
+    ["result"],
+)
+VIDEO_STATS_QUOTA_UNITS = counter(
+    "youinsight_video_stats_quota_units_total",
+    "YouTube Data API quota units spent refreshing video statistics.",
+)
+DIGESTS_GENERATED = counter(
+    "youinsight_digests_generated_total",
+    "Standard video digests generated in the background, by outcome (done, failed, retried).",
+    ["outcome"],
+)
+DIGEST_ANSWERS = counter(
+    "youinsight_digest_answers_total",
+    "Analyses served from stored digests, by kind and mode (instant, context).",
+    ["kind", "mode"],
+)
+EXPORT_ROWS = counter(
+    "youinsight_export_rows_total",
+    "Analyses written to history exports, by format (ndjson, csv).",
+    ["format"],
+)
+
+# Cache, refreshed from the cache backend's own counters at scrape time
+CACHE_REQUESTS = counter(
+    "youinsight_cache_requests_total",
+    "Cache lookups in this process since start, by namespace and result.",
+    ["namespace", "result"],
+)
+CACHE_EVICTIONS = counter(
+    "youinsight_cache_evictions_total",
+    "Cache evictions in this process since start, by tier.",
+    ["tier"],
+)
+CACHE_BYTES = gauge(
+    "youinsight_cache_bytes",
+    "Bytes currently held by each cache tier.",
+    ["tier"],
+)
+
+
+class AnalysisTracker:
+    """Moves one analysis through the queued and in-flight gauges."""
+
+    def __init__(self):
+        self.state = None
+
+    def __enter__(self):
+        ANALYSES_QUEUED.inc()
+        self.state = "queued"
+        return self
+
+    def streaming(self) -> None:
+        if self.state == "queued":
+            ANALYSES_QUEUED.dec()
+            ANALYSES_IN_FLIGHT.inc()
+            self.state = "streaming"
+
+    def __exit__(self, *exc_info):
+        if self.state == "queued":
+            ANALYSES_QUEUED.dec()
+        elif self.state == "streaming":
+            ANALYSES_IN_FLIGHT.dec()
+        self.state = None
+        return False
+
+
+def _before_commit(session):
+    session.info["commit_started"] = time.perf_counter()
+
+
+def _after_commit(session):
+    started = session.info.pop("commit_started", None)
+    if started is not None:
+        DB_COMMIT_SECONDS.observe(time.perf_counter() - started)
+
+
+def _after_rollback(session):
+    session.info.pop("commit_started", None)
+
+
+def instrument_sqlalchemy() -> None:
+    """Time every session commit through SQLAlchemy's session events."""
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session
+
+    for name, listener in (
+        ("before_commit", _before_commit),
+        ("after_commit", _after_commit),
+        ("after_rollback", _after_rollback),
+    ):
+        if not event.contains(Session, name, listener):
+            event.listen(Session, name, listener)
+
+
+_instrumented_caches = set()
+
+
+def instrument_cache(cache) -> None:
+    """Expose the cache backend's stats() at scrape time, if it has any."""
+    if id(cache) in _instrumented_caches:
+        return
+    _instrumented_caches.add(id(cache))
+
+    def collect():
+        backend = cache.cache
+        if not hasattr(backend, "stats"):
+            return
+        stats = backend.stats()
+        for namespace, counts in stats.get("namespaces", {}).items():
+            for result in ("memory_hits", "disk_hits", "stale_hits", "misses"):
+                CACHE_REQUESTS.set_total(counts.get(result, 0), namespace=namespace, result=result)
+        CACHE_EVICTIONS.set_total(stats.get("memory_evictions", 0), tier="memory")
+        CACHE_EVICTIONS.set_total(stats.get("disk_evictions", 0), tier="disk")
+        CACHE_BYTES.set(stats.get("memory_bytes", 0), tier="memory")
+        CACHE_BYTES.set(stats.get("disk_bytes", 0), tier="disk")
+
+    REGISTRY.add_collector(collect)
@@ -0,0 +1,165 @@
+import os
+import re
+import json
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from .metrics import MODEL_ROUTES, MODEL_ROUTE_TTFT_SECONDS, MODEL_ROUTE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Tiers are tried in order and the first that fits the request is used. A tier
+# fits when the prompt's class is in its "classes" (any class when it has
+# none) and the estimated input tokens are at most "max_input_tokens" (no
+# limit when it has none), so the last tier should take everything. "stream"
+# is whether interactive analyses stream from it; background ones are always
+# generated in one response. Override with MODEL_TIERS='[{"name": ..., ...}]'.
+DEFAULT_MODEL_TIERS = [
+    {"name": "quick", "model": "gemini-2.0-flash-lite", "classes": ["question"],
+     "max_input_tokens": 12_000, "max_output_tokens": 1024, "stream": True},
+    {"name": "light", "model": "gemini-2.0-flash-lite", "classes": ["question", "standard"],
+     "max_input_tokens": 32_000, "max_output_tokens": 2048, "stream": True},
+    {"name": "report", "model": "gemini-2.0-flash-exp", "classes": ["report"],
+     "max_input_tokens": 900_000, "max_output_tokens": 8192, "stream": True},
+    {"name": "standard", "model": "gemini-2.0-flash-exp",
+     "max_input_tokens": 900_000, "max_output_tokens": 4096, "stream": True},
+    {"name": "long-context", "model": "gemini-1.5-pro", "max_output_tokens": 8192, "stream": True},
+]
+
+PROMPT_CLASSES = ("question", "standard", "report", "general")
+
+# Questions longer than this are treated as general prompts
+_QUESTION_MAX_WORDS = 30
+# Prompts longer than this ask for more than a short answer
+_REPORT_MIN_WORDS = 60
+_QUESTION_WORDS = set("""
+    who what when where which why how is are was were do does did can could
+    should would will has have
+""".split())
+_REPORT_WORDS = set("""
+    compare comparison contrast report essay article blog outline
+    detailed thorough comprehensive depth chapter chapters timeline
+    rewrite translate script breakdown
+""".split())
+
+
+@dataclass(frozen=True)
+class Route:
+    """The model and generation settings chosen for one request."""
+
+    tier: str
+    model: str
+    max_output_tokens: int
+    stream: bool
+    prompt_class: str
+    estimated_input_tokens: int
+
+    def generation_config(self) -> Dict[str, Any]:
+        return {
+            "temperature": 0.7,
+            "top_p": 0.95,
+            "top_k": 64,
+            "max_output_tokens": self.max_output_tokens,
+        }
+
+
+def _load_tiers() -> List[Dict[str, Any]]:
+    raw = os.getenv("MODEL_TIERS")
+    if not raw:
+        return DEFAULT_MODEL_TIERS
+    try:
+        tiers = json.loads(raw)
+        for tier in tiers:
+            if not tier["name"] or not tier["model"] or int(tier["max_output_tokens"]) <= 0:
+                raise ValueError(f"Incomplete tier {tier!r}")
+            unknown = set(tier.get("classes") or ()) - set(PROMPT_CLASSES)
+            if unknown:
+                raise ValueError(f"Unknown prompt classes {', '.join(sorted(unknown))}")
+        if not tiers:
+            raise ValueError("No tiers")
+    except (ValueError, TypeError, KeyError, AttributeError) as e:
+        logger.error(f"Ignoring invalid MODEL_TIERS: {str(e)}")
+        return DEFAULT_MODEL_TIERS
+    return tiers
+
+
+MODEL_TIERS = _load_tiers()
+
+
+def estimate_tokens(text: str) -> int:
+    """~4 characters per token, the same estimate usage falls back to."""
+    return len(text) // 4
+
+
+def classify_prompt(prompt: str) -> str:
+    """One of PROMPT_CLASSES.
+
+    "standard" is a request for a summary, key takeaways or main arguments,
+    "question" a short question, "report" a request for long-form output.
+    """
+    # Imported here: digests imports GeminiService, which routes through this module
+    from .digests import DIGEST_KINDS, recognize_intent
+
+    if recognize_intent(prompt) or any(prompt == kind['prompt'] for kind in DIGEST_KINDS.values()):
+        return "standard"
+    words = re.findall(r"[a-z]+", (prompt or "").lower())
+    if len(words) > _REPORT_MIN_WORDS or _REPORT_WORDS & set(words):
+        return "report"
+    if words and len(words) <= _QUESTION_MAX_WORDS and (
+        prompt.rstrip().endswith("?") or words[0] in _QUESTION_WORDS
+    ):
+        return "question"
+    return "general"
+
+
+def route(prompt: str, formatted_prompt: str, interactive: bool = True) -> Route:
+    """Pick the tier for a prompt and the full text that will be sent for it."""
+    prompt_class = classify_prompt(prompt)
+    input_tokens = estimate_tokens(formatted_prompt)
+    for tier in MODEL_TIERS:
+        if tier.get("classes") and prompt_class not in tier["classes"]:
+            continue
+        if tier.get("max_input_tokens") is not None and input_tokens > tier["max_input_tokens"]:
+            continue
+        break
+    else:
+        # Nothing fits; the last tier is the one meant for everything left over
+        tier = MODEL_TIERS[-1]
+    return Route(
+        tier=tier["name"],
+        model=tier["model"],
+        max_output_tokens=int(tier["max_output_tokens"]),
+        stream=bool(tier.get("stream", True)) and interactive,
+        prompt_class=prompt_class,
+        estimated_input_tokens=input_tokens,
+    )
+
+
+def record_outcome(decision: Route, usage: Dict[str, Any], finish_reason: Optional[str] = None) -> None:
+    """Log a routing decision with how it went, one JSON object per line.
+
+    "truncated" is set when the output hit the tier's max_output_tokens, the
+    sign that a tier's cap is too low for the prompts it gets.
+    """
+    outcome = usage.get("outcome")
+    if outcome == "ok" and finish_reason == "MAX_TOKENS":
+        outcome = "truncated"
+    MODEL_ROUTES.inc(tier=decision.tier, model=decision.model, prompt_class=decision.prompt_class, outcome=outcome)
+    if usage.get("ttft_ms") is not None:
+        MODEL_ROUTE_TTFT_SECONDS.observe(usage["ttft_ms"] / 1000, tier=decision.tier)
+    MODEL_ROUTE_SECONDS.observe(usage["duration_ms"] / 1000, tier=decision.tier)
+    logger.info("Model route " + json.dumps({
+        "tier": decision.tier,
+        "model": decision.model,
+        "prompt_class": decision.prompt_class,
+        "stream": decision.stream,
+        "estimated_input_tokens": decision.estimated_input_tokens,
+        "max_output_tokens": decision.max_output_tokens,
+        "input_tokens": usage.get("input_tokens"),
+        "output_tokens": usage.get("output_tokens"),
+        "ttft_ms": usage.get("ttft_ms"),
+        "duration_ms": usage.get("duration_ms"),
+        "finish_reason": finish_reason,
+        "outcome": outcome,
+    }))
@@ -10,6 +10,8 @@ class User(UserMixin, db.Model):
     password_hash = db.Column(db.String(128), nullable=False)
     gemini_api_key = db.Column(db.String(100), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Selects the rate limits in youinsight.rate_limit
+    tier = db.Column(db.String(20), nullable=False, default='free', server_default='free')
     reset_token = db.Column(db.String(100), nullable=True)
     reset_token_expiry = db.Column(db.DateTime, nullable=True)
     analyses = db.relationship('Analysis', backref='user', lazy=True)
@@ -38,12 +40,18 @@ class User(UserMixin, db.Model):
 
 class Video(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    video_id = db.Column(db.String(20), nullable=False)
+    video_id = db.Column(db.String(20), nullable=False, index=True)
     title = db.Column(db.String(200), nullable=False)
     url = db.Column(db.String(200), nullable=False)
     view_count = db.Column(db.Integer, nullable=True)
+    channel_title = db.Column(db.String(200), nullable=True)
+    thumbnail_url = db.Column(db.String(300), nullable=True)
+    published_at = db.Column(db.DateTime, nullable=True)
     transcript = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Kept current by the background statistics refresher (video_stats.py)
+    stats_etag = db.Column(db.String(100), nullable=True)
+    stats_refreshed_at = db.Column(db.DateTime, nullable=True, index=True)
     analyses = db.relationship('AnalysisVideo', backref='video', lazy=True)
     
     def __repr__(self):
@@ -56,10 +64,17 @@ class Video(db.Model):
             'title': self.title,
             'url': self.url,
             'view_count': self.view_count,
+            'channel_title': self.channel_title,
+            'thumbnail_url': self.thumbnail_url,
+            'published_at': self.published_at.isoformat() if self.published_at else None,
+            'stats_refreshed_at': self.stats_refreshed_at.isoformat() if self.stats_refreshed_at else None,
             'created_at': self.created_at.isoformat()
         }
 
 class Analysis(db.Model):
+    # A user's analyses in id order, for exports that walk them in one pass
+    __table_args__ = (db.Index('ix_analysis_user_id_id', 'user_id', 'id'),)
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     search_term = db.Column(db.String(100), nullable=True)
@@ -71,6 +86,13 @@ class Analysis(db.Model):
     conversation_id = db.Column(db.String(100), nullable=True)
     is_conversation = db.Column(db.Boolean, default=False)
     messages = db.Column(db.Text, nullable=True)  # JSON string of conversation messages
+    # Token and latency accounting
+    model_name = db.Column(db.String(64), nullable=True)
+    input_tokens = db.Column(db.Integer, nullable=True)
+    output_tokens = db.Column(db.Integer, nullable=True)
+    ttft_ms = db.Column(db.Integer, nullable=True)
+    duration_ms = db.Column(db.Integer, nullable=True)
+    cost_usd = db.Column(db.Float, nullable=True)
     
     def __repr__(self):
         return f'<Analysis {self.id}>'
@@ -85,7 +107,13 @@ class Analysis(db.Model):
             'created_at': self.created_at.isoformat(),
             'videos': [av.video.to_dict() for av in self.videos],
             'is_conversation': self.is_conversation,
-            'conversation_id': self.conversation_id
+            'conversation_id': self.conversation_id,
+            'model_name': self.model_name,
+            'input_tokens': self.input_tokens,
+            'output_tokens': self.output_tokens,
+            'ttft_ms': self.ttft_ms,
+            'duration_ms': self.duration_ms,
+            'cost_usd': self.cost_usd
         }
         
         # Add messages if this is a conversation
@@ -100,9 +128,271 @@ class Analysis(db.Model):
 
 class AnalysisVideo(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    analysis_id = db.Column(db.Integer, db.ForeignKey('analysis.id'), nullable=False)
+    analysis_id = db.Column(db.Integer, db.ForeignKey('analysis.id'), nullable=False, index=True)
     video_id = db.Column(db.Integer, db.ForeignKey('video.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     def __repr__(self):
         return f'<AnalysisVideo {self.id}>'
+
+class EmailOutbox(db.Model):
+    """An email waiting for, or done with, delivery by the outbox worker in email_service."""
+    __table_args__ = (db.Index('ix_email_outbox_status_next_attempt_at', 'status', 'next_attempt_at'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(200), nullable=False)
+    html = db.Column(db.Text, nullable=False)
+    # pending -> sending -> sent, or back to pending for a retry, or failed
+    status = db.Column(db.String(16), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    # Due time while pending; lease expiry while sending
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    claimed_by = db.Column(db.String(32), nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<EmailOutbox {self.id} {self.status}>'
+
+class UsageRollup(db.Model):
+    """Per-user, per-day, per-model totals, updated as each analysis completes."""
+    __table_args__ = (db.UniqueConstraint('user_id', 'day', 'model_name', name='uq_usage_rollup_user_day_model'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False, index=True)
+    model_name = db.Column(db.String(64), nullable=False)
+    analyses = db.Column(db.Integer, nullable=False, default=0)
+    input_tokens = db.Column(db.Integer, nullable=False, default=0)
+    output_tokens = db.Column(db.Integer, nullable=False, default=0)
+    total_ttft_ms = db.Column(db.Integer, nullable=False, default=0)
+    total_duration_ms = db.Column(db.Integer, nullable=False, default=0)
+    cost_usd = db.Column(db.Float, nullable=False, default=0.0)
+
+    def __repr__(self):
+        return f'<UsageRollup {self.user_id} {self.day} {self.model_name}>'
+
+    def to_dict(self):
+        return {
+            'day': self.day.isoformat(),
+            'model_name': self.model_name,
+            'analyses': self.analyses,
+            'input_tokens': self.input_tokens,
+            'output_tokens': self.output_tokens,
+            'avg_ttft_ms': self.total_ttft_ms // self.analyses if self.analyses else None,
+            'avg_duration_ms': self.total_duration_ms // self.analyses if self.analyses else None,
+            'cost_usd': round(self.cost_usd, 6)
+        }
+
+class BatchJob(db.Model):
+    """One prompt run separately over many videos by the batch workers in youinsight.batch."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    prompt = db.Column(db.Text, nullable=False)
+    # running -> completed, or cancelled
+    status = db.Column(db.String(16), nullable=False, default='running', index=True)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    # Items finished so far, successfully or not; also hands out BatchItem.seq
+    processed = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    items = db.relationship('BatchItem', backref='job', lazy='dynamic')
+
+    def __repr__(self):
+        return f'<BatchJob {self.id} {self.status}>'
+
+class BatchItem(db.Model):
+    """One video of a batch job and, once processed, its result."""
+    __table_args__ = (
+        db.Index('ix_batch_item_job_id_status_position', 'job_id', 'status', 'position'),
+        db.Index('ix_batch_item_job_id_seq', 'job_id', 'seq'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey('batch_job.id'), nullable=False)
+    # Order the video was submitted in
+    position = db.Column(db.Integer, nullable=False)
+    video_id = db.Column(db.String(20), nullable=False)
+    title = db.Column(db.String(200), nullable=True)
+    # pending -> running -> done or failed, or back to pending for a retry; cancelled
+    status = db.Column(db.String(16), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    claimed_by = db.Column(db.String(32), nullable=True)
+    # Lease expiry while running (the item is retried after a crash); retry time while pending
+    lease_expires_at = db.Column(db.DateTime, nullable=True)
+    # Completion order within the job; results are streamed by it
+    seq = db.Column(db.Integer, nullable=True)
+    result = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    model_name = db.Column(db.String(64), nullable=True)
+    input_tokens = db.Column(db.Integer, nullable=True)
+    output_tokens = db.Column(db.Integer, nullable=True)
+    ttft_ms = db.Column(db.Integer, nullable=True)
+    duration_ms = db.Column(db.Integer, nullable=True)
+    cost_usd = db.Column(db.Float, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<BatchItem {self.job_id}/{self.position} {self.status}>'
+
+class PlaylistSync(db.Model):
+    """A playlist, or a channel's uploads playlist, whose videos youinsight.ingest keeps in the library."""
+    id = db.Column(db.Integer, primary_key=True)
+    playlist_id = db.Column(db.String(64), unique=True, nullable=False)
+    channel_id = db.Column(db.String(64), nullable=True)
+    title = db.Column(db.String(200), nullable=True)
+    # The playlist or channel reference it was added with
+    source = db.Column(db.String(300), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    # idle -> syncing -> idle, or failed
+    status = db.Column(db.String(16), nullable=False, default='idle')
+    # ETag of the first page at the last complete sync; unchanged means no new videos
+    etag = db.Column(db.String(100), nullable=True)
+    # Newest publish time seen; paging stops once it reaches older, known videos
+    last_published_at = db.Column(db.DateTime, nullable=True)
+    video_count = db.Column(db.Integer, nullable=False, default=0)
+    # New videos and quota units of the last sync
+    last_new_videos = db.Column(db.Integer, nullable=False, default=0)
+    last_quota_units = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text, nullable=True)
+    sync_started_at = db.Column(db.DateTime, nullable=True)
+    last_synced_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<PlaylistSync {self.playlist_id} {self.status}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'playlist_id': self.playlist_id,
+            'channel_id': self.channel_id,
+            'title': self.title,
+            'source': self.source,
+            'status': self.status,
+            'video_count': self.video_count,
+            'last_new_videos': self.last_new_videos,
+            'last_quota_units': self.last_quota_units,
+            'last_error': self.last_error,
+            'last_published_at': self.last_published_at.isoformat() if self.last_published_at else None,
+            'last_synced_at': self.last_synced_at.isoformat() if self.last_synced_at else None,
+            'created_at': self.created_at.isoformat()
+        }
+
+class WatchQuery(db.Model):
+    """A saved search and prompt that youinsight.watch re-runs on a schedule over newly found videos."""
+    __table_args__ = (db.Index('ix_watch_query_enabled_next_run_at', 'enabled', 'next_run_at'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    search_term = db.Column(db.String(100), nullable=False)
+    prompt = db.Column(db.Text, nullable=False)
+    max_results = db.Column(db.Integer, nullable=False, default=10)
+    interval_minutes = db.Column(db.Integer, nullable=False, default=1440)
+    enabled = db.Column(db.Boolean, nullable=False, default=True)
+    # Due time; moved forward by a full interval when a run is claimed
+    next_run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # Start of the last successful run; the next run searches videos published since
+    last_run_at = db.Column(db.DateTime, nullable=True)
+    last_new_videos = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text, nullable=True)
+    # Running summary of every video analyzed so far, merged with each run's new videos
+    summary = db.Column(db.Text, nullable=True)
+    last_analysis_id = db.Column(db.Integer, db.ForeignKey('analysis.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    videos = db.relationship('WatchQueryVideo', backref='watch', lazy='dynamic', cascade='all, delete-orphan')
+
+    def __repr__(self):
+        return f'<WatchQuery {self.id} {self.search_term}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'search_term': self.search_term,
+            'prompt': self.prompt,
+            'max_results': self.max_results,
+            'interval_minutes': self.interval_minutes,
+            'enabled': self.enabled,
+            'next_run_at': self.next_run_at.isoformat(),
+            'last_run_at': self.last_run_at.isoformat() if self.last_run_at else None,
+            'last_new_videos': self.last_new_videos,
+            'last_error': self.last_error,
+            'summary': self.summary,
+            'last_analysis_id': self.last_analysis_id,
+            'created_at': self.created_at.isoformat()
+        }
+
+class WatchQueryVideo(db.Model):
+    """A video a watch query has found: processed, so later runs skip it, or
+    still pending its transcript, so later runs try it again."""
+    __table_args__ = (db.UniqueConstraint('watch_id', 'video_id', name='uq_watch_query_video_watch_video'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    watch_id = db.Column(db.Integer, db.ForeignKey('watch_query.id'), nullable=False)
+    video_id = db.Column(db.String(20), nullable=False)
+    # The run's analysis; None when the video had no transcript
+    analysis_id = db.Column(db.Integer, db.ForeignKey('analysis.id'), nullable=True)
+    # Its transcript could not be fetched yet; it has not been analyzed
+    pending = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+    first_seen_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<WatchQueryVideo {self.watch_id} {self.video_id}>'
+
+class TranscriptAvailability(db.Model):
+    """Whether a video has transcripts, as last probed, so lookups bound to fail are skipped."""
+    id = db.Column(db.Integer, primary_key=True)
+    video_id = db.Column(db.String(20), unique=True, nullable=False)
+    # Comma-separated language codes, "-auto" marking generated ones; empty when there are none
+    languages = db.Column(db.String(300), nullable=False, default='')
+    checked_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # Re-probed after this; sooner for "none", as captions can be added later
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<TranscriptAvailability {self.video_id} {self.languages or "none"}>'
+
+class VideoDigest(db.Model):
+    """A standard analysis of one video (summary, takeaways, ...), generated in the
+    background once its transcript is stored so matching prompts are answered from it."""
+    __table_args__ = (
+        db.UniqueConstraint('video_id', 'kind', name='uq_video_digest_video_kind'),
+        db.Index('ix_video_digest_status_lease_expires_at', 'status', 'lease_expires_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    video_id = db.Column(db.String(20), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)
+    # pending -> running -> done or failed, or back to pending for a retry
+    status = db.Column(db.String(16), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    # Lease expiry while running; retry time while pending
+    lease_expires_at = db.Column(db.DateTime, nullable=True)
+    # Whose Gemini key generates it when no DIGEST_GEMINI_API_KEY is set
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    content = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    model_name = db.Column(db.String(64), nullable=True)
+    input_tokens = db.Column(db.Integer, nullable=True)
+    output_tokens = db.Column(db.Integer, nullable=True)
+    ttft_ms = db.Column(db.Integer, nullable=True)
+    duration_ms = db.Column(db.Integer, nullable=True)
+    cost_usd = db.Column(db.Float, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<VideoDigest {self.video_id} {self.kind} {self.status}>'
+
+    def to_dict(self):
+        return {
+            'kind': self.kind,
+            'status': self.status,
+            'content': self.content,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
@@ -0,0 +1,24 @@
+import os
+import threading
+from werkzeug.security import generate_password_hash, check_password_hash
+from .blocking import run_blocking
+
+# Hashes computed at once. Each takes ~100ms of CPU in a native thread (hashlib
+# releases the GIL), so more than a core's worth only queues inside the pool.
+PASSWORD_HASH_CONCURRENCY = int(os.getenv("PASSWORD_HASH_CONCURRENCY", str(os.cpu_count() or 2)))
+
+# A green semaphore once main.py has monkey-patched threading, so waiting
+# callers park their greenlet rather than the hub
+_slots = threading.BoundedSemaphore(PASSWORD_HASH_CONCURRENCY)
+
+
+def hash_password(password: str) -> str:
+    """generate_password_hash, run off the event loop."""
+    with _slots:
+        return run_blocking(generate_password_hash, password)
+
+
+def verify_password(password_hash: str, password: str) -> bool:
+    """check_password_hash, run off the event loop."""
+    with _slots:
+        return run_blocking(check_password_hash, password_hash, password)
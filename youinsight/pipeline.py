@@ -0,0 +1,311 @@
+import os
+import json
+import uuid
+from datetime import datetime
+
+from . import socketio, db
+from .models import Video, Analysis, AnalysisVideo
+from .youtube_service import YouTubeService
+from .gemini_service import GeminiService
+from .usage import record_usage
+from .transcript_index import known_missing, skip_missing, record as record_availability
+from .digests import recognize_intent, stored_digests, queue_digests, digest_context
+from .metrics import DIGEST_ANSWERS
+
+
+def load_video(yt_service, video_id, user_id=None):
+    """The Video row for a YouTube ID, created from the API if missing, with its
+    transcript fetched and saved if it has none yet. None if the video is unknown.
+    A newly saved transcript queues the video's digests when DIGEST_GEMINI_API_KEY
+    is set; `user_id` only records whose request stored it."""
+    video = Video.query.filter_by(video_id=video_id).first()
+    if not video:
+        video_data = yt_service.get_video_by_id(video_id)
+        if not video_data:
+            return None
+        video = Video(
+            video_id=video_id,
+            title=video_data['title'],
+            url=video_data['url'],
+            view_count=video_data.get('view_count', 0),
+            stats_refreshed_at=datetime.utcnow(),
+            channel_title=video_data.get('channel_title'),
+            thumbnail_url=video_data.get('thumbnail'),
+            published_at=yt_service.parse_published_at(video_data.get('published_at'))
+        )
+        db.session.add(video)
+        db.session.commit()
+
+    # Get transcript if not already saved, unless the video is known to have none
+    if not video.transcript and not known_missing([video_id]):
+        transcript = yt_service.get_transcript(video.url)
+        if transcript:
+            video.transcript = transcript
+            db.session.commit()
+            queue_digests([video_id], user_id)
+        else:
+            _record_if_missing(yt_service, video_id)
+    return video
+
+def _record_if_missing(yt_service, video_id):
+    """Remember a video found to have no transcript, so it is not fetched again until that expires."""
+    if video_id in yt_service.transcripts_missing:
+        record_availability({video_id: []})
+
+def _stream_and_save(send, gemini_service, analysis, prompt, videos_with_transcripts, conversation_id, tracker,
+                     skip_sid=None):
+    """Stream Gemini output to the client, then store the result on the analysis."""
+    tracker.streaming()
+    send('analysis_started', {'message': 'Analysis started'})
+    
+    # Stream analysis chunks
+    chunks = []
+    for chunk in gemini_service.stream_analysis(prompt, videos_with_transcripts):
+        chunks.append(chunk)
+        send('analysis_chunk', {'chunk': chunk})
+    
+    _save_result(send, analysis, ''.join(chunks), gemini_service.last_usage, conversation_id, skip_sid)
+
+def _save_result(send, analysis, result, usage, conversation_id, skip_sid=None):
+    """Store the finished result on the analysis and announce it."""
+    analysis.result = result
+    
+    # Update the messages with the assistant's response
+    if analysis.messages:
+        messages_list = json.loads(analysis.messages)
+        messages_list.append({
+            'role': 'assistant',
+            'content': result,
+            'timestamp': datetime.utcnow().isoformat()
+        })
+        analysis.messages = json.dumps(messages_list)
+    
+    # A failed call was not billed; its usage only holds the prompt estimate
+    if usage and usage.get('outcome') != 'error':
+        record_usage(analysis, usage)
+    db.session.commit()
+    
+    send('analysis_complete', {'analysis_id': analysis.id, 'conversation_id': conversation_id})
+    # Let the user's other pages know, whichever worker they are connected to
+    socketio.emit('analysis_saved', {'analysis_id': analysis.id, 'conversation_id': conversation_id},
+                  to=analysis.user_id, skip_sid=skip_sid)
+
+def _conversation(prompt, conversation_id, is_new_conversation):
+    """The conversation ID and messages (JSON) for a new analysis: a new
+    conversation, or the given one with the prompt added to its messages."""
+    message = {
+        'role': 'user',
+        'content': prompt,
+        'timestamp': datetime.utcnow().isoformat()
+    }
+    if is_new_conversation or not conversation_id:
+        return str(uuid.uuid4()), json.dumps([message])
+
+    # Continue existing conversation from its previous analysis
+    prev_analysis = Analysis.query.filter_by(conversation_id=conversation_id).order_by(Analysis.created_at.desc()).first()
+    if prev_analysis and prev_analysis.messages:
+        messages_list = json.loads(prev_analysis.messages)
+        messages_list.append(message)
+        return conversation_id, json.dumps(messages_list)
+    # Fallback if something goes wrong with the previous messages
+    return conversation_id, json.dumps([message])
+
+def answer_from_digest(data, identity, send, tracker, skip_sid=None):
+    """Answer a standard prompt ("summarize", "key takeaways", ...) about one
+    video from its stored digest, without Gemini or a YouTube call.
+
+    Returns False, having sent nothing, when the prompt is not a standard one
+    or the video's digest is not ready; the caller then runs the analysis.
+    """
+    prompt = data.get('prompt')
+    single_video_url = data.get('video_url')
+    kind = recognize_intent(prompt) if single_video_url else None
+    if kind is None:
+        return False
+    video_id = YouTubeService.get_video_id_from_url(single_video_url)
+    video = Video.query.filter_by(video_id=video_id).first() if video_id else None
+    result = stored_digests([video_id], kind).get(video_id) if video else None
+    if result is None:
+        return False
+
+    conversation_id, messages = _conversation(prompt, data.get('conversation_id'), data.get('is_new_conversation', False))
+    analysis = Analysis(
+        user_id=identity.id,
+        search_term=None,
+        prompt=prompt,
+        conversation_id=conversation_id,
+        is_conversation=True,
+        messages=messages
+    )
+    db.session.add(analysis)
+    db.session.flush()
+    db.session.add(AnalysisVideo(analysis_id=analysis.id, video_id=video.id))
+
+    tracker.streaming()
+    send('analysis_started', {'message': 'Analysis started', 'digest': kind})
+    send('analysis_chunk', {'chunk': result})
+    _save_result(send, analysis, result, None, conversation_id, skip_sid)
+    DIGEST_ANSWERS.inc(kind=kind, mode='instant')
+    return True
+
+def run_analysis(data, identity, send, tracker, skip_sid=None):
+    """Fetch transcripts, stream the Gemini analysis through `send(event, payload)`
+    and save it for `identity`. Shared by the Socket.IO handler and /api/analyze;
+    `skip_sid` is the socket that asked, which needs no analysis_saved notice."""
+    search_term = data.get('search_term')
+    video_ids = data.get('video_ids', [])
+    prompt = data.get('prompt')
+    single_video_url = data.get('video_url')
+    # Conversation tracking
+    conversation_id = data.get('conversation_id')
+    is_new_conversation = data.get('is_new_conversation', False)
+    if not prompt:
+        send('error', {'message': 'Prompt is required'})
+        return
+    
+    yt_service = YouTubeService(os.getenv('YOUTUBE_API_KEY'))
+    
+    # Case 1: Single video analysis
+    if single_video_url:
+        video_id = yt_service.get_video_id_from_url(single_video_url)
+        if not video_id:
+            send('error', {'message': 'Invalid video URL'})
+            return
+            
+        if known_missing([video_id]):
+            send('error', {'message': 'Transcript not available for this video'})
+            return
+
+        video_data = yt_service.get_video_by_id(video_id)
+        if not video_data:
+            send('error', {'message': 'Video not found'})
+            return
+            
+        video = Video.query.filter_by(video_id=video_id).first()
+        if not video:
+            video = Video(
+                video_id=video_id,
+                title=video_data['title'],
+                url=video_data['url'],
+                view_count=video_data.get('view_count', 0),
+                stats_refreshed_at=datetime.utcnow(),
+                channel_title=video_data.get('channel_title'),
+                thumbnail_url=video_data.get('thumbnail'),
+                published_at=yt_service.parse_published_at(video_data.get('published_at'))
+            )
+            db.session.add(video)
+            db.session.commit()
+        
+        # Get transcript
+        transcript = yt_service.get_transcript(video.url)
+        if not transcript:
+            _record_if_missing(yt_service, video_id)
+            send('error', {'message': 'Transcript not available for this video'})
+            return
+            
+        first_transcript = not video.transcript
+        video.transcript = transcript
+        db.session.commit()
+        if first_transcript:
+            queue_digests([video_id], identity.id)
+        
+        # Create analysis with conversation support
+        conversation_id, messages = _conversation(prompt, conversation_id, is_new_conversation)
+
+        analysis = Analysis(
+            user_id=identity.id,
+            search_term=None,
+            prompt=prompt,
+            conversation_id=conversation_id,
+            is_conversation=True,
+            messages=messages
+        )
+        db.session.add(analysis)
+        db.session.commit()
+        
+        # Link video to analysis
+        analysis_video = AnalysisVideo(
+            analysis_id=analysis.id,
+            video_id=video.id
+        )
+        db.session.add(analysis_video)
+        db.session.commit()
+        
+        # Perform analysis
+        gemini_service = GeminiService(identity.gemini_api_key)
+        video_with_transcript = {
+            'title': video.title,
+            'url': video.url,
+            'transcript': video.transcript
+        }
+        
+        _stream_and_save(send, gemini_service, analysis, prompt, [video_with_transcript], conversation_id, tracker, skip_sid)
+        
+    # Case 2: Multiple videos based on search
+    elif search_term:
+        # Search videos if no specific video_ids provided
+        if not video_ids:
+            videos_data = yt_service.search_videos(search_term)
+            video_ids = [v['video_id'] for v in videos_data]
+        
+        # Retrieve videos from database or create them, skipping those known to have no transcript
+        videos = []
+        for video_id in skip_missing(video_ids):
+            video = load_video(yt_service, video_id, identity.id)
+            if video and video.transcript:
+                videos.append(video)
+        
+        if not videos:
+            send('error', {'message': 'No videos with transcripts found'})
+            return
+        
+        # Create analysis with conversation support
+        conversation_id, messages = _conversation(prompt, conversation_id, is_new_conversation)
+
+        analysis = Analysis(
+            user_id=identity.id,
+            search_term=search_term,
+            prompt=prompt,
+            conversation_id=conversation_id,
+            is_conversation=True,
+            messages=messages
+        )
+        db.session.add(analysis)
+        db.session.commit()
+        
+        # Link videos to analysis
+        for video in videos:
+            analysis_video = AnalysisVideo(
+                analysis_id=analysis.id,
+                video_id=video.id
+            )
+            db.session.add(analysis_video)
+        db.session.commit()
+        
+        # A standard prompt over several videos is run over their stored
+        # digests of that kind, which are far shorter than the transcripts
+        kind = recognize_intent(prompt)
+        digests = stored_digests([video.video_id for video in videos], kind) if kind else {}
+        if digests:
+            DIGEST_ANSWERS.inc(kind=kind, mode='context')
+
+        # Prepare videos with transcripts for analysis
+        videos_with_transcripts = [
+            {
+                'title': video.title,
+                'url': video.url,
+                'transcript': (
+                    digest_context(kind, digests[video.video_id]) if video.video_id in digests else video.transcript
+                )
+            }
+            for video in videos if video.transcript
+        ]
+        
+        # Perform analysis
+        gemini_service = GeminiService(identity.gemini_api_key)
+        
+        _stream_and_save(send, gemini_service, analysis, prompt, videos_with_transcripts, conversation_id, tracker, skip_sid)
+    
+    else:
+        send('error', {'message': 'Either search_term or video_url is required'})
+        return
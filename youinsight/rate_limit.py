@@ -0,0 +1,270 @@
+import os
+import json
+import math
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Limits per user tier and event. "api" covers the REST endpoints under /api;
+# Socket.IO events are limited under their event name. A tier without an
+# entry for an event falls back to the "free" tier's limit.
+DEFAULT_LIMITS = {
+    "free": {
+        "api": "10/minute",
+        "search_videos": "30/minute",
+        "analyze_videos": "20/hour",
+    },
+    "pro": {
+        "api": "60/minute",
+        "search_videos": "120/minute",
+        "analyze_videos": "200/hour",
+    },
+}
+DEFAULT_TIER = "free"
+
+_PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+# Buckets kept by the in-process backend before the least recently used are dropped
+MEMORY_MAX_KEYS = 100000
+# The SQLite backend deletes refilled buckets every this many checks
+SQLITE_PRUNE_EVERY = 1000
+
+
+@dataclass(frozen=True)
+class Limit:
+    """A bucket of `capacity` tokens refilled evenly over `period` seconds."""
+
+    capacity: int
+    period: float
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / self.period
+
+    @classmethod
+    def parse(cls, value: str) -> "Limit":
+        """Parse "10/minute", "100/hour" or "5/30" (seconds)."""
+        count, _, period = value.partition("/")
+        period = period.strip().lower()
+        try:
+            seconds = float(period)
+        except ValueError:
+            seconds = _PERIODS.get(period.rstrip("s"))
+        if seconds is None or int(count) <= 0 or seconds <= 0:
+            raise ValueError(f"Invalid rate limit: {value!r}")
+        return cls(int(count), float(seconds))
+
+
+@dataclass(frozen=True)
+class Decision:
+    allowed: bool
+    remaining: int
+    # Seconds until enough tokens are back; 0 when allowed
+    retry_after: float
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+def take(tokens: float, updated_at: float, limit: Limit, cost: float, now: float) -> Tuple[bool, float, float, float]:
+    """Refill a bucket to `now` and try to take `cost` tokens.
+
+    Returns (allowed, tokens left, retry after, seconds until the bucket is full
+    again). A full bucket is the same as a missing one, so backends can forget a
+    key once that last time has passed. Backends store max(now, updated_at) as
+    the new update time: `now` is read before waiting on the backend's lock, and
+    moving a bucket's clock backwards would refill the same interval twice.
+    """
+    tokens = min(limit.capacity, tokens + max(0.0, now - updated_at) * limit.rate)
+    if tokens >= cost:
+        tokens -= cost
+        retry_after = 0.0
+        allowed = True
+    else:
+        retry_after = (cost - tokens) / limit.rate
+        allowed = False
+    return allowed, tokens, retry_after, (limit.capacity - tokens) / limit.rate
+
+
+class MemoryBackend:
+    """Buckets in this process only; idle keys are dropped once refilled."""
+
+    def __init__(self, max_keys: int = MEMORY_MAX_KEYS):
+        self.max_keys = max_keys
+        # key -> (tokens, updated at, full at), least recently used first
+        self._buckets: "OrderedDict[str, Tuple[float, float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key: str, limit: Limit, cost: float, now: float) -> Tuple[bool, float, float]:
+        with self._lock:
+            tokens, updated_at, _ = self._buckets.pop(key, (limit.capacity, now, now))
+            now = max(now, updated_at)
+            allowed, tokens, retry_after, full_in = take(tokens, updated_at, limit, cost, now)
+            if full_in > 0:
+                self._buckets[key] = (tokens, now, now + full_in)
+            self._expire(now)
+        return allowed, tokens, retry_after
+
+    def _expire(self, now: float) -> None:
+        # Entries are in last-use order, so refilled ones gather at the front
+        while self._buckets:
+            key, (_, _, full_at) = next(iter(self._buckets.items()))
+            if full_at > now and len(self._buckets) <= self.max_keys:
+                break
+            del self._buckets[key]
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class SQLiteBackend:
+    """Buckets in a SQLite file shared by every worker on the host."""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS rate_buckets ("
+            "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL, full_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS ix_rate_buckets_full_at ON rate_buckets (full_at)")
+        self._lock = threading.Lock()
+        self._checks = 0
+
+    def consume(self, key: str, limit: Limit, cost: float, now: float) -> Tuple[bool, float, float]:
+        with self._lock:
+            # IMMEDIATE takes the write lock up front so other workers wait instead of racing
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT tokens, updated_at FROM rate_buckets WHERE key = ? AND full_at > ?", (key, now)
+                ).fetchone()
+                tokens, updated_at = row if row else (limit.capacity, now)
+                now = max(now, updated_at)
+                allowed, tokens, retry_after, full_in = take(tokens, updated_at, limit, cost, now)
+                if full_in > 0:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO rate_buckets (key, tokens, updated_at, full_at) VALUES (?, ?, ?, ?)",
+                        (key, tokens, now, now + full_in),
+                    )
+                else:
+                    self._db.execute("DELETE FROM rate_buckets WHERE key = ?", (key,))
+                self._checks += 1
+                if self._checks % SQLITE_PRUNE_EVERY == 0:
+                    self._db.execute("DELETE FROM rate_buckets WHERE full_at <= ?", (now,))
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return allowed, tokens, retry_after
+
+
+class RedisBackend:
+    """Buckets in Redis (or anything speaking its protocol), shared across hosts.
+
+    Each bucket is one "tokens:updated_at" string that expires when it would be
+    full again, so idle keys cost nothing. Updates use WATCH/MULTI/EXEC.
+    """
+
+    def __init__(self, url: str, prefix: str = "youinsight:ratelimit:"):
+        import redis  # optional dependency, only needed for this backend
+
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+        self._watch_error = redis.WatchError
+
+    def consume(self, key: str, limit: Limit, cost: float, now: float) -> Tuple[bool, float, float]:
+        key = self.prefix + key
+        with self._client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    raw = pipe.get(key)
+                    if raw:
+                        tokens, _, updated_at = raw.decode().partition(":")
+                        tokens, updated_at = float(tokens), float(updated_at)
+                    else:
+                        tokens, updated_at = limit.capacity, now
+                    now = max(now, updated_at)
+                    allowed, tokens, retry_after, full_in = take(tokens, updated_at, limit, cost, now)
+                    pipe.multi()
+                    if full_in > 0:
+                        pipe.set(key, f"{tokens!r}:{now!r}", px=max(1, math.ceil(full_in * 1000)))
+                    else:
+                        pipe.delete(key)
+                    pipe.execute()
+                    return allowed, tokens, retry_after
+                except self._watch_error:
+                    # Another worker changed the bucket between our read and write
+                    continue
+
+
+def create_backend(spec: str, default_path: str):
+    """Backend for RATE_LIMIT_BACKEND: "memory", "sqlite[:path]" or a redis:// URL."""
+    if not spec or spec == "memory":
+        return MemoryBackend()
+    if spec == "sqlite" or spec.startswith("sqlite:"):
+        return SQLiteBackend(spec.partition(":")[2] or default_path)
+    if spec.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend(spec)
+    raise ValueError(f"Unknown rate limit backend: {spec!r}")
+
+
+def load_limits(overrides: Optional[str] = None) -> Dict[str, Dict[str, Limit]]:
+    """DEFAULT_LIMITS merged with RATE_LIMITS, e.g. '{"free": {"search_videos": "20/minute"}}'."""
+    merged = {tier: dict(events) for tier, events in DEFAULT_LIMITS.items()}
+    raw = overrides if overrides is not None else os.getenv("RATE_LIMITS")
+    if raw:
+        try:
+            for tier, events in json.loads(raw).items():
+                merged.setdefault(tier, {}).update(events)
+        except (ValueError, AttributeError) as e:
+            logger.error(f"Ignoring invalid RATE_LIMITS: {str(e)}")
+    return {
+        tier: {event: Limit.parse(value) for event, value in events.items()}
+        for tier, events in merged.items()
+    }
+
+
+class RateLimiter:
+    """Token-bucket limits per (event, caller), configured per user tier."""
+
+    def __init__(self, backend=None, limits: Optional[Dict[str, Dict[str, Limit]]] = None):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.limits = limits if limits is not None else load_limits()
+
+    def init_app(self, app) -> None:
+        self.backend = create_backend(
+            app.config.get("RATE_LIMIT_BACKEND", "memory"),
+            app.config.get("RATE_LIMIT_PATH") or os.path.join(app.instance_path, "ratelimit.sqlite"),
+        )
+        self.limits = load_limits(app.config.get("RATE_LIMITS"))
+
+    def limit_for(self, event: str, tier: Optional[str]) -> Optional[Limit]:
+        limits = self.limits.get(tier or DEFAULT_TIER, {})
+        return limits.get(event) or self.limits.get(DEFAULT_TIER, {}).get(event)
+
+    def hit(self, event: str, caller: str, tier: Optional[str] = None, cost: float = 1) -> Decision:
+        """Take `cost` tokens from the caller's bucket for this event."""
+        limit = self.limit_for(event, tier)
+        if limit is None:
+            return Decision(True, 0, 0.0)
+        try:
+            allowed, tokens, retry_after = self.backend.consume(f"{event}:{caller}", limit, cost, time.time())
+        except Exception as e:
+            # A broken shared backend should not take the site down with it
+            logger.error(f"Rate limit backend error, allowing request: {str(e)}")
+            return Decision(True, 0, 0.0)
+        return Decision(allowed, int(tokens), retry_after)
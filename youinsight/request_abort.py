@@ -0,0 +1,108 @@
+import socket
+import threading
+from typing import List
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+class RequestAborted(ConnectionError):
+    """The request was abandoned by another thread."""
+
+
+class Connections:
+    """The connections a request goes out on, so another thread can cut it off.
+
+    A request blocked waiting for its response cannot be interrupted from
+    outside; shutting down its socket makes the wait fail at once, and tells
+    the server to stop generating.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._connections: List[HTTPConnection] = []
+        self.aborted = False
+
+    def add(self, connection: HTTPConnection) -> None:
+        with self._lock:
+            if self.aborted:
+                raise RequestAborted("Request abandoned before it was sent")
+            self._connections.append(connection)
+
+    def abort(self) -> None:
+        with self._lock:
+            self.aborted = True
+            connections = list(self._connections)
+        for connection in connections:
+            _shutdown(connection)
+
+
+def _shutdown(connection: HTTPConnection) -> None:
+    sock = getattr(connection, "sock", None)
+    if sock is None:
+        return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+class _Current(threading.local):
+    connections = None
+
+
+_current = _Current()
+
+
+class tracking:
+    """Within the block, requests sent on this thread by a session using
+    TrackingAdapter have their connections added to `connections`."""
+
+    def __init__(self, connections: Connections):
+        self.connections = connections
+
+    def __enter__(self) -> Connections:
+        _current.connections = self.connections
+        return self.connections
+
+    def __exit__(self, *exc_info) -> None:
+        _current.connections = None
+
+
+class _Tracked:
+    def request(self, *args, **kwargs):
+        connections = _current.connections
+        if connections is not None:
+            connections.add(self)
+        super().request(*args, **kwargs)
+        # Aborted while connecting, before the socket could be shut down
+        if connections is not None and connections.aborted:
+            _shutdown(self)
+
+
+class _TrackedHTTPConnection(_Tracked, HTTPConnection):
+    pass
+
+
+class _TrackedHTTPSConnection(_Tracked, HTTPSConnection):
+    pass
+
+
+class _TrackedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TrackedHTTPConnection
+
+
+class _TrackedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TrackedHTTPSConnection
+
+
+class TrackingAdapter(HTTPAdapter):
+    """A requests adapter whose connections can be tracked with `tracking`."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TrackedHTTPConnectionPool,
+            "https": _TrackedHTTPSConnectionPool,
+        }
@@ -0,0 +1,282 @@
+import os
+import time
+import queue
+import random
+import hashlib
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .metrics import LLM_RETRIES, LLM_HEDGES, LLM_CIRCUIT_EVENTS
+
+logger = logging.getLogger(__name__)
+
+# Attempts at getting a Gemini stream started, the first included
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "3"))
+# Backoff before retry n is random between 0 and base * 2^(n-1), at most the max
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "1"))
+LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", "10"))
+# Time to first token after which a duplicate request is sent and the first of
+# the two to answer is kept. Long prompts take longer to start, so the deadline
+# grows with the estimated input tokens. LLM_HEDGE=0 turns hedging off.
+LLM_TTFT_DEADLINE_SECONDS = float(os.getenv("LLM_TTFT_DEADLINE_SECONDS", "8"))
+LLM_TTFT_DEADLINE_PER_100K_TOKENS = float(os.getenv("LLM_TTFT_DEADLINE_PER_100K_TOKENS", "4"))
+LLM_HEDGE = os.getenv("LLM_HEDGE", "1") != "0"
+# An attempt with no first token after this many deadlines fails (and is retried)
+LLM_TTFT_TIMEOUT_DEADLINES = float(os.getenv("LLM_TTFT_TIMEOUT_DEADLINES", "3"))
+# Consecutive transient failures that open an API key's circuit, and how long
+# it stays open before one trial request is let through
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+
+_DONE = object()
+
+
+class FirstTokenTimeout(Exception):
+    """Gemini did not start answering in time."""
+
+
+class CircuitOpen(Exception):
+    """Requests with this API key are failing; not sent until the circuit resets."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Gemini requests with this API key are failing, try again in {max(1, round(retry_after))}s")
+        self.retry_after = retry_after
+
+
+def classify_error(error: BaseException) -> Optional[str]:
+    """The kind of a transient error worth retrying, or None for one that would fail again."""
+    # Already imported by the Gemini client that raised the error
+    import requests
+    from google.api_core import exceptions as api_exceptions
+
+    if isinstance(error, FirstTokenTimeout):
+        return "timeout"
+    if isinstance(error, (api_exceptions.TooManyRequests, api_exceptions.ResourceExhausted)):
+        return "rate_limited"
+    if isinstance(error, (api_exceptions.ServiceUnavailable, api_exceptions.BadGateway)):
+        return "unavailable"
+    if isinstance(error, (api_exceptions.GatewayTimeout, api_exceptions.DeadlineExceeded)):
+        return "timeout"
+    if isinstance(error, api_exceptions.InternalServerError):
+        return "server_error"
+    if isinstance(error, (requests.ConnectionError, requests.Timeout, ConnectionError, TimeoutError)):
+        return "connection"
+    return None
+
+
+def backoff_delay(retry: int) -> float:
+    """Seconds to wait before retry number `retry` (from 1), with full jitter."""
+    return random.uniform(0, min(LLM_RETRY_MAX_SECONDS, LLM_RETRY_BASE_SECONDS * 2 ** (retry - 1)))
+
+
+def ttft_deadline(input_tokens: int) -> float:
+    return LLM_TTFT_DEADLINE_SECONDS + LLM_TTFT_DEADLINE_PER_100K_TOKENS * input_tokens / 100_000
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breakers, one per API key, in this process.
+
+    A key's circuit opens after LLM_BREAKER_FAILURES transient failures in a
+    row; requests then fail at once. After LLM_BREAKER_RESET_SECONDS one trial
+    request goes through (half open): success closes the circuit, failure
+    opens it again. Keys are only kept as hashes.
+    """
+
+    def __init__(self, failures: int = LLM_BREAKER_FAILURES, reset_seconds: float = LLM_BREAKER_RESET_SECONDS):
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        # key hash -> [consecutive failures, opened at or None, trial in flight]
+        self._circuits: Dict[str, List[Any]] = {}
+
+    @staticmethod
+    def _key(api_key: str) -> str:
+        return hashlib.sha256((api_key or "").encode()).hexdigest()[:16]
+
+    def before_request(self, api_key: str) -> None:
+        """Raise CircuitOpen unless a request with this key may be sent now."""
+        now = time.monotonic()
+        with self._lock:
+            circuit = self._circuits.get(self._key(api_key))
+            if circuit is None or circuit[1] is None:
+                return
+            retry_after = circuit[1] + self.reset_seconds - now
+            if retry_after > 0 or circuit[2]:
+                LLM_CIRCUIT_EVENTS.inc(event="rejected")
+                raise CircuitOpen(max(retry_after, 0))
+            circuit[2] = True
+            LLM_CIRCUIT_EVENTS.inc(event="half_open")
+
+    def record_success(self, api_key: str) -> None:
+        with self._lock:
+            circuit = self._circuits.pop(self._key(api_key), None)
+        if circuit is not None and circuit[1] is not None:
+            LLM_CIRCUIT_EVENTS.inc(event="closed")
+            logger.info("Gemini circuit closed")
+
+    def record_failure(self, api_key: str) -> None:
+        with self._lock:
+            circuit = self._circuits.setdefault(self._key(api_key), [0, None, False])
+            circuit[0] += 1
+            opened = circuit[2] or (circuit[1] is None and circuit[0] >= self.failures)
+            if opened:
+                circuit[1], circuit[2] = time.monotonic(), False
+        if opened:
+            LLM_CIRCUIT_EVENTS.inc(event="opened")
+            logger.warning(f"Gemini circuit opened after {circuit[0]} failures in a row, "
+                           f"for {self.reset_seconds:g}s")
+
+    def release(self, api_key: str) -> None:
+        """Give up a half-open trial that neither succeeded nor failed upstream."""
+        with self._lock:
+            circuit = self._circuits.get(self._key(api_key))
+            if circuit is not None:
+                circuit[2] = False
+
+
+BREAKER = CircuitBreaker()
+
+
+class _Attempt:
+    """One request, started in its own thread until its first item arrives."""
+
+    def __init__(self, start: Callable[..., Iterator[Any]], results: "queue.Queue", hedge: bool):
+        self.hedge = hedge
+        self.iterator: Optional[Iterator[Any]] = None
+        self._lock = threading.Lock()
+        self._cancelled = False
+        self._aborts: List[Callable[[], None]] = []
+        threading.Thread(target=self._first, args=(start, results), daemon=True).start()
+
+    def on_cancel(self, abort: Callable[[], None]) -> None:
+        """Have `abort` called when the attempt is cancelled; at once if it already is."""
+        with self._lock:
+            if not self._cancelled:
+                self._aborts.append(abort)
+                return
+        abort()
+
+    def _first(self, start, results):
+        try:
+            self.iterator = iter(start(self.on_cancel))
+            item, error = next(self.iterator, _DONE), None
+        except Exception as e:
+            item, error = None, e
+        with self._lock:
+            if not self._cancelled:
+                results.put((self, item, error))
+                return
+        self.close()
+
+    def cancel(self) -> None:
+        """Drop the request, aborting it if its start registered how; it is
+        closed once it stops waiting on Gemini."""
+        with self._lock:
+            self._cancelled = True
+            aborts, self._aborts = self._aborts, []
+        for abort in aborts:
+            try:
+                abort()
+            except Exception as e:
+                logger.warning(f"Error aborting cancelled Gemini request: {str(e)}")
+
+    def close(self) -> None:
+        close = getattr(self.iterator, "close", None)
+        if close is not None:
+            try:
+                close()
+            except Exception as e:
+                logger.warning(f"Error closing cancelled Gemini request: {str(e)}")
+
+
+def _first_item(start: Callable[..., Iterator[Any]], deadline: Optional[float]) -> Tuple[Any, Iterator[Any]]:
+    """Start a stream, hedged past the deadline; its first item and the rest of it."""
+    results: "queue.Queue" = queue.Queue()
+    attempts = [_Attempt(start, results, hedge=False)]
+    started = time.monotonic()
+    timeout_at = started + deadline * LLM_TTFT_TIMEOUT_DEADLINES if deadline is not None else None
+    winner = None
+    answered = 0
+    try:
+        while True:
+            wait_until = timeout_at
+            if timeout_at is not None and LLM_HEDGE and len(attempts) == 1:
+                wait_until = started + deadline
+            try:
+                attempt, item, error = results.get(
+                    timeout=max(0.0, wait_until - time.monotonic()) if wait_until is not None else None
+                )
+            except queue.Empty:
+                if time.monotonic() >= timeout_at:
+                    raise FirstTokenTimeout(f"Gemini did not start answering within {timeout_at - started:.0f}s")
+                logger.info(f"No first token from Gemini within {deadline:.1f}s, sending a hedged request")
+                attempts.append(_Attempt(start, results, hedge=True))
+                continue
+            answered += 1
+            if error is None:
+                winner = attempt
+                return item, attempt.iterator
+            if answered == len(attempts):
+                raise error
+            # The other request may still get through
+    finally:
+        for attempt in attempts:
+            if attempt is not winner:
+                attempt.cancel()
+        while True:
+            try:
+                attempt, _, _ = results.get_nowait()
+            except queue.Empty:
+                break
+            attempt.close()
+        if len(attempts) > 1:
+            LLM_HEDGES.inc(winner="neither" if winner is None else "hedge" if winner.hedge else "primary")
+
+
+def resilient_stream(
+    start: Callable[..., Iterator[Any]], api_key: str, deadline: Optional[float] = None
+) -> Iterator[Any]:
+    """Items of the stream `start(on_cancel)` returns, made to survive slow starts and transient errors.
+
+    Until the first item arrives the request is retried with backoff on
+    transient errors, behind the API key's circuit breaker, and hedged once it
+    has gone `deadline` seconds without one (None for no deadline, e.g. when
+    the first item is the whole response). Once items have been yielded an
+    error is raised as is: the caller has already passed them on.
+
+    `start` may pass `on_cancel` a function that aborts its request. It is
+    called from another thread when the attempt loses a hedge or times out,
+    so the losing request stops instead of running on to its first item.
+    """
+    retries = 0
+    while True:
+        BREAKER.before_request(api_key)
+        try:
+            first, iterator = _first_item(start, deadline)
+        except Exception as e:
+            kind = classify_error(e)
+            if kind is None:
+                BREAKER.release(api_key)
+                raise
+            BREAKER.record_failure(api_key)
+            retries += 1
+            if retries >= LLM_MAX_ATTEMPTS:
+                raise
+            delay = backoff_delay(retries)
+            LLM_RETRIES.inc(error=kind)
+            logger.warning(f"Gemini request failed ({kind}), retry {retries} in {delay:.1f}s: {str(e)}")
+            time.sleep(delay)
+            continue
+        break
+
+    BREAKER.record_success(api_key)
+    if first is _DONE:
+        return
+    yield first
+    try:
+        yield from iterator
+    except Exception as e:
+        if classify_error(e) is not None:
+            BREAKER.record_failure(api_key)
+        raise
@@ -7,60 +7,71 @@ from flask import (
     request,
     jsonify,
     session,
+    current_app,
+    Response,
+    stream_with_context,
 )
 from flask_login import login_user, logout_user, login_required, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
 from functools import wraps
 import os
-import time
+import json
+import math
 from .email_service import send_reset_email
+from .passwords import hash_password, verify_password
 
-from . import db, login_manager
-from .models import User, Video, Analysis, AnalysisVideo
+from . import db, login_manager, limiter
+from .models import User, Video, Analysis, AnalysisVideo, BatchJob, PlaylistSync, WatchQuery, VideoDigest
 from .youtube_service import YouTubeService
+from .search_index import search_history as search_history_index
+from .metrics import REGISTRY, RATE_LIMITED, ANALYSIS_STREAM_REQUESTS
+from .usage import usage_summary
+from .identity import get_identity, invalidate_identity
+from .scheduler import AnalysisRejected, TIER_WEIGHTS
+from .analysis_streams import start_stream, get_stream, format_sse, format_ndjson
+from .batch import (
+    BatchError, create_job, cancel_job, job_progress, follow_results, csv_line, RESULT_FIELDS,
+)
+from .export import EXPORT_FORMATS, export_records, export_lines, export_chunks
+from .ingest import IngestError, add_playlist, start_sync
+from .watch import WatchError, create_watch, run_now
 
 # Create main blueprint
 main = Blueprint("main", __name__)
 
-# Rate limiting data
-api_calls = {}
-MAX_CALLS_PER_MINUTE = 10
-
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return get_identity(int(user_id))
 
 
 # Custom decorators
+def _check_rate_limit(event):
+    """Take a token from the caller's bucket for `event`; a 429 response if it is empty."""
+    if current_user.is_authenticated:
+        caller, tier = f"user:{current_user.id}", current_user.tier
+    else:
+        caller, tier = f"ip:{request.remote_addr}", None
+    decision = limiter.hit(event, caller, tier)
+    if decision.allowed:
+        return None
+    RATE_LIMITED.inc(event=event)
+    response = jsonify(
+        {
+            "error": "Rate limit exceeded. Please wait before making more requests.",
+            "retry_after": round(decision.retry_after, 1),
+        }
+    )
+    response.headers["Retry-After"] = decision.retry_after_header
+    return response, 429
+
+
 def rate_limit(f):
+    """Apply the "api" token bucket of the caller's tier, answering 429 with Retry-After."""
     @wraps(f)
     def decorated(*args, **kwargs):
-        user_id = (
-            current_user.get_id()
-            if current_user.is_authenticated
-            else request.remote_addr
-        )
-        current_time = int(time.time())
-
-        # Initialize or clean up old calls
-        if user_id not in api_calls:
-            api_calls[user_id] = []
-        api_calls[user_id] = [t for t in api_calls[user_id] if current_time - t < 60]
-
-        # Check rate limit
-        if len(api_calls[user_id]) >= MAX_CALLS_PER_MINUTE:
-            return (
-                jsonify(
-                    {
-                        "error": "Rate limit exceeded. Please wait before making more requests."
-                    }
-                ),
-                429,
-            )
-
-        # Add current call
-        api_calls[user_id].append(current_time)
+        limited = _check_rate_limit("api")
+        if limited is not None:
+            return limited
 
         return f(*args, **kwargs)
 
@@ -99,7 +110,7 @@ def register():
         user = User(
             email=email,
             username=username,
-            password_hash=generate_password_hash(password),
+            password_hash=hash_password(password),
             gemini_api_key=gemini_api_key,
         )
         db.session.add(user)
@@ -119,7 +130,7 @@ def login():
 
         user = User.query.filter_by(email=email).first()
 
-        if not user or not check_password_hash(user.password_hash, password):
+        if not user or not verify_password(user.password_hash, password):
             flash("Invalid email or password", "danger")
             return redirect(url_for("main.login"))
 
@@ -248,7 +259,7 @@ def reset_password(token):
 
         try:
             # Update the user's password
-            user.password_hash = generate_password_hash(password)
+            user.password_hash = hash_password(password)
 
             # Try to clear the token (database approach)
             try:
@@ -260,6 +271,7 @@ def reset_password(token):
                 pass  # Ignore if this fails
 
             db.session.commit()
+            invalidate_identity(user.id)
 
             # Clear the session token
             if token in reset_tokens:
@@ -338,24 +350,42 @@ def profile():
         current_password = request.form.get("current_password")
         new_password = request.form.get("new_password")
 
+        # current_user is a cached snapshot; changes go to the row itself
+        user = db.session.get(User, current_user.id)
+
         # Update API key if provided
         if gemini_api_key:
-            current_user.gemini_api_key = gemini_api_key
+            user.gemini_api_key = gemini_api_key
 
         # Update password if provided
         if current_password and new_password:
-            if check_password_hash(current_user.password_hash, current_password):
-                current_user.password_hash = generate_password_hash(new_password)
+            if verify_password(user.password_hash, current_password):
+                user.password_hash = hash_password(new_password)
                 flash("Password updated", "success")
             else:
                 flash("Current password is incorrect", "danger")
                 return redirect(url_for("main.profile"))
 
         db.session.commit()
+        invalidate_identity(user.id)
         flash("Profile updated successfully", "success")
         return redirect(url_for("main.profile"))
 
-    return render_template("profile.html")
+    return render_template("profile.html", usage=usage_summary(current_user.id))
+
+
+@main.route("/metrics")
+def metrics():
+    # Optional bearer token so the endpoint can be exposed beyond the scraper's network
+    token = os.getenv("METRICS_TOKEN")
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        return jsonify({"error": "Unauthorized"}), 401
+
+    return (
+        REGISTRY.render(),
+        200,
+        {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+    )
 
 
 # API endpoints
@@ -408,6 +438,319 @@ def get_transcript():
     return jsonify({"transcript": transcript})
 
 
+def _stream_format():
+    """"sse" or "ndjson", from ?format= or else the Accept header (SSE by default)."""
+    requested = request.args.get("format")
+    if requested in ("sse", "ndjson"):
+        return requested
+    best = request.accept_mimetypes.best_match(["text/event-stream", "application/x-ndjson"])
+    return "ndjson" if best == "application/x-ndjson" else "sse"
+
+
+def _stream_response(stream, after, fmt):
+    """Relay the stream's events after ID `after` as they are produced."""
+    def generate():
+        if fmt == "sse":
+            yield "retry: 2000\n\n"
+        for event in stream.follow(after):
+            if event is None:
+                # Keeps proxies from closing an idle SSE connection
+                if fmt == "sse":
+                    yield ": keepalive\n\n"
+                continue
+            yield format_sse(event) if fmt == "sse" else format_ndjson(event)
+
+    response = Response(
+        generate(), mimetype="text/event-stream" if fmt == "sse" else "application/x-ndjson"
+    )
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    response.headers["X-Analysis-Stream"] = stream.id
+    return response
+
+
+@main.route("/api/analyze", methods=["POST"])
+@login_required
+@rate_limit
+def analyze():
+    data = request.get_json(silent=True) or {}
+    if not data.get("prompt"):
+        return jsonify({"error": "Prompt is required"}), 400
+    if not data.get("search_term") and not data.get("video_url"):
+        return jsonify({"error": "Either search_term or video_url is required"}), 400
+
+    limited = _check_rate_limit("analyze_videos")
+    if limited is not None:
+        return limited
+
+    identity = current_user._get_current_object()
+    try:
+        stream = start_stream(
+            current_app._get_current_object(), identity, data, TIER_WEIGHTS.get(identity.tier, 1.0)
+        )
+    except AnalysisRejected as e:
+        response = jsonify({"error": str(e), "reason": e.reason, "retry_after": round(e.retry_after, 1)})
+        response.headers["Retry-After"] = str(max(1, math.ceil(e.retry_after)))
+        return response, 429 if e.reason == "userBusy" else 503
+
+    fmt = _stream_format()
+    ANALYSIS_STREAM_REQUESTS.inc(format=fmt, kind="new")
+    return _stream_response(stream, 0, fmt)
+
+
+@main.route("/api/analyze/<stream_id>", methods=["GET"])
+@login_required
+def resume_analysis(stream_id):
+    stream = get_stream(stream_id, current_user.id)
+    if stream is None:
+        return jsonify({"error": "Stream not found or expired"}), 404
+
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id") or "0"
+    try:
+        after = int(last_event_id)
+    except ValueError:
+        return jsonify({"error": "Last-Event-ID must be an event ID from this stream"}), 400
+
+    fmt = _stream_format()
+    ANALYSIS_STREAM_REQUESTS.inc(format=fmt, kind="resume")
+    return _stream_response(stream, after, fmt)
+
+
+@main.route("/api/batches", methods=["POST"])
+@login_required
+@rate_limit
+def create_batch():
+    data = request.get_json(silent=True) or {}
+    video_ids = list(data.get("video_ids") or [])
+    for url in data.get("video_urls") or []:
+        video_id = YouTubeService.get_video_id_from_url(url)
+        if not video_id:
+            return jsonify({"error": f"Invalid video URL: {url}"}), 400
+        video_ids.append(video_id)
+    if data.get("search_term"):
+        try:
+            max_results = int(data.get("max_results", 50))
+        except (TypeError, ValueError):
+            return jsonify({"error": "max_results must be a whole number"}), 400
+        if max_results < 1:
+            return jsonify({"error": "max_results must be at least 1"}), 400
+        yt_service = YouTubeService(os.getenv("YOUTUBE_API_KEY"))
+        videos = yt_service.search_videos(data["search_term"], min(max_results, 50))
+        if videos is None:
+            return jsonify({"error": f"Could not search YouTube for {data['search_term']!r}"}), 400
+        video_ids.extend(video["video_id"] for video in videos)
+
+    try:
+        job = create_job(current_user.id, data.get("prompt"), video_ids)
+    except BatchError as e:
+        return jsonify({"error": str(e)}), e.status
+
+    response = jsonify(job_progress(job))
+    response.headers["Location"] = url_for("main.get_batch", job_id=job.id)
+    return response, 202
+
+
+@main.route("/api/batches", methods=["GET"])
+@login_required
+def list_batches():
+    jobs = (
+        BatchJob.query.filter_by(user_id=current_user.id)
+        .order_by(BatchJob.created_at.desc())
+        .limit(50)
+        .all()
+    )
+    return jsonify({"batches": [job_progress(job) for job in jobs]})
+
+
+@main.route("/api/batches/<int:job_id>", methods=["GET"])
+@login_required
+def get_batch(job_id):
+    job = BatchJob.query.filter_by(id=job_id, user_id=current_user.id).first()
+    if job is None:
+        return jsonify({"error": "Batch not found"}), 404
+    return jsonify(job_progress(job))
+
+
+@main.route("/api/batches/<int:job_id>/cancel", methods=["POST"])
+@login_required
+def cancel_batch(job_id):
+    job = BatchJob.query.filter_by(id=job_id, user_id=current_user.id).first()
+    if job is None:
+        return jsonify({"error": "Batch not found"}), 404
+    cancel_job(job)
+    return jsonify(job_progress(job))
+
+
+@main.route("/api/batches/<int:job_id>/results", methods=["GET"])
+@login_required
+def batch_results(job_id):
+    """Finished items in completion order, streamed as they finish until the batch is done.
+
+    ?after=<seq> skips the rows a client already has.
+    """
+    job = BatchJob.query.filter_by(id=job_id, user_id=current_user.id).first()
+    if job is None:
+        return jsonify({"error": "Batch not found"}), 404
+    fmt = request.args.get("format", "ndjson")
+    if fmt not in ("ndjson", "csv"):
+        return jsonify({"error": "format must be ndjson or csv"}), 400
+    after = request.args.get("after", 0, type=int)
+
+    def generate():
+        if fmt == "csv":
+            yield csv_line(RESULT_FIELDS)
+        for row in follow_results(job_id, after):
+            if row is None:
+                continue
+            if fmt == "csv":
+                yield csv_line([row[field] for field in RESULT_FIELDS])
+            else:
+                yield json.dumps(row) + "\n"
+
+    response = Response(
+        stream_with_context(generate()),
+        mimetype="text/csv" if fmt == "csv" else "application/x-ndjson",
+    )
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    if fmt == "csv":
+        response.headers["Content-Disposition"] = f"attachment; filename=batch-{job_id}.csv"
+    return response
+
+
+@main.route("/api/playlists", methods=["POST"])
+@login_required
+@rate_limit
+def create_playlist_sync():
+    """Add a playlist or channel to the library and sync it in the background."""
+    data = request.get_json(silent=True) or {}
+    yt_service = YouTubeService(os.getenv("YOUTUBE_API_KEY"))
+    try:
+        sync = add_playlist(yt_service, data.get("source", ""), current_user.id)
+    except IngestError as e:
+        return jsonify({"error": str(e)}), e.status
+
+    start_sync(current_app._get_current_object(), sync)
+    db.session.refresh(sync)
+    response = jsonify(sync.to_dict())
+    response.headers["Location"] = url_for("main.get_playlist_sync", sync_id=sync.id)
+    return response, 202
+
+
+@main.route("/api/playlists", methods=["GET"])
+@login_required
+def list_playlist_syncs():
+    syncs = PlaylistSync.query.order_by(PlaylistSync.created_at.desc()).limit(100).all()
+    return jsonify({"playlists": [sync.to_dict() for sync in syncs]})
+
+
+@main.route("/api/playlists/<int:sync_id>", methods=["GET"])
+@login_required
+def get_playlist_sync(sync_id):
+    sync = db.session.get(PlaylistSync, sync_id)
+    if sync is None:
+        return jsonify({"error": "Playlist not found"}), 404
+    return jsonify(sync.to_dict())
+
+
+@main.route("/api/playlists/<int:sync_id>/sync", methods=["POST"])
+@login_required
+@rate_limit
+def sync_playlist_now(sync_id):
+    """Fetch the videos added since the last sync; 409 if a sync is already running."""
+    sync = db.session.get(PlaylistSync, sync_id)
+    if sync is None:
+        return jsonify({"error": "Playlist not found"}), 404
+    if not start_sync(current_app._get_current_object(), sync):
+        return jsonify({"error": "This playlist is already being synced"}), 409
+    db.session.refresh(sync)
+    return jsonify(sync.to_dict()), 202
+
+
+@main.route("/api/watches", methods=["POST"])
+@login_required
+@rate_limit
+def create_watch_query():
+    """Save a search and prompt to re-run every interval_minutes over newly published videos."""
+    data = request.get_json(silent=True) or {}
+    try:
+        watch = create_watch(
+            current_user.id,
+            data.get("search_term"),
+            data.get("prompt"),
+            data.get("interval_minutes", 1440),
+            data.get("max_results", 10),
+        )
+    except WatchError as e:
+        return jsonify({"error": str(e)}), e.status
+
+    response = jsonify(watch.to_dict())
+    response.headers["Location"] = url_for("main.get_watch_query", watch_id=watch.id)
+    return response, 201
+
+
+@main.route("/api/watches", methods=["GET"])
+@login_required
+def list_watch_queries():
+    watches = WatchQuery.query.filter_by(user_id=current_user.id).order_by(WatchQuery.created_at.desc()).all()
+    return jsonify({"watches": [watch.to_dict() for watch in watches]})
+
+
+@main.route("/api/watches/<int:watch_id>", methods=["GET"])
+@login_required
+def get_watch_query(watch_id):
+    watch = WatchQuery.query.filter_by(id=watch_id, user_id=current_user.id).first()
+    if watch is None:
+        return jsonify({"error": "Watch query not found"}), 404
+    return jsonify(watch.to_dict())
+
+
+@main.route("/api/watches/<int:watch_id>", methods=["PATCH"])
+@login_required
+def update_watch_query(watch_id):
+    """Pause or resume a watch query with {"enabled": false|true}."""
+    watch = WatchQuery.query.filter_by(id=watch_id, user_id=current_user.id).first()
+    if watch is None:
+        return jsonify({"error": "Watch query not found"}), 404
+    data = request.get_json(silent=True) or {}
+    if "enabled" in data:
+        watch.enabled = bool(data["enabled"])
+    db.session.commit()
+    return jsonify(watch.to_dict())
+
+
+@main.route("/api/watches/<int:watch_id>", methods=["DELETE"])
+@login_required
+def delete_watch_query(watch_id):
+    watch = WatchQuery.query.filter_by(id=watch_id, user_id=current_user.id).first()
+    if watch is None:
+        return jsonify({"error": "Watch query not found"}), 404
+    db.session.delete(watch)
+    db.session.commit()
+    return "", 204
+
+
+@main.route("/api/watches/<int:watch_id>/run", methods=["POST"])
+@login_required
+@rate_limit
+def run_watch_query(watch_id):
+    """Run a watch query now instead of waiting for its next interval."""
+    watch = WatchQuery.query.filter_by(id=watch_id, user_id=current_user.id).first()
+    if watch is None:
+        return jsonify({"error": "Watch query not found"}), 404
+    run_now(watch)
+    return jsonify(watch.to_dict()), 202
+
+
+@main.route("/api/videos/<video_id>/digests", methods=["GET"])
+@login_required
+@rate_limit
+def get_video_digests(video_id):
+    """The standard digests stored for a video, generated or still queued."""
+    digests = VideoDigest.query.filter_by(video_id=video_id).order_by(VideoDigest.id).all()
+    return jsonify({"video_id": video_id, "digests": [digest.to_dict() for digest in digests]})
+
+
 @main.route("/api/analysis/<int:analysis_id>", methods=["GET"])
 @login_required
 def get_analysis(analysis_id):
@@ -423,7 +766,15 @@ def get_analysis(analysis_id):
         if av.video:
             video = av.video
             videos.append(
-                {"video_id": video.video_id, "title": video.title, "url": video.url}
+                {
+                    "video_id": video.video_id,
+                    "title": video.title,
+                    "url": video.url,
+                    "view_count": video.view_count,
+                    "stats_refreshed_at": (
+                        video.stats_refreshed_at.isoformat() if video.stats_refreshed_at else None
+                    ),
+                }
             )
 
     response = {
@@ -465,6 +816,7 @@ def get_conversation(conversation_id):
                     "title": video.title,
                     "url": video.url,
                     "single_video_url": video.url,
+                    "view_count": video.view_count,
                 }
             )
 
@@ -487,3 +839,51 @@ def get_conversation(conversation_id):
     }
 
     return jsonify(response)
+
+
+@main.route("/api/export", methods=["GET"])
+@login_required
+def export_history():
+    """The user's whole history as NDJSON (default) or CSV, streamed as it is read.
+
+    ?transcripts=1 adds every video's transcript. Gzipped when the client
+    accepts it.
+    """
+    fmt = request.args.get("format", "ndjson")
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": "format must be ndjson or csv"}), 400
+    transcripts = request.args.get("transcripts") in ("1", "true")
+    compress = "gzip" in request.accept_encodings
+    user_id = current_user.id
+
+    response = Response(
+        stream_with_context(export_chunks(export_lines(export_records(user_id, transcripts), fmt), compress)),
+        mimetype="text/csv" if fmt == "csv" else "application/x-ndjson",
+    )
+    if compress:
+        response.headers["Content-Encoding"] = "gzip"
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = "no-store"
+    response.headers["X-Accel-Buffering"] = "no"
+    response.headers["Content-Disposition"] = f"attachment; filename=youinsight-history.{fmt}"
+    return response
+
+
+@main.route("/api/search-history", methods=["GET"])
+@login_required
+def search_history():
+    query = request.args.get("q", "").strip()
+    page = request.args.get("page", 1, type=int)
+    per_page = request.args.get("per_page", 20, type=int)
+
+    if not query:
+        return jsonify({"error": "Query is required"}), 400
+
+    return jsonify(search_history_index(current_user.id, query, page, per_page))
+
+
+@main.route("/api/usage", methods=["GET"])
+@login_required
+def get_usage():
+    days = min(max(request.args.get("days", 30, type=int), 1), 366)
+    return jsonify(usage_summary(current_user.id, days))
@@ -0,0 +1,229 @@
+import os
+import json
+import math
+import time
+import bisect
+import logging
+import threading
+import itertools
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+from .metrics import ANALYSIS_QUEUE_WAIT_SECONDS, ANALYSES_REJECTED
+
+logger = logging.getLogger(__name__)
+
+# Analyses running at once in this process, and per user
+ANALYSIS_MAX_IN_FLIGHT = int(os.getenv("ANALYSIS_MAX_IN_FLIGHT", "32"))
+ANALYSIS_MAX_PER_USER = int(os.getenv("ANALYSIS_MAX_PER_USER", "2"))
+# Reject new analyses whose estimated queue wait is longer than this
+ANALYSIS_MAX_QUEUE_WAIT = float(os.getenv("ANALYSIS_MAX_QUEUE_WAIT", "60"))
+# Starting guess for how long an analysis holds its slot, refined as they finish
+ANALYSIS_EXPECTED_SECONDS = float(os.getenv("ANALYSIS_EXPECTED_SECONDS", "20"))
+# Share of the slots each tier gets while users compete for them
+DEFAULT_TIER_WEIGHTS = {"free": 1.0, "pro": 2.0}
+
+
+def load_tier_weights() -> Dict[str, float]:
+    weights = dict(DEFAULT_TIER_WEIGHTS)
+    raw = os.getenv("ANALYSIS_TIER_WEIGHTS")
+    if raw:
+        try:
+            weights.update({tier: float(weight) for tier, weight in json.loads(raw).items()})
+        except (ValueError, AttributeError) as e:
+            logger.error(f"Ignoring invalid ANALYSIS_TIER_WEIGHTS: {str(e)}")
+    return weights
+
+
+class AnalysisRejected(Exception):
+    """An analysis was not admitted; the message is meant for the user."""
+
+    def __init__(self, message: str, reason: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """One analysis waiting for, or holding, a slot."""
+
+    def __init__(self, user_id: int, owner: str, finish: float, seq: int):
+        self.user_id = user_id
+        self.owner = owner
+        # Virtual finish time; waiting tickets are served in this order
+        self.finish = finish
+        self.seq = seq
+        self.submitted_at = time.monotonic()
+        self.granted_at: Optional[float] = None
+        self.cancelled = False
+        self.position = 0
+        self.estimated_wait = 0.0
+        self._changed = threading.Event()
+
+    def __lt__(self, other: "Ticket") -> bool:
+        return (self.finish, self.seq) < (other.finish, other.seq)
+
+
+class FairScheduler:
+    """Weighted fair queuing of analyses across users.
+
+    At most `max_in_flight` analyses run at once, and at most `max_per_user`
+    for any one user. Waiting analyses are ordered by virtual finish time
+    (self-clocked fair queuing): a user's next analysis is tagged 1/weight
+    after their previous one, so a user who submits ten at once does not delay
+    someone else's single analysis by ten. New analyses are rejected up front
+    when the queue wait they would face exceeds `max_wait`.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = ANALYSIS_MAX_IN_FLIGHT,
+        max_per_user: int = ANALYSIS_MAX_PER_USER,
+        max_wait: float = ANALYSIS_MAX_QUEUE_WAIT,
+        expected_seconds: float = ANALYSIS_EXPECTED_SECONDS,
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_per_user = max_per_user
+        self.max_wait = max_wait
+        # Moving average of how long a slot is held
+        self.service_seconds = expected_seconds
+        self._lock = threading.Lock()
+        self._waiting: List[Ticket] = []
+        self._running: Dict[int, int] = {}
+        self._in_flight = 0
+        self._virtual_time = 0.0
+        self._last_finish: Dict[int, float] = {}
+        self._seq = itertools.count()
+
+    # Estimates; callers hold the lock
+
+    def _estimate(self, position: int, user_waiting: int) -> float:
+        """Queue wait for the `position`-th waiting ticket, `user_waiting`-th of its user."""
+        overall = math.ceil(position / self.max_in_flight) * self.service_seconds
+        own = math.ceil(user_waiting / self.max_per_user) * self.service_seconds
+        return max(overall, own)
+
+    def _can_run(self, user_id: int) -> bool:
+        return self._in_flight < self.max_in_flight and self._running.get(user_id, 0) < self.max_per_user
+
+    def _dispatch(self) -> None:
+        """Grant slots to the earliest eligible waiters, then refresh queue positions."""
+        i = 0
+        while i < len(self._waiting) and self._in_flight < self.max_in_flight:
+            ticket = self._waiting[i]
+            if not self._can_run(ticket.user_id):
+                i += 1
+                continue
+            del self._waiting[i]
+            self._virtual_time = max(self._virtual_time, ticket.finish)
+            self._in_flight += 1
+            self._running[ticket.user_id] = self._running.get(ticket.user_id, 0) + 1
+            ticket.granted_at = time.monotonic()
+            ticket._changed.set()
+
+        per_user: Dict[int, int] = {}
+        for position, ticket in enumerate(self._waiting, 1):
+            per_user[ticket.user_id] = per_user.get(ticket.user_id, 0) + 1
+            if ticket.position != position:
+                ticket.position = position
+                ticket.estimated_wait = self._estimate(position, per_user[ticket.user_id])
+                ticket._changed.set()
+
+        # Users with nothing queued restart from the current virtual time
+        for user_id in [u for u, finish in self._last_finish.items() if finish <= self._virtual_time]:
+            del self._last_finish[user_id]
+
+    # Public API
+
+    def submit(self, user_id: int, owner: str, weight: float = 1.0) -> Ticket:
+        """Queue an analysis, or raise AnalysisRejected if it would wait too long."""
+        with self._lock:
+            start = max(self._virtual_time, self._last_finish.get(user_id, 0.0))
+            ticket = Ticket(user_id, owner, start + 1.0 / max(weight, 0.01), next(self._seq))
+
+            # Waiters left behind by _dispatch are all blocked, so a ticket that
+            # can run now is granted straight away and needs no estimate
+            if not self._can_run(user_id):
+                position = bisect.bisect_right(self._waiting, ticket) + 1
+                user_waiting = 1 + sum(1 for waiting in self._waiting if waiting.user_id == user_id)
+                estimate = self._estimate(position, user_waiting)
+                if estimate > self.max_wait:
+                    own_turns = math.ceil(user_waiting / self.max_per_user)
+                    reason = "userBusy" if own_turns >= math.ceil(position / self.max_in_flight) else "overloaded"
+                    ANALYSES_REJECTED.inc(reason=reason)
+                    if reason == "userBusy":
+                        message = "You already have several analyses running. Please wait for them to finish."
+                    else:
+                        message = "The server is busy right now. Please try again in a minute."
+                    raise AnalysisRejected(message, reason, retry_after=estimate - self.max_wait)
+
+            self._last_finish[user_id] = ticket.finish
+            bisect.insort(self._waiting, ticket)
+            self._dispatch()
+        return ticket
+
+    def wait(self, ticket: Ticket, on_position: Optional[Callable[[int, float], None]] = None) -> None:
+        """Block until the ticket holds a slot, reporting queue position changes."""
+        while True:
+            ticket._changed.wait()
+            ticket._changed.clear()
+            if ticket.cancelled:
+                raise AnalysisRejected("The analysis was cancelled.", "cancelled")
+            if ticket.granted_at is not None:
+                ANALYSIS_QUEUE_WAIT_SECONDS.observe(ticket.granted_at - ticket.submitted_at)
+                return
+            if on_position is not None:
+                on_position(ticket.position, ticket.estimated_wait)
+
+    def release(self, ticket: Ticket) -> None:
+        with self._lock:
+            if ticket.granted_at is not None:
+                held = time.monotonic() - ticket.granted_at
+                self.service_seconds = 0.8 * self.service_seconds + 0.2 * held
+                self._in_flight -= 1
+                running = self._running.get(ticket.user_id, 1) - 1
+                if running:
+                    self._running[ticket.user_id] = running
+                else:
+                    self._running.pop(ticket.user_id, None)
+                ticket.granted_at = None
+            elif ticket in self._waiting:
+                self._waiting.remove(ticket)
+            self._dispatch()
+
+    def cancel_owner(self, owner: str) -> None:
+        """Drop the waiting analyses of a disconnected socket."""
+        with self._lock:
+            for ticket in [t for t in self._waiting if t.owner == owner]:
+                self._waiting.remove(ticket)
+                ticket.cancelled = True
+                ticket._changed.set()
+            self._dispatch()
+
+    @contextmanager
+    def slot(
+        self,
+        user_id: int,
+        owner: str,
+        weight: float = 1.0,
+        on_position: Optional[Callable[[int, float], None]] = None,
+    ):
+        """Hold an analysis slot for the duration of the block."""
+        ticket = self.submit(user_id, owner, weight)
+        try:
+            self.wait(ticket, on_position)
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "in_flight": self._in_flight,
+                "waiting": len(self._waiting),
+                "service_seconds": round(self.service_seconds, 3),
+            }
+
+
+TIER_WEIGHTS = load_tier_weights()
+scheduler = FairScheduler()
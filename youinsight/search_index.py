@@ -0,0 +1,324 @@
+import re
+import logging
+from html import escape
+from typing import Any, Dict, List, Optional
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from . import db
+from .models import Analysis
+
+logger = logging.getLogger(__name__)
+
+# Sentinels passed to snippet() so highlighting survives HTML escaping
+_MARK_OPEN = "\x02"
+_MARK_CLOSE = "\x03"
+_SNIPPET_TOKENS = 24
+
+# Plain text of the conversation messages stored as JSON in analysis.messages
+_MESSAGES_TEXT = """coalesce((SELECT group_concat(json_extract(value, '$.content'), char(10))
+    FROM json_each(CASE WHEN json_valid({row}.messages) THEN {row}.messages ELSE '[]' END)), '')"""
+
+_ANALYSIS_VALUES = """{row}.id, 'u' || {row}.user_id, {row}.prompt, coalesce({row}.result, ''),
+    """ + _MESSAGES_TEXT + """, coalesce({row}.search_term, '')"""
+
+_VIDEO_VALUES = """{row}.id, {row}.title, coalesce({row}.channel_title, ''),
+    coalesce({row}.transcript, '')"""
+
+SCHEMA = [
+    # The owner column lets FTS5 intersect a user's rows inside the index
+    # instead of ranking every user's matches and filtering afterwards.
+    """CREATE VIRTUAL TABLE IF NOT EXISTS analysis_fts USING fts5(
+        owner, prompt, result, messages, search_term,
+        tokenize='porter unicode61', prefix='2 3 4')""",
+    """CREATE TRIGGER IF NOT EXISTS analysis_fts_ai AFTER INSERT ON analysis BEGIN
+        INSERT INTO analysis_fts(rowid, owner, prompt, result, messages, search_term)
+        VALUES (""" + _ANALYSIS_VALUES.format(row="new") + """);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS analysis_fts_au
+        AFTER UPDATE OF user_id, prompt, result, messages, search_term ON analysis BEGIN
+        DELETE FROM analysis_fts WHERE rowid = old.id;
+        INSERT INTO analysis_fts(rowid, owner, prompt, result, messages, search_term)
+        VALUES (""" + _ANALYSIS_VALUES.format(row="new") + """);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS analysis_fts_ad AFTER DELETE ON analysis BEGIN
+        DELETE FROM analysis_fts WHERE rowid = old.id;
+    END""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS video_fts USING fts5(
+        title, channel_title, transcript,
+        tokenize='porter unicode61', prefix='2 3 4')""",
+    """CREATE TRIGGER IF NOT EXISTS video_fts_ai AFTER INSERT ON video BEGIN
+        INSERT INTO video_fts(rowid, title, channel_title, transcript)
+        VALUES (""" + _VIDEO_VALUES.format(row="new") + """);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS video_fts_au AFTER UPDATE OF title, channel_title, transcript ON video BEGIN
+        DELETE FROM video_fts WHERE rowid = old.id;
+        INSERT INTO video_fts(rowid, title, channel_title, transcript)
+        VALUES (""" + _VIDEO_VALUES.format(row="new") + """);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS video_fts_ad AFTER DELETE ON video BEGIN
+        DELETE FROM video_fts WHERE rowid = old.id;
+    END""",
+]
+
+# Incremental indexer for rows written before the index (or its triggers) existed
+BACKFILL = [
+    """INSERT INTO analysis_fts(rowid, owner, prompt, result, messages, search_term)
+        SELECT """ + _ANALYSIS_VALUES.format(row="analysis") + """ FROM analysis
+        WHERE analysis.id NOT IN (SELECT rowid FROM analysis_fts)""",
+    """INSERT INTO video_fts(rowid, title, channel_title, transcript)
+        SELECT """ + _VIDEO_VALUES.format(row="video") + """ FROM video
+        WHERE video.id NOT IN (SELECT rowid FROM video_fts)""",
+]
+
+
+# Expected FTS5 columns, used to rebuild tables created by an older schema
+COLUMNS = {
+    "analysis_fts": ["owner", "prompt", "result", "messages", "search_term"],
+    "video_fts": ["title", "channel_title", "transcript"],
+}
+
+TRIGGERS = {
+    "analysis_fts": ["analysis_fts_ai", "analysis_fts_au", "analysis_fts_ad"],
+    "video_fts": ["video_fts_ai", "video_fts_au", "video_fts_ad"],
+}
+
+
+def is_supported(engine=None) -> bool:
+    """FTS5 indexing is only available on SQLite databases."""
+    engine = engine or db.engine
+    return engine.dialect.name == "sqlite"
+
+
+def ensure_search_index(engine=None) -> None:
+    """Create the FTS5 tables and sync triggers, then index any unindexed rows."""
+    engine = engine or db.engine
+    if not is_supported(engine):
+        logger.info("Full-text search index skipped: database is not SQLite")
+        return
+
+    try:
+        with engine.begin() as conn:
+            _create_search_index(conn)
+    except OperationalError as e:
+        # Typically the base tables predate a column the index needs
+        logger.warning(f"Full-text search index not updated, run 'flask db upgrade': {str(e)}")
+
+
+def _create_search_index(conn) -> None:
+    """Rebuild stale FTS5 tables, then create missing tables and triggers and backfill."""
+    for table, columns in COLUMNS.items():
+        existing = [row[1] for row in conn.execute(text("PRAGMA table_info({})".format(table)))]
+        if existing and existing != columns:
+            logger.info(f"Rebuilding {table}: columns changed from {existing} to {columns}")
+            for trigger in TRIGGERS[table]:
+                conn.execute(text("DROP TRIGGER IF EXISTS {}".format(trigger)))
+            conn.execute(text("DROP TABLE {}".format(table)))
+
+    for statement in SCHEMA + BACKFILL:
+        conn.execute(text(statement))
+
+
+def build_match_query(query: str) -> Optional[str]:
+    """Turn free text into a safe FTS5 query: every term must match, last term as a prefix."""
+    terms = re.findall(r"\w+", query.lower())
+    if not terms:
+        return None
+    quoted = ['"{}"'.format(term) for term in terms[:16]]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def _highlight(snippet: Optional[str]) -> str:
+    """HTML-escape a snippet and turn the FTS5 sentinels into <mark> tags."""
+    if not snippet:
+        return ""
+    return (
+        escape(snippet)
+        .replace(_MARK_OPEN, "<mark>")
+        .replace(_MARK_CLOSE, "</mark>")
+    )
+
+
+def search_history(
+    user_id: int, query: str, page: int = 1, per_page: int = 20
+) -> Dict[str, Any]:
+    """Ranked, paginated search over a user's analyses and the videos they analyzed."""
+    page = max(page, 1)
+    per_page = min(max(per_page, 1), 100)
+    result = {"query": query, "page": page, "per_page": per_page, "total": 0, "results": []}
+
+    match = build_match_query(query)
+    if not match:
+        return result
+
+    if not is_supported():
+        return _search_history_fallback(user_id, query, page, per_page, result)
+
+    content_match = "{prompt result messages search_term} : (%s)" % match
+    params = {
+        "owner_match": '{owner} : "u%d" AND %s' % (user_id, content_match),
+        "video_match": match,
+        "user_id": user_id,
+    }
+
+    # Rank ids first; snippets are only computed for the rows on this page
+    hits = """
+        SELECT rowid AS analysis_id,
+               bm25(analysis_fts, 0.0, 4.0, 1.0, 1.0, 2.0) AS score
+        FROM analysis_fts WHERE analysis_fts MATCH :owner_match
+        UNION ALL
+        SELECT analysis_video.analysis_id AS analysis_id,
+               bm25(video_fts, 3.0, 1.0, 1.0) AS score
+        FROM video_fts
+        JOIN analysis_video ON analysis_video.video_id = video_fts.rowid
+        JOIN analysis ON analysis.id = analysis_video.analysis_id
+        WHERE video_fts MATCH :video_match AND analysis.user_id = :user_id
+    """
+
+    result["total"] = db.session.execute(
+        text("SELECT count(DISTINCT analysis_id) FROM ({})".format(hits)), params
+    ).scalar()
+    if not result["total"]:
+        return result
+
+    ranked = db.session.execute(
+        text(
+            """
+            SELECT analysis_id, min(score) AS score FROM ({})
+            GROUP BY analysis_id
+            ORDER BY score, analysis_id DESC
+            LIMIT :limit OFFSET :offset
+            """.format(hits)
+        ),
+        dict(params, limit=per_page, offset=(page - 1) * per_page),
+    ).all()
+
+    page_ids = [analysis_id for analysis_id, _ in ranked]
+    analyses = {
+        analysis.id: analysis
+        for analysis in Analysis.query.filter(Analysis.id.in_(page_ids)).all()
+    }
+    snippets = _analysis_snippets(content_match, page_ids)
+    missing = [analysis_id for analysis_id in page_ids if analysis_id not in snippets]
+    video_snippets = _video_snippets(match, missing)
+
+    for analysis_id, score in ranked:
+        analysis = analyses[analysis_id]
+        if analysis_id in snippets:
+            matched, snippet = "analysis", snippets[analysis_id]
+        else:
+            matched, snippet = "video", video_snippets.get(analysis_id, "")
+        result["results"].append(
+            {
+                "id": analysis.id,
+                "prompt": analysis.prompt,
+                "search_term": analysis.search_term,
+                "created_at": analysis.created_at.isoformat(),
+                "is_conversation": bool(analysis.is_conversation),
+                "conversation_id": analysis.conversation_id,
+                "score": score,
+                "matched": matched,
+                "snippet": _highlight(snippet),
+            }
+        )
+
+    result["has_more"] = page * per_page < result["total"]
+    return result
+
+
+def _id_params(ids: List[int]) -> Dict[str, int]:
+    return {"id_{}".format(i): value for i, value in enumerate(ids)}
+
+
+def _id_placeholders(ids: List[int]) -> str:
+    return ", ".join(":id_{}".format(i) for i in range(len(ids)))
+
+
+def _analysis_snippets(match: str, analysis_ids: List[int]) -> Dict[int, str]:
+    """Highlighted snippets for the given analyses, keyed by analysis id."""
+    if not analysis_ids:
+        return {}
+    rows = db.session.execute(
+        text(
+            """
+            SELECT rowid, snippet(analysis_fts, -1, :open, :close, '…', :tokens)
+            FROM analysis_fts
+            WHERE analysis_fts MATCH :match AND rowid IN ({})
+            """.format(_id_placeholders(analysis_ids))
+        ),
+        dict(
+            _id_params(analysis_ids),
+            match=match,
+            open=_MARK_OPEN,
+            close=_MARK_CLOSE,
+            tokens=_SNIPPET_TOKENS,
+        ),
+    )
+    return {row[0]: row[1] for row in rows}
+
+
+def _video_snippets(match: str, analysis_ids: List[int]) -> Dict[int, str]:
+    """Snippets from video titles/transcripts for analyses that only matched via a video."""
+    if not analysis_ids:
+        return {}
+    rows = db.session.execute(
+        text(
+            """
+            SELECT analysis_video.analysis_id,
+                   snippet(video_fts, -1, :open, :close, '…', :tokens)
+            FROM video_fts
+            JOIN analysis_video ON analysis_video.video_id = video_fts.rowid
+            WHERE video_fts MATCH :match AND analysis_video.analysis_id IN ({})
+            """.format(_id_placeholders(analysis_ids))
+        ),
+        dict(
+            _id_params(analysis_ids),
+            match=match,
+            open=_MARK_OPEN,
+            close=_MARK_CLOSE,
+            tokens=_SNIPPET_TOKENS,
+        ),
+    )
+    snippets = {}
+    for analysis_id, snippet in rows:
+        snippets.setdefault(analysis_id, snippet)
+    return snippets
+
+
+def _search_history_fallback(user_id, query, page, per_page, result):
+    """Unranked substring search for databases without FTS5."""
+    # The query is matched literally: LIKE wildcards in it are escaped
+    escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    pattern = "%{}%".format(escaped)
+    base = Analysis.query.filter(
+        Analysis.user_id == user_id,
+        db.or_(
+            Analysis.prompt.ilike(pattern, escape="\\"),
+            Analysis.result.ilike(pattern, escape="\\"),
+            Analysis.messages.ilike(pattern, escape="\\"),
+            Analysis.search_term.ilike(pattern, escape="\\"),
+        ),
+    )
+    result["total"] = base.count()
+    analyses = (
+        base.order_by(Analysis.created_at.desc())
+        .offset((page - 1) * per_page)
+        .limit(per_page)
+        .all()
+    )
+    for analysis in analyses:
+        result["results"].append(
+            {
+                "id": analysis.id,
+                "prompt": analysis.prompt,
+                "search_term": analysis.search_term,
+                "created_at": analysis.created_at.isoformat(),
+                "is_conversation": bool(analysis.is_conversation),
+                "conversation_id": analysis.conversation_id,
+                "score": None,
+                "matched": "analysis",
+                "snippet": escape((analysis.result or analysis.prompt or "")[:200]),
+            }
+        )
+    result["has_more"] = page * per_page < result["total"]
+    return result
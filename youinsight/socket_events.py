@@ -1,38 +1,112 @@
 import os
-from flask import current_app
+from flask import current_app, request
 from flask_socketio import emit, join_room
 from flask_login import current_user
 import json
-import uuid
 import os
-from datetime import datetime
+from functools import wraps
 
-from . import socketio, db
-from .models import User, Video, Analysis, AnalysisVideo
+from . import socketio, db, limiter
+from .models import User
 from .youtube_service import YouTubeService
-from .gemini_service import GeminiService
+from .catalog import (
+    search_catalog, record_quota_saved, ingest_search_results,
+    CATALOG_MIN_RESULTS, SEARCH_QUOTA_COST,
+)
 from . import cache  # Added for Flask-Caching
 from googleapiclient.errors import HttpError  # Added for YouTube API error handling
+from .identity import bind_connection, release_connection, connection_identity
+from .scheduler import scheduler, AnalysisRejected, TIER_WEIGHTS
+from .pipeline import run_analysis, answer_from_digest
+from .transcript_index import annotate, probe
+from .video_stats import with_current_stats
+from .metrics import ACTIVE_SOCKETS, SEARCHES, SOCKET_EVENT_SECONDS, RATE_LIMITED, AnalysisTracker
+
+# Session IDs of accepted connections in this process
+_connected_sids = set()
 
 def register_socket_events():
     """Register all WebSocket event handlers"""
     # This function will be called during app initialization
     pass
 
+def _with_availability(videos, logger):
+    """Search results with the transcript availability the index already has;
+    unchanged if it cannot be read."""
+    try:
+        return annotate(videos)
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Failed to look up transcript availability: {str(e)}")
+        return videos
+
+def _send_availability(videos, logger):
+    """Probe the search results whose availability is unknown and send what was
+    found as 'transcript_availability', after the results themselves."""
+    unknown = [v['video_id'] for v in videos if v.get('transcript_available') is None]
+    if not unknown:
+        return
+    try:
+        availability = probe(unknown)
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Failed to probe transcript availability: {str(e)}")
+        return
+    emit('transcript_availability', {'videos': availability})
+
+def rate_limited(event):
+    """Apply the event's token bucket for the socket's user; rejected events get an
+    'error' with reason 'rateLimited' and retry_after seconds."""
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(*args, **kwargs):
+            identity = connection_identity(request.sid)
+            if identity is not None:
+                decision = limiter.hit(event, f"user:{identity.id}", identity.tier)
+            else:
+                decision = limiter.hit(event, f"sid:{request.sid}")
+            if not decision.allowed:
+                RATE_LIMITED.inc(event=event)
+                emit('error', {
+                    'message': f'Too many requests. Please try again in {decision.retry_after_header} seconds.',
+                    'reason': 'rateLimited',
+                    'retry_after': round(decision.retry_after, 1),
+                })
+                return
+            return handler(*args, **kwargs)
+        return wrapper
+    return decorator
+
 @socketio.on('connect')
 def handle_connect():
     if current_user.is_authenticated:
         join_room(current_user.id)
+        # Later events on this socket use the snapshot instead of reloading the user
+        bind_connection(request.sid, current_user._get_current_object())
+        _connected_sids.add(request.sid)
+        ACTIVE_SOCKETS.inc()
         emit('status', {'message': 'Connected to server'})
     else:
         return False  # Reject the connection
 
+@socketio.on('disconnect')
+def handle_disconnect():
+    release_connection(request.sid)
+    scheduler.cancel_owner(request.sid)
+    if request.sid in _connected_sids:
+        _connected_sids.discard(request.sid)
+        ACTIVE_SOCKETS.dec()
+
 @socketio.on('search_videos')
+@rate_limited('search_videos')
+@SOCKET_EVENT_SECONDS.time(event='search_videos')
 def handle_search(data):
     """Handle search requests for YouTube videos with caching and robust error handling."""
     logger = getattr(current_app, 'logger', print) # Use print as fallback if logger not set up
 
     query = data.get('query', '')
+    # Skip the library and the cache when the user explicitly asks for fresh results
+    fresh = bool(data.get('fresh'))
     if not query or not isinstance(query, str):
         logger.warning(f"Invalid search query received: {query}")
         emit('error', {'message': 'Please provide a valid search term'})
@@ -50,12 +124,37 @@ def handle_search(data):
     logger.info(f"Handling search for: '{query}', cache_key: {cache_key}")
 
     try:
-        cached_videos = cache.get(cache_key)
+        cached_videos = None if fresh else cache.get(cache_key)
         if cached_videos is not None:
             logger.info(f"Cache hit for '{query}'. Returning {len(cached_videos)} cached videos.")
-            emit('search_results', {'videos': cached_videos})
+            SEARCHES.inc(source='cache')
+            # The cached view counts date from the search; the library's are kept current
+            try:
+                cached_videos = with_current_stats(cached_videos)
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Failed to read current statistics: {str(e)}")
+            cached_videos = _with_availability(cached_videos, logger)
+            emit('search_results', {'videos': cached_videos, 'source': 'cache'})
+            _send_availability(cached_videos, logger)
             return
 
+        if not fresh:
+            library_videos = search_catalog(query, limit=MAX_RESULTS)
+            if len(library_videos) >= CATALOG_MIN_RESULTS:
+                quota_saved_total = record_quota_saved()
+                SEARCHES.inc(source='library')
+                library_videos = _with_availability(library_videos, logger)
+                emit('search_results', {
+                    'videos': library_videos,
+                    'source': 'library',
+                    'quota_saved': SEARCH_QUOTA_COST,
+                    'quota_saved_total': quota_saved_total,
+                })
+                _send_availability(library_videos, logger)
+                return
+            logger.info(f"Library has {len(library_videos)} matches for '{query}', falling through to YouTube.")
+
         logger.info(f"Cache miss for '{query}'. Fetching from YouTube API.")
         yt_service = YouTubeService(api_key)
         videos = yt_service.search_videos(query, max_results=MAX_RESULTS)
@@ -67,7 +166,20 @@ def handle_search(data):
         logger.info(f"Search for '{query}' found {len(videos)} videos. Caching results.")
         cache.set(cache_key, videos) 
         
-        emit('search_results', {'videos': videos})
+        SEARCHES.inc(source='youtube')
+        # The results go out first; videos found to have no transcript are
+        # marked as unusable once the probes are back
+        annotated = _with_availability(videos, logger)
+        emit('search_results', {'videos': annotated, 'source': 'youtube'})
+
+        # Grow the local catalog so later searches can be answered without quota
+        try:
+            ingest_search_results(videos)
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Failed to add search results for '{query}' to the library: {str(e)}")
+
+        _send_availability(annotated, logger)
 
     except HttpError as e:
         error_message = "An error occurred with the YouTube API."
@@ -97,269 +209,29 @@ def handle_search(data):
         emit('error', {'message': 'An unexpected error occurred while searching. Please try again.'})
 
 @socketio.on('analyze_videos')
+@rate_limited('analyze_videos')
+@SOCKET_EVENT_SECONDS.time(event='analyze_videos')
 def handle_analyze(data):
-    search_term = data.get('search_term')
-    video_ids = data.get('video_ids', [])
-    prompt = data.get('prompt')
-    single_video_url = data.get('video_url')
-    # Conversation tracking
-    conversation_id = data.get('conversation_id')
-    is_new_conversation = data.get('is_new_conversation', False)
-    
-    if not prompt:
-        emit('error', {'message': 'Prompt is required'})
+    identity = connection_identity(request.sid)
+    if identity is None:
+        emit('error', {'message': 'Please log in again'})
         return
-    
-    yt_service = YouTubeService(os.getenv('YOUTUBE_API_KEY'))
-    
-    # Case 1: Single video analysis
-    if single_video_url:
-        video_id = yt_service.get_video_id_from_url(single_video_url)
-        if not video_id:
-            emit('error', {'message': 'Invalid video URL'})
-            return
-            
-        video_data = yt_service.get_video_by_id(video_id)
-        if not video_data:
-            emit('error', {'message': 'Video not found'})
-            return
-            
-        video = Video.query.filter_by(video_id=video_id).first()
-        if not video:
-            video = Video(
-                video_id=video_id,
-                title=video_data['title'],
-                url=video_data['url'],
-                view_count=video_data.get('view_count', 0)
-            )
-            db.session.add(video)
-            db.session.commit()
-        
-        # Get transcript
-        transcript = yt_service.get_transcript(video.url)
-        if not transcript:
-            emit('error', {'message': 'Transcript not available for this video'})
-            return
-            
-        video.transcript = transcript
-        db.session.commit()
-        
-        # Create analysis with conversation support
-        if is_new_conversation or not conversation_id:
-            # Start a new conversation
-            conversation_id = str(uuid.uuid4())
-            is_conversation = True
-            messages = json.dumps([{
-                'role': 'user',
-                'content': prompt,
-                'timestamp': datetime.utcnow().isoformat()
-            }])
-        else:
-            # Continue existing conversation
-            # Find the previous analysis in this conversation
-            prev_analysis = Analysis.query.filter_by(conversation_id=conversation_id).order_by(Analysis.created_at.desc()).first()
-            is_conversation = True
-            
-            # Get existing messages and add the new one
-            if prev_analysis and prev_analysis.messages:
-                messages_list = json.loads(prev_analysis.messages)
-                messages_list.append({
-                    'role': 'user',
-                    'content': prompt,
-                    'timestamp': datetime.utcnow().isoformat()
-                })
-                messages = json.dumps(messages_list)
-            else:
-                # Fallback if something goes wrong with the previous messages
-                messages = json.dumps([{
-                    'role': 'user',
-                    'content': prompt,
-                    'timestamp': datetime.utcnow().isoformat()
-                }])
 
-        analysis = Analysis(
-            user_id=current_user.id,
-            search_term=None,
-            prompt=prompt,
-            conversation_id=conversation_id,
-            is_conversation=is_conversation,
-            messages=messages
-        )
-        db.session.add(analysis)
-        db.session.commit()
-        
-        # Link video to analysis
-        analysis_video = AnalysisVideo(
-            analysis_id=analysis.id,
-            video_id=video.id
-        )
-        db.session.add(analysis_video)
-        db.session.commit()
-        
-        # Perform analysis
-        gemini_service = GeminiService(current_user.gemini_api_key)
-        video_with_transcript = {
-            'title': video.title,
-            'url': video.url,
-            'transcript': video.transcript
-        }
-        
-        emit('analysis_started', {'message': 'Analysis started'})
-        
-        # Stream analysis chunks
-        chunks = []
-        for chunk in gemini_service.stream_analysis(prompt, [video_with_transcript]):
-            chunks.append(chunk)
-            emit('analysis_chunk', {'chunk': chunk})
-        
-        # Save complete analysis
-        result = ''.join(chunks)
-        analysis.result = result
-        
-        # Update the messages with the assistant's response
-        if analysis.messages:
-            messages_list = json.loads(analysis.messages)
-            messages_list.append({
-                'role': 'assistant',
-                'content': result,
-                'timestamp': datetime.utcnow().isoformat()
-            })
-            analysis.messages = json.dumps(messages_list)
-        
-        db.session.commit()
-        
-        emit('analysis_complete', {'analysis_id': analysis.id, 'conversation_id': conversation_id})
-        
-    # Case 2: Multiple videos based on search
-    elif search_term:
-        # Search videos if no specific video_ids provided
-        if not video_ids:
-            videos_data = yt_service.search_videos(search_term)
-            video_ids = [v['video_id'] for v in videos_data]
-        
-        # Retrieve videos from database or create them
-        videos = []
-        for video_id in video_ids:
-            video = Video.query.filter_by(video_id=video_id).first()
-            if not video:
-                video_data = yt_service.get_video_by_id(video_id)
-                if video_data:
-                    video = Video(
-                        video_id=video_id,
-                        title=video_data['title'],
-                        url=video_data['url'],
-                        view_count=video_data.get('view_count', 0)
-                    )
-                    db.session.add(video)
-                    db.session.commit()
-            
-            if video:
-                # Get transcript if not already saved
-                if not video.transcript:
-                    transcript = yt_service.get_transcript(video.url)
-                    if transcript:
-                        video.transcript = transcript
-                        db.session.commit()
-                
-                if video.transcript:
-                    videos.append(video)
-        
-        if not videos:
-            emit('error', {'message': 'No videos with transcripts found'})
-            return
-        
-        # Create analysis with conversation support
-        if is_new_conversation or not conversation_id:
-            # Start a new conversation
-            conversation_id = str(uuid.uuid4())
-            is_conversation = True
-            messages = json.dumps([{
-                'role': 'user',
-                'content': prompt,
-                'timestamp': datetime.utcnow().isoformat()
-            }])
-        else:
-            # Continue existing conversation
-            # Find the previous analysis in this conversation
-            prev_analysis = Analysis.query.filter_by(conversation_id=conversation_id).order_by(Analysis.created_at.desc()).first()
-            is_conversation = True
-            
-            # Get existing messages and add the new one
-            if prev_analysis and prev_analysis.messages:
-                messages_list = json.loads(prev_analysis.messages)
-                messages_list.append({
-                    'role': 'user',
-                    'content': prompt,
-                    'timestamp': datetime.utcnow().isoformat()
-                })
-                messages = json.dumps(messages_list)
-            else:
-                # Fallback if something goes wrong with the previous messages
-                messages = json.dumps([{
-                    'role': 'user',
-                    'content': prompt,
-                    'timestamp': datetime.utcnow().isoformat()
-                }])
+    def report_position(position, estimated_wait):
+        emit('analysis_queued', {'position': position, 'estimated_wait': round(estimated_wait)})
 
-        analysis = Analysis(
-            user_id=current_user.id,
-            search_term=search_term,
-            prompt=prompt,
-            conversation_id=conversation_id,
-            is_conversation=is_conversation,
-            messages=messages
-        )
-        db.session.add(analysis)
-        db.session.commit()
-        
-        # Link videos to analysis
-        for video in videos:
-            analysis_video = AnalysisVideo(
-                analysis_id=analysis.id,
-                video_id=video.id
-            )
-            db.session.add(analysis_video)
-        db.session.commit()
-        
-        # Prepare videos with transcripts for analysis
-        videos_with_transcripts = [
-            {
-                'title': video.title,
-                'url': video.url,
-                'transcript': video.transcript
-            }
-            for video in videos if video.transcript
-        ]
-        
-        # Perform analysis
-        gemini_service = GeminiService(current_user.gemini_api_key)
-        
-        emit('analysis_started', {'message': 'Analysis started'})
-        
-        # Stream analysis chunks
-        chunks = []
-        for chunk in gemini_service.stream_analysis(prompt, videos_with_transcripts):
-            chunks.append(chunk)
-            emit('analysis_chunk', {'chunk': chunk})
-        
-        # Save complete analysis
-        result = ''.join(chunks)
-        analysis.result = result
-        
-        # Update the messages with the assistant's response
-        if analysis.messages:
-            messages_list = json.loads(analysis.messages)
-            messages_list.append({
-                'role': 'assistant',
-                'content': result,
-                'timestamp': datetime.utcnow().isoformat()
-            })
-            analysis.messages = json.dumps(messages_list)
-        
-        db.session.commit()
-        
-        emit('analysis_complete', {'analysis_id': analysis.id, 'conversation_id': conversation_id})
-    
-    else:
-        emit('error', {'message': 'Either search_term or video_url is required'})
-        return
+    with AnalysisTracker() as tracker:
+        try:
+            # Standard prompts answered from stored digests need no slot
+            if answer_from_digest(data, identity, emit, tracker, skip_sid=request.sid):
+                return
+            # Waits here, fairly interleaved with other users, until a slot is free
+            with scheduler.slot(identity.id, request.sid, TIER_WEIGHTS.get(identity.tier, 1.0), report_position):
+                run_analysis(data, identity, emit, tracker, skip_sid=request.sid)
+        except AnalysisRejected as e:
+            if e.reason != 'cancelled':
+                emit('error', {
+                    'message': str(e),
+                    'reason': e.reason,
+                    'retry_after': round(e.retry_after, 1) if e.retry_after is not None else None,
+                })
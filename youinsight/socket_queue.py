@@ -0,0 +1,20 @@
+import socketio
+
+
+class LocalFirstRedisManager(socketio.RedisManager):
+    """Redis-backed Socket.IO manager for running several worker processes.
+
+    Emits to rooms, broadcasts and sockets connected to other workers go
+    through Redis as usual. An emit aimed at one socket connected to this
+    process is delivered directly, so replies such as streamed analysis chunks
+    cost no Redis round trip.
+    """
+
+    def emit(self, event, data, namespace=None, room=None, skip_sid=None, callback=None, to=None, **kwargs):
+        room = to or room
+        # Rooms used by the app are user IDs, so a string room is a socket ID
+        if isinstance(room, str) and self.is_connected(room, namespace or '/'):
+            kwargs['ignore_queue'] = True
+        return super().emit(
+            event, data, namespace=namespace, room=room, skip_sid=skip_sid, callback=callback, **kwargs
+        )
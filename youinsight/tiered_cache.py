@@ -0,0 +1,325 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, Optional, Tuple
+from flask_caching.backends.base import BaseCache
+
+logger = logging.getLogger(__name__)
+
+# Key prefix -> (ttl seconds, stale-while-revalidate seconds).
+# Overridable with the CACHE_NAMESPACE_TTLS environment variable (same shape, JSON).
+DEFAULT_NAMESPACES = {
+    "youtube_search_": (3600, 900),
+    "transcript_": (86400, 3600),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entries (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires_at REAL NOT NULL,
+    stale_until REAL NOT NULL,
+    refreshing_until REAL NOT NULL DEFAULT 0
+)
+"""
+
+# How long a caller that got a miss on a stale entry has to recompute it
+# before another caller is allowed to try.
+REFRESH_CLAIM_SECONDS = 30
+
+# Prune the disk tier every this many writes
+PRUNE_EVERY = 256
+
+_NEVER = float("inf")
+
+
+def _dumps(value: Any) -> bytes:
+    # JSON rather than pickle: loading a pickle runs code, and anyone who can
+    # write the shared cache file could plant one
+    return json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+
+def _loads(blob: bytes) -> Any:
+    return json.loads(blob)
+
+
+class TieredCache(BaseCache):
+    """Two-tier cache: a byte-bounded in-process LRU in front of a SQLite file
+    shared by every worker on the host.
+
+    Entries past their TTL but inside their namespace's stale window are
+    served stale, except to one caller per entry which gets a miss and is
+    expected to recompute and ``set`` the value (stale-while-revalidate).
+
+    Values are stored as JSON, so only JSON-serializable values can be cached
+    and tuples come back as lists.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        default_timeout: int = 300,
+        memory_limit_bytes: int = 64 * 1024 * 1024,
+        memory_max_age: int = 60,
+        disk_limit_bytes: int = 512 * 1024 * 1024,
+        namespaces: Optional[Dict[str, Tuple[int, int]]] = None,
+    ):
+        BaseCache.__init__(self, default_timeout=default_timeout)
+        self.path = path
+        self.memory_limit_bytes = memory_limit_bytes
+        # Bounds how long a worker can serve a value another worker replaced or deleted
+        self.memory_max_age = memory_max_age
+        self.disk_limit_bytes = disk_limit_bytes
+        self.namespaces = sorted(
+            (namespaces if namespaces is not None else DEFAULT_NAMESPACES).items(),
+            key=lambda item: len(item[0]),
+            reverse=True,
+        )
+
+        # key -> (blob, expires_at, stale_until, cached_at)
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.RLock()
+        self._writes = 0
+        self._stats = defaultdict(int)
+        self._namespace_stats = defaultdict(lambda: defaultdict(int))
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(SCHEMA)
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS ix_cache_entries_stale_until ON cache_entries (stale_until)"
+        )
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        namespaces = dict(DEFAULT_NAMESPACES)
+        namespaces.update(
+            {prefix: tuple(ttls) for prefix, ttls in config.get("CACHE_NAMESPACE_TTLS", {}).items()}
+        )
+        kwargs.update(
+            dict(
+                path=config.get("CACHE_PATH") or os.path.join(app.instance_path, "cache.sqlite"),
+                memory_limit_bytes=config.get("CACHE_MEMORY_LIMIT_BYTES", 64 * 1024 * 1024),
+                memory_max_age=config.get("CACHE_MEMORY_MAX_AGE", 60),
+                disk_limit_bytes=config.get("CACHE_DISK_LIMIT_BYTES", 512 * 1024 * 1024),
+                namespaces=namespaces,
+            )
+        )
+        return cls(*args, **kwargs)
+
+    # Namespaces and timeouts
+
+    def _namespace(self, key: str) -> Tuple[str, Optional[int], int]:
+        """Return (namespace, ttl or None to use the caller's timeout, stale window)."""
+        for prefix, (ttl, stale) in self.namespaces:
+            if key.startswith(prefix):
+                return prefix, ttl, stale
+        return "default", None, 0
+
+    def _expiry(self, key: str, timeout: Optional[int]) -> Tuple[float, float]:
+        _, ttl, stale = self._namespace(key)
+        timeout = self._normalize_timeout(ttl if ttl is not None else timeout)
+        if timeout == 0:
+            return _NEVER, _NEVER
+        expires_at = time.time() + timeout
+        return expires_at, expires_at + stale
+
+    def _count(self, key: str, stat: str) -> None:
+        self._stats[stat] += 1
+        self._namespace_stats[self._namespace(key)[0]][stat] += 1
+
+    # Memory tier
+
+    def _memory_put(self, key: str, blob: bytes, expires_at: float, stale_until: float) -> None:
+        size = len(blob)
+        if size > self.memory_limit_bytes:
+            return
+        with self._lock:
+            self._memory_discard(key)
+            self._memory[key] = (blob, expires_at, stale_until, time.time())
+            self._memory_bytes += size
+            while self._memory_bytes > self.memory_limit_bytes:
+                _, (evicted, _, _, _) = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+                self._stats["memory_evictions"] += 1
+
+    def _memory_discard(self, key: str) -> None:
+        with self._lock:
+            entry = self._memory.pop(key, None)
+            if entry is not None:
+                self._memory_bytes -= len(entry[0])
+
+    def _memory_get(self, key: str, now: float) -> Optional[bytes]:
+        """Return a fresh blob from memory, or None when absent, stale or too old."""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            blob, expires_at, _, cached_at = entry
+            if expires_at <= now or now - cached_at > self.memory_max_age:
+                self._memory_discard(key)
+                return None
+            self._memory.move_to_end(key)
+            return blob
+
+    # Cache API
+
+    def get(self, key: str) -> Any:
+        now = time.time()
+        blob = self._memory_get(key, now)
+        if blob is not None:
+            self._count(key, "memory_hits")
+            return _loads(blob)
+
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, expires_at, stale_until, refreshing_until FROM cache_entries WHERE key = ?",
+                (key,),
+            ).fetchone()
+        if row is None or row[2] <= now:
+            self._count(key, "misses")
+            return None
+
+        blob, expires_at, stale_until, refreshing_until = row
+        try:
+            value = _loads(blob)
+        except ValueError:
+            # Written by an older version, or not by this cache at all
+            logger.warning(f"Dropping unreadable cache entry {key!r}")
+            self.delete(key)
+            self._count(key, "misses")
+            return None
+        if expires_at > now:
+            self._count(key, "disk_hits")
+            self._memory_put(key, blob, expires_at, stale_until)
+            return value
+
+        # Stale: the first caller to claim the refresh recomputes, the rest get the old value
+        if refreshing_until <= now:
+            with self._lock:
+                claimed = self._db.execute(
+                    "UPDATE cache_entries SET refreshing_until = ? WHERE key = ? AND refreshing_until <= ?",
+                    (now + REFRESH_CLAIM_SECONDS, key, now),
+                ).rowcount
+            if claimed:
+                self._count(key, "misses")
+                return None
+        self._count(key, "stale_hits")
+        return value
+
+    def set(self, key: str, value: Any, timeout: Optional[int] = None) -> bool:
+        try:
+            blob = _dumps(value)
+        except (TypeError, ValueError) as e:
+            logger.error(f"Not caching {key!r}, its value is not JSON-serializable: {str(e)}")
+            return False
+        expires_at, stale_until = self._expiry(key, timeout)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO cache_entries (key, value, expires_at, stale_until, refreshing_until) "
+                "VALUES (?, ?, ?, ?, 0)",
+                (key, blob, expires_at, stale_until),
+            )
+            self._writes += 1
+            prune = self._writes % PRUNE_EVERY == 0
+        self._memory_put(key, blob, expires_at, stale_until)
+        self._count(key, "sets")
+        if prune:
+            self.prune()
+        return True
+
+    def add(self, key: str, value: Any, timeout: Optional[int] = None) -> bool:
+        if self.has(key):
+            return False
+        return self.set(key, value, timeout)
+
+    def has(self, key: str) -> bool:
+        now = time.time()
+        if self._memory_get(key, now) is not None:
+            return True
+        with self._lock:
+            row = self._db.execute(
+                "SELECT 1 FROM cache_entries WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+        return row is not None
+
+    def delete(self, key: str) -> bool:
+        self._memory_discard(key)
+        with self._lock:
+            self._db.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+        return True
+
+    def clear(self) -> bool:
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            self._db.execute("DELETE FROM cache_entries")
+        return True
+
+    # Maintenance and introspection
+
+    def prune(self) -> None:
+        """Drop dead entries from the disk tier and keep it under its byte limit."""
+        now = time.time()
+        with self._lock:
+            expired = self._db.execute(
+                "DELETE FROM cache_entries WHERE stale_until <= ?", (now,)
+            ).rowcount
+            self._stats["disk_expirations"] += expired
+
+            total = self._db.execute(
+                "SELECT coalesce(sum(length(value)), 0) FROM cache_entries"
+            ).fetchone()[0]
+            if total <= self.disk_limit_bytes:
+                return
+
+            # Evict soonest-to-expire entries until under the limit
+            excess = total - self.disk_limit_bytes
+            freed = 0
+            evicted = []
+            for key, size in self._db.execute(
+                "SELECT key, length(value) FROM cache_entries ORDER BY expires_at"
+            ):
+                evicted.append((key,))
+                freed += size
+                if freed >= excess:
+                    break
+            self._db.executemany("DELETE FROM cache_entries WHERE key = ?", evicted)
+            self._stats["disk_evictions"] += len(evicted)
+        logger.info(f"Evicted {len(evicted)} entries ({freed} bytes) from the disk cache")
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss/eviction counters for this process plus current tier sizes."""
+        with self._lock:
+            disk_entries, disk_bytes = self._db.execute(
+                "SELECT count(*), coalesce(sum(length(value)), 0) FROM cache_entries"
+            ).fetchone()
+            return {
+                **self._stats,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_entries": disk_entries,
+                "disk_bytes": disk_bytes,
+                "namespaces": {name: dict(stats) for name, stats in self._namespace_stats.items()},
+            }
+
+
+def load_namespace_ttls() -> Dict[str, Tuple[int, int]]:
+    """Parse CACHE_NAMESPACE_TTLS, e.g. '{"youtube_search_": [3600, 900]}'."""
+    raw = os.getenv("CACHE_NAMESPACE_TTLS")
+    if not raw:
+        return {}
+    try:
+        return {prefix: tuple(ttls) for prefix, ttls in json.loads(raw).items()}
+    except (ValueError, TypeError, AttributeError) as e:
+        logger.error(f"Ignoring invalid CACHE_NAMESPACE_TTLS: {str(e)}")
+        return {}
@@ -0,0 +1,132 @@
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from . import db
+from .models import Video, TranscriptAvailability
+from .youtube_service import YouTubeService
+from .metrics import TRANSCRIPT_PROBES, TRANSCRIPT_LOOKUPS_SKIPPED
+
+logger = logging.getLogger(__name__)
+
+# How long a probe result is trusted. "None" expires sooner: captions are
+# often added after upload, while a video rarely loses them.
+TRANSCRIPT_AVAILABLE_TTL = int(os.getenv('TRANSCRIPT_AVAILABLE_TTL', str(7 * 86400)))
+TRANSCRIPT_MISSING_TTL = int(os.getenv('TRANSCRIPT_MISSING_TTL', '86400'))
+# Watch pages fetched at once when probing search results
+TRANSCRIPT_PROBE_CONCURRENCY = int(os.getenv('TRANSCRIPT_PROBE_CONCURRENCY', '8'))
+
+
+def lookup(video_ids: Iterable[str]) -> Dict[str, List[str]]:
+    """Unexpired probe results by video ID: the languages, empty for "none"."""
+    video_ids = list(set(video_ids))
+    if not video_ids:
+        return {}
+    rows = TranscriptAvailability.query.filter(
+        TranscriptAvailability.video_id.in_(video_ids),
+        TranscriptAvailability.expires_at > datetime.utcnow(),
+    )
+    return {row.video_id: row.languages.split(',') if row.languages else [] for row in rows}
+
+
+def known_missing(video_ids: Iterable[str]) -> Set[str]:
+    """The videos known to have no transcript, without any network call."""
+    return {video_id for video_id, languages in lookup(video_ids).items() if not languages}
+
+
+def record(results: Dict[str, List[str]]) -> None:
+    """Store probe results, replacing earlier ones for the same videos."""
+    if not results:
+        return
+    now = datetime.utcnow()
+    rows = {
+        row.video_id: row
+        for row in TranscriptAvailability.query.filter(TranscriptAvailability.video_id.in_(list(results)))
+    }
+    for video_id, languages in results.items():
+        row = rows.get(video_id)
+        if row is None:
+            row = TranscriptAvailability(video_id=video_id)
+            db.session.add(row)
+        row.languages = ','.join(languages)[:300]
+        row.checked_at = now
+        row.expires_at = now + timedelta(seconds=TRANSCRIPT_AVAILABLE_TTL if languages else TRANSCRIPT_MISSING_TTL)
+    db.session.commit()
+
+
+def _probe_one(video_id: str) -> Optional[List[str]]:
+    try:
+        languages = YouTubeService.list_transcript_languages(video_id)
+    except Exception as e:
+        logger.warning(f"Could not list transcripts of {video_id}: {str(e)}")
+        TRANSCRIPT_PROBES.inc(result='error')
+        return None
+    TRANSCRIPT_PROBES.inc(result='available' if languages else 'none')
+    return languages
+
+
+def known(video_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """Availability of the videos the index has something current on, or whose
+    transcript is stored, without any network call.
+
+    Maps each such video ID to {"available": True or False, "languages": [...]}.
+    """
+    video_ids = list(dict.fromkeys(video_ids))
+    found = {
+        video_id: {'available': bool(languages), 'languages': languages}
+        for video_id, languages in lookup(video_ids).items()
+    }
+    unknown = [video_id for video_id in video_ids if video_id not in found]
+    if unknown:
+        # A stored transcript needs no probe, though its languages stay unknown
+        for row in Video.query.with_entities(Video.video_id).filter(
+            Video.video_id.in_(unknown), Video.transcript.isnot(None)
+        ):
+            found[row.video_id] = {'available': True, 'languages': []}
+    return found
+
+
+def probe(video_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """Availability of every video, probing in parallel only those not already known.
+
+    Maps each video ID to {"available": True, False or None if unknown
+    because the probe failed, "languages": [...]}.
+    """
+    video_ids = list(dict.fromkeys(video_ids))
+    found = known(video_ids)
+    to_probe = [video_id for video_id in video_ids if video_id not in found]
+    if to_probe:
+        with ThreadPoolExecutor(max_workers=TRANSCRIPT_PROBE_CONCURRENCY, thread_name_prefix='probe') as pool:
+            probed = dict(zip(to_probe, pool.map(_probe_one, to_probe)))
+        record({video_id: languages for video_id, languages in probed.items() if languages is not None})
+        for video_id, languages in probed.items():
+            found[video_id] = {
+                'available': bool(languages) if languages is not None else None,
+                'languages': languages or [],
+            }
+    return found
+
+
+def annotate(videos: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Copies of search results with transcript_available and transcript_languages
+    as far as they are known without probing; None and [] for the rest."""
+    availability = known([video['video_id'] for video in videos])
+    unknown = {'available': None, 'languages': []}
+    return [
+        dict(
+            video,
+            transcript_available=availability.get(video['video_id'], unknown)['available'],
+            transcript_languages=availability.get(video['video_id'], unknown)['languages'],
+        )
+        for video in videos
+    ]
+
+
+def skip_missing(video_ids: List[str]) -> List[str]:
+    """`video_ids` without the ones known to have no transcript."""
+    missing = known_missing(video_ids)
+    if missing:
+        TRANSCRIPT_LOOKUPS_SKIPPED.inc(len(missing))
+    return [video_id for video_id in video_ids if video_id not in missing]
@@ -0,0 +1,121 @@
+import os
+import json
+import logging
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+from . import db
+from .models import Analysis, UsageRollup
+
+logger = logging.getLogger(__name__)
+
+# USD per million (input, output) tokens; override with MODEL_PRICING='{"model": [in, out]}'
+DEFAULT_MODEL_PRICING = {
+    "gemini-2.0-flash-exp": (0.10, 0.40),
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-2.0-flash-lite": (0.075, 0.30),
+    "gemini-1.5-pro": (1.25, 5.00),
+}
+
+
+def _load_pricing() -> Dict[str, Tuple[float, float]]:
+    pricing = dict(DEFAULT_MODEL_PRICING)
+    raw = os.getenv("MODEL_PRICING")
+    if raw:
+        try:
+            pricing.update({model: tuple(prices) for model, prices in json.loads(raw).items()})
+        except (ValueError, TypeError, AttributeError) as e:
+            logger.error(f"Ignoring invalid MODEL_PRICING: {str(e)}")
+    return pricing
+
+
+MODEL_PRICING = _load_pricing()
+
+
+def estimate_cost(model_name: str, input_tokens: int, output_tokens: int) -> float:
+    """Cost in USD of one request; unknown models cost 0."""
+    input_price, output_price = MODEL_PRICING.get(model_name, (0.0, 0.0))
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+
+def record_usage(analysis: Analysis, usage: Optional[Dict[str, Any]], user_id: Optional[int] = None) -> None:
+    """Store token counts and timings on the analysis and add them to the daily rollup.
+
+    Also takes a BatchItem, which has the same columns, with the job's user_id.
+    Runs inside the caller's transaction; the caller commits.
+    """
+    if not usage:
+        return
+
+    analysis.model_name = usage["model_name"]
+    analysis.input_tokens = usage["input_tokens"]
+    analysis.output_tokens = usage["output_tokens"]
+    analysis.ttft_ms = usage["ttft_ms"]
+    analysis.duration_ms = usage["duration_ms"]
+    analysis.cost_usd = estimate_cost(
+        usage["model_name"], usage["input_tokens"], usage["output_tokens"]
+    )
+
+    increments = {
+        "analyses": 1,
+        "input_tokens": analysis.input_tokens,
+        "output_tokens": analysis.output_tokens,
+        "total_ttft_ms": analysis.ttft_ms or 0,
+        "total_duration_ms": analysis.duration_ms or 0,
+        "cost_usd": analysis.cost_usd,
+    }
+    _upsert_rollup(user_id or analysis.user_id, datetime.utcnow().date(), analysis.model_name, increments)
+
+
+def _upsert_rollup(user_id: int, day: date, model_name: str, increments: Dict[str, Any]) -> None:
+    """Atomically add increments to the (user, day, model) rollup row."""
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+
+        table = UsageRollup.__table__
+        statement = insert(table).values(
+            user_id=user_id, day=day, model_name=model_name, **increments
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=["user_id", "day", "model_name"],
+            set_={column: table.c[column] + statement.excluded[column] for column in increments},
+        )
+        db.session.execute(statement)
+        return
+
+    rollup = UsageRollup.query.filter_by(
+        user_id=user_id, day=day, model_name=model_name
+    ).with_for_update().first()
+    if rollup is None:
+        rollup = UsageRollup(user_id=user_id, day=day, model_name=model_name, **increments)
+        db.session.add(rollup)
+    else:
+        for column, value in increments.items():
+            setattr(rollup, column, getattr(rollup, column) + value)
+
+
+def usage_summary(user_id: int, days: int = 30) -> Dict[str, Any]:
+    """Per-day usage for a user over the last `days` days, read from the rollup table."""
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    rollups = (
+        UsageRollup.query.filter(UsageRollup.user_id == user_id, UsageRollup.day >= since)
+        .order_by(UsageRollup.day.desc(), UsageRollup.model_name)
+        .all()
+    )
+
+    totals = {"analyses": 0, "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0}
+    for rollup in rollups:
+        totals["analyses"] += rollup.analyses
+        totals["input_tokens"] += rollup.input_tokens
+        totals["output_tokens"] += rollup.output_tokens
+        totals["cost_usd"] += rollup.cost_usd
+    totals["cost_usd"] = round(totals["cost_usd"], 6)
+
+    return {
+        "since": since.isoformat(),
+        "days": [rollup.to_dict() for rollup in rollups],
+        "totals": totals,
+    }
@@ -0,0 +1,214 @@
+import os
+import time
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import or_, update
+
+from . import db, cache, limiter
+from .models import Video
+from .rate_limit import Limit
+from .youtube_service import YouTubeService, PAGE_SIZE
+from .metrics import VIDEO_STATS_REFRESHED, VIDEO_STATS_QUOTA_UNITS
+
+logger = logging.getLogger(__name__)
+
+# Statistics older than this are refreshed
+STATS_MAX_AGE_SECONDS = int(os.getenv('STATS_MAX_AGE_SECONDS', str(86400)))
+# Data API quota the refresher may spend, as a rate ("1000/day"). Taken from
+# the rate limiter's backend, so with RATE_LIMIT_BACKEND=sqlite or redis the
+# budget is shared by every process instead of granted to each.
+STATS_UNIT_BUDGET = Limit.parse(os.getenv('STATS_UNIT_BUDGET', '1000/day'))
+# How often the refresher looks for stale videos when it has caught up
+STATS_POLL_SECONDS = float(os.getenv('STATS_POLL_SECONDS', '60'))
+
+BUDGET_KEY = 'video_stats_units:youtube'
+
+
+def _stale(now: datetime):
+    return or_(
+        Video.stats_refreshed_at.is_(None),
+        Video.stats_refreshed_at <= now - timedelta(seconds=STATS_MAX_AGE_SECONDS),
+    )
+
+
+def _etag_key(video_ids: List[str]) -> str:
+    return 'video_stats_etag_' + hashlib.sha1(','.join(video_ids).encode()).hexdigest()
+
+
+def _view_count(item: Dict[str, Any]) -> Optional[int]:
+    try:
+        return int(item.get('statistics', {})['viewCount'])
+    except (KeyError, ValueError, TypeError):
+        # Hidden or missing counts leave the stored one alone
+        return None
+
+
+def claim_stale(now: datetime, limit: int = PAGE_SIZE) -> List[Any]:
+    """Take up to `limit` stale videos, least recently refreshed first.
+
+    They are claimed by stamping them refreshed at `now` with a conditional
+    update, so with several processes each video is refreshed once. Videos
+    refreshed together come back due together, in the same order, so their
+    next request repeats the IDs and can be made conditional on its ETag.
+    """
+    ids = [
+        row.id for row in Video.query.with_entities(Video.id).filter(_stale(now))
+        .order_by(Video.stats_refreshed_at.asc().nullsfirst(), Video.id).limit(limit)
+    ]
+    if not ids:
+        return []
+    Video.query.filter(Video.id.in_(ids), _stale(now)).update(
+        {'stats_refreshed_at': now}, synchronize_session=False
+    )
+    db.session.commit()
+    return (
+        Video.query.with_entities(Video.id, Video.video_id, Video.stats_etag)
+        .filter(Video.id.in_(ids), Video.stats_refreshed_at == now).order_by(Video.id).all()
+    )
+
+
+def refresh_batch(yt_service: YouTubeService, now: Optional[datetime] = None) -> Optional[Dict[str, int]]:
+    """Refresh the statistics of the next stale videos with one videos.list call.
+
+    The call carries the ETag the same IDs returned last time, and only
+    videos whose own ETag changed are written, in one bulk UPDATE. None when
+    no video was stale.
+    """
+    now = now or datetime.utcnow()
+    rows = claim_stale(now)
+    if not rows:
+        return None
+    video_ids = [row.video_id for row in rows]
+    etag_key = _etag_key(video_ids)
+    try:
+        response = yt_service.get_statistics(video_ids, etag=cache.get(etag_key))
+    except Exception:
+        # Let the next pass retry them
+        Video.query.filter(Video.id.in_([row.id for row in rows]), Video.stats_refreshed_at == now).update(
+            {'stats_refreshed_at': None}, synchronize_session=False
+        )
+        db.session.commit()
+        raise
+    VIDEO_STATS_QUOTA_UNITS.inc()
+
+    counts = {'videos': len(rows), 'updated': 0, 'unchanged': 0, 'not_modified': 0, 'missing': 0}
+    if response is None:
+        counts['not_modified'] = len(rows)
+    else:
+        cache.set(etag_key, response.get('etag'), timeout=STATS_MAX_AGE_SECONDS * 7)
+        items = {item.get('id'): item for item in response.get('items', [])}
+        changes = []
+        for row in rows:
+            item = items.get(row.video_id)
+            if item is None:
+                # Deleted or made private; keep the last known numbers
+                counts['missing'] += 1
+            elif row.stats_etag and item.get('etag') == row.stats_etag:
+                counts['unchanged'] += 1
+            else:
+                change = {'id': row.id, 'stats_etag': item.get('etag')}
+                view_count = _view_count(item)
+                if view_count is not None:
+                    change['view_count'] = view_count
+                changes.append(change)
+        if changes:
+            # Bulk UPDATE by primary key: one executemany for the whole batch
+            db.session.execute(update(Video), changes)
+            db.session.commit()
+        counts['updated'] = len(changes)
+
+    for result in ('updated', 'unchanged', 'not_modified', 'missing'):
+        if counts[result]:
+            VIDEO_STATS_REFRESHED.inc(counts[result], result=result)
+    return counts
+
+
+def with_current_stats(videos: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Copies of search results with the view counts stored in the library,
+    which the refresher keeps current, in place of the ones they were cached with."""
+    video_ids = [video['video_id'] for video in videos]
+    if not video_ids:
+        return videos
+    stored = {
+        row.video_id: row.view_count for row in
+        Video.query.with_entities(Video.video_id, Video.view_count).filter(
+            Video.video_id.in_(video_ids), Video.view_count.isnot(None)
+        )
+    }
+    return [
+        dict(video, view_count=stored[video['video_id']]) if video['video_id'] in stored else video
+        for video in videos
+    ]
+
+
+class StatsRefresher:
+    """Refreshes stale video statistics in the background, within a quota budget.
+
+    Each pass costs one quota unit for up to 50 videos. When the budget is
+    spent the refresher sleeps until it has refilled enough for the next call.
+    """
+
+    def __init__(self, app, budget: Limit = STATS_UNIT_BUDGET):
+        self.app = app
+        self.budget = budget
+
+    def run(self):
+        """Loop forever; meant to run as a background task."""
+        while True:
+            try:
+                with self.app.app_context():
+                    wait = self.refresh_next()
+            except Exception as e:
+                logger.error(f"Video statistics refresher error: {str(e)}", exc_info=True)
+                wait = STATS_POLL_SECONDS
+            if wait:
+                time.sleep(wait)
+
+    def _spend(self) -> float:
+        """Take a unit from the budget; the seconds to wait if there was none."""
+        try:
+            allowed, _, retry_after = limiter.backend.consume(BUDGET_KEY, self.budget, 1, time.time())
+        except Exception as e:
+            logger.error(f"Rate limit backend error, refreshing without a budget: {str(e)}")
+            return 0.0
+        return 0.0 if allowed else retry_after
+
+    def refresh_next(self) -> float:
+        """Refresh one batch; the seconds to wait before the next."""
+        now = datetime.utcnow()
+        if not db.session.query(Video.query.filter(_stale(now)).exists()).scalar():
+            return STATS_POLL_SECONDS
+        wait = self._spend()
+        if wait:
+            logger.info(f"Video statistics budget spent, next refresh in {wait:.0f}s")
+            return wait
+        counts = refresh_batch(YouTubeService(os.getenv('YOUTUBE_API_KEY')), now)
+        if counts is None:
+            return STATS_POLL_SECONDS
+        logger.info(
+            f"Refreshed statistics of {counts['videos']} videos: {counts['updated']} updated, "
+            f"{counts['unchanged']} unchanged, {counts['not_modified']} not modified, {counts['missing']} missing"
+        )
+        return 0.0
+
+
+_refresher = None
+
+
+def start_stats_refresher(app):
+    """Start this process's video statistics refresher as a Socket.IO background task."""
+    global _refresher
+    if _refresher is not None:
+        return _refresher
+    from . import socketio
+
+    _refresher = StatsRefresher(app)
+    socketio.start_background_task(_refresher.run)
+    logger.info(
+        f"Video statistics refresher started with a budget of {_refresher.budget.capacity} "
+        f"quota units per {_refresher.budget.period:.0f}s"
+    )
+    return _refresher
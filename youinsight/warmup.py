@@ -0,0 +1,75 @@
+import os
+import time
+import logging
+import importlib
+from typing import Dict
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# Client libraries the app imports on first use rather than at boot
+HEAVY_MODULES = (
+    "google.generativeai",
+    "google.api_core.exceptions",
+    "googleapiclient.discovery",
+    "youtube_transcript_api",
+    "youtube_transcript_api.formatters",
+)
+
+# Servers (main.py, gunicorn workers) do the first request's one-off work
+# (imports, a database connection, the YouTube client) when they start, before
+# they take traffic: importing google.generativeai mid-request would block the
+# eventlet hub for half a second. WARMUP=0 turns this off. The flask CLI never
+# warms up, so its commands keep the imports lazy.
+WARMUP = os.getenv("WARMUP", "1") != "0"
+# PRELOAD_LIBRARIES=1 imports the client libraries once in the gunicorn master,
+# so forked workers share them instead of each importing its own copy. They are
+# then imported before eventlet patches the standard library in the worker.
+PRELOAD_LIBRARIES = os.getenv("PRELOAD_LIBRARIES", "0") == "1"
+
+
+def preload() -> Dict[str, float]:
+    """Import the heavy client libraries; seconds taken by each."""
+    timings = {}
+    for name in HEAVY_MODULES:
+        started = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            logger.warning(f"Could not preload {name}: {str(e)}")
+            continue
+        timings[name] = time.perf_counter() - started
+    return timings
+
+
+def warmup(app) -> Dict[str, float]:
+    """Get a worker ready to serve its first request quickly; seconds taken by each step."""
+    started = time.perf_counter()
+    timings = {"imports": sum(preload().values())}
+
+    step = time.perf_counter()
+    with app.app_context():
+        from . import db
+        try:
+            with db.engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
+        except Exception as e:
+            logger.warning(f"Warmup could not reach the database: {str(e)}")
+    timings["database"] = time.perf_counter() - step
+
+    # Building the client parses its bundled discovery document, without a request
+    api_key = os.getenv("YOUTUBE_API_KEY")
+    if api_key:
+        step = time.perf_counter()
+        try:
+            from .youtube_service import YouTubeService
+            YouTubeService(api_key)
+        except Exception as e:
+            logger.warning(f"Warmup could not build the YouTube client: {str(e)}")
+        timings["youtube_client"] = time.perf_counter() - step
+
+    timings["total"] = time.perf_counter() - started
+    logger.info(f"Warmed up in {timings['total']:.2f}s: " +
+                ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items() if name != "total"))
+    return timings
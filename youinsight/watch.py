@@ -0,0 +1,251 @@
+import os
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from sqlalchemy import or_
+
+from . import db, socketio
+from .models import Video, Analysis, AnalysisVideo, WatchQuery, WatchQueryVideo
+from .youtube_service import YouTubeService
+from .gemini_service import GeminiService
+from .identity import get_identity
+from .catalog import ingest_search_results
+from .ingest import fetch_transcripts
+from .transcript_index import known_missing, record as record_availability
+from .digests import queue_digests
+from .usage import record_usage
+from .metrics import WATCH_RUNS, WATCH_NEW_VIDEOS
+
+logger = logging.getLogger(__name__)
+
+# Shortest interval a watch query may run at
+WATCH_MIN_INTERVAL_MINUTES = int(os.getenv('WATCH_MIN_INTERVAL_MINUTES', '60'))
+WATCH_MAX_PER_USER = int(os.getenv('WATCH_MAX_PER_USER', '20'))
+WATCH_MAX_RESULTS = 50
+# How often the scheduler looks for due watch queries
+WATCH_POLL_SECONDS = float(os.getenv('WATCH_POLL_SECONDS', '30'))
+
+MERGE_PROMPT = """{prompt}
+
+Below is the summary written from the videos analyzed in earlier runs, followed by new videos published since. Update the summary with what the new videos add and mark what is new.
+
+PREVIOUS SUMMARY:
+{summary}"""
+
+
+class WatchError(Exception):
+    """A watch query could not be saved; the message is meant for the user."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def create_watch(user_id: int, search_term: str, prompt: str,
+                 interval_minutes: int = 1440, max_results: int = 10) -> WatchQuery:
+    """Save a watch query, due to run right away."""
+    search_term = (search_term or '').strip()
+    if not search_term or not prompt:
+        raise WatchError('Search term and prompt are required')
+    if len(search_term) > 100:
+        raise WatchError('Search term is too long')
+    try:
+        interval_minutes, max_results = int(interval_minutes), int(max_results)
+    except (TypeError, ValueError):
+        raise WatchError('interval_minutes and max_results must be numbers') from None
+    if interval_minutes < WATCH_MIN_INTERVAL_MINUTES:
+        raise WatchError(f'A watch query can run at most every {WATCH_MIN_INTERVAL_MINUTES} minutes')
+    if not 1 <= max_results <= WATCH_MAX_RESULTS:
+        raise WatchError(f'max_results must be between 1 and {WATCH_MAX_RESULTS}')
+    if WatchQuery.query.filter_by(user_id=user_id).count() >= WATCH_MAX_PER_USER:
+        raise WatchError(f'You can have at most {WATCH_MAX_PER_USER} watch queries', status=429)
+
+    watch = WatchQuery(user_id=user_id, search_term=search_term, prompt=prompt,
+                       interval_minutes=interval_minutes, max_results=max_results)
+    db.session.add(watch)
+    db.session.commit()
+    if _scheduler is not None:
+        _scheduler.wake()
+    return watch
+
+
+def run_now(watch: WatchQuery) -> None:
+    """Make the watch query due immediately."""
+    watch.next_run_at = datetime.utcnow()
+    db.session.commit()
+    if _scheduler is not None:
+        _scheduler.wake()
+
+
+def run_watch(watch: WatchQuery) -> Dict[str, Any]:
+    """Search for videos published since the last run and analyze the ones
+    this watch query has not processed yet.
+
+    Transcripts are fetched just for those videos and for earlier ones still
+    pending theirs, and the analysis merges them into the summary of earlier
+    runs instead of starting over. A video is only marked processed once it
+    is analyzed or known to have no captions. The user is notified over their
+    socket room when there was something new.
+    """
+    identity = get_identity(watch.user_id)
+    if identity is None:
+        raise RuntimeError(f"User {watch.user_id} no longer exists")
+
+    started = datetime.utcnow()
+    yt_service = YouTubeService(os.getenv('YOUTUBE_API_KEY'))
+    results = yt_service.search_videos(
+        watch.search_term, watch.max_results, order='date', published_after=watch.last_run_at
+    )
+    ingest_search_results(results)
+    result_ids = [v['video_id'] for v in results]
+    found = {
+        row.video_id: row for row in WatchQueryVideo.query.filter(
+            WatchQueryVideo.watch_id == watch.id,
+            or_(WatchQueryVideo.video_id.in_(result_ids), WatchQueryVideo.pending.is_(True)),
+        )
+    }
+    pending_ids = [video_id for video_id, row in found.items() if row.pending]
+    new_ids = list(dict.fromkeys(
+        pending_ids + [video_id for video_id in result_ids if video_id not in found]
+    ))
+
+    videos = {video.video_id: video for video in Video.query.filter(Video.video_id.in_(new_ids))}
+    without = known_missing(new_ids)
+    missing = [
+        {'video_id': v.video_id, 'url': v.url} for v in videos.values()
+        if not v.transcript and v.video_id not in without
+    ]
+    fetched = fetch_transcripts(yt_service, missing)
+    for video_id, transcript in fetched.items():
+        videos[video_id].transcript = transcript
+    db.session.commit()
+    queue_digests(list(fetched), watch.user_id)
+    # Videos the fetch found to have no captions are not tried again until that expires
+    found_missing = yt_service.transcripts_missing & set(new_ids)
+    record_availability({video_id: [] for video_id in found_missing})
+    without |= found_missing
+
+    to_analyze = [videos[video_id] for video_id in new_ids if video_id in videos and videos[video_id].transcript]
+    documents = [{'title': v.title, 'url': v.url, 'transcript': v.transcript} for v in to_analyze]
+    analysis = None
+    if documents:
+        prompt = MERGE_PROMPT.format(prompt=watch.prompt, summary=watch.summary) if watch.summary else watch.prompt
+        # Nothing is written until Gemini is done, so no database lock is held meanwhile
+        gemini_service = GeminiService(identity.gemini_api_key)
+        result = ''.join(gemini_service.stream_analysis(prompt, documents, interactive=False))
+        usage = gemini_service.last_usage or {}
+        if usage.get('outcome') == 'error':
+            raise RuntimeError(result)
+
+        analysis = Analysis(user_id=watch.user_id, search_term=watch.search_term, prompt=watch.prompt, result=result)
+        db.session.add(analysis)
+        db.session.flush()
+        for video in to_analyze:
+            db.session.add(AnalysisVideo(analysis_id=analysis.id, video_id=video.id))
+        record_usage(analysis, usage)
+        watch.summary = result
+        watch.last_analysis_id = analysis.id
+
+    analyzed = {video.video_id for video in to_analyze}
+    for video_id in new_ids:
+        row = found.get(video_id)
+        if row is None:
+            row = WatchQueryVideo(watch_id=watch.id, video_id=video_id)
+            db.session.add(row)
+        row.analysis_id = analysis.id if video_id in analyzed else None
+        # Neither analyzed nor known to lack captions: try its transcript again next run
+        row.pending = video_id not in analyzed and video_id not in without
+    watch.last_run_at = started
+    watch.last_new_videos = len(analyzed)
+    watch.last_error = None
+    db.session.commit()
+
+    WATCH_RUNS.inc(outcome='changed' if analysis else 'unchanged')
+    WATCH_NEW_VIDEOS.inc(len(analyzed))
+    if analysis is not None:
+        socketio.emit('watch_update', {
+            'watch_id': watch.id,
+            'search_term': watch.search_term,
+            'new_videos': len(analyzed),
+            'analysis_id': analysis.id,
+        }, to=watch.user_id)
+    logger.info(f"Watch query {watch.id} ran: {len(new_ids)} new or pending of {len(results)} results, "
+                f"{len(analyzed)} analyzed")
+    return {'results': len(results), 'new_videos': len(new_ids), 'analyzed': len(analyzed),
+            'analysis_id': analysis.id if analysis else None}
+
+
+class WatchScheduler:
+    """Runs due watch queries, one at a time, in a background task.
+
+    A run is claimed by moving the query's next_run_at a full interval ahead
+    with a conditional update, so with several processes each run happens
+    once. A run that fails is not retried before its next interval.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._wake = threading.Event()
+
+    def wake(self):
+        self._wake.set()
+
+    def run(self):
+        """Loop forever; meant to run as a background task."""
+        while True:
+            try:
+                with self.app.app_context():
+                    ran = self.run_next()
+            except Exception as e:
+                logger.error(f"Watch scheduler error: {str(e)}", exc_info=True)
+                ran = False
+            if not ran:
+                self._wake.wait(WATCH_POLL_SECONDS)
+                self._wake.clear()
+
+    def _claim(self, now: datetime) -> Optional[WatchQuery]:
+        due = (
+            WatchQuery.query.filter(WatchQuery.enabled.is_(True), WatchQuery.next_run_at <= now)
+            .order_by(WatchQuery.next_run_at).limit(10).all()
+        )
+        for watch in due:
+            claimed = WatchQuery.query.filter_by(id=watch.id, next_run_at=watch.next_run_at).update(
+                {'next_run_at': now + timedelta(minutes=watch.interval_minutes)}, synchronize_session=False
+            )
+            db.session.commit()
+            if claimed:
+                return db.session.get(WatchQuery, watch.id)
+        return None
+
+    def run_next(self) -> bool:
+        """Run one due watch query; False when none was due."""
+        watch = self._claim(datetime.utcnow())
+        if watch is None:
+            return False
+        try:
+            run_watch(watch)
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Watch query {watch.id} failed: {str(e)}", exc_info=True)
+            watch = db.session.get(WatchQuery, watch.id)
+            # last_run_at stays put, so the next run searches this run's window again
+            watch.last_error = str(e)[:500]
+            db.session.commit()
+            WATCH_RUNS.inc(outcome='failed')
+        return True
+
+
+_scheduler = None
+
+
+def start_watch_scheduler(app):
+    """Start this process's watch query scheduler as a Socket.IO background task."""
+    global _scheduler
+    if _scheduler is not None:
+        return _scheduler
+    _scheduler = WatchScheduler(app)
+    socketio.start_background_task(_scheduler.run)
+    logger.info("Watch query scheduler started")
+    return _scheduler
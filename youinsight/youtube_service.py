@@ -1,18 +1,87 @@
 import os
 import re
 import json
+import time
 import logging
-from typing import List, Dict, Optional, Any
-from googleapiclient.discovery import build
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from urllib.parse import urlsplit, parse_qsl, urlencode
+from typing import List, Dict, Optional, Any, Set
 from googleapiclient.errors import HttpError
-from youtube_transcript_api import YouTubeTranscriptApi
-from youtube_transcript_api.formatters import TextFormatter
 from . import cache
+from .cassettes import CASSETTES
+from .metrics import YOUTUBE_REQUEST_SECONDS, YOUTUBE_REQUESTS
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Alternate endpoints for the Data API and the watch page transcripts are read
+# from, e.g. the stand-in servers in benchmarks/. Unset in production.
+YOUTUBE_API_BASE_URL = os.getenv("YOUTUBE_API_BASE_URL")
+YOUTUBE_WATCH_URL = os.getenv("YOUTUBE_WATCH_URL")
+
+# Most items the Data API returns per list call, and IDs it accepts per videos.list
+PAGE_SIZE = 50
+
+# Transcript lists fetched by availability probes, kept in the process so that
+# fetching one of their transcripts soon after (an analysis of a search
+# result) does not load the watch page again. Not shared between workers: the
+# lists hold an HTTP session, and the caption URLs in them expire.
+TRANSCRIPT_LIST_TTL = int(os.getenv("TRANSCRIPT_LIST_TTL", "600"))
+TRANSCRIPT_LISTS_MAX = 1000
+_transcript_lists = OrderedDict()  # video ID -> (fetched at, TranscriptList)
+_transcript_lists_lock = threading.Lock()
+
+
+def _keep_transcript_list(video_id: str, transcripts) -> None:
+    with _transcript_lists_lock:
+        _transcript_lists.pop(video_id, None)
+        _transcript_lists[video_id] = (time.monotonic(), transcripts)
+        while len(_transcript_lists) > TRANSCRIPT_LISTS_MAX:
+            _transcript_lists.popitem(last=False)
+
+
+def _take_transcript_list(video_id: str):
+    """The probe's transcript list of the video, if recent; used once."""
+    with _transcript_lists_lock:
+        entry = _transcript_lists.pop(video_id, None)
+    if entry is None or time.monotonic() - entry[0] > TRANSCRIPT_LIST_TTL:
+        return None
+    return entry[1]
+
+
+def _transcript_api():
+    """youtube_transcript_api, imported on first use; it pulls in requests and
+    friends, which the rest of boot does not need."""
+    import youtube_transcript_api
+    if YOUTUBE_WATCH_URL:
+        from youtube_transcript_api import _transcripts
+        _transcripts.WATCH_URL = YOUTUBE_WATCH_URL
+    return youtube_transcript_api
+
+
+def _no_transcript_errors(api):
+    """The youtube_transcript_api errors meaning the video has no transcript,
+    rather than that it could not be fetched this time."""
+    return (api.TranscriptsDisabled, api.NoTranscriptFound, api.NoTranscriptAvailable,
+            api.VideoUnavailable, api.InvalidVideoId)
+
+
+def _fetch_transcript(api, video_id: str, transcripts=None):
+    """The English transcript, or else the first listed (manual ones come first)."""
+    if transcripts is None:
+        transcripts = api.YouTubeTranscriptApi.list_transcripts(video_id)
+    try:
+        transcript = transcripts.find_transcript(("en",))
+    except api.NoTranscriptFound:
+        transcript = next(iter(transcripts), None)
+        if transcript is None:
+            raise
+    return transcript.fetch()
+
+
 class YouTubeService:
     def __init__(self, api_key: str):
         """Initialize YouTube API service with the provided API key."""
@@ -21,40 +90,82 @@ class YouTubeService:
             raise ValueError("YouTube API key is required")
             
         self.api_key = api_key
+        # IDs of the videos get_transcript found to have no transcript at all,
+        # as opposed to failing to fetch one
+        self.transcripts_missing: Set[str] = set()
         logger.info(f"Initializing YouTube service with API key: {api_key[:5]}...")
         
         try:
-            self.youtube = build("youtube", "v3", developerKey=api_key)
+            # Imported here: the discovery module is slow to import and most
+            # processes (the flask CLI, workers that only serve the library) never need it
+            from googleapiclient.discovery import build
+
+            client_options = {"api_endpoint": YOUTUBE_API_BASE_URL} if YOUTUBE_API_BASE_URL else None
+            self.youtube = build("youtube", "v3", developerKey=api_key, client_options=client_options)
             logger.info("YouTube API client successfully built")
         except Exception as e:
             logger.error(f"Failed to initialize YouTube API: {str(e)}")
             raise
             
+    def _execute(self, operation: str, request) -> Dict[str, Any]:
+        """Execute a Data API request, recording its latency and outcome."""
+        with YOUTUBE_REQUEST_SECONDS.time(operation=operation):
+            try:
+                response = CASSETTES.call("youtube", operation, self._describe(request), request.execute)
+            except HttpError as e:
+                # A 304 answers a conditional request whose resource has not changed
+                outcome = "not_modified" if e.resp.status == 304 else "error"
+                YOUTUBE_REQUESTS.inc(operation=operation, outcome=outcome)
+                raise
+            except Exception:
+                YOUTUBE_REQUESTS.inc(operation=operation, outcome="error")
+                raise
+        YOUTUBE_REQUESTS.inc(operation=operation, outcome="ok")
+        return response
+
+    @staticmethod
+    def _describe(request) -> Dict[str, Any]:
+        """Identify a Data API request for the cassette layer, without the API key."""
+        url = urlsplit(request.uri)
+        query = urlencode(sorted((k, v) for k, v in parse_qsl(url.query) if k != "key"))
+        return {"method": request.method, "path": url.path, "query": query, "body": request.body}
+
     def test_api_key(self) -> bool:
         """Test if the API key is valid by making a simple request"""
         logger.info("Testing YouTube API key")
         try:
             # Make a minimal API request to test the key
-            response = self.youtube.videos().list(part="snippet", id="dQw4w9WgXcQ").execute()
+            response = self._execute("videos.list", self.youtube.videos().list(part="snippet", id="dQw4w9WgXcQ"))
             logger.info("API key test successful")
             return True
         except Exception as e:
             logger.error(f"YouTube API key test failed: {str(e)}")
             return False
     
-    def search_videos(self, search_term: str, max_results: int = 10) -> List[Dict[str, Any]]:
-        """Search for YouTube videos based on the provided search term."""
+    def search_videos(self, search_term: str, max_results: int = 10, order: Optional[str] = None,
+                      published_after: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Search for YouTube videos based on the provided search term.
+
+        `order` is a search.list order such as "date" (relevance by default);
+        `published_after`, a UTC time, leaves out videos published before it.
+        """
         logger.info(f"Searching for '{search_term}', max results: {max_results}")
+        filters = {}
+        if order:
+            filters["order"] = order
+        if published_after:
+            filters["publishedAfter"] = published_after.strftime("%Y-%m-%dT%H:%M:%SZ")
         
         try:
             # Step 1: Search for videos
             logger.info("Executing search request")
-            search_response = self.youtube.search().list(
+            search_response = self._execute("search.list", self.youtube.search().list(
                 q=search_term,
                 part="id,snippet",
                 maxResults=max_results,
-                type="video"
-            ).execute()
+                type="video",
+                **filters
+            ))
             
             logger.info(f"Found {len(search_response.get('items', []))} search results")
             
@@ -75,48 +186,13 @@ class YouTubeService:
                 
             # Step 2: Get video details including statistics
             logger.info(f"Getting details for {len(video_ids)} videos")
-            videos_response = self.youtube.videos().list(
+            videos_response = self._execute("videos.list", self.youtube.videos().list(
                 part="snippet,statistics",
                 id=",".join(video_ids)
-            ).execute()
+            ))
             
             # Process videos and extract relevant information
-            videos = []
-            for video in videos_response.get("items", []):
-                try:
-                    # Extract data with fallbacks for missing fields
-                    snippet = video.get("snippet", {})
-                    statistics = video.get("statistics", {})
-                    
-                    # Handle missing thumbnails
-                    thumbnails = snippet.get("thumbnails", {})
-                    thumbnail_url = ""
-                    for quality in ["high", "medium", "default"]:
-                        if quality in thumbnails and "url" in thumbnails[quality]:
-                            thumbnail_url = thumbnails[quality]["url"]
-                            break
-                    
-                    # Get view count with fallback
-                    try:
-                        view_count = int(statistics.get("viewCount", 0))
-                    except (ValueError, TypeError):
-                        view_count = 0
-                    
-                    video_info = {
-                        "video_id": video.get("id", ""),
-                        "title": snippet.get("title", "Untitled Video"),
-                        "url": f"https://www.youtube.com/watch?v={video.get('id', '')}",
-                        "view_count": view_count,
-                        "thumbnail_url": thumbnail_url,  # Renamed from 'thumbnail'
-                        "channel_title": snippet.get("channelTitle", "Unknown Channel"),
-                        "published_at": snippet.get("publishedAt", "")
-                    }
-                    videos.append(video_info)
-                    
-                except Exception as e:
-                    logger.error(f"Error processing video data: {str(e)}")
-                    # Continue processing other videos
-                    continue
+            videos = self._video_infos(videos_response)
             
             logger.info(f"Successfully processed {len(videos)} videos")
             return videos
@@ -137,6 +213,181 @@ class YouTubeService:
             logger.error(f"Error searching videos: {str(e)}")
             return []
     
+    @staticmethod
+    def _video_info(video: Dict[str, Any]) -> Dict[str, Any]:
+        """A videos.list item as the dict search results use."""
+        # Extract data with fallbacks for missing fields
+        snippet = video.get("snippet", {})
+        statistics = video.get("statistics", {})
+        
+        # Handle missing thumbnails
+        thumbnails = snippet.get("thumbnails", {})
+        thumbnail_url = ""
+        for quality in ["high", "medium", "default"]:
+            if quality in thumbnails and "url" in thumbnails[quality]:
+                thumbnail_url = thumbnails[quality]["url"]
+                break
+        
+        # Get view count with fallback
+        try:
+            view_count = int(statistics.get("viewCount", 0))
+        except (ValueError, TypeError):
+            view_count = 0
+        
+        return {
+            "video_id": video.get("id", ""),
+            "title": snippet.get("title", "Untitled Video"),
+            "url": f"https://www.youtube.com/watch?v={video.get('id', '')}",
+            "view_count": view_count,
+            "thumbnail_url": thumbnail_url,  # Renamed from 'thumbnail'
+            "channel_title": snippet.get("channelTitle", "Unknown Channel"),
+            "published_at": snippet.get("publishedAt", "")
+        }
+
+    def _video_infos(self, videos_response: Dict[str, Any]) -> List[Dict[str, Any]]:
+        videos = []
+        for video in videos_response.get("items", []):
+            try:
+                videos.append(self._video_info(video))
+            except Exception as e:
+                logger.error(f"Error processing video data: {str(e)}")
+                # Continue processing other videos
+                continue
+        return videos
+
+    def get_videos(self, video_ids: List[str]) -> List[Dict[str, Any]]:
+        """Details of many videos, 50 per videos.list call (1 quota unit each)."""
+        videos = []
+        for start in range(0, len(video_ids), PAGE_SIZE):
+            response = self._execute("videos.list", self.youtube.videos().list(
+                part="snippet,statistics",
+                id=",".join(video_ids[start:start + PAGE_SIZE]),
+                maxResults=PAGE_SIZE,
+            ))
+            videos.extend(self._video_infos(response))
+        return videos
+
+    def get_statistics(self, video_ids: List[str], etag: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """The videos.list response with statistics for up to 50 videos (1 quota unit).
+
+        With `etag` the request is conditional and None means none of the
+        videos changed since that ETag was returned for the same IDs.
+        """
+        request = self.youtube.videos().list(
+            part="statistics", id=",".join(video_ids[:PAGE_SIZE]), maxResults=PAGE_SIZE
+        )
+        if etag:
+            request.headers["If-None-Match"] = etag
+        try:
+            return self._execute("videos.list", request)
+        except HttpError as e:
+            if e.resp.status == 304:
+                return None
+            raise
+
+    @staticmethod
+    def parse_playlist_source(source: str) -> Dict[str, str]:
+        """What a playlist or channel reference names, as one of
+        {"playlist_id"}, {"channel_id"}, {"handle"} or {"username"}; empty if unrecognized."""
+        source = (source or "").strip()
+        url = urlsplit(source if "://" in source else f"https://{source}")
+        playlist_id = dict(parse_qsl(url.query)).get("list")
+        if "youtube.com" in url.netloc or "youtu.be" in url.netloc:
+            if playlist_id:
+                return {"playlist_id": playlist_id}
+            parts = [part for part in url.path.split("/") if part]
+            if len(parts) >= 2 and parts[0] == "channel":
+                return {"channel_id": parts[1]}
+            if parts and parts[0].startswith("@"):
+                return {"handle": parts[0]}
+            if len(parts) >= 2 and parts[0] in ("user", "c"):
+                return {"username": parts[1]}
+            return {}
+        if source.startswith("@"):
+            return {"handle": source}
+        if re.fullmatch(r"UC[0-9A-Za-z_-]{22}", source):
+            return {"channel_id": source}
+        if re.fullmatch(r"(PL|UU|OL|FL|LL)[0-9A-Za-z_-]{10,}", source):
+            return {"playlist_id": source}
+        return {}
+
+    def resolve_playlist(self, source: str) -> Optional[Dict[str, Any]]:
+        """The playlist a reference points at, with a channel standing for its uploads playlist.
+
+        Returns {"playlist_id", "channel_id", "title"}, or None if YouTube does
+        not know it. Costs one quota unit.
+        """
+        ref = self.parse_playlist_source(source)
+        if not ref:
+            return None
+        if "playlist_id" in ref:
+            response = self._execute("playlists.list", self.youtube.playlists().list(
+                part="snippet", id=ref["playlist_id"]
+            ))
+            if not response.get("items"):
+                return None
+            snippet = response["items"][0].get("snippet", {})
+            return {
+                "playlist_id": ref["playlist_id"],
+                "channel_id": snippet.get("channelId"),
+                "title": snippet.get("title", "Untitled Playlist"),
+            }
+
+        if "channel_id" in ref:
+            lookup = {"id": ref["channel_id"]}
+        elif "handle" in ref:
+            lookup = {"forHandle": ref["handle"]}
+        else:
+            lookup = {"forUsername": ref["username"]}
+        try:
+            request = self.youtube.channels().list(part="snippet,contentDetails", **lookup)
+        except TypeError:
+            # Older API clients do not know forHandle; find the channel by search (100 units)
+            channel_id = self._search_channel(ref["handle"])
+            if not channel_id:
+                return None
+            request = self.youtube.channels().list(part="snippet,contentDetails", id=channel_id)
+        response = self._execute("channels.list", request)
+        if not response.get("items"):
+            return None
+        channel = response["items"][0]
+        uploads = channel.get("contentDetails", {}).get("relatedPlaylists", {}).get("uploads")
+        if not uploads:
+            return None
+        return {
+            "playlist_id": uploads,
+            "channel_id": channel.get("id"),
+            "title": channel.get("snippet", {}).get("title", "Untitled Channel"),
+        }
+
+    def _search_channel(self, query: str) -> Optional[str]:
+        response = self._execute("search.list", self.youtube.search().list(
+            q=query, part="id", maxResults=1, type="channel"
+        ))
+        for item in response.get("items", []):
+            return item.get("id", {}).get("channelId")
+        return None
+
+    def list_playlist_page(
+        self, playlist_id: str, page_token: Optional[str] = None, etag: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """One page of up to 50 playlist items (1 quota unit).
+
+        With `etag` the request is conditional and None means the page has not
+        changed since that ETag was returned.
+        """
+        request = self.youtube.playlistItems().list(
+            part="contentDetails", playlistId=playlist_id, maxResults=PAGE_SIZE, pageToken=page_token
+        )
+        if etag:
+            request.headers["If-None-Match"] = etag
+        try:
+            return self._execute("playlistItems.list", request)
+        except HttpError as e:
+            if e.resp.status == 304:
+                return None
+            raise
+
     @staticmethod
     def get_video_id_from_url(url: str) -> Optional[str]:
         """Extract video ID from YouTube URL."""
@@ -147,28 +398,97 @@ class YouTubeService:
                 return match.group(1)
         return None
     
-    @cache.memoize(timeout=86400)  # Cache transcripts for 24 hours
+    @staticmethod
+    def parse_published_at(published_at: Optional[str]) -> Optional[datetime]:
+        """Parse a YouTube publishedAt timestamp (RFC 3339, UTC) into a naive UTC datetime."""
+        if not published_at:
+            return None
+        try:
+            return datetime.strptime(published_at[:19], "%Y-%m-%dT%H:%M:%S")
+        except ValueError:
+            return None
+
     def get_transcript(self, video_url: str) -> Optional[str]:
-        """Get transcript for a YouTube video."""
+        """Get transcript for a YouTube video: the English one, or else the
+        first listed, so any video the availability probe reports as having
+        transcripts gets one. None when there is none or it could not be
+        fetched; the former also adds the video to `transcripts_missing`."""
         video_id = self.get_video_id_from_url(video_url)
         if not video_id:
             return None
 
+        # Keyed by video ID so every worker and service instance shares it
+        cache_key = f"transcript_{video_id}"
+        cached_transcript = cache.get(cache_key)
+        if cached_transcript is not None:
+            return cached_transcript
+
+        api = None
         try:
-            transcript = YouTubeTranscriptApi.get_transcript(video_id)
+            api = _transcript_api()
+            transcripts = _take_transcript_list(video_id)
+
+            def fetch():
+                if transcripts is not None:
+                    try:
+                        return _fetch_transcript(api, video_id, transcripts)
+                    except api.NoTranscriptFound:
+                        raise
+                    except Exception as e:
+                        logger.info(f"Refetching the transcript list of {video_id}: {str(e)}")
+                return _fetch_transcript(api, video_id)
+
+            with YOUTUBE_REQUEST_SECONDS.time(operation="transcript"):
+                transcript = CASSETTES.call("youtube", "transcript", {"video_id": video_id}, fetch)
+            YOUTUBE_REQUESTS.inc(operation="transcript", outcome="ok")
+            from youtube_transcript_api.formatters import TextFormatter
             formatter = TextFormatter()
-            return formatter.format_transcript(transcript)
+            text = formatter.format_transcript(transcript)
+            cache.set(cache_key, text, timeout=86400)  # Cache transcripts for 24 hours
+            return text
         except Exception as e:
+            YOUTUBE_REQUESTS.inc(operation="transcript", outcome="error")
+            if api is not None and isinstance(e, _no_transcript_errors(api)):
+                self.transcripts_missing.add(video_id)
             print(f"Error getting transcript: {str(e)}")
             return None
     
+    @staticmethod
+    def list_transcript_languages(video_id: str) -> List[str]:
+        """Language codes of the video's transcripts, auto-generated ones suffixed
+        with "-auto"; empty when it has none.
+
+        Costs one watch page fetch. Raises on errors that may be transient
+        (rate limiting, network), which say nothing about the video. A video
+        with transcripts keeps its list for get_transcript.
+        """
+        api = _transcript_api()
+
+        def list_languages():
+            try:
+                transcripts = api.YouTubeTranscriptApi.list_transcripts(video_id)
+            except _no_transcript_errors(api):
+                return []
+            languages = [t.language_code + ("-auto" if t.is_generated else "") for t in transcripts]
+            if languages:
+                _keep_transcript_list(video_id, transcripts)
+            return languages
+
+        with YOUTUBE_REQUEST_SECONDS.time(operation="transcript_list"):
+            try:
+                languages = CASSETTES.call("youtube", "transcript_list", {"video_id": video_id}, list_languages)
+            except Exception:
+                YOUTUBE_REQUESTS.inc(operation="transcript_list", outcome="error")
+                raise
+        YOUTUBE_REQUESTS.inc(operation="transcript_list", outcome="ok")
+        return languages
+
     def get_video_by_id(self, video_id: str) -> Optional[Dict[str, str]]:
         """Get video details by video ID."""
         try:
-            video_response = (
-                self.youtube.videos()
-                .list(part="snippet,statistics", id=video_id)
-                .execute()
+            video_response = self._execute(
+                "videos.list",
+                self.youtube.videos().list(part="snippet,statistics", id=video_id),
             )
             
             if not video_response["items"]: